@@ -0,0 +1,42 @@
+import sys
+import json
+from argparse import ArgumentParser
+
+from benchmarks import environment_info, run_sampling_benchmarks
+from benchmarks.sampling_benchmark import ARCHITECTURES, HEADS, RESOLUTIONS
+
+if __name__ == "__main__":
+
+    # parse arguments
+    parser = ArgumentParser()
+    parser.add_argument("--architectures", type=str, nargs='+', default=list(ARCHITECTURES))
+    parser.add_argument("--heads", type=str, nargs='+', default=list(HEADS))
+    parser.add_argument("--resolutions", type=int, nargs='+', default=list(RESOLUTIONS))
+    parser.add_argument("--precondition_resolution", type=int, default=4)
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--accept_threshold", type=float, default=None)
+    parser.add_argument("--embed_dim", type=int, default=64)
+    parser.add_argument("--head_dim", type=int, default=16)
+    parser.add_argument("--num_heads", type=int, default=4)
+    parser.add_argument("--num_layers", type=int, default=4)
+    parser.add_argument("--num_threads", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = vars(parser.parse_args())
+    output = args.pop('output')
+
+    # run each configuration in a separate process and report the progress
+    runs = []
+    for run in run_sampling_benchmarks(**args):
+        print(f"{run['architecture']} {run['head']} {run['resolution']}: {run['status']}", file=sys.stderr)
+        runs += [run]
+
+    # write the machine-readable report to a file or to stdout
+    report = {**environment_info(), 'runs': runs}
+    if output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
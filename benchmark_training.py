@@ -0,0 +1,43 @@
+import sys
+import json
+from argparse import ArgumentParser
+
+from benchmarks import environment_info, run_training_benchmarks
+from benchmarks.training_benchmark import ARCHITECTURES, EMBEDDINGS
+
+if __name__ == "__main__":
+
+    # parse arguments
+    parser = ArgumentParser()
+    parser.add_argument("--architectures", type=str, nargs='+', default=list(ARCHITECTURES))
+    parser.add_argument("--embeddings", type=str, nargs='+', default=list(EMBEDDINGS))
+    parser.add_argument("--resolution", type=int, default=32)
+    parser.add_argument("--batch_size", type=int, default=4)
+    parser.add_argument("--num_steps", type=int, default=10)
+    parser.add_argument("--warmup_steps", type=int, default=2)
+    parser.add_argument("--min_tokens", type=int, default=256)
+    parser.add_argument("--max_tokens", type=int, default=2048)
+    parser.add_argument("--embed_dim", type=int, default=64)
+    parser.add_argument("--head_dim", type=int, default=16)
+    parser.add_argument("--num_heads", type=int, default=4)
+    parser.add_argument("--num_layers", type=int, default=4)
+    parser.add_argument("--num_threads", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = vars(parser.parse_args())
+    output = args.pop('output')
+
+    # run each configuration in a separate process and report the progress
+    runs = []
+    for run in run_training_benchmarks(**args):
+        print(f"{run['architecture']} {run['embedding']}: {run['status']}", file=sys.stderr)
+        runs += [run]
+
+    # write the machine-readable report to a file or to stdout
+    report = {**environment_info(), 'runs': runs}
+    if output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
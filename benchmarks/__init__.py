@@ -0,0 +1,27 @@
+from benchmarks.benchmark_utils import (
+    environment_info,
+    peak_rss_mib,
+    run_isolated,
+)
+from benchmarks.sampling_benchmark import (
+    benchmark_sampler,
+    create_random_sampler,
+    run_sampling_benchmarks,
+)
+from benchmarks.training_benchmark import (
+    benchmark_training,
+    synthetic_sequences,
+    run_training_benchmarks,
+)
+
+__all__ = [
+    "environment_info",
+    "peak_rss_mib",
+    "run_isolated",
+    "benchmark_sampler",
+    "create_random_sampler",
+    "run_sampling_benchmarks",
+    "benchmark_training",
+    "synthetic_sequences",
+    "run_training_benchmarks",
+]
@@ -0,0 +1,86 @@
+import os
+import sys
+import platform
+import resource
+import subprocess
+import contextlib
+import multiprocessing as mp
+
+import torch
+
+
+def environment_info():
+    """ Returns the current git commit and the versions of the environment, which identify a benchmark report. """
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def peak_rss_mib():
+    """ Returns the peak resident set size of the current process in MiB. """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextlib.contextmanager
+def deterministic_algorithms():
+    """ Context, which forces torch to use deterministic algorithms and restores the previous setting afterwards. """
+    enabled = torch.are_deterministic_algorithms_enabled()
+    torch.use_deterministic_algorithms(True)
+    try:
+        yield
+    finally:
+        torch.use_deterministic_algorithms(enabled)
+
+
+def _run_worker(task):
+    """ Runs a single benchmark configuration in a fresh worker process and reports missing optional modules and
+    unsupported configurations instead of failing.
+    """
+    benchmark_fn, config, num_threads = task
+    torch.set_num_threads(num_threads)
+    try:
+        # keep stdout free for the report
+        with contextlib.redirect_stdout(sys.stderr):
+            return {'status': 'ok', **benchmark_fn(**config)}
+    except ImportError as e:
+        return {'status': 'skipped', 'error': str(e)}
+    except Exception as e:
+        return {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+
+
+def run_isolated(benchmark_fn, configs, num_threads=1, timeout=None):
+    """ Runs a benchmark function for each configuration in its own spawned process.
+
+    The peak RSS of a run is not affected by previous runs. Configurations, which depend on missing optional modules
+    are reported as 'skipped', configurations, which raise an error are reported as 'error' and configurations, which
+    exceed the `timeout` are reported as 'timeout'.
+
+    Args:
+        benchmark_fn: Module level function, which is called with each configuration as keyword arguments and returns
+            a dictionary with the results.
+        configs: Iterable of configuration dictionaries.
+        num_threads: Number of torch threads of each run.
+        timeout: Maximum time of each run in seconds or `None`.
+
+    Return:
+        Generator, which yields the configuration and result of each run as a dictionary.
+    """
+    ctx = mp.get_context('spawn')
+    for config in configs:
+        with ctx.Pool(1) as pool:
+            run = pool.apply_async(_run_worker, ((benchmark_fn, config, num_threads), ))
+            try:
+                result = run.get(timeout)
+            except mp.TimeoutError:
+                result = {'status': 'timeout'}
+        yield {**config, **result}
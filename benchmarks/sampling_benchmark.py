@@ -0,0 +1,261 @@
+import sys
+import time
+import functools
+
+import numpy as np
+import torch
+
+from modules.architecture import create_architecture
+from modules.generative_head import create_head
+from modules.token_embedding import create_embedding
+from sample.layer_sampler import create_sampler
+from .benchmark_utils import peak_rss_mib, run_isolated
+
+# benchmarked model combinations, each token generator supports only the composite heads
+ARCHITECTURES = ('encoder_only', 'pytorch', 'fast-recurrent')
+HEADS = ('composite_A', 'composite_B', 'composite_C', 'composite_D')
+RESOLUTIONS = (16, 32, 64, 128)
+
+# pre- and post-processing stages of the layer samplers, which are timed separately from the model. Each stage is
+# timed at the first of its functions or methods, which is found in the module of the sampler.
+PROCESSING_STAGES = {
+    'preprocess': ('preprocess', ),
+    'next_layer_tokens': ('SequenceBuffer.expand', 'next_layer_tokens'),
+    'postprocess': ('postprocess', ),
+}
+
+
+def create_random_sampler(
+    architecture,
+    head,
+    resolution,
+    embed_dim=64,
+    head_dim=16,
+    n_layer_head=1,
+    num_heads=4,
+    num_layers=4,
+    accept_threshold=None,
+    **_,
+):
+    """ Creates a sampler of a randomly initialised model with the given architecture, embedding and head.
+
+    Args:
+        architecture: Architecture type of the model.
+        head: Generative head type of the model. The token embedding of the same name is used.
+        resolution: Maximum resolution of the model.
+        embed_dim: Size of embedding dimensions used by the transformer model.
+        head_dim: Size of embedding dimensions used in the head layers.
+        n_layer_head: Number of layers used in each linear or convolution block of the head.
+        num_heads: Number of attention heads.
+        num_layers: Number of transformer layers.
+        accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+            multinomial draw. Disabled, if `None`.
+
+    Return:
+        Sampler of the model on the cpu.
+    """
+    embedding = create_embedding([head], 'basic', 3, embed_dim, resolution, 3)
+    generative_head = create_head([head], 'None', 3, embed_dim, head_dim, n_layer_head, resolution)
+    model = create_architecture(
+        architecture, 'basic_full', embedding, generative_head, embed_dim, num_heads, num_layers, 0.0, 1
+    )
+    return create_sampler(
+        architecture, [head], [head], model.eval(), 3, 2 ** 16, resolution, 'centered', 'cpu', accept_threshold
+    )
+
+
+def sphere(resolution):
+    """ Returns a voxelized sphere, which fills the volume of the given resolution. """
+    coords = (np.arange(resolution) + 0.5) / resolution - 0.5
+    x, y, z = np.meshgrid(coords, coords, coords, indexing='ij')
+    return (x ** 2 + y ** 2 + z ** 2 <= 0.25).astype(np.int64)
+
+
+class _Timed:
+    """ Wraps a function and accumulates its wall time and number of calls. """
+    def __init__(self, fn):
+        self.fn = fn
+        self.time = 0.0
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = self.fn(*args, **kwargs)
+        self.time += time.perf_counter() - start
+        self.calls += 1
+        return result
+
+    def __get__(self, instance, owner):
+        """ Binds the timed function to an instance, if it replaces a method of a class. """
+        return self if instance is None else functools.partial(self, instance)
+
+
+def _processing_targets(module):
+    """ Finds the timed function of each processing stage, which is used by the given sampler module.
+
+    Args:
+        module: Module of the layer sampler.
+
+    Return:
+        Dictionary, which maps each stage onto the owner (module or class) and the attribute name of its function.
+    """
+    targets = {}
+    for stage, names in PROCESSING_STAGES.items():
+        for name in names:
+            *path, attr = name.split('.')
+            owner = functools.reduce(lambda obj, n: getattr(obj, n, None), path, module)
+            if owner is not None and hasattr(owner, attr):
+                targets[stage] = (owner, attr)
+                break
+        else:
+            raise ValueError(f"ERROR: Module '{module.__name__}' uses none of the timed functions {names}.")
+    return targets
+
+
+def _progress_bars():
+    """ Finds the progress bars `tqdm` and `trange`, which are imported by the loaded modules of the samplers.
+
+    Return:
+        List with the module and the attribute name of each progress bar.
+    """
+    modules = [m for name, m in list(sys.modules.items()) if name.startswith('sample.') and m is not None]
+    return [(m, attr) for m in modules for attr in ('tqdm', 'trange') if hasattr(m, attr)]
+
+
+class _TimedGenerator:
+    """ Wraps a token generator and records the wall time and number of sampled tokens of each layer. """
+    def __init__(self, generator):
+        self.generator = generator
+        self.layers = []
+
+    def _record(self, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        # the depth of the sampled layer is given by the depth tokens of the last input layer
+        dep = kwargs['dep'] if 'dep' in kwargs else args[1]
+        dep = dep[0] if isinstance(dep[0], list) else dep
+        # recurrent generators return the sampled tokens together with their memory and state
+        tokens = result[0] if isinstance(result, tuple) else result
+        num_tokens = sum(len(t) for t in tokens) if isinstance(tokens, list) else len(tokens)
+        self.layers += [{'depth': int(dep[-1][0]), 'time': elapsed, 'tokens': num_tokens}]
+        return result
+
+    def __call__(self, *args, **kwargs):
+        return self._record(self.generator, *args, **kwargs)
+
+    def sample_batch(self, *args, **kwargs):
+        return self._record(self.generator.sample_batch, *args, **kwargs)
+
+
+def benchmark_sampler(
+    architecture,
+    head,
+    resolution,
+    precondition_resolution=4,
+    batch_size=1,
+    temperature=1.0,
+    seed=0,
+    **kwargs,
+):
+    """ Samples shapes with a randomly initialised model and measures the throughput of the sampler.
+
+    The sampling starts from a voxelized sphere downscaled to `precondition_resolution`. All layers above are sampled
+    by the model. The time spent in `preprocess`, the creation of the next layer and `postprocess` is measured
+    separately, the remaining time is spent in the model and the token generators. The next layer is created either by
+    `SequenceBuffer.expand` or `next_layer_tokens` and reported as 'next_layer_tokens'.
+
+    Args:
+        architecture: Architecture type of the model.
+        head: Generative head type and token embedding of the model.
+        resolution: Target resolution of the sampled shapes.
+        precondition_resolution: Resolution of the precondition.
+        batch_size: Number of shapes, which are sampled in lock-step, if the sampler supports batched sampling.
+        temperature: Defines the randomness of the samples.
+        seed: Seed of the model initialisation and the sampling.
+        kwargs: Model dimensions, see `create_random_sampler`.
+
+    Return:
+        Dictionary with the measured times in seconds, the number of sampled tokens and the peak RSS in MiB.
+    """
+    torch.manual_seed(seed)
+    sampler = create_random_sampler(architecture, head, resolution, **kwargs)
+
+    # wrap the pre- and post-processing functions in the module of the sampler and its token generators
+    targets = _processing_targets(sys.modules[type(sampler).__module__])
+    timed_fns = {stage: _Timed(getattr(owner, attr)) for stage, (owner, attr) in targets.items()}
+    for stage, (owner, attr) in targets.items():
+        setattr(owner, attr, timed_fns[stage])
+    sampler.generators = [_TimedGenerator(g) for g in sampler.generators]
+
+    # disable the progress bars of the sampler and its token generators
+    progress_bars = {(owner, attr): getattr(owner, attr) for owner, attr in _progress_bars()}
+    for (owner, attr), bar in progress_bars.items():
+        setattr(owner, attr, functools.partial(bar, disable=True))
+
+    precondition = sphere(resolution)
+    cls = torch.zeros(batch_size, dtype=torch.long)
+    try:
+        start = time.perf_counter()
+        if batch_size > 1 and hasattr(sampler, 'sample_batch'):
+            sampler.sample_batch([precondition] * batch_size, precondition_resolution, resolution, temperature, cls)
+        else:
+            for i in range(batch_size):
+                sampler(precondition, precondition_resolution, resolution, temperature, cls[i:i + 1])
+        total_time = time.perf_counter() - start
+    finally:
+        for stage, (owner, attr) in targets.items():
+            setattr(owner, attr, timed_fns[stage].fn)
+        for (owner, attr), bar in progress_bars.items():
+            setattr(owner, attr, bar)
+
+    # accumulate the sampled layers of all generators and samples for each depth
+    layers = [layer for g in sampler.generators for layer in g.layers]
+    per_layer = {}
+    for layer in layers:
+        entry = per_layer.setdefault(layer['depth'], {'time': 0.0, 'tokens': 0})
+        entry['time'] += layer['time']
+        entry['tokens'] += layer['tokens']
+
+    num_tokens = sum(layer['tokens'] for layer in layers)
+    processing_time = sum(fn.time for fn in timed_fns.values())
+    return {
+        'total_time': total_time,
+        'model_time': total_time - processing_time,
+        'processing_time': {name: fn.time for name, fn in timed_fns.items()},
+        'tokens': num_tokens,
+        'tokens_per_sec': num_tokens / total_time if total_time > 0 else None,
+        'layers': [{'depth': d, **per_layer[d]} for d in sorted(per_layer)],
+        'peak_rss_mib': peak_rss_mib(),
+    }
+
+
+def run_sampling_benchmarks(
+    architectures=ARCHITECTURES,
+    heads=HEADS,
+    resolutions=RESOLUTIONS,
+    num_threads=1,
+    timeout=None,
+    **kwargs,
+):
+    """ Benchmarks the sampling of each combination of architecture, head and resolution.
+
+    Each configuration runs in its own spawned process, see `run_isolated`.
+
+    Args:
+        architectures: Benchmarked architecture types.
+        heads: Benchmarked generative heads and token embeddings.
+        resolutions: Benchmarked target resolutions.
+        num_threads: Number of torch threads of each run.
+        timeout: Maximum time of each run in seconds or `None`.
+        kwargs: Sampling parameters and model dimensions, see `benchmark_sampler` and `create_random_sampler`.
+
+    Return:
+        Generator, which yields the configuration and result of each run as a dictionary.
+    """
+    configs = [
+        {'architecture': architecture, 'head': head, 'resolution': resolution, **kwargs}
+        for architecture in architectures for head in heads for resolution in resolutions
+    ]
+    return run_isolated(benchmark_sampler, configs, num_threads, timeout)
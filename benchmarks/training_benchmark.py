@@ -0,0 +1,292 @@
+import random
+import time
+
+import numpy as np
+import torch
+
+from data.collate import create_data_collate
+from modules import ShapeTransformer
+from utils import quick_linearise
+from .benchmark_utils import deterministic_algorithms, peak_rss_mib, run_isolated
+
+# benchmarked model combinations, each embedding is paired with the generative head of the same name
+ARCHITECTURES = ('encoder_only', 'pytorch')
+EMBEDDINGS = (
+    'basic',
+    'half_conv',
+    'single_conv',
+    'composite_A',
+    'composite_B',
+    'composite_C',
+    'composite_D',
+)
+
+
+def procedural_shape(rng, resolution, num_primitives):
+    """ Returns a voxel array of the union of random spheres and boxes.
+
+    Args:
+        rng: Numpy random generator.
+        resolution: Side length of the voxel array.
+        num_primitives: Number of spheres and boxes in the shape.
+
+    Return:
+        Voxel array with the shape [R, R, R].
+    """
+    coords = (np.arange(resolution) + 0.5) / resolution
+    grid = np.stack(np.meshgrid(coords, coords, coords, indexing='ij'), axis=-1)  # [R, R, R, 3]
+
+    shape = np.zeros(3 * [resolution], dtype=bool)
+    for _ in range(num_primitives):
+        center = rng.uniform(0.2, 0.8, 3)
+        size = rng.uniform(0.05, 0.3, 3)
+        if rng.random() < 0.5:
+            shape |= np.sum(((grid - center) / size)**2, axis=-1) <= 1.0
+        else:
+            shape |= np.all(np.abs(grid - center) <= size, axis=-1)
+    return shape.astype(np.int64)
+
+
+def synthetic_sequences(resolution, num_sequences, min_tokens, max_tokens, seed=0, pool_size=64):
+    """ Returns linearised octree sequences of procedural shapes with a controlled length distribution.
+
+    A pool of procedural shapes of increasing complexity is linearised with `quick_linearise`. For each sequence a
+    target length is drawn uniformly from [`min_tokens`, `max_tokens`] and the shape of the pool with the closest
+    sequence length is selected.
+
+    Args:
+        resolution: Resolution of the procedural shapes.
+        num_sequences: Number of returned sequences.
+        min_tokens: Minimal target length of the sequences.
+        max_tokens: Maximal target length of the sequences.
+        seed: Seed of the shapes and the target lengths.
+        pool_size: Number of different procedural shapes.
+
+    Return:
+        List of (value, depth, position) sequences as numpy arrays.
+    """
+    rng = np.random.default_rng(seed)
+    pool = [
+        quick_linearise(procedural_shape(rng, resolution, 1 + i * 16 // pool_size), 'centered', resolution)
+        for i in range(pool_size)
+    ]
+    pool = sorted(pool, key=lambda seq: len(seq[0]))
+    lengths = np.array([len(seq[0]) for seq in pool])
+
+    # select the shape with the closest length for each target length
+    targets = rng.uniform(min_tokens, max_tokens, num_sequences)
+    idx = np.clip(np.searchsorted(lengths, targets), 1, len(pool) - 1)
+    idx -= targets - lengths[idx - 1] < lengths[idx] - targets
+    return [pool[i] for i in idx]
+
+
+class _ComponentTimer:
+    """ Measures the forward and backward time of the token embeddings and generative heads of a model with hooks.
+
+    The forward time is measured between the forward pre-hook and the forward hook of each module. The backward pass
+    of the heads ends as soon as the gradient of their input is computed, the backward pass of the embeddings starts
+    as soon as the gradient of their output is computed. The remaining time is spent in the transformer.
+    """
+    def __init__(self, model):
+        self.reset()
+        self._start = {}
+
+        for name, modules in (('embedding', model.embedding), ('head', model.head)):
+            for module in modules:
+                if module is not None:
+                    module.register_forward_pre_hook(self._pre_hook(name))
+                    module.register_forward_hook(self._hook(name))
+
+    def _pre_hook(self, name):
+        def hook(module, args):
+            self._start[name] = time.perf_counter()
+            if name == 'head' and args[0].requires_grad:
+                args[0].register_hook(self._grad_hook(self.head_backward_end))
+        return hook
+
+    def _hook(self, name):
+        def hook(module, args, output):
+            self.forward[name] += time.perf_counter() - self._start[name]
+            if name == 'embedding' and output.requires_grad:
+                output.register_hook(self._grad_hook(self.embedding_backward_start))
+        return hook
+
+    def _grad_hook(self, times):
+        def hook(grad):
+            times.append(time.perf_counter())
+        return hook
+
+    def reset(self):
+        """ Resets all measured times. """
+        self.forward = {'embedding': 0.0, 'head': 0.0}
+        self.head_backward_end = []
+        self.embedding_backward_start = []
+
+
+def benchmark_training(
+    architecture,
+    embedding,
+    head=None,
+    resolution=32,
+    batch_size=4,
+    num_steps=10,
+    warmup_steps=2,
+    min_tokens=256,
+    max_tokens=2048,
+    seed=0,
+    embed_dim=64,
+    head_dim=16,
+    n_layer_head=1,
+    num_heads=4,
+    num_layers=4,
+    dropout=0.0,
+    **_,
+):
+    """ Measures the time of training steps of a randomly initialised `ShapeTransformer` on synthetic batches.
+
+    The time of each step is split into forward, backward and optimizer time. The forward and backward time are
+    further split into token embedding, transformer and generative head. All random numbers are seeded and
+    deterministic algorithms are used, thus the final loss of a configuration is reproducible.
+
+    Args:
+        architecture: Architecture type of the model.
+        embedding: Token embedding type of the model.
+        head: Generative head type of the model. Uses the head of the same name as the embedding, if `None`.
+        resolution: Resolution of the synthetic shapes.
+        batch_size: Number of sequences in each batch.
+        num_steps: Number of measured training steps.
+        warmup_steps: Number of training steps before the measurement.
+        min_tokens: Minimal target length of the synthetic sequences.
+        max_tokens: Maximal target length of the synthetic sequences.
+        seed: Seed of the model initialisation and the synthetic shapes.
+        embed_dim: Size of embedding dimensions used by the transformer model.
+        head_dim: Size of embedding dimensions used in the head layers.
+        n_layer_head: Number of layers used in each linear or convolution block of the head.
+        num_heads: Number of attention heads.
+        num_layers: Number of transformer layers.
+        dropout: The dropout rate.
+
+    Return:
+        Dictionary with the measured mean times per step in seconds, the number of tokens and the peak RSS in MiB.
+    """
+    random.seed(seed)
+    torch.manual_seed(seed)
+    head = embedding if head is None else head
+
+    pl_module = ShapeTransformer(
+        embed_dim=embed_dim,
+        head_dim=head_dim,
+        n_layer_head=n_layer_head,
+        num_heads=num_heads,
+        num_layers=num_layers,
+        num_positions=max_tokens,
+        num_vocab=3,
+        resolution=resolution,
+        spatial_dim=3,
+        dropout=dropout,
+        architecture=architecture,
+        embedding=[embedding],
+        head=[head],
+        position_encoding='centered',
+    )
+    model = pl_module.model.train()
+    optimizer = torch.optim.Adam(model.parameters(), lr=pl_module.hparams.learning_rate)
+    timer = _ComponentTimer(model)
+
+    # create synthetic batches, with the data collate of the architecture and embedding
+    collate = create_data_collate(architecture, [embedding], resolution)
+    num_batches = warmup_steps + num_steps
+    sequences = synthetic_sequences(resolution, num_batches * batch_size, min_tokens, max_tokens, seed)
+    batches = [
+        collate([seq + (np.array(0), ) for seq in sequences[i * batch_size:(i + 1) * batch_size]])
+        for i in range(num_batches)
+    ]
+
+    times = {'forward': 0.0, 'backward': 0.0, 'optimizer': 0.0}
+    components = {
+        'embedding': {'forward': 0.0, 'backward': 0.0},
+        'transformer': {'forward': 0.0, 'backward': 0.0},
+        'head': {'forward': 0.0, 'backward': 0.0},
+    }
+    num_tokens = 0
+    with deterministic_algorithms():
+        for step, (sequence, target, cls) in enumerate(batches):
+            timer.reset()
+
+            start = time.perf_counter()
+            logits = model(sequence, cls)
+            loss = pl_module.loss_function(logits, target)
+            loss = torch.mean(loss[target[1] != 0])
+            forward_end = time.perf_counter()
+
+            optimizer.zero_grad()
+            backward_start = time.perf_counter()
+            loss.backward()
+            backward_end = time.perf_counter()
+
+            optimizer.step()
+            optimizer_end = time.perf_counter()
+
+            if step < warmup_steps:
+                continue
+
+            # split the measured times into the components of the model
+            forward_time = forward_end - start
+            backward_time = backward_end - backward_start
+            head_backward = max(timer.head_backward_end, default=backward_start) - backward_start
+            embedding_backward = backward_end - min(timer.embedding_backward_start, default=backward_end)
+
+            times['forward'] += forward_time
+            times['backward'] += backward_time
+            times['optimizer'] += optimizer_end - backward_end
+            components['embedding']['forward'] += timer.forward['embedding']
+            components['head']['forward'] += timer.forward['head']
+            components['transformer']['forward'] += forward_time - timer.forward['embedding'] - timer.forward['head']
+            components['embedding']['backward'] += embedding_backward
+            components['head']['backward'] += head_backward
+            components['transformer']['backward'] += backward_time - embedding_backward - head_backward
+            num_tokens += int(torch.sum(target[1] != 0))
+
+    step_time = sum(times.values())
+    return {
+        'step_time': step_time / num_steps,
+        'times': {k: v / num_steps for k, v in times.items()},
+        'components': {c: {k: v / num_steps for k, v in t.items()} for c, t in components.items()},
+        'tokens_per_step': num_tokens / num_steps,
+        'tokens_per_sec': num_tokens / step_time if step_time > 0 else None,
+        'parameters': {
+            'embedding': sum(p.numel() for p in model.embedding.parameters()),
+            'head': sum(p.numel() for p in model.head.parameters()),
+            'total': sum(p.numel() for p in model.parameters()),
+        },
+        'final_loss': float(loss),
+        'peak_rss_mib': peak_rss_mib(),
+    }
+
+
+def run_training_benchmarks(
+    architectures=ARCHITECTURES,
+    embeddings=EMBEDDINGS,
+    num_threads=1,
+    timeout=None,
+    **kwargs,
+):
+    """ Benchmarks the training steps of each combination of architecture and embedding.
+
+    Each configuration runs in its own spawned process, see `run_isolated`.
+
+    Args:
+        architectures: Benchmarked architecture types.
+        embeddings: Benchmarked token embeddings, each paired with the generative head of the same name.
+        num_threads: Number of torch threads of each run.
+        timeout: Maximum time of each run in seconds or `None`.
+        kwargs: Training parameters and model dimensions, see `benchmark_training`.
+
+    Return:
+        Generator, which yields the configuration and result of each run as a dictionary.
+    """
+    configs = [
+        {'architecture': architecture, 'embedding': embedding, **kwargs}
+        for architecture in architectures for embedding in embeddings
+    ]
+    return run_isolated(benchmark_training, configs, num_threads, timeout)
@@ -1,10 +1,13 @@
 from data.quadtree_MNIST import QuadtreeMNIST
 from data.octree_ShapeNet import OctreeShapeNet
+from data.cached_octree_ShapeNet import CachedOctreeShapeNet, preprocess_shapenet
 from data.data import datasets, dataloaders
 
 __all__ = [
     "QuadtreeMNIST",
     "OctreeShapeNet",
+    "CachedOctreeShapeNet",
+    "preprocess_shapenet",
     "datasets",
     "dataloaders",
 ]
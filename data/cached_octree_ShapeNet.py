@@ -0,0 +1,257 @@
+import os
+import random
+import numpy as np
+import multiprocessing as mp
+
+from contextlib import nullcontext
+from glob import glob
+from torch.utils.data import Dataset
+from typing import Tuple, Any, Callable, Iterable
+from tqdm.auto import tqdm
+
+from data.octree_ShapeNet import _class_folder_map, _folder_id_map
+from data.profiler import count, record
+from utils import load_hsp, quick_linearise, quick_delinearise
+
+
+def cache_path(root: str, resolution: int, position_encoding: str) -> str:
+    """ Returns the directory of the sequence cache for the given resolution and positional encoding. """
+    return os.path.join(root, 'ShapeNet', f'octree_{resolution}_{position_encoding}')
+
+
+def _record_dtype(spatial_dim: int, position_dtype: str) -> np.dtype:
+    """ Returns the dtype of a single token record of the packed sequence file. """
+    return np.dtype([('value', 'u1'), ('depth', 'u1'), ('position', position_dtype, (spatial_dim, ))])
+
+
+def write_sequence_cache(
+    path: str,
+    sequences: Iterable,
+    cls_ids: np.ndarray,
+    train: np.ndarray,
+    names: np.ndarray,
+    resolution: int,
+    spatial_dim: int = 3,
+    position_encoding: str = "centered",
+) -> None:
+    """ Writes value, depth and position sequences into a single packed file with an offset index.
+
+    The sequence file `sequences.bin` holds all tokens of all shapes consecutively as records of (value, depth,
+    position). The index file `index.npz` holds the offset of the first token of each shape, as well as the class id,
+    the train/test split and the name of each shape.
+
+    Args:
+        path: Directory of the cache.
+        sequences: Iterable, which yields a tuple of (value, depth, position) sequences for each shape.
+        cls_ids: Class id of each shape.
+        train: Boolean array, which marks shapes of the training dataset.
+        names: Name of each shape, e.g. the path to its raw data file.
+        resolution: Resolution of the voxel grid, which was linearised.
+        spatial_dim: The spatial dimensionality of the shapes.
+        position_encoding: Positional encoding of the position sequences.
+    """
+    os.makedirs(path, exist_ok=True)
+    position_dtype = 'i2' if 2 * resolution < 2**15 else 'i4'
+    dtype = _record_dtype(spatial_dim, position_dtype)
+
+    # write sequences into a temporary file, which is only visible after it was completely written
+    offsets = [0]
+    with open(os.path.join(path, 'sequences.bin.tmp'), 'wb') as f:
+        for value, depth, position in sequences:
+            records = np.empty(len(value), dtype=dtype)
+            records['value'] = value
+            records['depth'] = depth
+            records['position'] = position
+            records.tofile(f)
+            offsets += [offsets[-1] + len(value)]
+    os.replace(os.path.join(path, 'sequences.bin.tmp'), os.path.join(path, 'sequences.bin'))
+
+    np.savez(
+        os.path.join(path, 'index.npz'),
+        offsets=np.array(offsets, dtype=np.int64),
+        cls_ids=np.asarray(cls_ids, dtype=np.int64),
+        train=np.asarray(train, dtype=bool),
+        names=np.asarray(names, dtype=str),
+        resolution=resolution,
+        spatial_dim=spatial_dim,
+        position_encoding=position_encoding,
+        position_dtype=position_dtype,
+    )
+
+
+def _linearise_shape(args: Tuple[str, int, str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Loads a single shape and linearises its voxels into value, depth and position sequences. """
+    data_path, resolution, position_encoding = args
+    voxels = load_hsp(data_path, resolution)
+    return quick_linearise(voxels, position_encoding, max_resolution=voxels.shape[0])
+
+
+def preprocess_shapenet(
+    source: str,
+    root: str,
+    resolution: int = 32,
+    position_encoding: str = "centered",
+    num_workers: int = 0,
+) -> str:
+    """ Linearises all shapes of the voxelized ShapeNet dataset once and writes them into a sequence cache.
+
+    Args:
+        source: Path to the raw voxelized ShapeNet dataset with a subdirectory for each class.
+        root: Root directory, where the cache will be stored.
+        resolution: Resolution of the voxel grid, which will be linearised.
+        position_encoding: Positional encoding of the position sequences.
+        num_workers: Number of worker processes, which load and linearise the shapes.
+
+    Return:
+        The directory of the written cache.
+    """
+    # fetch paths with raw voxel data and compute a repeatable train-test split (80-20) for each class
+    paths, cls_ids, train = [], [], []
+    for subdir in _class_folder_map.values():
+        cls_paths = sorted(glob(os.path.join(source, subdir, '*.mat')))
+        paths += cls_paths
+        cls_ids += [_folder_id_map[subdir]] * len(cls_paths)
+        train += [i < int(0.8 * len(cls_paths)) for i in range(len(cls_paths))]
+
+    args = [(p, resolution, position_encoding) for p in paths]
+    path = cache_path(root, resolution, position_encoding)
+    names = [os.path.relpath(p, source) for p in paths]
+
+    # load and linearise shapes in parallel, but write them in order
+    with (mp.Pool(num_workers) if num_workers > 0 else nullcontext()) as pool:
+        sequences = pool.imap(_linearise_shape, args, chunksize=16) if pool else map(_linearise_shape, args)
+        sequences = tqdm(sequences, total=len(args), desc=f"Preprocess {resolution}^3")
+        # `load_hsp` loads shapes with a resolution of at least 16
+        write_sequence_cache(path, sequences, cls_ids, train, names, max(resolution, 16), 3, position_encoding)
+
+    return path
+
+
+class CachedOctreeShapeNet(Dataset):
+    """ Voxelized ShapeNet Dataset, which serves linearised shapes from a precomputed sequence cache. """
+    def __init__(
+        self,
+        root: str = "datasets",
+        train: bool = True,
+        download: bool = False,
+        subclass: str = "all",
+        resolution: int = 32,
+        transform: Callable = None,
+        position_encoding: str = "centered",
+        **kwargs,
+    ) -> None:
+        """ Initializes the cached voxelized ShapeNet dataset. The cache has to be created with `preprocess` first.
+
+        Args:
+            root: Root directory, where the sequence cache is stored.
+            train: Defines whether to load the train or test dataset.
+            download: Unused - needed for consistent API with other downloadable datasets.
+            subclass: Defines which subclass of the dataset should be loaded. Select 'all' for all subclasses.
+            resolution: Defines the used resolution of the dataset.
+            transform: Holds a transform module, which can be used for data augmentation. Deterministic transforms are
+                applied directly on the cached sequences, all other transforms on the decoded voxels.
+            position_encoding: Positional encoding of the cached position sequences.
+        """
+        self.subclass = subclass
+        self.resolution = resolution
+        self.path = cache_path(root, resolution, position_encoding)
+
+        # data transformation & augmentation
+        self.transform = transform
+        self.deterministic = getattr(transform, 'deterministic', False)
+        self.uses_layer_tokens = getattr(transform, 'uses_layer_tokens', False)
+
+        # load the offset index of the requested shapes into memory
+        index = np.load(os.path.join(self.path, 'index.npz'))
+        self.grid_resolution = int(index['resolution'])
+        self.spatial_dim = int(index['spatial_dim'])
+        self.dtype = _record_dtype(self.spatial_dim, str(index['position_dtype']))
+
+        if self.subclass == "all":
+            cls_ids = list(_folder_id_map.values())
+        elif isinstance(self.subclass, list):
+            cls_ids = [_folder_id_map[_class_folder_map[s]] for s in self.subclass]
+        else:
+            cls_ids = [_folder_id_map[_class_folder_map[self.subclass]]]
+        select = (index['train'] == train) & np.isin(index['cls_ids'], cls_ids)
+
+        offsets = index['offsets']
+        self.offsets = offsets[:-1][select]
+        self.lengths = np.diff(offsets)[select]
+        self.cls_ids = index['cls_ids'][select]
+
+        # the sequence file is memory-mapped lazily, separately in each worker process
+        self._sequences = None
+
+    @property
+    def sequences(self) -> np.memmap:
+        """ Returns the memory-mapped packed sequence file. """
+        if self._sequences is None:
+            self._sequences = np.memmap(os.path.join(self.path, 'sequences.bin'), dtype=self.dtype, mode='r')
+        return self._sequences
+
+    def __getstate__(self):
+        """ Excludes the memory-mapped file, when the dataset is send to worker processes. """
+        state = self.__dict__.copy()
+        state['_sequences'] = None
+        return state
+
+    def load_sequence(self, index: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Returns the cached value, depth and position sequences of a single shape. """
+        records = self.sequences[self.offsets[index]:self.offsets[index] + self.lengths[index]]
+        return (
+            records['value'].astype(np.int64),
+            records['depth'].astype(np.int64),
+            records['position'].astype(np.int64),
+        )
+
+    def layer_tokens(self, index: int) -> np.ndarray:
+        """ Returns the number of tokens of each depth layer of a single shape, counted from its cached sequence. """
+        depth = self.sequences[self.offsets[index]:self.offsets[index] + self.lengths[index]]['depth']
+        return np.bincount(depth)[1:]
+
+    def load_voxels(self, index: int) -> np.ndarray:
+        """ Returns the voxels of a single shape, decoded from its cached value sequence. """
+        value = self.sequences[self.offsets[index]:self.offsets[index] + self.lengths[index]]['value']
+        return quick_delinearise(value, self.grid_resolution, self.spatial_dim)
+
+    def __getitem__(self, index: int) -> Tuple[Any, Any, Tuple]:
+        """ Returns a single sample from the dataset. """
+        if self.transform is None:
+            with record('load'):
+                return (self.load_voxels(index), self.cls_ids[index])
+
+        # iterate n times to find a valid output with data augmentation
+        for _ in range(100):
+            if self.deterministic:
+                # transform the cached sequence directly - retries with the same sample would not change the output
+                with record('load'):
+                    sequence = self.load_sequence(index)
+                with record('transform'):
+                    output = self.transform.transform_sequence(sequence)
+                if output is not None:
+                    return output + (self.cls_ids[index], )
+            else:
+                with record('load'):
+                    voxels = self.load_voxels(index)
+                kwargs = {'layer_tokens': self.layer_tokens(index)} if self.uses_layer_tokens else {}
+                for _ in range(10):
+                    # perform data augmentation with transform
+                    with record('transform'):
+                        output = self.transform(voxels, **kwargs)
+
+                    # return only a valid output
+                    if output is not None:
+                        return output + (self.cls_ids[index], )
+                    if getattr(self.transform, 'rejected', False):
+                        break  # the sample exceeds the token limit with any augmentation
+                    count('retries')
+
+            # after a few failed iterations get a new random sample and retry data augmentation
+            count('resamples')
+            index = random.randrange(len(self.offsets))
+
+        raise ValueError("Data loader could not create a valid sample within the token limit.")
+
+    def __len__(self) -> int:
+        return len(self.offsets)
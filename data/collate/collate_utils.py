@@ -29,3 +29,32 @@ def get_min_batch_depth(batch):
         b_depth = max(b[1])
         max_depth = b_depth if b_depth < max_depth else max_depth
     return max_depth
+
+
+def pack_batch(batch, chunk_size=1):
+    """ Unpack batch and concatenate all sequences into a single packed sequence without padding between them.
+
+    Each sequence is padded to a multiple of `chunk_size` only, such that embeddings, which reduce a fixed number of
+    tokens at once, do not mix tokens of different sequences.
+
+    Return:
+        Packed value, depth and position sequences, the cumulative lengths of the packed sequences starting with '0' and
+        the class labels.
+    """
+    val, dep, pos, cls = to_sequences(batch)
+
+    # compute borders of the packed sequences
+    lengths = [-(-len(v) // chunk_size) * chunk_size for v in val]
+    cu_seqlens = torch.zeros(len(lengths) + 1, dtype=torch.int32)
+    cu_seqlens[1:] = torch.cumsum(torch.tensor(lengths), dim=0)
+
+    # copy each sequence into the packed sequence
+    val_pack = torch.zeros(cu_seqlens[-1], dtype=val[0].dtype)
+    dep_pack = torch.zeros(cu_seqlens[-1], dtype=dep[0].dtype)
+    pos_pack = torch.zeros((cu_seqlens[-1], ) + pos[0].shape[1:], dtype=pos[0].dtype)
+    for v, d, p, start in zip(val, dep, pos, cu_seqlens.tolist()):
+        val_pack[start:start + len(v)] = v
+        dep_pack[start:start + len(d)] = d
+        pos_pack[start:start + len(p)] = p
+
+    return val_pack, dep_pack, pos_pack, cu_seqlens, cls
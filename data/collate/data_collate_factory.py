@@ -2,23 +2,56 @@ from .autoencoder_collate import AutoencoderCollate
 from .encoder_only_collate import EncoderOnlyCollate
 from .encoder_decoder_collate import EncoderDecoderCollate
 from .encoder_multi_decoder_collate import EncoderMultiDecoderCollate
+from .packed_encoder_only_collate import PackedEncoderOnlyCollate
 
 
-def create_data_collate(architecture, embeddings, resolution):
+def _packing_chunk_size(embeddings, spatial_dim):
+    """ Returns the number of tokens, which the token embedding reduces at once, or raises a value error if the
+    embedding does not support packed sequences.
+    """
+    name = embeddings[0] if isinstance(embeddings, list) else embeddings
+    if name in ('basic', 'basic_A', 'discrete_transformation'):
+        return 1
+    if name in ('half_conv', 'half_conv_A'):
+        return 2**(spatial_dim - 1)
+    if name in ('single_conv', 'single_conv_A'):
+        return 2**spatial_dim
+    raise ValueError(f"ERROR: Packed sequences are not supported by the {name} embedding.")
+
+
+def _uses_substitution(embeddings):
+    """ Returns whether the token embedding substitutes tokens of depth layers with tokens of the following layer. """
+    name = embeddings[0] if isinstance(embeddings, list) else embeddings
+    return name in ('substitution', 'double_substitution') or name.startswith('composite')
+
+
+def create_data_collate(architecture, embeddings, resolution, spatial_dim=3, packed=False, encodings=()):
     """ Creates a data collate function.
 
     Args:
         architecture: Transformer architecture defines which data transformation function will be created.
         embeddings: Defines the used token embeddings in the shape transformer.
         resolution: Maximum side length of input data.
+        spatial_dim: Spatial dimensionality of input data.
+        packed: Defines whether samples are packed into a single sequence without padding, instead of being padded to
+            equal length. Only available for the 'encoder_only', 'pytorch' and 'fast' architectures.
+        encodings: Defines the positional encodings of the token embedding and the generative head. Packed sequences
+            do not support look-ahead encodings, as they would look ahead across the borders of the packed sequences.
 
     Return:
         data transformation function initialised with specified parameters.
     """
+    if packed:
+        if architecture not in ("encoder_only", 'pytorch', 'fast'):
+            raise ValueError(f"ERROR: Packed sequences are not supported by the {architecture} architecture.")
+        for encoding in encodings:
+            if encoding in ('look_ahead', 'look_ahead_split'):
+                raise ValueError(f"ERROR: Packed sequences are not supported by the {encoding} encoding.")
+        return PackedEncoderOnlyCollate(_packing_chunk_size(embeddings, spatial_dim))
     if architecture == "autoencoder":
         return AutoencoderCollate(embeddings)
     if architecture in ("encoder_only", 'pytorch', 'fast', 'fast-recurrent'):
-        return EncoderOnlyCollate()
+        return EncoderOnlyCollate(_uses_substitution(embeddings))
     if architecture == "encoder_decoder":
         return EncoderDecoderCollate(embeddings)
     if architecture == "encoder_multi_decoder":
@@ -1,17 +1,25 @@
 import torch
 
+from utils.substitution_index import substitution_index
 from .collate_utils import pad_batch
 
 
 class EncoderOnlyCollate():
-    """ Creates a collate module, which pads batched sequences to equal length with the padding token '0'. """
+    def __init__(self, substitution=False):
+        """ Creates a collate module, which pads batched sequences to equal length with the padding token '0'.
+
+        Args:
+            substitution: Defines whether the token embedding and generative head substitute tokens of depth layers.
+                If so, the `SubstitutionIndex` of the batch is precomputed and appended to the sequence.
+        """
+        self.substitution = substitution
 
     def __call__(self, batch):
         """ Pads and packs a list of samples for the 'encoder_only' architecture. """
         # pad batched sequences with '0' to same length
         val, dep, pos, cls = pad_batch(batch)
-        seq = [(val, dep, pos)]
+        seq = [(val, dep, pos, substitution_index(val, dep)) if self.substitution else (val, dep, pos)]
         cls = torch.stack(cls)
 
         # return as (sequence, target)
-        return seq, seq[-1], cls
+        return seq, (val, dep, pos), cls
@@ -0,0 +1,24 @@
+import torch
+
+from .collate_utils import pack_batch
+
+
+class PackedEncoderOnlyCollate():
+    def __init__(self, chunk_size=1):
+        """ Creates a collate module, which packs batched sequences into a single sequence without padding.
+
+        Args:
+            chunk_size: Number of tokens, which are reduced at once by the token embedding. Each sequence is aligned to
+                a multiple of this size.
+        """
+        self.chunk_size = chunk_size
+
+    def __call__(self, batch):
+        """ Packs a list of samples for the 'encoder_only' architecture into a sequence with a batch size of one. """
+        # concatenate batched sequences and keep the borders of each sequence
+        val, dep, pos, cu_seqlens, cls = pack_batch(batch, self.chunk_size)
+        seq = [(val.unsqueeze(0), dep.unsqueeze(0), pos.unsqueeze(0))]
+        cls = torch.stack(cls)
+
+        # return as (sequence, target, cls, cu_seqlens)
+        return seq, seq[-1], cls, cu_seqlens
@@ -1,25 +1,31 @@
 import torch
-from torch.utils.data import DataLoader, random_split
+import numpy as np
+from torch.utils.data import DataLoader, Subset, random_split
 
 import multiprocessing as mp
 
 from . import (
     QuadtreeMNIST,
     OctreeShapeNet,
+    CachedOctreeShapeNet,
 )
 
 from .transform import create_data_transform
 from .collate import create_data_collate
+from .sampler import BucketBatchSampler
+from .profiler import ProfiledCollate, ProfiledDataLoader, ProfiledDataset
 
 # Defines a dictionary of available datasets, which can be selected.
 DATASETS = {
     "mnist": QuadtreeMNIST,
     "shapenet": OctreeShapeNet,
+    "shapenet_cached": CachedOctreeShapeNet,
 }
 
 spatial_dim = {
     "mnist": 2,
     "shapenet": 3,
+    "shapenet_cached": 3,
 }
 
 
@@ -29,16 +35,18 @@ def datasets(
     resolution=32,
     transform='basic',
     datapath="datasets",
+    position_encoding="centered",
 ):
     """ Loads datasets for training, validation and testing.
 
     Args:
-        dataset: Select a dataset. Currently only 'mnist' and 'shapenet' available.
+        dataset: Select a dataset. Currently only 'mnist', 'shapenet' and 'shapenet_cached' available.
         subclass: Select a subclass of a dataset, if available.
         resolution: Select the underlying resolution of the selected dataset, if available.
         transform: Data transformation and augmentation functions.
         datapath: Path to the dataset. If the dataset is not found then
             the data is automatically downloaded to the specified location.
+        position_encoding: Defines the positional encoding of the data, used to select a precomputed sequence cache.
 
     Returns:
         train_ds: Dataset with training data.
@@ -53,6 +61,7 @@ def datasets(
         "subclass": subclass,
         "resolution": resolution,
         "transform": transform,
+        "position_encoding": position_encoding,
     }
 
     # load train and test datasets
@@ -72,6 +81,20 @@ def datasets(
     return train_ds, valid_ds, test_ds
 
 
+def sequence_lengths(dataset):
+    """ Returns the precomputed sequence length of each sample in the dataset, also for subsets of a dataset. """
+    if isinstance(dataset, Subset):
+        return sequence_lengths(dataset.dataset)[np.asarray(dataset.indices)]
+    if isinstance(dataset, ProfiledDataset):
+        return sequence_lengths(dataset.dataset)
+    if not hasattr(dataset, 'lengths'):
+        raise ValueError(
+            f"ERROR: {type(dataset).__name__} provides no precomputed sequence lengths. " +
+            "Select the dataset 'shapenet_cached' for bucketing."
+        )
+    return np.asarray(dataset.lengths)
+
+
 def dataloaders(
     dataset,
     subclass,
@@ -84,11 +107,17 @@ def dataloaders(
     position_encoding,
     num_positions,
     datapath="datasets",
+    bucketing=False,
+    max_tokens=None,
+    packed_sequences=False,
+    token_encoding='basic',
+    head_pos_encoding='None',
+    profile=False,
 ):
     """ Creates dataloaders for training, validation and testing.
 
     Args:
-        dataset: Select a dataset. Currently only 'mnist' and 'shapenet' available.
+        dataset: Select a dataset. Currently only 'mnist', 'shapenet' and 'shapenet_cached' available.
         subclass: Select a subclass of a dataset, if available.
         resolution: Select the underlying resolution of the selected dataset, if available.
         transform: Defines data transformation and augmentation functions.
@@ -100,12 +129,24 @@ def dataloaders(
         num_positions: Maximum length of the input token sequence after embedding.
         datapath: Path to the dataset. If the dataset is not found then
             the data is automatically downloaded to the specified location.
+        bucketing: Select if batches should be formed from samples of similar sequence length.
+        max_tokens: Defines the maximum number of tokens in each batch, including padding tokens, instead of a fixed
+            `batch_size`. Requires `bucketing`, otherwise a value error is raised.
+        packed_sequences: Select if samples of a batch should be packed into a single sequence without padding.
+        token_encoding: Defines the positional encoding of the token embedding of the shape transformer.
+        head_pos_encoding: Defines the positional encoding of the generative head of the shape transformer.
+        profile: Select if the data pipeline should be profiled. Measures the time of loading, transforms and collate
+            in each worker, counts retries of the data augmentation and measures the time the main process waits for
+            each batch. A summary is printed after each epoch.
 
     Returns:
         train_dl: Dataloader with training data.
         valid_dl: Dataloader with validation data.
         test_dl: Dataloader with test data.
     """
+    if max_tokens is not None and not bucketing:
+        raise ValueError("ERROR: A token budget `max_tokens` requires `bucketing`.")
+
     # select data transform function
     transform_fn = create_data_transform(
         name=transform,
@@ -117,22 +158,47 @@ def dataloaders(
     )
 
     # load datasets
-    train_ds, valid_ds, test_ds = datasets(dataset, subclass, resolution, transform_fn, datapath)
+    train_ds, valid_ds, test_ds = datasets(dataset, subclass, resolution, transform_fn, datapath, position_encoding)
 
     # select padding function
-    collate_fn = create_data_collate(architecture, embedding, resolution)
+    collate_fn = create_data_collate(
+        architecture,
+        embedding,
+        resolution,
+        spatial_dim[dataset],
+        packed_sequences,
+        (token_encoding, head_pos_encoding),
+    )
 
     # initialize arguments
     kwargs = {
-        "batch_size": batch_size,
         "pin_memory": True,
         "collate_fn": collate_fn,
         "num_workers": num_workers,
     }
 
+    # attach the profile of each worker to its batches
+    if profile:
+        train_ds, valid_ds, test_ds = ProfiledDataset(train_ds), ProfiledDataset(valid_ds), ProfiledDataset(test_ds)
+        kwargs["collate_fn"] = ProfiledCollate(collate_fn)
+
+    def data_loader(ds, name, **dl_kwargs):
+        if profile:
+            return ProfiledDataLoader(ds, name=name, **dl_kwargs, **kwargs)
+        return DataLoader(ds, **dl_kwargs, **kwargs)
+
     # create dataloaders
-    train_dl = DataLoader(train_ds, shuffle=True, **kwargs)
-    valid_dl = DataLoader(valid_ds, **kwargs)
-    test_dl = DataLoader(test_ds, **kwargs)
+    if bucketing:
+        # group samples of similar sequence length into batches
+        def batch_sampler(ds, shuffle):
+            return BucketBatchSampler(sequence_lengths(ds), batch_size, max_tokens, shuffle)
+
+        train_dl = data_loader(train_ds, 'train', batch_sampler=batch_sampler(train_ds, True))
+        valid_dl = data_loader(valid_ds, 'valid', batch_sampler=batch_sampler(valid_ds, False))
+        test_dl = data_loader(test_ds, 'test', batch_sampler=batch_sampler(test_ds, False))
+    else:
+        train_dl = data_loader(train_ds, 'train', batch_size=batch_size, shuffle=True)
+        valid_dl = data_loader(valid_ds, 'valid', batch_size=batch_size)
+        test_dl = data_loader(test_ds, 'test', batch_size=batch_size)
 
     return train_dl, valid_dl, test_dl
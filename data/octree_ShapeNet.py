@@ -1,10 +1,12 @@
 import os
 import random
+import numpy as np
 
 from glob import glob
 from torch.utils.data import Dataset
 from typing import Tuple, Any, Callable
-from utils import load_hsp
+from utils import load_hsp, layer_token_counts
+from data.profiler import count, record
 
 _class_folder_map = {
     "airplane": "02691156",
@@ -154,35 +156,53 @@ class OctreeShapeNet(Dataset):
 
         # data transformation & augmentation
         self.transform = transform
+        self.uses_layer_tokens = getattr(transform, 'uses_layer_tokens', False)
+        # number of tokens of each depth layer of each shape, which are computed once for each worker process
+        self._layer_tokens = {}
 
         # load requested data paths into memory
         self.fetch_data_paths(train)
 
     def __getitem__(self, index: int) -> Tuple[Any, Any, Tuple]:
         """ Returns a single sample from the dataset. """
-        voxels = load_hsp(self.data_paths[index], self.resolution)
+        with record('load'):
+            voxels = load_hsp(self.data_paths[index], self.resolution)
         if self.transform is None:
             return (voxels, self.cls_ids[index])
 
         # iterate n times to find a valid output with data augmentation
         for _ in range(100):
+            kwargs = {'layer_tokens': self.layer_tokens(index, voxels)} if self.uses_layer_tokens else {}
             for _ in range(10):
                 # perform data augmentation with transform
-                output = self.transform(voxels)
+                with record('transform'):
+                    output = self.transform(voxels, **kwargs)
 
                 # return only a valid output
                 if output is not None:
                     return output + (self.cls_ids[index], )
+                if getattr(self.transform, 'rejected', False):
+                    break  # the sample exceeds the token limit with any augmentation
+                count('retries')
 
             # after a few failed iterations get a new random sample and retry data augmentation
+            count('resamples')
             index = random.randrange(len(self.data_paths))
-            voxels = load_hsp(self.data_paths[index], self.resolution)
+            with record('load'):
+                voxels = load_hsp(self.data_paths[index], self.resolution)
 
         raise ValueError("Data loader could not create a valid sample within the token limit.")
 
     def __len__(self) -> int:
         return len(self.data_paths)
 
+    def layer_tokens(self, index: int, voxels: np.ndarray) -> np.ndarray:
+        """ Returns the number of tokens of each depth layer of the linearised shape, which is computed only once. """
+        if index not in self._layer_tokens:
+            with record('layer_tokens'):
+                self._layer_tokens[index] = layer_token_counts(voxels)
+        return self._layer_tokens[index]
+
     @property
     def dataset_path(self) -> str:
         return os.path.join('/clusterarchive/ShapeNet/voxelization')
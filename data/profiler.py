@@ -0,0 +1,221 @@
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from torch.utils.data import DataLoader, Dataset, get_worker_info
+
+# profiler of the current process, which collects the stage timings of the data pipeline, `None` if disabled
+_profiler = None
+
+
+class DataProfiler:
+    def __init__(self):
+        """ Accumulates the wall time and number of calls of each stage of the data pipeline, as well as event counts.
+
+        Stages are nested by their names, e.g. 'transform/AxisScalingTransform' is a part of 'transform'.
+        """
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counts = defaultdict(int)
+
+    def record(self, stage, elapsed):
+        """ Adds a single call of a stage with the given wall time in seconds. """
+        self.times[stage] += elapsed
+        self.calls[stage] += 1
+
+    def count(self, event, n=1):
+        """ Increments the counter of an event. """
+        self.counts[event] += n
+
+    def update(self, other):
+        """ Adds all timings and counts of another profiler. """
+        for stage, elapsed in other.times.items():
+            self.times[stage] += elapsed
+        for stage, calls in other.calls.items():
+            self.calls[stage] += calls
+        for event, n in other.counts.items():
+            self.counts[event] += n
+
+    def drain(self):
+        """ Returns a copy of the profiler and resets all timings and counts. """
+        profiler = DataProfiler()
+        profiler.update(self)
+        self.__init__()
+        return profiler
+
+    def summary(self):
+        """ Returns all timings and counts as a dictionary. """
+        return {
+            'stages': {
+                stage: {'time': self.times[stage], 'calls': self.calls[stage]}
+                for stage in sorted(self.times)
+            },
+            'counts': dict(sorted(self.counts.items())),
+        }
+
+
+def enable_profiling(*_):
+    """ Enables the profiling of the data pipeline in the current process. Can be used as `worker_init_fn`. """
+    global _profiler
+    if _profiler is None:
+        _profiler = DataProfiler()
+
+
+def disable_profiling():
+    """ Disables the profiling of the data pipeline in the current process. """
+    global _profiler
+    _profiler = None
+
+
+@contextmanager
+def record(stage):
+    """ Measures the wall time of the enclosed code as a stage of the data pipeline, if profiling is enabled. """
+    if _profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _profiler.record(stage, time.perf_counter() - start)
+
+
+def count(event, n=1):
+    """ Increments the counter of an event of the data pipeline, if profiling is enabled. """
+    if _profiler is not None:
+        _profiler.count(event, n)
+
+
+def _worker_name():
+    """ Returns the name of the current data loader worker or 'main', if the data is loaded in the main process. """
+    info = get_worker_info()
+    return 'main' if info is None else f"worker_{info.id}"
+
+
+class ProfiledDataset(Dataset):
+    def __init__(self, dataset):
+        """ Wraps a dataset and measures the time to get each sample, including loading, transforms and retries.
+
+        Args:
+            dataset: Dataset, which is profiled.
+        """
+        self.dataset = dataset
+
+    def __getitem__(self, index):
+        """ Returns a single sample of the wrapped dataset. """
+        with record('sample'):
+            return self.dataset[index]
+
+    def __len__(self):
+        return len(self.dataset)
+
+
+class ProfiledCollate:
+    def __init__(self, collate_fn):
+        """ Wraps a collate function, which attaches the profile of the current worker to each batch.
+
+        The profile of a batch holds the timings of all samples of the batch, as the samples of a batch are fetched by
+        the same worker directly before they are collated.
+
+        Args:
+            collate_fn: Collate function, which is profiled.
+        """
+        self.collate_fn = collate_fn
+
+    def __call__(self, batch):
+        """ Collates the batch and returns it together with the name of the worker and its drained profile. """
+        with record('collate'):
+            batch = self.collate_fn(batch)
+        return batch, _worker_name(), _profiler.drain() if _profiler is not None else DataProfiler()
+
+
+class ProfiledDataLoader(DataLoader):
+    def __init__(self, dataset, name='data', **kwargs):
+        """ Creates a data loader, which profiles the data pipeline and prints a summary after each epoch.
+
+        The dataset has to be a `ProfiledDataset` and the collate function has to be a `ProfiledCollate`. Besides the
+        stages of the workers, the time, which the main process waits for each batch, is measured.
+
+        Args:
+            dataset: Profiled dataset, see `ProfiledDataset`.
+            name: Name of the data loader used in the summary.
+            kwargs: Arguments of the `DataLoader`.
+        """
+        kwargs.setdefault('worker_init_fn', enable_profiling)
+        super(ProfiledDataLoader, self).__init__(dataset, **kwargs)
+        self.name = name
+        self.summaries = []
+
+    def __iter__(self):
+        """ Yields the batches of an epoch without their profiles and stores and prints the summary of the epoch. """
+        profilers = defaultdict(DataProfiler)
+        num_samples = defaultdict(int)
+        wait_time = 0.0
+        num_batches = 0
+
+        # samples are loaded in the main process without workers
+        if self.num_workers == 0:
+            enable_profiling()
+
+        start = time.perf_counter()
+        iterator = super(ProfiledDataLoader, self).__iter__()
+        while True:
+            wait_start = time.perf_counter()
+            try:
+                batch, worker, profiler = next(iterator)
+            except StopIteration:
+                break
+            wait_time += time.perf_counter() - wait_start
+            num_batches += 1
+
+            profilers[worker].update(profiler)
+            num_samples[worker] += profiler.calls['sample']
+            yield batch
+
+        self.summaries += [self._summary(profilers, num_samples, wait_time, num_batches, time.perf_counter() - start)]
+        print(self.format_summary(self.summaries[-1]))
+
+    def _summary(self, profilers, num_samples, wait_time, num_batches, epoch_time):
+        """ Merges the profiles of all workers into the summary of an epoch. """
+        total = DataProfiler()
+        workers = {}
+        for worker in sorted(profilers):
+            profiler = profilers[worker]
+            total.update(profiler)
+            busy_time = profiler.times['sample'] + profiler.times['collate']
+            workers[worker] = {
+                'samples': num_samples[worker],
+                'busy_time': busy_time,
+                'samples_per_sec': num_samples[worker] / busy_time if busy_time > 0 else None,
+            }
+
+        return {
+            'name': self.name,
+            'pid': os.getpid(),
+            'batches': num_batches,
+            'samples': sum(num_samples.values()),
+            'epoch_time': epoch_time,
+            'wait_time': wait_time,
+            'samples_per_sec': sum(num_samples.values()) / epoch_time if epoch_time > 0 else None,
+            'workers': workers,
+            **total.summary(),
+        }
+
+    @staticmethod
+    def format_summary(summary):
+        """ Formats the summary of an epoch as a human readable table. """
+        lines = [
+            f"\nData pipeline profile '{summary['name']}': {summary['samples']} samples in {summary['batches']} " +
+            f"batches, {summary['epoch_time']:.2f}s total, {summary['wait_time']:.2f}s waited for batches",
+            f"  {'stage':<40} {'time [s]':>10} {'calls':>8} {'ms/call':>10}",
+        ]
+        for stage, s in summary['stages'].items():
+            ms_per_call = 1000 * s['time'] / max(s['calls'], 1)
+            lines += [f"  {stage:<40} {s['time']:>10.3f} {s['calls']:>8} {ms_per_call:>10.3f}"]
+        for event, n in summary['counts'].items():
+            lines += [f"  {event:<40} {n:>10}"]
+        for worker, w in summary['workers'].items():
+            rate = w['samples_per_sec'] or 0.0
+            lines += [f"  {worker:<40} {w['samples']:>10} samples {rate:>10.1f} samples/s"]
+        return "\n".join(lines)
@@ -0,0 +1,3 @@
+from data.sampler.bucket_batch_sampler import BucketBatchSampler
+
+__all__ = ["BucketBatchSampler"]
@@ -0,0 +1,139 @@
+import math
+import numpy as np
+import torch.distributed as dist
+
+from torch.utils.data import Sampler
+
+
+class BucketBatchSampler(Sampler):
+    def __init__(
+        self,
+        lengths,
+        batch_size=None,
+        max_tokens=None,
+        shuffle=True,
+        bucket_size=100,
+        drop_last=False,
+        num_replicas=None,
+        rank=None,
+        seed=0,
+    ):
+        """ Creates a batch sampler, which groups samples of similar sequence length into batches.
+
+        Each epoch, the (shuffled) samples are divided into buckets, which are sorted by their sequence length and cut
+        into batches. The order of the batches is shuffled afterwards. Thus, each batch holds samples of similar length,
+        which reduces the number of padding tokens.
+
+        Args:
+            lengths: Precomputed sequence length of each sample in the dataset.
+            batch_size: Defines the number of samples in each batch. Ignored, if `max_tokens` is given.
+            max_tokens: Defines the maximum number of tokens in each batch, including padding tokens, instead of a fixed
+                number of samples. Batches hold always at least a single sample.
+            shuffle: Select if samples and batches should be shuffled each epoch.
+            bucket_size: Number of batches, which are formed from a single sorted bucket of samples.
+            drop_last: Select if the last incomplete batch of a bucket should be dropped.
+            num_replicas: Number of processes in distributed training. Defaults to the world size, if initialized.
+            rank: Rank of the current process in distributed training. Defaults to the current rank, if initialized.
+            seed: Random seed, which has to be identical on all processes in distributed training.
+        """
+        if batch_size is None and max_tokens is None:
+            raise ValueError("ERROR: Either a batch size or a token budget has to be defined.")
+
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.shuffle = shuffle
+        self.bucket_size = bucket_size
+        self.drop_last = drop_last
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+        self.cached = None  # ((epoch, num_replicas, rank), batches) of the running or the next epoch
+
+    def set_epoch(self, epoch):
+        """ Sets the epoch, which defines the random permutation of samples and batches. """
+        if self.cached is not None and self.cached[0][0] != epoch:
+            self.cached = None
+        self.epoch = epoch
+
+    def _distributed(self):
+        """ Returns the number of replicas and the rank of the current process. Resolved lazily, as distributed
+        training is initialized only after the dataloaders are created.
+        """
+        initialized = dist.is_available() and dist.is_initialized()
+        num_replicas = self.num_replicas or (dist.get_world_size() if initialized else 1)
+        rank = self.rank if self.rank is not None else (dist.get_rank() if initialized else 0)
+        return num_replicas, rank
+
+    def _split_bucket(self, bucket):
+        """ Cuts a bucket of samples sorted by their sequence length into batches. """
+        if self.max_tokens is None:
+            batches = [bucket[i:i + self.batch_size] for i in range(0, len(bucket), self.batch_size)]
+            if self.drop_last and len(batches) > 0 and len(batches[-1]) < self.batch_size:
+                batches = batches[:-1]
+            return batches
+
+        # fill each batch, until the padded batch exceeds the token budget
+        batches = []
+        start = 0
+        for end in range(1, len(bucket) + 1):
+            if (end - start) * self.lengths[bucket[end - 1]] > self.max_tokens and end - 1 > start:
+                batches += [bucket[start:end - 1]]
+                start = end - 1
+        if start < len(bucket):
+            batches += [bucket[start:]]
+        return batches
+
+    def _epoch_batches(self):
+        """ Returns the batches of the current epoch, which are computed only once for each epoch and process. The
+        distributed setup is part of the cache key, as the length might be requested before it is initialized.
+        """
+        key = (self.epoch, ) + self._distributed()
+        if self.cached is None or self.cached[0] != key:
+            self.cached = (key, self._batches())
+        return self.cached[1]
+
+    def _batches(self):
+        """ Computes all batches of the current epoch for the current process. """
+        rng = np.random.default_rng(self.seed + self.epoch)
+        indices = rng.permutation(len(self.lengths)) if self.shuffle else np.arange(len(self.lengths))
+
+        # number of samples in a single bucket
+        if self.max_tokens is None:
+            samples_per_bucket = self.batch_size * self.bucket_size
+        else:
+            samples_per_bucket = max(1, int(self.bucket_size * self.max_tokens // max(np.mean(self.lengths), 1)))
+
+        batches = []
+        for i in range(0, len(indices), samples_per_bucket):
+            bucket = indices[i:i + samples_per_bucket]
+            # stable sort keeps the random order of samples with equal length
+            bucket = bucket[np.argsort(self.lengths[bucket], kind='stable')]
+            batches += self._split_bucket(bucket)
+
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+
+        # each process gets the same number of batches, repeating batches from the beginning if necessary
+        num_replicas, rank = self._distributed()
+        if num_replicas > 1 and len(batches) > 0:
+            num_batches = math.ceil(len(batches) / num_replicas) * num_replicas
+            batches = (batches * math.ceil(num_batches / len(batches)))[:num_batches]
+            batches = batches[rank::num_replicas]
+
+        return [batch.tolist() for batch in batches]
+
+    def __iter__(self):
+        """ Yields the batches of the current epoch and advances to the next epoch. """
+        batches = self._epoch_batches()
+        self.epoch += 1
+        yield from batches
+        # the running epoch is finished, the following epoch is computed by the next call
+        self.cached = None
+
+    def __len__(self):
+        """ Returns the number of batches of the running epoch, or of the current epoch, if no epoch is running. """
+        if self.cached is None or self.cached[0][1:] != self._distributed():
+            return len(self._epoch_batches())
+        return len(self.cached[1])
@@ -1,8 +1,12 @@
 import math
-from utils import kdTree
+import numpy as np
+from utils import CompactKdTree
 
 
 class BasicTransform():
+    # the transform returns always the same output for the same input
+    deterministic = True
+
     def __init__(self, position_encoding, resolution, **_):
         """ Creates a transform module, which transforms the input data samples to pytorch tensors.
 
@@ -15,9 +19,15 @@ class BasicTransform():
 
     def __call__(self, voxels, **_):
         """ Transforms a single sample to pytorch tensors. """
-        octree = kdTree(voxels.ndim, self.position_encoding).insert_element_array(voxels)
+        octree = CompactKdTree(voxels.ndim, self.position_encoding).insert_element_array(voxels)
         return octree.get_token_sequence(
             depth=math.log2(self.resolution),
             return_depth=True,
             return_pos=True,
         )
+
+    def transform_sequence(self, seq, **_):
+        """ Transforms a single precomputed, full depth sequence, as it would be returned for the underlying voxels. """
+        val, dep, pos = seq
+        num_tokens = np.searchsorted(dep, math.log2(self.resolution), side='right')
+        return val[:num_tokens], dep[:num_tokens], pos[:num_tokens]
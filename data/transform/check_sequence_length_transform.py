@@ -1,4 +1,9 @@
+import numpy as np
+
+
 class CheckSequenceLenghtTransform():
+    # the transform returns always the same output for the same input
+    deterministic = True
 
     # TODO: make this maps actually properties of the embedding class or decouple them from this module
     _substitution_level_map = {
@@ -48,38 +53,36 @@ class CheckSequenceLenghtTransform():
         self.convolution_factor = self._convolution_factor_map[embedding[0]]
         self.substitution_level = self._substitution_level_map[embedding[0]]
 
-    def check_single_embedding(self, val, dep, pos):
-        """ Check the embedded sequence length given a single token embedding module. """
-        # Note: substitution is not valid for a single token embedding
-        sequence_length = len(val) // self.convolution_factor
-        if sequence_length > self.num_positions:
-            return None
-        else:
-            return val, dep, pos
+    def sequence_length(self, layer_tokens):
+        """ Computes the embedded sequence length from the number of tokens of each depth layer.
 
-    def check_composite_embedding(self, val, dep, pos):
-        """ Check the embedded sequence length given a composite token embedding with multiple modules. """
-        sum_sequence_length = 0
-        max_depth = max(dep)
-        for i in range(min(len(self.substitution_level), max_depth)):
-            sub_diff = self.substitution_level[i]
-            conv_fac = self.convolution_factor[i]
-            dep_level = i + 1 - sub_diff
+        Args:
+            layer_tokens: Number of tokens of each depth layer, starting with depth 1.
 
-            sum_sequence_length += len(dep[dep == dep_level]) // conv_fac
+        Return:
+            Length of the sequence after the token embedding.
+        """
+        if type(self.convolution_factor) is not list:
+            # Note: substitution is not valid for a single token embedding
+            return int(np.sum(layer_tokens)) // self.convolution_factor
 
-        if sum_sequence_length > self.num_positions:
-            return None
-        else:
-            return val, dep, pos
+        # composite token embedding with multiple modules
+        sum_sequence_length = 0
+        for i in range(min(len(self.substitution_level), len(layer_tokens))):
+            dep_level = i + 1 - self.substitution_level[i]
+            sum_sequence_length += int(layer_tokens[dep_level - 1]) // self.convolution_factor[i]
+        return sum_sequence_length
 
     def __call__(self, seq, **_):
-        """ Transforms a single sample to trinary representation. """
+        """ Returns the sequence, if its embedded length is within the limit, otherwise `None`. """
         if self.num_positions <= 0:
             return seq  # no maximum sequence length for the Transformer
 
-        val, dep, pos = seq
-        if type(self.convolution_factor) is list:
-            return self.check_composite_embedding(val, dep, pos)
-        else:
-            return self.check_single_embedding(val, dep, pos)
+        _, dep, _ = seq
+        if self.sequence_length(np.bincount(dep)[1:]) > self.num_positions:
+            return None
+        return seq
+
+    def transform_sequence(self, seq, **_):
+        """ Checks a single precomputed sequence. The transform does not depend on the underlying voxels. """
+        return self(seq)
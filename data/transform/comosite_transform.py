@@ -1,10 +1,43 @@
+from data.profiler import count, record
+
+
 class CompositeTransform():
     def __init__(self, transforms, **_):
         """ Compose multiple data transforms sequentially. """
         self.transforms = transforms
+        # the last input was rejected by a transform, which would reject it with any random augmentation
+        self.rejected = False
+
+    @property
+    def deterministic(self):
+        """ Returns true, if all transforms return always the same output for the same input. """
+        return all(getattr(transform, 'deterministic', False) for transform in self.transforms)
 
-    def __call__(self, data, **_):
-        """ Call each transform separately. """
+    @property
+    def uses_layer_tokens(self):
+        """ Returns true, if any transform uses the precomputed number of tokens of each depth layer. """
+        return any(getattr(transform, 'uses_layer_tokens', False) for transform in self.transforms)
+
+    def __call__(self, data, **kwargs):
+        """ Call each transform separately. Additional arguments, e.g. `layer_tokens`, are passed to each transform. """
+        self.rejected = False
         for transform in self.transforms:
-            data = transform(data)
+            name = type(transform).__name__
+            with record('transform/' + name):
+                data = transform(data, **kwargs)
+            if data is None:
+                count('rejected/' + name)
+                self.rejected = getattr(transform, 'rejected', False)
+                return None
         return data
+
+    def transform_sequence(self, seq, **_):
+        """ Call each deterministic transform separately on a single precomputed, full depth sequence. """
+        for transform in self.transforms:
+            name = type(transform).__name__
+            with record('transform/' + name):
+                seq = transform.transform_sequence(seq)
+            if seq is None:
+                count('rejected/' + name)
+                return None
+        return seq
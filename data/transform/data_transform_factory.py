@@ -1,6 +1,7 @@
 from .basic_transform import BasicTransform
 from .comosite_transform import CompositeTransform
 from .scaling_transform import AxisScalingTransform
+from .length_aware_scaling_transform import LengthAwareScalingTransform
 from .piecewise_warping_transform import PiecewiseLinearWarpingTransform
 from .quick_linearisation_transform import QuickLinearisationTransform
 from .check_sequence_length_transform import CheckSequenceLenghtTransform
@@ -20,6 +21,8 @@ def _create_data_transform(name, spatial_dim, resolution, position_encoding, num
         return BasicTransform(position_encoding, resolution)
     elif name == 'scaling':
         return AxisScalingTransform()
+    elif name == 'length_aware_scaling':
+        return LengthAwareScalingTransform(num_positions, embedding, resolution)
     elif name == 'warping':
         return PiecewiseLinearWarpingTransform()
     elif name in ('linear_max_res', 'quick_linear', 'linear'):
@@ -0,0 +1,126 @@
+import math
+import numpy as np
+
+from data.profiler import count
+from utils import AXIS_SCALING_RANGE, axis_scaling, layer_token_counts, random_axis_scales
+from .check_sequence_length_transform import CheckSequenceLenghtTransform
+
+
+def predict_layer_tokens(layer_tokens, scales):
+    """ Predicts the number of tokens of each depth layer after a scaling of the array axes.
+
+    The number of mixed nodes of a sparse depth layer is proportional to the surface area of the shape, which scales
+    with the mean of the products of all but one scaling factor. Nodes of densely occupied coarse layers are large
+    compared to the shape, thus the area factor of each layer is weighted by the share of empty nodes of the layer, e.g.
+    a complete layer does not shrink. Each layer holds at most the nodes of a complete layer.
+
+    Args:
+        layer_tokens: Number of tokens of each depth layer of the unscaled array, starting with depth 1.
+        scales: Scaling factor of each axis.
+
+    Return:
+        Predicted number of tokens of each depth layer of the scaled array.
+    """
+    scales = np.asarray(scales, dtype=np.float64)
+    layer_tokens = np.asarray(layer_tokens, dtype=np.float64)
+    area_factor = np.prod(scales) * np.mean(1.0 / scales)
+    max_tokens = (2**len(scales))**np.arange(1, len(layer_tokens) + 1, dtype=np.float64)
+
+    layer_factor = area_factor**(1.0 - layer_tokens / max_tokens)
+    predicted = np.minimum(np.ceil(layer_tokens * layer_factor), max_tokens)
+    predicted[:1] = layer_tokens[:1]  # the first layer holds always all children of the root
+    return predicted.astype(np.int64)
+
+
+class LengthAwareScalingTransform():
+    # the transform returns a randomly augmented output
+    deterministic = False
+    # the transform uses the precomputed number of tokens of each depth layer of the unscaled sample
+    uses_layer_tokens = True
+
+    def __init__(self, num_positions, embedding, resolution, **_):
+        """ Scales input data for each axis in the range of [0.75 .. 1.25], such that the embedded sequence length
+        of the scaled data stays within the token limit.
+
+        The sequence length after scaling is predicted from the number of tokens of each depth layer of the unscaled
+        data, before any voxel is transformed. Random scales, which would exceed the limit, are shrunk uniformly and
+        the exact sequence length of the shrunk output is checked. Data, which is predicted to exceed the limit even
+        with the smallest scaling or whose shrunk output exceeds the limit, is scaled with the smallest scaling. Data,
+        which exceeds the limit also then, is rejected and `rejected` is set, as retries with other random scales would
+        not fit either. As the prediction of unshrunk scales is an estimate, the transform should still be followed by
+        the 'check_len' transform.
+
+        Args:
+            num_positions: Maximal length of processed input tokens for the shape transformer.
+            embedding: Defines the used token embedding of the shape transformer.
+            resolution: Maximum resolution of the linearised data.
+        """
+        self.num_positions = num_positions
+        self.max_depth = int(math.log2(resolution))
+        self.check_len = CheckSequenceLenghtTransform(num_positions, embedding)
+        # the last input was rejected, as it exceeds the limit with any scaling
+        self.rejected = False
+
+    def predict_length(self, layer_tokens, scales):
+        """ Predicts the embedded sequence length of the data after a scaling of the array axes. """
+        return self.check_len.sequence_length(predict_layer_tokens(layer_tokens, scales))
+
+    def exact_length(self, voxels):
+        """ Computes the exact embedded sequence length of the data, without linearising it. """
+        return self.check_len.sequence_length(layer_token_counts(voxels)[:self.max_depth])
+
+    def min_scaling(self, voxels):
+        """ Scales the data with the smallest scaling, if its exact sequence length is within the limit.
+
+        Return:
+            Scaled array or `None`, if the data exceeds the limit with any scaling.
+        """
+        output = axis_scaling(voxels, np.full(voxels.ndim, AXIS_SCALING_RANGE[0]))
+        if self.exact_length(output) > self.num_positions:
+            self.rejected = True
+            return None
+        count('min_scaled/' + type(self).__name__)
+        return output
+
+    def __call__(self, voxels, layer_tokens=None, **_):
+        """ Perform a length-aware scaling of the input.
+
+        Args:
+            voxels: Input array containing pixels/voxels.
+            layer_tokens: Precomputed number of tokens of each depth layer of the input. Computed from the input, if
+                `None`.
+
+        Return:
+            Scaled array or `None`, if the data cannot be scaled within the token limit.
+        """
+        self.rejected = False
+        scales = random_axis_scales(voxels.ndim)
+        if self.num_positions <= 0:
+            return axis_scaling(voxels, scales)  # no maximum sequence length for the Transformer
+
+        if layer_tokens is None:
+            layer_tokens = layer_token_counts(voxels)
+        layer_tokens = layer_tokens[:self.max_depth]
+
+        # check the exact length of data, which is predicted to exceed the limit even with the smallest scaling
+        min_scale = AXIS_SCALING_RANGE[0]
+        if self.predict_length(layer_tokens, np.full(voxels.ndim, min_scale)) > self.num_positions:
+            return self.min_scaling(voxels)
+        if self.predict_length(layer_tokens, scales) <= self.num_positions:
+            return axis_scaling(voxels, scales)
+
+        # shrink all scales uniformly with a bisection, until the predicted length is within the limit
+        lo, hi = min_scale / np.max(scales), 1.0
+        for _ in range(10):
+            mid = (lo + hi) / 2
+            if self.predict_length(layer_tokens, np.maximum(mid * scales, min_scale)) <= self.num_positions:
+                lo = mid
+            else:
+                hi = mid
+        count('rescaled/' + type(self).__name__)
+
+        # the shrunk scales are close to the limit, thus the exact length is checked
+        output = axis_scaling(voxels, np.maximum(lo * scales, min_scale))
+        if self.exact_length(output) > self.num_positions:
+            return self.min_scaling(voxels)
+        return output
@@ -1,7 +1,12 @@
+import math
+import numpy as np
 from utils import quick_linearise
 
 
 class QuickLinearisationTransform():
+    # the transform returns always the same output for the same input
+    deterministic = True
+
     def __init__(self, pos_encoding, resolution, **_):
         """Transforms voxel data into value, depth and position sequences.
 
@@ -15,3 +20,9 @@ class QuickLinearisationTransform():
     def __call__(self, voxels, **_):
         """ Perform linearisation of voxels. """
         return quick_linearise(voxels, self.pos_enc, self.max_res)
+
+    def transform_sequence(self, seq, **_):
+        """ Transforms a single precomputed, full depth sequence, as it would be returned for the underlying voxels. """
+        val, dep, pos = seq
+        num_tokens = np.searchsorted(dep, int(math.log2(self.max_res)), side='right')
+        return val[:num_tokens], dep[:num_tokens], pos[:num_tokens]
@@ -2,6 +2,9 @@ from utils import axis_scaling
 
 
 class AxisScalingTransform():
+    # the transform returns a randomly augmented output
+    deterministic = False
+
     def __init__(self, **_):
         """Scales input data for each axis in the range of [0.75 .. 1.25] independently. """
 
@@ -1,9 +1,11 @@
 from executable.train import train
 from executable.test import test
 from executable.sample import sample
+from executable.preprocess import preprocess
 
 __all__ = [
     "train",
     "test",
     "sample",
+    "preprocess",
 ]
@@ -0,0 +1,16 @@
+from data import preprocess_shapenet
+
+
+def preprocess(config):
+    """ Linearises the voxelized ShapeNet dataset once for each given resolution and stores the sequences in a packed
+    cache, which can be used for training with the dataset 'shapenet_cached'.
+    """
+    for resolution in config['resolution']:
+        path = preprocess_shapenet(
+            source=config['source'],
+            root=config['datapath'],
+            resolution=resolution,
+            position_encoding=config['position_encoding'],
+            num_workers=config['num_workers'],
+        )
+        print(f"Stored sequence cache in: {path}")
@@ -48,6 +48,12 @@ def train(config):
         datapath=config['datapath'],
         position_encoding=config['position_encoding'],
         num_positions=config['num_positions'],
+        bucketing=config.get('bucketing', False),
+        max_tokens=config.get('max_tokens', None),
+        packed_sequences=config.get('packed_sequences', False),
+        token_encoding=config.get('token_encoding', 'basic'),
+        head_pos_encoding=config.get('head_pos_encoding', 'None'),
+        profile=config.get('profile_data', False),
     )
 
     # setup tensorboard logging
@@ -90,6 +96,8 @@ def train(config):
         gradient_clip_val=1.0,
         log_gpu_memory='min_max' if config['log_gpu'] else None,
         weights_summary='full',
+        # the bucket batch sampler distributes batches itself
+        replace_sampler_ddp=not config.get('bucketing', False),
     )
 
     train_steps = compute_train_steps(
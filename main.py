@@ -1,5 +1,5 @@
 from argparse import ArgumentParser
-from executable import train, test, sample
+from executable import train, test, sample, preprocess
 
 if __name__ == "__main__":
     """ Parses the console input and calls one of the executable functions.
@@ -9,6 +9,7 @@ if __name__ == "__main__":
             Allows to override the default config file arguments with command line arguments.
         test: not supported, yet.
         sample: not supported, yet.
+        preprocess: Linearises the voxelized ShapeNet dataset once and stores the sequences in a packed cache.
 
     TODO: test - Tests the loss of the given checkpoint on the test data set.
     TODO: sample - Samples a number of sequences on the given checkpoint and creates an image with the results.
@@ -47,6 +48,9 @@ if __name__ == "__main__":
     parser_train.add_argument("--epochs", type=int, default=None)
     parser_train.add_argument("--warmup_steps", default=None)
     parser_train.add_argument("--batch_size", type=int, default=None)
+    parser_train.add_argument("--bucketing", type=str, default=None)
+    parser_train.add_argument("--max_tokens", type=int, default=None)
+    parser_train.add_argument("--packed_sequences", type=str, default=None)
     parser_train.add_argument("--accumulate_grad_batches", type=int, default=None)
     parser_train.add_argument("--learning_rate", type=float, default=None)
     # hardware
@@ -57,6 +61,7 @@ if __name__ == "__main__":
     parser_train.add_argument("--log_gradient", type=str, default=None)
     parser_train.add_argument("--log_weights_and_biases", type=str, default=None)
     parser_train.add_argument("--log_learning_rate", type=str, default=None)
+    parser_train.add_argument("--profile_data", type=str, default=None)
 
     # TESTING
     parser_test = subparsers.add_parser("test")
@@ -67,5 +72,14 @@ if __name__ == "__main__":
     parser_sample = subparsers.add_parser("sample")
     parser_sample.set_defaults(func=sample)
 
+    # PREPROCESSING
+    parser_preprocess = subparsers.add_parser("preprocess")
+    parser_preprocess.set_defaults(func=preprocess)
+    parser_preprocess.add_argument("--source", type=str, default='/clusterarchive/ShapeNet/voxelization')
+    parser_preprocess.add_argument("--datapath", type=str, default='datasets')
+    parser_preprocess.add_argument("--resolution", type=int, nargs='+', default=[32])
+    parser_preprocess.add_argument("--position_encoding", type=str, default='centered')
+    parser_preprocess.add_argument("--num_workers", type=int, default=8)
+
     args = parser.parse_args()
     args.func(vars(args))
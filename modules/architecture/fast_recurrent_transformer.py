@@ -3,6 +3,8 @@ import torch.nn as nn
 
 from fast_transformers.builders import RecurrentEncoderBuilder
 
+from ..utils import gather_tokens
+
 
 class FastRecurrentTransformer(nn.Module):
     def __init__(
@@ -125,6 +127,24 @@ class FastRecurrentTransformer(nn.Module):
         # shift sequence by one token to right to predict tokens autoregressively
         return self._prepend_sos_token(input_seq, cls)  # [N, L, E]
 
+    def block_embedding(self, x, index, valid):
+        """ Embeds a single block of tokens of the last depth layer, e.g. the previously sampled block.
+
+        Only the tokens of the block and the tokens, which they look ahead to, are encoded and reduced by the embedding
+        of the last depth layer, instead of the whole octree sequence.
+
+        Args:
+            x: Octree sequence ([N, L], [N, L], [N, L, A]).
+            index: Index of the tokens of the block, together with its context tokens in preceding layers [N, S].
+            valid: Marks tokens of `index`, which belong to the block. All other tokens are padding [N, S].
+
+        Returns:
+            Embedded block token [N, E].
+        """
+        encoding = self.embedding[0].embedding.gather(*x, index, valid)  # [N, S, E]
+        block = [encoding] + [gather_tokens(s, index, valid) for s in x]
+        return self.embedding[0].reduce_block(*block, int(torch.max(x[1])))[:, 0]  # [N, E]
+
     def transformer_module(self, x, state):
         """ Performs a single Transformer module operation on the given input
 
@@ -145,4 +165,18 @@ class FastRecurrentTransformer(nn.Module):
         Returns:
             Logits for each output token.
         """
-        return self.head[0](x, *seq, last_only)  # [N, L, V]
+        return self.head[0](x, *seq, last_only=last_only)  # [N, L, V]
+
+    def sample_block(self, x, seq, sample_fn, length=None):
+        """ Samples the value tokens of a single block of the last depth layer with a single pass of the head.
+
+        Args:
+            x: Output token of the block [N, 1, E].
+            seq: Block of the octree sequence, together with its context tokens in preceding layers.
+            sample_fn: Function, which samples the next token of each sample [N] from its logits [N, V].
+            length: Number of tokens of each sample, which are not padding [N]. Optional.
+
+        Returns:
+            Sampled value tokens of the last layer of the block [N, T].
+        """
+        return self.head[0].sample(x, *seq, sample_fn, length)
@@ -4,6 +4,8 @@ import torch.nn as nn
 from fast_transformers.builders import TransformerEncoderBuilder
 from fast_transformers.masking import TriangularCausalMask, FullMask
 
+from ..utils import cached_embedding, cached_encoder, reduce_cu_seqlens, shift_packed_sequence, start_tokens
+
 
 class FastTransformer(nn.Module):
     def __init__(
@@ -86,13 +88,15 @@ class FastTransformer(nn.Module):
         """ Transposes the first and second dimension of the input tensor. """
         return torch.transpose(x, 0, 1)
 
-    def forward(self, sequence, cls):
+    def forward(self, sequence, cls, cu_seqlens=None):
         """ Performs a transformer forward pass of the sequence through embedding, transformer and generative head.
 
         Args:
             sequence: List containing input sequences, where each element is a tuple of (value, depth, position)
                 sequence layer for the transformer with the shape ([N, L], [N, L], [N, L, A]), respectively.
             cls: class label, optional if `num_classes` <= 1.
+            cu_seqlens: Cumulative lengths of packed sequences - [N + 1]. If given, `sequence` holds all sequences of
+                the batch packed into one sequence without padding ([1, L], [1, L], [1, L, A]).
 
         Return:
             Logits which describe the autoregressive likelihood of the next target token, with shape [N, T, V].
@@ -102,6 +106,9 @@ class FastTransformer(nn.Module):
         # embed sequence tokens, get input sequence
         input_seq = self.embedding[0](*seq)  # [N, L, E]
 
+        if cu_seqlens is not None:
+            return self._forward_packed(input_seq, seq, cls, cu_seqlens)  # [1, L, V]
+
         # shift sequence by one token to right to predict tokens autoregressively
         input_seq = self._prepend_sos_token(input_seq, cls)  # [N, L, E]
 
@@ -115,6 +122,40 @@ class FastTransformer(nn.Module):
         # return logits
         return self.head[0](output_seq, *seq)  # [N, L, V]
 
-    def compute_logits(self, seq_layer, memory, idx, cls):
-        """ Alias for 'forward' to make this module compatible to old sampling pipeline. """
-        return self.forward([seq_layer], cls)
+    def _forward_packed(self, input_seq, seq, cls, cu_seqlens):
+        """ Performs the transformer pass of embedded packed sequences without attending across sequence borders. """
+        cu_seqlens = reduce_cu_seqlens(cu_seqlens, seq[0].shape[1], input_seq.shape[1])
+
+        # shift each packed sequence by one token to right to predict tokens autoregressively
+        input_seq = shift_packed_sequence(input_seq, start_tokens(self, cls, len(cu_seqlens) - 1), cu_seqlens)
+
+        # process each packed sequence on its own by the Transformer stack, get output sequence
+        padding_mask = self.embedding[0].padding_mask()  # [1, L]
+        output_seq = torch.cat([
+            self.transformer(
+                x=input_seq[:, start:end],  # [1, L_i, E]
+                attn_mask=TriangularCausalMask(end - start, device=input_seq.device),  # [L_i, L_i]
+                length_mask=FullMask(mask=padding_mask[:, start:end] == 0, device=input_seq.device),  # [1, L_i]
+            ) for start, end in zip(cu_seqlens[:-1].tolist(), cu_seqlens[1:].tolist())
+        ], dim=1)  # [1, L, E]
+
+        # return logits
+        return self.head[0](output_seq, *seq)  # [1, L, V]
+
+    def compute_logits(self, seq_layer, memory, idx, cls, cache=None):
+        """ Alias for 'forward' to make this module compatible to old sampling pipeline.
+
+        If a `DecodingCache` is given, the transformer processes only tokens, which changed since the previous call with
+        the same cache, and reuses the keys and values of all other tokens.
+        """
+        if cache is None:
+            return self.forward([seq_layer], cls)
+
+        # embed sequence tokens and shift sequence by one token to right
+        input_seq = self._prepend_sos_token(cached_embedding(self.embedding[0], seq_layer, cache), cls)  # [N, L, E]
+
+        # process changed tokens by the Transformer stack, get output sequence
+        output_seq = cached_encoder(self.transformer, input_seq, cache, self.embedding[0].padding_mask())  # [N, L, E]
+
+        # return logits
+        return self.head[0](output_seq, *seq_layer)  # [N, L, V]
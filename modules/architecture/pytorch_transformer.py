@@ -2,6 +2,14 @@ import torch
 import torch.nn as nn
 
 from utils.masks import look_ahead_mask
+from ..utils import (
+    cached_embedding,
+    cached_encoder,
+    packed_encoder,
+    reduce_cu_seqlens,
+    shift_packed_sequence,
+    start_tokens,
+)
 
 
 class PytorchTransformer(nn.Module):
@@ -88,13 +96,15 @@ class PytorchTransformer(nn.Module):
         """ Transposes the first and second dimension of the input tensor. """
         return torch.transpose(x, 0, 1)
 
-    def forward(self, sequence, cls):
+    def forward(self, sequence, cls, cu_seqlens=None):
         """ Performs a transformer forward pass of the sequence through embedding, transformer and generative head.
 
         Args:
             sequence: List containing input sequences, where each element is a tuple of (value, depth, position)
                 sequence layer for the transformer with the shape ([N, L], [N, L], [N, L, A]), respectively.
             cls: class label, optional if `num_classes` <= 1.
+            cu_seqlens: Cumulative lengths of packed sequences - [N + 1]. If given, `sequence` holds all sequences of
+                the batch packed into one sequence without padding ([1, L], [1, L], [1, L, A]).
 
         Return:
             Logits which describe the autoregressive likelihood of the next target token, with shape [N, T, V].
@@ -104,6 +114,9 @@ class PytorchTransformer(nn.Module):
         # embed sequence tokens, get input sequence
         input_seq = self.embedding[0](*seq)  # [N, L, E]
 
+        if cu_seqlens is not None:
+            return self._forward_packed(input_seq, seq, cls, cu_seqlens)  # [1, L, V]
+
         # shift sequence by one token to right to predict tokens autoregressively
         input_seq = self._prepend_sos_token(input_seq, cls)  # [N, L, E]
 
@@ -118,6 +131,33 @@ class PytorchTransformer(nn.Module):
         # return logits
         return self.head[0](output_seq, *seq)  # [N, L, V]
 
-    def compute_logits(self, seq_layer, memory, idx, cls):
-        """ Alias for 'forward' to make this module compatible to old sampling pipeline. """
-        return self.forward([seq_layer], cls)
+    def _forward_packed(self, input_seq, seq, cls, cu_seqlens):
+        """ Performs the transformer pass of embedded packed sequences without attending across sequence borders. """
+        cu_seqlens = reduce_cu_seqlens(cu_seqlens, seq[0].shape[1], input_seq.shape[1])
+
+        # shift each packed sequence by one token to right to predict tokens autoregressively
+        input_seq = shift_packed_sequence(input_seq, start_tokens(self, cls, len(cu_seqlens) - 1), cu_seqlens)
+
+        # process input sequence by the Transformer stack, get output sequence
+        output_seq = packed_encoder(self.transformer, input_seq, cu_seqlens, self.embedding[0].padding_mask())
+
+        # return logits
+        return self.head[0](output_seq, *seq)  # [1, L, V]
+
+    def compute_logits(self, seq_layer, memory, idx, cls, cache=None):
+        """ Alias for 'forward' to make this module compatible to old sampling pipeline.
+
+        If a `DecodingCache` is given, the transformer processes only tokens, which changed since the previous call with
+        the same cache, and reuses the keys and values of all other tokens.
+        """
+        if cache is None:
+            return self.forward([seq_layer], cls)
+
+        # embed sequence tokens and shift sequence by one token to right
+        input_seq = self._prepend_sos_token(cached_embedding(self.embedding[0], seq_layer, cache), cls)  # [N, L, E]
+
+        # process changed tokens by the Transformer stack, get output sequence
+        output_seq = cached_encoder(self.transformer, input_seq, cache, self.embedding[0].padding_mask())  # [N, L, E]
+
+        # return logits
+        return self.head[0](output_seq, *seq_layer)  # [N, L, V]
@@ -2,6 +2,14 @@ import torch
 import torch.nn as nn
 
 from utils.masks import look_ahead_mask, full_mask
+from ..utils import (
+    cached_embedding,
+    cached_encoder,
+    packed_encoder,
+    reduce_cu_seqlens,
+    shift_packed_sequence,
+    start_tokens,
+)
 
 
 class Transformer(nn.Module):
@@ -104,11 +112,17 @@ class Transformer(nn.Module):
         sos = torch.ones(batch_size, 1, self.embed_dim, device=x.device) * self.sos  # [N, 1, E]
         return torch.cat([sos, x[:, :-1]], axis=1)  # [N, S, E]
 
+    def _shift_sequence(self, seq, cls):
+        """ Shifts given sequence one token to right and pads with the class or start of sequence token. """
+        if self.cls_conditional:
+            return torch.cat([self.cls_embedding(cls).unsqueeze(1), seq[:, :-1]], dim=1)
+        return self._prepend_sos_token(seq)
+
     def _transpose(self, x):
         """ Transposes the first and second dimension of the input tensor. """
         return torch.transpose(x, 0, 1)
 
-    def process(self, seq, memory, padding_mask, layer_idx, is_final, cls):
+    def process(self, seq, memory, padding_mask, layer_idx, is_final, cls, cu_seqlens=None):
         """ Performs computations in the decoder part of the transformer.
 
         It embeds the target token sequence into the embedding space of the decoder and creates an upper triangular
@@ -121,19 +135,23 @@ class Transformer(nn.Module):
             layer_idx: Defines which transformer layer should be used.
             is_final: Defines if the current layer is final, e.g. if the transformer should be 'autoregressive'.
             cls: class label for conditional generation.
+            cu_seqlens: Cumulative lengths of packed sequences - [N + 1]. If given, `seq` holds all sequences of the
+                batch packed into a single sequence - [1, L, E]. Only supported by the encoder.
 
         Return:
             The output of the last layer of the decoder in latent decoder space - [N, L, E].
         """
+        if cu_seqlens is not None:  # packed sequences without padding
+            if is_final:
+                seq = shift_packed_sequence(seq, start_tokens(self, cls, len(cu_seqlens) - 1), cu_seqlens)  # [1, L, E]
+            return packed_encoder(self.emd_transformer[0], seq, cu_seqlens, padding_mask, causal=is_final)
+
         # create attention mask
         seq_len = seq.shape[1]
         if is_final:  # attention mask is autoregressive in the final layer
             attn_mask = look_ahead_mask(seq_len, device=seq.device)  # [L, L]
             # shift sequence by one token to right to predict tokens autoregressively
-            if self.cls_conditional:
-                seq = torch.cat([self.cls_embedding(cls).unsqueeze(1), seq[:, :-1]], dim=1)
-            else:
-                seq = self._prepend_sos_token(seq)  # [N, L, E]
+            seq = self._shift_sequence(seq, cls)  # [N, L, E]
         else:  # otherwise we allow access to all tokens
             attn_mask = full_mask(seq_len, device=seq.device)  # [L, L]
 
@@ -154,12 +172,15 @@ class Transformer(nn.Module):
 
         return self._transpose(out)  # [N, S/T, E]
 
-    def forward(self, sequence, cls):
+    def forward(self, sequence, cls, cu_seqlens=None):
         """ Performs a full transformer pass of the input sequence through embedding, transformer and generative head.
 
         Args:
             sequence: List containing input sequences, where each element is a tuple of (value, depth, position)
                 sequence layer for the transformer with the shape ([N, L], [N, L], [N, L, A]), respectively.
+            cls: class label for conditional generation.
+            cu_seqlens: Cumulative lengths of packed sequences - [N + 1]. If given, `sequence` holds a single layer
+                with all sequences of the batch packed into one sequence ([1, L], [1, L], [1, L, A]).
 
         Return:
             Logits which describe the autoregressive likelihood of the next target token, with shape [N, T, V].
@@ -172,9 +193,9 @@ class Transformer(nn.Module):
             if idx < seq_len - 1:  # intermediate layer
                 memory = self.compute_memory(seq_layer, memory, idx, False, cls)  # [N, L, E]
             else:  # only final layer
-                return self.compute_logits(seq_layer, memory, idx, cls)  # [N, T, V]
+                return self.compute_logits(seq_layer, memory, idx, cls, cu_seqlens)  # [N, T, V]
 
-    def compute_memory(self, seq_layer, memory, idx, is_final, cls):
+    def compute_memory(self, seq_layer, memory, idx, is_final, cls, cu_seqlens=None):
         """ Computes the output of the corresponding transformer layer, without processing the corresponding head.
 
         Args:
@@ -186,6 +207,7 @@ class Transformer(nn.Module):
             is_final: Defines the used mask. True - uses an autoregressive mask, False - each token can access each
                 other token.
             cls: class label for conditional generation.
+            cu_seqlens: Cumulative lengths of packed token sequences - [N + 1], optional.
 
         Return:
             Memory latent vector of the selecter transformer layer with the shape [N, L, E].
@@ -194,10 +216,14 @@ class Transformer(nn.Module):
         emb = self.embedding[idx](*seq_layer)  # [N, L, E]
         seq_mask = self.embedding[idx].padding_mask()  # [N, L]
 
+        # map packed sequence borders onto the embedded sequence
+        if cu_seqlens is not None:
+            cu_seqlens = reduce_cu_seqlens(cu_seqlens, seq_layer[0].shape[1], emb.shape[1])
+
         # compute memory / process sequence
-        return self.process(emb, memory, seq_mask, idx, is_final, cls)  # [N, L, E]
+        return self.process(emb, memory, seq_mask, idx, is_final, cls, cu_seqlens)  # [N, L, E]
 
-    def compute_logits(self, seq_layer, memory, idx, cls):
+    def compute_logits(self, seq_layer, memory, idx, cls, cu_seqlens=None, cache=None):
         """ Performs a full pass of a single transformer layer to computes the logits of given sequence.
 
         Each token can access previous tokens in `seq_layer` only autoregressivelly. All tokens of the `memory`
@@ -210,12 +236,36 @@ class Transformer(nn.Module):
                 `idx` is 0.
             idx: Index of the transformer layer.
             cls: class label for conditional generation.
+            cu_seqlens: Cumulative lengths of packed token sequences - [N + 1], optional.
+            cache: Instance of `DecodingCache`. If given, the transformer layer processes only tokens, which changed
+                since the previous call with the same cache, and reuses the keys and values of all other tokens.
 
         Return
             Logits of the given layer token sequence with the shape [N, L, V]
         """
+        if cache is not None:
+            return self._compute_logits_cached(seq_layer, memory, idx, cls, cache)  # [N, T, V]
+
         # compute memory
-        memory = self.compute_memory(seq_layer, memory, idx, True, cls)  # [N, L, E]
+        memory = self.compute_memory(seq_layer, memory, idx, True, cls, cu_seqlens)  # [N, L, E]
 
         # return logits
         return self.head[idx](memory, *seq_layer)  # [N, T, V]
+
+    def _compute_logits_cached(self, seq_layer, memory, idx, cls, cache):
+        """ Computes the logits of given sequence incrementally with a `DecodingCache`, see `compute_logits`. """
+        # embed sequence tokens and shift sequence by one token to right
+        emb = cached_embedding(self.embedding[idx], seq_layer, cache)  # [N, L, E]
+        seq = self._shift_sequence(emb, cls)  # [N, L, E]
+
+        # process changed tokens by the transformer layer
+        out = cached_encoder(
+            self.emd_transformer[idx],
+            seq,
+            cache,
+            padding_mask=self.embedding[idx].padding_mask(),  # [N, L]
+            memory=memory if idx > 0 else None,  # [N, M, E]
+        )  # [N, L, E]
+
+        # return logits
+        return self.head[idx](out, *seq_layer)  # [N, T, V]
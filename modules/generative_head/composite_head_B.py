@@ -1,7 +1,6 @@
-import torch
 import torch.nn as nn
-from torch.nn.utils.rnn import pad_sequence
 
+from .composite_utils import composite_forward, composite_sample
 from .convolution_head import ConvolutionHead
 from .linear_head import LinearHead
 from .substitution_head import SubstitutionHead
@@ -47,6 +46,8 @@ class CompositeHeadB(nn.Module):
 
         # embeddings
         self.heads = nn.ModuleList(modules)
+        # number of preceding layers, which are passed together with each layer to its head
+        self.num_context = [0, 0, 0, 0, 0, 1, 2, 2][:len(modules)]
 
         self.reduction_factor = {
             1: 1,
@@ -57,7 +58,7 @@ class CompositeHeadB(nn.Module):
             6: 8,  # Note: 'substitution'
         }
 
-    def forward(self, x, value, depth, position, last_only=False):
+    def forward(self, x, value, depth, position, index=None, last_only=False):
         """ Transforms the output of the transformer target value logits.
 
         Args:
@@ -65,84 +66,29 @@ class CompositeHeadB(nn.Module):
             value: Target value token sequence [N, T].
             depth: Target depth token sequence [N, T].
             position: Target position token sequence [N, T, A].
+            index: Precomputed `SubstitutionIndex` of all depth layers, e.g. by the collate function. Optional.
             last_only: Flag to switch processing, to decode only last depth layer.
 
         Return
             Logits of target value sequence.
         """
-        batch_depth = torch.max(depth)
-        out = []
+        # compute logits layerwise for the whole batch at once
+        return composite_forward(
+            self.heads, self.num_context, self.reduction_factor, x, value, depth, position, index, last_only
+        )
 
-        # process each sample individually
-        for latent_vec, val, dep, pos in zip(x, value, depth, position):
-            logits = torch.tensor([], device=x.device)
-            vector_idx = 0
+    def sample(self, x, value, depth, position, sample_fn, length=None):
+        """ Samples the target value tokens of a single block of the last depth layer autoregressively.
 
-            # compute logits layerwise
-            for layer_idx, head in enumerate(self.heads):
-                layer_depth = layer_idx + 1
-
-                if last_only and layer_depth != batch_depth:
-                    continue  # process only last depth layer
-                if layer_depth > batch_depth:
-                    break  # reached max depth layer
-
-                if layer_depth < 6:
-                    # get value, depth and position sequence of current layer
-                    layer_val = val[dep == layer_depth]
-                    layer_dep = dep[dep == layer_depth]
-                    layer_pos = pos[dep == layer_depth]
-                    # compute number of vectors in latent vector of current layer
-                    num_vectors = torch.sum(dep == layer_depth) // self.reduction_factor[layer_depth]
-                elif layer_depth == 6:  # handle substitution
-                    # get value, depth and position sequence of previous and current layer
-                    layer_val = torch.cat([val[dep == (layer_depth - 1)], val[dep == layer_depth]])
-                    layer_dep = torch.cat([dep[dep == (layer_depth - 1)], dep[dep == layer_depth]])
-                    layer_pos = torch.cat([pos[dep == (layer_depth - 1)], pos[dep == layer_depth]])
-                    # compute number of vectors in latent vector of current layer
-                    num_vectors = torch.sum(dep == (layer_depth - 1)) // self.reduction_factor[layer_depth]
-                elif layer_depth in (7, 8):  # handle substitution
-                    # get value, depth and position sequence of previous and current layer
-                    layer_val = torch.cat(
-                        [
-                            val[dep == (layer_depth - 2)],
-                            val[dep == (layer_depth - 1)],
-                            val[dep == layer_depth],
-                        ]
-                    )
-                    layer_dep = torch.cat(
-                        [
-                            dep[dep == (layer_depth - 2)],
-                            dep[dep == (layer_depth - 1)],
-                            dep[dep == layer_depth],
-                        ]
-                    )
-                    layer_pos = torch.cat(
-                        [
-                            pos[dep == (layer_depth - 2)],
-                            pos[dep == (layer_depth - 1)],
-                            pos[dep == layer_depth],
-                        ]
-                    )
-                    # compute number of vectors in latent vector of current layer
-                    num_vectors = torch.sum(dep == (layer_depth - 2)) // self.reduction_factor[layer_depth]
-
-                # filter latent vector of current layer
-                layer_vec = latent_vec[vector_idx:vector_idx + num_vectors]
-
-                # compute layer logits
-                layer_logits = head(
-                    layer_vec.unsqueeze(0),
-                    layer_val.unsqueeze(0),
-                    layer_dep.unsqueeze(0),
-                    layer_pos.unsqueeze(0),
-                )[0]
-                logits = torch.cat([logits, layer_logits])
-
-                # discard processed tokens
-                vector_idx += num_vectors
-
-            out += [logits]
-
-        # pad embedding sequence
-        return pad_sequence(out, batch_first=True, padding_value=0.0)
+        Args:
+            x: Output of the transformer, the latent vector of the block [N, 1, E].
+            value: Target value token sequence of the block, together with its context layers [N, T].
+            depth: Target depth token sequence of the block, together with its context layers [N, T].
+            position: Target position token sequence of the block, together with its context layers [N, T, A].
+            sample_fn: Function, which samples the next token of each sample [N] from its logits [N, V].
+            length: Number of tokens of each sample, which are not padding [N]. Optional.
+
+        Return:
+            Sampled value tokens of the last layer of the block [N, T'].
+        """
+        return composite_sample(self.heads, x, value, depth, position, sample_fn, length)
@@ -0,0 +1,77 @@
+import torch
+
+from ..utils import gather_windows, layer_windows, scatter_layers
+
+
+def composite_forward(heads, num_context, reduction_factor, x, value, depth, position, index=None, last_only=False):
+    """ Computes the logits of each depth layer with its own head for the whole batch at once.
+
+    The latent vectors of each layer and the target tokens of the layer, together with `num_context` preceding layers,
+    are gathered for all samples into batch-padded tensors. Each head processes its layer once and the logits of all
+    layers are scattered with one index map into the output sequence. The heads get the length of each window, such
+    that look-ahead encodings place the end of sequence token after the window of each sample, as for a single
+    sample. Assumes that the depth layers are stored in ascending order.
+
+    Args:
+        heads: List of generative heads, one for each depth layer starting with depth '1'.
+        num_context: List with the number of preceding depth layers, which are passed to each head.
+        reduction_factor: Dictionary with the number of tokens of the first layer passed to the head of each depth
+            layer, which correspond to one latent vector.
+        x: Output of the transformer, the latent vector [N, T', E].
+        value: Target value token sequence [N, T].
+        depth: Target depth token sequence [N, T].
+        position: Target position token sequence [N, T, A].
+        index: Precomputed `SubstitutionIndex` of all depth layers, which is passed to heads with context layers.
+        last_only: Flag to switch processing, to decode only last depth layer.
+
+    Return:
+        Logits of target value sequence, padded with zeros [N, T, V].
+    """
+    batch_depth = int(torch.max(depth))
+    num_layers = min(len(heads), batch_depth)
+    layers = [num_layers - 1] if last_only else list(range(num_layers))
+
+    # compute the tokens passed to each head, e.g. its layer and preceding context layers
+    layer_len, first_len, window_start, window_len = layer_windows(depth, num_context[:num_layers])
+    factor = torch.tensor([reduction_factor[idx + 1] for idx in layers], device=value.device)
+
+    # compute the latent vectors of each processed layer, which are stored consecutively in `x`
+    num_vectors = torch.div(first_len[:, layers], factor, rounding_mode='floor')  # [N, D]
+    vector_start = torch.cumsum(num_vectors, dim=1) - num_vectors  # [N, D]
+
+    # gather all inputs of all heads at once
+    vectors, = gather_windows((x, ), vector_start, num_vectors)
+    windows = gather_windows((value, depth, position), window_start[:, layers], window_len[:, layers])
+
+    # compute logits of all samples layerwise
+    logits = []
+    for idx, vec, val, dep, pos in zip(layers, vectors, *windows):
+        if num_context[idx] == 0:
+            logits += [heads[idx](vec, val, dep, pos, length=window_len[:, idx])]
+        elif index is not None:
+            logits += [heads[idx](vec, val, dep, pos, index.window(idx - num_context[idx], num_context[idx] + 1))]
+        else:
+            logits += [heads[idx](vec, val, dep, pos)]
+    # each head returns logits for all tokens of its layer, which are covered by latent vectors
+    num_logits = torch.div(layer_len[:, layers], factor, rounding_mode='floor') * factor  # [N, D]
+
+    # scatter logits of all layers into the padded output sequence
+    return scatter_layers(logits, num_logits)[0]
+
+
+def composite_sample(heads, x, value, depth, position, sample_fn, length=None):
+    """ Samples the target value tokens of a single block of the last depth layer with the head of this layer.
+
+    Args:
+        heads: List of generative heads, one for each depth layer starting with depth '1'.
+        x: Output of the transformer, the latent vector of the block [N, 1, E].
+        value: Target value token sequence of the block, together with its preceding context layers [N, T].
+        depth: Target depth token sequence of the block, together with its preceding context layers [N, T].
+        position: Target position token sequence of the block, together with its preceding context layers [N, T, A].
+        sample_fn: Function, which samples the next token of each sample [N] from its logits [N, V].
+        length: Number of tokens of each sample, which are not padding [N]. Optional.
+
+    Return:
+        Sampled value tokens of the last layer of the block [N, T'].
+    """
+    return heads[int(torch.max(depth)) - 1].sample(x, value, depth, position, sample_fn, length)
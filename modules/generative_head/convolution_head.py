@@ -1,6 +1,7 @@
+import torch
 import torch.nn as nn
 
-from ..utils import Deconvolution, Convolution, BlockConvolution, Linear
+from ..utils import Deconvolution, Convolution, BlockConvolution, Linear, block_convolution_step
 
 
 class ConvolutionHead(nn.Module):
@@ -40,7 +41,7 @@ class ConvolutionHead(nn.Module):
         self.spatial_encoding = spatial_encoding
         self.value_embedding = nn.Embedding(num_vocab + 1, head_dim, padding_idx=0)
 
-    def forward(self, x, value, depth, pos):
+    def forward(self, x, value, depth, pos, length=None):
         """ Transforms the output of the transformer target value logits.
 
         Args:
@@ -48,6 +49,7 @@ class ConvolutionHead(nn.Module):
             value: Target value token sequence [N, T].
             depth: Target depth token sequence [N, T].
             pos: Target position token sequence [N, T, A].
+            length: Number of tokens of each sample, which are not padding [N]. Optional.
 
         Return
             Logits of target value sequence.
@@ -58,10 +60,47 @@ class ConvolutionHead(nn.Module):
         emb = self.value_embedding(value)
         # add spatial decoding if available
         if self.spatial_encoding is not None:
-            emb = emb + self.spatial_encoding(pos)
+            emb = emb + self.spatial_encoding(pos, length)
         emb = self.convolution(emb[:, :x.shape[1]])
 
         x = x + emb
 
         # compute logits for each token
         return self.linear(x)  # [N, T, V]
+
+    def sample(self, x, value, depth, pos, sample_fn, length=None):
+        """ Samples the target value tokens of a single block autoregressively with a single pass of the head.
+
+        The latent vector is deconvoluted once for the whole block. The block convolution of each token reuses the
+        intermediate activations of all previously sampled tokens of the block.
+
+        Args:
+            x: Output of the transformer, the latent vector of the block [N, 1, E].
+            value: Target value token sequence of the block [N, T].
+            depth: Target depth token sequence of the block [N, T].
+            pos: Target position token sequence of the block [N, T, A].
+            sample_fn: Function, which samples the next token of each sample [N] from its logits [N, V].
+            length: Number of tokens of each sample, which are not padding [N]. Optional.
+
+        Return:
+            Sampled value tokens of the block [N, T'].
+        """
+        # deconvolute the latent space - create new tokens
+        x = self.deconvolution(x)  # [N, T', E]
+
+        # add spatial decoding if available
+        spatial = self.spatial_encoding(pos, length)[:, :x.shape[1]] if self.spatial_encoding is not None else None
+
+        tokens = value.new_zeros(x.shape[:2])  # [N, T']
+        emb = torch.zeros_like(x)  # [N, T', E]
+        buffers = []
+        for idx in range(x.shape[1]):
+            # compute logits of the current token from the embeddings of all previously sampled tokens
+            y = x[:, idx] + block_convolution_step(self.convolution, emb, buffers, idx)
+            tokens[:, idx] = sample_fn(self.linear(y))
+
+            emb[:, idx] = self.value_embedding(tokens[:, idx])
+            if spatial is not None:
+                emb[:, idx] = emb[:, idx] + spatial[:, idx]
+
+        return tokens
@@ -1,7 +1,8 @@
 import torch
 import torch.nn as nn
 
-from ..utils import Deconvolution, Convolution, BlockConvolution, Linear
+from utils.substitution_index import substitution_index
+from ..utils import Deconvolution, Convolution, BlockConvolution, Linear, block_convolution_step, gather_layers
 
 
 class DoubleSubstitutionHead(nn.Module):
@@ -63,90 +64,133 @@ class DoubleSubstitutionHead(nn.Module):
         self.spatial_encoding = spatial_encoding
         self.value_embedding = nn.Embedding(num_vocab + 1, head_dim, padding_idx=0)
 
-    def forward(self, x, value, depth, pos):
+    def forward(self, x, value, depth, pos, index=None):
         """ Transforms the output of the transformer target value logits.
 
         Transforms one token of the latent vector into multiple tokens of the target vector through de-convolutional
         operations. In the case of a quadtree one token is responsible for up to 16 target tokens. In the case of a
         octree one token is responsible for up to 64 target tokens. Only tokens, which correspond to a mixed target
-        value token in the penultimate layer are transformed into target sequence tokens.
+        value token in the penultimate layer are transformed into target sequence tokens. Processes all samples of the
+        batch at once, where each sample might be followed by padding tokens.
 
         Args:
             x: Output of the transformer, the latent vector [N, T'', E].
             value: Value token sequence, with penultimate and last layer.
             depth: Depth token sequence, with penultimate and last layer.
             pos: Position token sequence, with penultimate and last layer.
+            index: Precomputed `SubstitutionIndex` of the sequence. Computed from `value` and `depth`, if `None`.
 
         Return
             Logits of target value sequence.
         """
-        batch_size = value.shape[0]
-        max_depth = torch.max(depth)
-        len_0 = torch.sum(depth == (max_depth), dim=1)
-        len_1 = torch.sum(depth == (max_depth - 1), dim=1)
-        len_2 = torch.sum(depth == (max_depth - 2), dim=1)
+        if index is None:
+            index = substitution_index(value, depth, 3)
+        emb_0, spatial_0, x_0 = self._substitute(x, value, pos, index)
+
+        # deconvolute the intermediate latent space - create new tokens in latent space for each mixed token
+        y_0 = self.deconvolution_0(x_0)  # [N, T, C]
+        y_0 = y_0 + self.convolution_0(emb_0)  # [N, T, C]
+
+        # add spatial decoding if available
+        if spatial_0 is not None:
+            y_0 = y_0 + spatial_0
 
-        # create intermediate list to hold values
-        val_1 = torch.zeros((batch_size, torch.max(len_1)), device=value.device)
-        val_2 = torch.zeros((batch_size, torch.max(len_2)), device=value.device)
+        # compute logits of generated tokens
+        return self.linear(y_0)  # [N, T, V]
 
-        # split input in second-last (1) layer
-        for i in range(batch_size):
-            val_2[i, :len_2[i]] = value[i, :len_2[i]]
-            val_1[i, :len_1[i]] = value[i, len_2[i]:len_2[i] + len_1[i]]
+    def sample(self, x, value, depth, pos, sample_fn, length=None):
+        """ Samples the target value tokens of the last layer of a single block autoregressively with a single pass of
+        the head.
 
-        # compute the number of mixed tokens in mask
-        mix_1 = torch.sum(val_1 == 2, dim=1)
-        mix_2 = torch.sum(val_2 == 2, dim=1)
+        The latent vectors of the children of each mixed token of the penultimate layer are computed once, when its
+        first child is sampled, as they depend only on previously sampled groups of children. The block convolution of
+        each token reuses the intermediate activations of all previously sampled tokens of its group.
 
-        assert ((depth[:, -len_0:] == max_depth).all())
+        Args:
+            x: Output of the transformer, the latent vector of the block [N, 1, E].
+            value: Value token sequence of the block, with third-last, penultimate and last layer.
+            depth: Depth token sequence of the block, with third-last, penultimate and last layer.
+            pos: Position token sequence of the block, with third-last, penultimate and last layer.
+            sample_fn: Function, which samples the next token of each sample [N] from its logits [N, V].
+            length: Unused, the number of tokens of the last layer is given by the substitution index.
+
+        Return:
+            Sampled value tokens of the last layer [N, T].
+        """
+        index = substitution_index(value, depth, 3)
+        value = value.clone()
+        num_mixed = torch.bincount(index.mixed[1][0], minlength=value.shape[0])  # [N]
+        tokens = value.new_zeros(value.shape[0], 8 * index.max_mixed[1])  # [N, T]
+
+        for chunk in range(index.max_mixed[1]):
+            batch = torch.nonzero(num_mixed > chunk)[:, 0]
+
+            # deconvolute the latent vector of the current mixed token - create a group of 8 new tokens
+            emb_0, spatial_0, x_0 = self._substitute(x, value, pos, index)
+            emb_0 = emb_0[:, 8 * chunk:8 * chunk + 8]  # [N, 8, C]
+            y_0 = self.deconvolution_0(x_0[:, chunk:chunk + 1])  # [N, 8, C]
+
+            buffers = []
+            for idx in range(8):
+                y = y_0[batch, idx] + block_convolution_step(self.convolution_0, emb_0, buffers, idx)[batch]
+                if spatial_0 is not None:
+                    y = y + spatial_0[batch, 8 * chunk + idx]
+                token = sample_fn(self.linear(y))
+                tokens[batch, 8 * chunk + idx] = token
+                value[batch, index.start[2][batch] + 8 * chunk + idx] = token
+
+                # update the embedding of the sampled token
+                emb_0[batch, idx] = self.value_embedding(token)
+                if spatial_0 is not None:
+                    emb_0[batch, idx] = emb_0[batch, idx] + spatial_0[batch, 8 * chunk + idx]
+
+        return tokens
+
+    def _substitute(self, x, value, pos, index):
+        """ Computes the embedding [N, T, C] and the spatial encoding [N, T, C] of the last layer and the latent vectors
+        of all mixed tokens of the penultimate layer [N, T', C], which are substituted by the embeddings of their
+        children.
+        """
+        batch_size = value.shape[0]
+        batch_2, token_2, chunk_2 = index.mixed[0]
+        batch_1, token_1, chunk_1 = index.mixed[1]
+        len_mix = 8 * index.max_mixed[1]
 
-        emb_0 = self.value_embedding(value[:, -len_0:])
+        # embed last layer, which follows the third-last and second-last layer in each sample
+        emb_0 = self.value_embedding(gather_layers(value, index.start[2], index.length[2], len_mix))  # [N, T, C]
+        spatial_0 = None
         # add spatial decoding if available
         if self.spatial_encoding is not None:
-            emb_0 = emb_0 + self.spatial_encoding(pos[:, -len_0:])
+            spatial_0 = self.spatial_encoding(
+                gather_layers(pos, index.start[2], index.length[2], len_mix), index.length[2]
+            )
+            emb_0 = emb_0 + spatial_0
 
-        emb_1 = torch.zeros((batch_size, torch.max(len_1), self.head_dim), dtype=torch.float, device=value.device)
+        emb_1 = torch.zeros((batch_size, index.max_length[1], self.head_dim), dtype=torch.float, device=value.device)
         # substitute all mixed token embeddings of penultimate layer, with token embeddings of last layer
-        emb_1[val_1 == 2] = self.down_convolution_0(emb_0[:, :mix_1 * 8])  # [N, T1, C]
+        emb_1[batch_1, token_1] = self.down_convolution_0(emb_0)[batch_1, chunk_1]  # [N, T1, C]
 
-        emb_2 = torch.zeros((batch_size, torch.max(len_2), self.head_dim), dtype=torch.float, device=value.device)
+        emb_2 = torch.zeros((batch_size, index.max_length[0], self.head_dim), dtype=torch.float, device=value.device)
         # substitute all mixed token embeddings of third to last layer, with token embeddings of penultimate layer
-        emb_2[val_2 == 2] = self.down_convolution_1(emb_1)  # [N, T1, C]
+        emb_2[batch_2, token_2] = self.down_convolution_1(emb_1)[batch_2, chunk_2]  # [N, T2, C]
 
-        emb_0 = self.convolution_0(emb_0[:, :mix_1 * 8])
         emb_1 = self.convolution_1(emb_1)
         emb_2 = self.convolution_2(emb_2)
 
         # create intermediate list to hold vectors
-        x_0 = torch.zeros((batch_size, torch.max(mix_1), self.head_dim), device=value.device)
-        x_1 = torch.zeros((batch_size, torch.max(mix_2), self.head_dim), device=value.device)
+        x_0 = torch.zeros((batch_size, index.max_mixed[1], self.head_dim), device=value.device)
+        x_1 = torch.zeros((batch_size, index.max_mixed[0], self.head_dim), device=value.device)
 
         # deconvolute the latent space - sequence length equals number of tokens in the penultimate layer
         y_2 = self.deconvolution_2(x)
         y_2 = y_2 + emb_2
         # select only latent vectors, which correspond to mixed tokens in third-last layer
-        for i in range(batch_size):
-            mix_2_mask_i = (val_2[i] == 2)
-            x_1[i, :torch.sum(mix_2_mask_i)] = y_2[i, mix_2_mask_i]  # [N, T', C]
+        x_1[batch_2, chunk_2] = y_2[batch_2, token_2]  # [N, T', C]
 
         # deconvolute the latent space - sequence length equals number of tokens in the penultimate layer
         y_1 = self.deconvolution_1(x_1)
         y_1 = y_1 + emb_1
         # select only latent vectors, which correspond to mixed tokens in third-last layer
-        for i in range(batch_size):
-            mix_1_mask_i = (val_1[i] == 2)
-            x_0[i, :torch.sum(mix_1_mask_i)] = y_1[i, mix_1_mask_i]  # [N, T', C]
-
-        # deconvolute the intermediate latent space - create new tokens in latent space for each mixed token
-        y_0 = self.deconvolution_0(x_0)  # [N, T, C]
-        y_0 = y_0 + emb_0  # [N, T, C]
+        x_0[batch_1, chunk_1] = y_1[batch_1, token_1]  # [N, T', C]
 
-        # add spatial decoding if available
-        if self.spatial_encoding is not None:
-            len_last = torch.sum(depth == max_depth, dim=1)
-            assert ((depth[:, -len_last:] == max_depth).all())
-            y_0 = y_0 + self.spatial_encoding(pos[:, -len_last:])[:, :mix_1 * 8]
-
-        # compute logits of generated tokens
-        return self.linear(y_0)  # [N, T, V]
+        return emb_0, spatial_0, x_0
@@ -35,7 +35,7 @@ class LinearHead(nn.Module):
         else:
             self.spatial_encoding = None
 
-    def forward(self, x, value, depth, pos):
+    def forward(self, x, value, depth, pos, length=None):
         """ Transforms the output of the transformer target value logits.
 
         Args:
@@ -43,12 +43,30 @@ class LinearHead(nn.Module):
             value: Target value token sequence [N, T].
             depth: Target depth token sequence [N, T].
             pos: Target position token sequence [N, T, A].
+            length: Number of tokens of each sample, which are not padding [N]. Optional.
 
         Return
             Logits of target value sequence.
         """
         # add spatial decoding if available
         if self.spatial_encoding is not None:
-            x = x + self.spatial_encoding(pos)
+            spatial_encoding, linear = self.spatial_encoding
+            x = x + linear(spatial_encoding(pos, length))
 
         return self.linear(x)
+
+    def sample(self, x, value, depth, pos, sample_fn, length=None):
+        """ Samples the target value token of a single latent vector.
+
+        Args:
+            x: Output of the transformer, the latent vector of the block [N, 1, E].
+            value: Target value token sequence of the block [N, T].
+            depth: Target depth token sequence of the block [N, T].
+            pos: Target position token sequence of the block [N, T, A].
+            sample_fn: Function, which samples the next token of each sample [N] from its logits [N, V].
+            length: Number of tokens of each sample, which are not padding [N]. Optional.
+
+        Return:
+            Sampled value tokens of the block [N, 1].
+        """
+        return sample_fn(self.forward(x, value, depth, pos, length)[:, 0]).unsqueeze(1)
@@ -143,7 +143,7 @@ class ShapeTransformer(pl.LightningModule):
         }
         return [optimizer], [scheduler]
 
-    def forward(self, sequence, cls):
+    def forward(self, sequence, cls, cu_seqlens=None):
         """ Performs a full transformer pass of the input sequence.
 
         Args:
@@ -151,17 +151,21 @@ class ShapeTransformer(pl.LightningModule):
                 architecture. The 'encoder_only' architecture expects sequence to be a tuple of (value, depth, position)
                 sequences, while the 'encoder_decoder' architecture expects sequence to the a tuple of
                 (encoder_sequence, decoder_sequence) inputs for the encoder and decoder, respectively.
+            cls: Class label for conditional generation.
+            cu_seqlens: Cumulative lengths of packed sequences, if the batch was packed without padding.
 
         Return:
             Logits which describe the autoregressive likelihood of the next target token.
         """
+        if cu_seqlens is not None:
+            return self.model(sequence, cls, cu_seqlens)
         return self.model(sequence, cls)
 
     def training_step(self, batch, batch_idx):
         """ Perform one training step with the given batch and log the loss. """
-        sequence, target, cls = batch
+        sequence, target, cls, *cu_seqlens = batch
 
-        logits = self.forward(sequence, cls)
+        logits = self.forward(sequence, cls, *cu_seqlens)
         loss = self.compute_and_log_loss(logits, target, self.loss_function, prefix='training/train_')
         self.compute_and_log_loss(logits, target, self.val_loss_function, prefix='training/val_')
 
@@ -169,9 +173,9 @@ class ShapeTransformer(pl.LightningModule):
 
     def validation_step(self, batch, batch_idx):
         """ Perform one validation step with the given batch and log the loss as well the allocated memory. """
-        sequence, target, cls = batch
+        sequence, target, cls, *cu_seqlens = batch
 
-        logits = self.forward(sequence, cls)
+        logits = self.forward(sequence, cls, *cu_seqlens)
         self.compute_and_log_loss(logits, target, self.loss_function, prefix='validation/train_', log_per_layer=True)
         loss = self.compute_and_log_loss(
             logits, target, self.val_loss_function, prefix='validation/val_', log_per_layer=True
@@ -186,9 +190,9 @@ class ShapeTransformer(pl.LightningModule):
     def test_step(self, batch, batch_idx):
         """ Perform one test step with the given batch and log the loss as well the allocated memory. """
 
-        sequence, target, cls = batch
+        sequence, target, cls, *cu_seqlens = batch
 
-        logits = self.forward(sequence, cls)
+        logits = self.forward(sequence, cls, *cu_seqlens)
         loss = self.loss_function(logits, target).mean()
 
         self.log('loss', loss, on_epoch=True)
@@ -1,8 +1,7 @@
-import torch
 import torch.nn as nn
-from torch.nn.utils.rnn import pad_sequence
 
 from .basic_embedding import BasicEmbedding
+from .composite_utils import composite_reduce, composite_reduce_block
 from .convolution_embedding import ConvolutionEmbedding
 from .substitution_embedding import SubstitutionEmbedding
 
@@ -48,8 +47,10 @@ class CompositeEmbeddingC(nn.Module):
         # embeddings
         self.embedding = encoding
         self.reductions = nn.ModuleList(modules)
+        # number of preceding layers, which are passed together with each layer to its reduction
+        self.num_context = [0, 0, 0, 0, 0, 1, 2, 2][:len(modules)]
 
-    def reduce(self, embedding, value, depth, position):
+    def reduce(self, embedding, value, depth, position, index=None, cache=None):
         """ Transform sequences of token into an embedding space.
 
         Args:
@@ -57,84 +58,51 @@ class CompositeEmbeddingC(nn.Module):
             value: Value token sequence.
             depth: Depth token sequence.
             position: Position token sequence.
+            index: Precomputed `SubstitutionIndex` of all depth layers, e.g. by the collate function. Optional.
+            cache: Instance of `DecodingCache`, which reuses unchanged reduced depth layers while sampling. Optional.
 
         Return:
             Token sequence in the embedding space.
         """
-        batch_depth = torch.max(depth)
-        batch_size = len(value)
-
-        x = []
-        padding_mask = []
-
-        # process each sample individually
-        for i in range(batch_size):
-            # extract value, depth and position sequence of current sample
-            emb, val, dep, pos = embedding[i], value[i], depth[i], position[i]
-            b_emb = torch.tensor([], device=value.device)
-
-            # embed layerwise
-            for layer_idx, reduction in enumerate(self.reductions):
-                layer_depth = layer_idx + 1
-                if layer_depth > batch_depth:
-                    break  # reached max depth layer
-
-                # filter layers for embeddings
-                if layer_depth < 6:  # only last layer
-                    emb_seq = emb[dep == layer_depth]
-                    val_seq = val[dep == layer_depth]
-                    dep_seq = dep[dep == layer_depth]
-                    pos_seq = pos[dep == layer_depth]
-                elif layer_depth == 6:  # penultimate and last layer
-                    emb_seq = torch.cat([emb[dep == (layer_depth - 1)], emb[dep == layer_depth]])
-                    val_seq = torch.cat([val[dep == (layer_depth - 1)], val[dep == layer_depth]])
-                    dep_seq = torch.cat([dep[dep == (layer_depth - 1)], dep[dep == layer_depth]])
-                    pos_seq = torch.cat([pos[dep == (layer_depth - 1)], pos[dep == layer_depth]])
-                elif layer_depth in (7, 8):  # third-, second- and last layer
-                    emb_seq = torch.cat(
-                        [emb[dep == (layer_depth - 2)], emb[dep == (layer_depth - 1)], emb[dep == layer_depth]]
-                    )
-                    val_seq = torch.cat(
-                        [val[dep == (layer_depth - 2)], val[dep == (layer_depth - 1)], val[dep == layer_depth]]
-                    )
-                    dep_seq = torch.cat(
-                        [dep[dep == (layer_depth - 2)], dep[dep == (layer_depth - 1)], dep[dep == layer_depth]]
-                    )
-                    pos_seq = torch.cat(
-                        [pos[dep == (layer_depth - 2)], pos[dep == (layer_depth - 1)], pos[dep == layer_depth]]
-                    )
-
-                # compute layer embedding
-                layer_emb = reduction.reduce(
-                    emb_seq.unsqueeze(0),
-                    val_seq.unsqueeze(0),
-                    dep_seq.unsqueeze(0),
-                    pos_seq.unsqueeze(0),
-                )[0]
-                b_emb = torch.cat([b_emb, layer_emb])
-
-            # append embedding
-            x += [b_emb]
-            padding_mask += [torch.zeros(b_emb.shape[0], dtype=torch.bool, device=value.device)]
-
-        # create padding mask
-        self.mask = pad_sequence(padding_mask, batch_first=True, padding_value=1)
-        # pad embedding sequence
-        return pad_sequence(x, batch_first=True, padding_value=0.0)
-
-    def forward(self, value, depth, position):
+        # embed layerwise for the whole batch at once
+        x, self.mask = composite_reduce(
+            self.reductions, self.num_context, embedding, value, depth, position, index, cache
+        )
+        return x
+
+    def forward(self, value, depth, position, index=None, cache=None):
         """ Transform sequences of token into an embedding space.
 
         Args:
             value: Value token sequence.
             depth: Depth token sequence.
             position: Position token sequence.
+            index: Precomputed `SubstitutionIndex` of all depth layers, e.g. by the collate function. Optional.
+            cache: Instance of `DecodingCache`, which reuses unchanged reduced depth layers while sampling. Optional.
 
         Return:
             Token sequence in the embedding space.
         """
 
-        return self.reduce(self.embedding(value, depth, position), value, depth, position)
+        return self.reduce(self.embedding(value, depth, position), value, depth, position, index, cache)
+
+    def reduce_block(self, embedding, value, depth, position, max_depth):
+        """ Transform a single block of tokens of the last depth layer, together with its context tokens in preceding
+        layers, into one token of the embedding space, e.g. the previously sampled block while sampling.
+
+        Args:
+            embedding: Embedding sequence of the block.
+            value: Value token sequence of the block.
+            depth: Depth token sequence of the block.
+            position: Position token sequence of the block.
+            max_depth: Depth of the last layer of the sequence.
+
+        Return:
+            Token of the block in the embedding space.
+        """
+        return composite_reduce_block(
+            self.reductions, self.num_context, embedding, value, depth, position, max_depth
+        )
 
     def padding_mask(self):
         """ Returns a padding mask, where padding tokens '0' of the value sequence are masked out. """
@@ -0,0 +1,96 @@
+import torch
+
+from utils.substitution_index import substitution_index
+from ..utils import gather_windows, layer_windows, scatter_layers
+
+
+def _reduction_factor(reduction):
+    """ Returns the number of tokens of the first layer passed to `reduction`, which are reduced into one embedding. """
+    if hasattr(reduction, 'chunk_size'):  # convolution embedding
+        return reduction.chunk_size
+    if hasattr(reduction, 'conv_size'):  # (double) substitution embedding
+        return reduction.conv_size
+    return 1  # basic embedding
+
+
+def _is_cached(cached, window):
+    """ Returns `True`, if the cached reduction was computed for the same tokens as given in `window`. """
+    return cached is not None and all(c.shape == w.shape and torch.equal(c, w) for c, w in zip(cached, window))
+
+
+def composite_reduce(reductions, num_context, embedding, value, depth, position, index=None, cache=None):
+    """ Reduces each depth layer of the sequence with its own reduction module for the whole batch at once.
+
+    Each reduction module processes its depth layer, together with `num_context` preceding layers, of all samples as a
+    single batch-padded tensor. The reduced layers are scattered with one index map into the output sequence, where
+    they are stored consecutively for each sample. Assumes that the depth layers are stored in ascending order.
+
+    Args:
+        reductions: List of reduction modules, one for each depth layer starting with depth '1'.
+        num_context: List with the number of preceding depth layers, which are passed to each reduction module.
+        embedding: Embedding sequence - [N, S, E].
+        value: Value token sequence - [N, S].
+        depth: Depth token sequence - [N, S].
+        position: Position token sequence - [N, S, A].
+        index: Precomputed `SubstitutionIndex` of all depth layers, which is passed to reductions with context layers.
+        cache: Instance of `DecodingCache`. If given, only reductions of windows with changed tokens are recomputed.
+
+    Return:
+        Token sequence in the embedding space [N, S', E] and its padding mask [N, S'].
+    """
+    num_layers = min(len(reductions), int(torch.max(depth)))
+
+    # gather the window of tokens passed to each reduction, e.g. its layer and preceding context layers
+    _, first_len, window_start, window_len = layer_windows(depth, num_context[:num_layers])
+    windows = gather_windows((embedding, value, depth, position), window_start, window_len)
+
+    # reduce all samples layerwise
+    reduced, reduced_len = [], []
+    for idx, window in enumerate(zip(*windows)):
+        reduced_len += [torch.div(first_len[:, idx], _reduction_factor(reductions[idx]), rounding_mode='floor')]
+
+        # reuse the reduced layer, if its tokens did not change since the previous call, e.g. while sampling
+        if cache is not None and _is_cached(cache.reduced.get(idx), window[1:]):
+            reduced += [cache.reduced[idx][-1]]
+            continue
+
+        if index is not None and num_context[idx] > 0:
+            window += (index.window(idx - num_context[idx], num_context[idx] + 1), )
+        reduced += [reductions[idx].reduce(*window)]  # [N, S'_i, E]
+        if cache is not None:
+            cache.reduced[idx] = window[1:4] + (reduced[-1], )
+
+    # scatter all reduced layers into the padded output sequence
+    x, total_len = scatter_layers(reduced, torch.stack(reduced_len, dim=1))
+    mask = torch.arange(x.shape[1], device=value.device) >= total_len.unsqueeze(1)  # [N, S']
+
+    return x, mask
+
+
+def composite_reduce_block(reductions, num_context, embedding, value, depth, position, max_depth):
+    """ Reduces a single block of tokens of the last depth layer, e.g. the previously sampled block while sampling.
+
+    The block contains the tokens of the last layer, which are reduced into one embedding, together with their context
+    tokens in `num_context` preceding layers, e.g. the chunk of the penultimate layer and its children in the last layer
+    for a substitution embedding.
+
+    Args:
+        reductions: List of reduction modules, one for each depth layer starting with depth '1'.
+        num_context: List with the number of preceding depth layers, which are passed to each reduction module.
+        embedding: Embedding sequence of the block - [N, S, E].
+        value: Value token sequence of the block - [N, S].
+        depth: Depth token sequence of the block - [N, S].
+        position: Position token sequence of the block - [N, S, A].
+        max_depth: Depth of the last layer, as blocks without mixed tokens do not contain tokens of the last layer.
+
+    Return:
+        Embedding of the block [N, 1, E].
+    """
+    idx = max_depth - 1
+    if num_context[idx] == 0:
+        return reductions[idx].reduce(embedding, value, depth, position)
+
+    index = substitution_index(value, depth, num_context[idx] + 1, max_depth)
+    # substituted layers are convolved in groups of 8 children, but a block might not contain any children
+    index = index._replace(max_length=index.max_length[:1] + tuple(max(m, 8) for m in index.max_length[1:]))
+    return reductions[idx].reduce(embedding, value, depth, position, index)
@@ -1,8 +1,8 @@
-import torch
 import torch.nn as nn
 
 from utils.masks import padding_mask
-from ..utils import Convolution
+from utils.substitution_index import substitution_index
+from ..utils import Convolution, gather_layers
 
 
 class DoubleSubstitutionEmbedding(nn.Module):
@@ -36,7 +36,7 @@ class DoubleSubstitutionEmbedding(nn.Module):
         self.convolution_1 = Convolution(embed_dim, embed_dim, 8)
         self.convolution_2 = Convolution(embed_dim, embed_dim, conv_size)
 
-    def reduce(self, embedding, value, depth, position):
+    def reduce(self, embedding, value, depth, position, index=None):
         """ Transform sequences into embedding space for the encoder.
 
         Uses a convolutional operation to pack multiple tokens of the last layer into one token in higher dimension.
@@ -50,52 +50,19 @@ class DoubleSubstitutionEmbedding(nn.Module):
             value: Value token sequence, with penultimate and last layer.
             depth: Depth token sequence, with penultimate and last layer.
             position: Position token sequence, with penultimate and last layer.
+            index: Precomputed `SubstitutionIndex` of the sequence. Computed from `value` and `depth`, if `None`.
 
         Return:
             Token sequence in the embedding space.
         """
-        batch_size = value.shape[0]
-        max_depth = torch.max(depth)
-
-        # compute number of tokens in each layer
-        len_0 = torch.sum(depth == max_depth, dim=1)
-        len_1 = torch.sum(depth == (max_depth - 1), dim=1)
-        len_2 = torch.sum(depth == (max_depth - 2), dim=1)
-
-        assert (len_0 + len_1 + len_2 == value.shape[1])
-
-        # create intermediate list to hold values
-        x_0 = torch.zeros((batch_size, torch.max(len_0), embedding.shape[2]), dtype=torch.float, device=value.device)
-        val_0 = torch.zeros((batch_size, torch.max(len_0)), dtype=torch.long, device=value.device)
-        dep_0 = torch.zeros((batch_size, torch.max(len_0)), dtype=torch.long, device=value.device)
-        pos_0 = torch.zeros((batch_size, torch.max(len_0), self.spatial_dim), dtype=torch.long, device=value.device)
-
-        x_1 = torch.zeros((batch_size, torch.max(len_1), embedding.shape[2]), dtype=torch.float, device=value.device)
-        val_1 = torch.zeros((batch_size, torch.max(len_1)), dtype=torch.long, device=value.device)
-        dep_1 = torch.zeros((batch_size, torch.max(len_1)), dtype=torch.long, device=value.device)
-        pos_1 = torch.zeros((batch_size, torch.max(len_1), self.spatial_dim), dtype=torch.long, device=value.device)
-
-        x_2 = torch.zeros((batch_size, torch.max(len_2), embedding.shape[2]), dtype=torch.float, device=value.device)
-        val_2 = torch.zeros((batch_size, torch.max(len_2)), dtype=torch.long, device=value.device)
-        dep_2 = torch.zeros((batch_size, torch.max(len_2)), dtype=torch.long, device=value.device)
-        pos_2 = torch.zeros((batch_size, torch.max(len_2), self.spatial_dim), dtype=torch.long, device=value.device)
-
-        # splitt input in third-last (2), second-last (1) and last (0) layer
-        for i in range(batch_size):
-            x_2[i, :len_2[i]] = embedding[i, :len_2[i]]
-            val_2[i, :len_2[i]] = value[i, :len_2[i]]
-            dep_2[i, :len_2[i]] = depth[i, :len_2[i]]
-            pos_2[i, :len_2[i]] = position[i, :len_2[i]]
-
-            x_1[i, :len_1[i]] = embedding[i, len_2[i]:len_2[i] + len_1[i]]
-            val_1[i, :len_1[i]] = value[i, len_2[i]:len_2[i] + len_1[i]]
-            dep_1[i, :len_1[i]] = depth[i, len_2[i]:len_2[i] + len_1[i]]
-            pos_1[i, :len_1[i]] = position[i, len_2[i]:len_2[i] + len_1[i]]
-
-            x_0[i, :len_0[i]] = embedding[i, len_2[i] + len_1[i]:len_2[i] + len_1[i] + len_0[i]]
-            val_0[i, :len_0[i]] = value[i, len_2[i] + len_1[i]:len_2[i] + len_1[i] + len_0[i]]
-            dep_0[i, :len_0[i]] = depth[i, len_2[i] + len_1[i]:len_2[i] + len_1[i] + len_0[i]]
-            pos_0[i, :len_0[i]] = position[i, len_2[i] + len_1[i]:len_2[i] + len_1[i] + len_0[i]]
+        if index is None:
+            index = substitution_index(value, depth, 3)
+
+        # split input in third-last (2), second-last (1) and last (0) layer
+        x_2 = gather_layers(embedding, index.start[0], index.length[0], index.max_length[0])  # [N, S_2, E]
+        val_2 = gather_layers(value, index.start[0], index.length[0], index.max_length[0])  # [N, S_2]
+        x_1 = gather_layers(embedding, index.start[1], index.length[1], index.max_length[1])  # [N, S_1, E]
+        x_0 = gather_layers(embedding, index.start[2], index.length[2], index.max_length[2])  # [N, S_0, E]
 
         # precompute padding mask
         self.mask = padding_mask(val_2[:, ::self.conv_size], device=value.device)  # [N, S'_2, E]
@@ -103,17 +70,19 @@ class DoubleSubstitutionEmbedding(nn.Module):
         # convolute embedded tokens of last layer
         y_0 = self.convolution_0(x_0)  # [N, S'_0, E // 4]
         # substitite all mixed token embeddings of second-last layer, with token embeddings of last layer
-        x_1[val_1 == 2] = y_0[val_0[:, ::8] != 0]  # [N, S_1, E // 4]
+        batch, token, chunk = index.mixed[1]
+        x_1[batch, token] = y_0[batch, chunk]  # [N, S_1, E // 4]
 
         # convolute substituted tokens of second-last layer
         y_1 = self.convolution_1(x_1.contiguous())  # [N, S'_1, E // 4]
         # substitite all mixed token embeddings of third-last layer, with token embeddings of second-last layer
-        x_2[val_2 == 2] = y_1[val_1[:, ::8] != 0]  # [N, S_2, E // 2]
+        batch, token, chunk = index.mixed[0]
+        x_2[batch, token] = y_1[batch, chunk]  # [N, S_2, E // 2]
 
         # convolute substituted tokens of second-last layer
         return self.convolution_2(x_2.contiguous())  # [N, S'_2, E]
 
-    def forward(self, value, depth, position):
+    def forward(self, value, depth, position, index=None):
         """ Transform sequences into embedding space for the encoder.
 
         Uses a convolutional operation to pack multiple tokens of the last layer into one token in higher dimension.
@@ -126,12 +95,13 @@ class DoubleSubstitutionEmbedding(nn.Module):
             value: Value token sequence, with penultimate and last layer.
             depth: Depth token sequence, with penultimate and last layer.
             position: Position token sequence, with penultimate and last layer.
+            index: Precomputed `SubstitutionIndex` of the sequence, e.g. by the collate function.
 
         Return:
             Token sequence in the embedding space.
         """
 
-        return self.reduce(self.embedding(value, depth, position), value, depth, position)
+        return self.reduce(self.embedding(value, depth, position), value, depth, position, index)
 
     def padding_mask(self):
         """ Returns a padding mask, where padding tokens '0' of the value sequence are masked out. """
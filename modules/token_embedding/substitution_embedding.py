@@ -1,8 +1,8 @@
-import torch
 import torch.nn as nn
 
 from utils.masks import padding_mask
-from ..utils import Convolution
+from utils.substitution_index import substitution_index
+from ..utils import Convolution, gather_layers
 
 
 class SubstitutionEmbedding(nn.Module):
@@ -35,7 +35,7 @@ class SubstitutionEmbedding(nn.Module):
         self.convolution_0 = Convolution(embed_dim, embed_dim, 8)
         self.convolution_1 = Convolution(embed_dim, embed_dim, conv_size)
 
-    def reduce(self, embedding, value, depth, position):
+    def reduce(self, embedding, value, depth, position, index=None):
         """ Transform sequences into embedding space for the encoder.
 
         Uses a convolutional operation to pack multiple tokens of the last layer into one token in higher dimension.
@@ -49,38 +49,18 @@ class SubstitutionEmbedding(nn.Module):
             value: Value token sequence, with penultimate and last layer.
             depth: Depth token sequence, with penultimate and last layer.
             position: Position token sequence, with penultimate and last layer.
+            index: Precomputed `SubstitutionIndex` of the sequence. Computed from `value` and `depth`, if `None`.
 
         Return:
             Token sequence in the embedding space.
         """
-        batch_size = value.shape[0]
-        max_depth = torch.max(depth)
-        len_0 = torch.sum(depth == max_depth, dim=1)
-        len_1 = torch.sum(depth == (max_depth - 1), dim=1)
-
-        assert (len_0 + len_1 == value.shape[1])
-
-        # create intermediate list to hold values
-        x_0 = torch.zeros((batch_size, torch.max(len_0), embedding.shape[2]), dtype=torch.float, device=value.device)
-        val_0 = torch.zeros((batch_size, torch.max(len_0)), dtype=torch.long, device=value.device)
-        dep_0 = torch.zeros((batch_size, torch.max(len_0)), dtype=torch.long, device=value.device)
-        pos_0 = torch.zeros((batch_size, torch.max(len_0), self.spatial_dim), dtype=torch.long, device=value.device)
-
-        x_1 = torch.zeros((batch_size, torch.max(len_1), embedding.shape[2]), dtype=torch.float, device=value.device)
-        val_1 = torch.zeros((batch_size, torch.max(len_1)), dtype=torch.long, device=value.device)
-        dep_1 = torch.zeros((batch_size, torch.max(len_1)), dtype=torch.long, device=value.device)
-        pos_1 = torch.zeros((batch_size, torch.max(len_1), self.spatial_dim), dtype=torch.long, device=value.device)
+        if index is None:
+            index = substitution_index(value, depth, 2)
 
         # split input in penultimate (1) and last (0) layer
-        for i in range(batch_size):
-            x_1[i, :len_1[i]] = embedding[i, :len_1[i]]
-            val_1[i, :len_1[i]] = value[i, :len_1[i]]
-            dep_1[i, :len_1[i]] = depth[i, :len_1[i]]
-            pos_1[i, :len_1[i]] = position[i, :len_1[i]]
-            x_0[i, :len_0[i]] = embedding[i, len_1[i]:len_1[i] + len_0[i]]
-            val_0[i, :len_0[i]] = value[i, len_1[i]:len_1[i] + len_0[i]]
-            dep_0[i, :len_0[i]] = depth[i, len_1[i]:len_1[i] + len_0[i]]
-            pos_0[i, :len_0[i]] = position[i, len_1[i]:len_1[i] + len_0[i]]
+        x_1 = gather_layers(embedding, index.start[0], index.length[0], index.max_length[0])  # [N, T1, C]
+        val_1 = gather_layers(value, index.start[0], index.length[0], index.max_length[0])  # [N, T1]
+        x_0 = gather_layers(embedding, index.start[1], index.length[1], index.max_length[1])  # [N, T2, C]
 
         # precompute padding mask
         self.mask = padding_mask(val_1[:, ::self.conv_size], device=value.device)
@@ -89,12 +69,13 @@ class SubstitutionEmbedding(nn.Module):
         y_0 = self.convolution_0(x_0)  # [N, T2', C]
 
         # substitute all mixed token embeddings of penultimate layer, with token embeddings of last layer
-        x_1[val_1 == 2] = y_0[val_0[:, ::8] != 0]  # [N, T1, C]
+        batch, token, chunk = index.mixed[0]
+        x_1[batch, token] = y_0[batch, chunk]  # [N, T1, C]
 
         # convolve substituted tokens of penultimate layer
         return self.convolution_1(x_1.contiguous())  # [N, T1', E]
 
-    def forward(self, value, depth, position):
+    def forward(self, value, depth, position, index=None):
         """ Transform sequences into embedding space for the encoder.
 
         Uses a convolutional operation to pack multiple tokens of the last layer into one token in higher dimension.
@@ -107,12 +88,13 @@ class SubstitutionEmbedding(nn.Module):
             value: Value token sequence, with penultimate and last layer.
             depth: Depth token sequence, with penultimate and last layer.
             position: Position token sequence, with penultimate and last layer.
+            index: Precomputed `SubstitutionIndex` of the sequence, e.g. by the collate function.
 
         Return:
             Token sequence in the embedding space.
         """
 
-        return self.reduce(self.embedding(value, depth, position), value, depth, position)
+        return self.reduce(self.embedding(value, depth, position), value, depth, position, index)
 
     def padding_mask(self):
         """ Returns a padding mask, where padding tokens '0' of the value sequence are masked out. """
@@ -1,9 +1,12 @@
 from .convolution import Convolution
-from .block_convolution import BlockConvolution
+from .block_convolution import BlockConvolution, block_convolution_step
+from .cached_encoder import DecodingCache, cached_embedding, cached_encoder
 from .deconvolution import Deconvolution
 from .embedding import Embedding, PositionalEncodingLearned, PositionalEncodingLearnedLookAhead, \
     PositionalEncodingLearnedLookAheadSplit
+from .layer_utils import gather_layers, gather_tokens, gather_windows, layer_windows, scatter_layers
 from .linear import Linear
+from .packed_encoder import packed_encoder, reduce_cu_seqlens, shift_packed_sequence, start_tokens
 
 __all__ = [
     "Embedding",
@@ -13,5 +16,18 @@ __all__ = [
     "Linear",
     "Convolution",
     "BlockConvolution",
+    "block_convolution_step",
+    "DecodingCache",
+    "cached_embedding",
+    "cached_encoder",
     "Deconvolution",
+    "gather_layers",
+    "gather_tokens",
+    "gather_windows",
+    "layer_windows",
+    "scatter_layers",
+    "packed_encoder",
+    "reduce_cu_seqlens",
+    "shift_packed_sequence",
+    "start_tokens",
 ]
@@ -42,6 +42,21 @@ class BlockConvolution(nn.Module):
 
         return out
 
+    def forward_token(self, seq_vector, idx):
+        """ Convolute the preceding tokens of a single position of the block, e.g. while sampling token by token.
+
+        Args:
+            seq_vector: Sequence vector of a single block [N, B, E], where only tokens in front of `idx` are used.
+            idx: Position of the computed token within the block.
+
+        Return:
+            Output token at position `idx` of the block with target embedding dimension [N, E'].
+        """
+        if idx == 0:
+            return torch.zeros_like(seq_vector[:, 0]) + self.bias[0]
+        out = self.convolutions[idx - 1](seq_vector[:, :idx].transpose(1, 2))[:, :, 0]
+        return out + self.bias[idx]
+
 
 class BlockConvolutionLean(nn.Module):
     def __init__(self, source_dim, target_dim, block_size):
@@ -80,3 +95,41 @@ class BlockConvolutionLean(nn.Module):
             out[:, i::self.block_size] += self.bias[i]
 
         return out
+
+
+def block_convolution_step(convolution, seq_vector, buffers, idx):
+    """ Computes a single output token of a stack of block convolutions, while the block is sampled token by token.
+
+    Each block convolution reuses the intermediate activations of all preceding tokens of the block, which were stored
+    in `buffers` by previous steps, instead of convolving the whole block again.
+
+    Args:
+        convolution: Sequence of `BlockConvolution` and element-wise modules, e.g. activations.
+        seq_vector: Input sequence vector of a single block [N, B, E], where only tokens in front of `idx` are used.
+        buffers: List with the intermediate activations of the block, which is filled and updated by each step.
+        idx: Position of the computed token within the block. Must be called for all positions in ascending order.
+
+    Return:
+        Output token at position `idx` of the block [N, E'].
+    """
+    x, y = seq_vector, None
+    num_conv = 0
+    for module in convolution:
+        if not isinstance(module, BlockConvolution):
+            # element-wise modules are applied to the input block or to the current token
+            if y is None:
+                x = module(x)
+            else:
+                y = module(y)
+            continue
+
+        if y is not None:
+            # store the activation of the current token, which is an input of the following convolution
+            if len(buffers) < num_conv:
+                buffers += [y.new_zeros(y.shape[0], module.block_size, y.shape[1])]
+            buffers[num_conv - 1][:, idx] = y
+            x = buffers[num_conv - 1]
+        y = module.forward_token(x, idx)
+        num_conv += 1
+
+    return y
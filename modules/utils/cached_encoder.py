@@ -0,0 +1,250 @@
+import math
+import torch
+import torch.nn.functional as F
+
+
+class DecodingCache:
+    def __init__(self):
+        """ Stores intermediate results of previous passes of an autoregressive transformer for incremental decoding.
+
+        Each token of a causal transformer accesses only previous tokens. Therefore, the keys, values and outputs of
+        all tokens in front of the first changed input token of a sample remain valid and are reused by the following
+        pass, which processes only changed or appended tokens of each sample.
+        """
+        self.reduced = {}  # reduced depth layers of a composite embedding, which are validated before each reuse
+        self.num_skipped = 0  # number of last tokens of each sample, which are not computed
+        self.reset()
+
+    def reset(self):
+        """ Discards all cached results of the transformer. """
+        self.input = None  # [N, L, E]
+        self.padding_mask = None  # [N, L]
+        self.memory = None  # [N, M, E]
+        self.keys = []  # [N, H, L + 1, D] for each transformer layer
+        self.values = []  # [N, H, L + 1, D] for each transformer layer
+        self.output = None  # [N, L + 1, E]
+        self.valid = None  # number of leading tokens of each sample with valid results - [N]
+
+    def skip(self, num_tokens):
+        """ Skips the last tokens of each sample in the following passes, e.g. if their logits are not required yet.
+        The outputs of skipped tokens are undefined, but they are computed by the first pass, which requires them.
+
+        Args:
+            num_tokens: Number of skipped tokens at the end of each sample - int or [N].
+        """
+        self.num_skipped = num_tokens
+
+    def select(self, index):
+        """ Keeps only the cached results of the given samples of the batch, e.g. if all other samples are finished.
+
+        Args:
+            index: Indices of the kept samples in the batch of the previous pass.
+        """
+        index = torch.as_tensor(index, dtype=torch.long)
+        if self.input is not None:
+            self.input, self.padding_mask, self.valid = self.input[index], self.padding_mask[index], self.valid[index]
+            self.memory = self.memory[index] if self.memory is not None else None
+            self.keys = [k[index] for k in self.keys]
+            self.values = [v[index] for v in self.values]
+            self.output = self.output[index]
+        self.reduced = {idx: tuple(x[index] for x in cached) for idx, cached in self.reduced.items()}
+
+    def update(self, x, padding_mask=None, memory=None):
+        """ Compares the input sequence with the cached input and returns the first changed token of each sample.
+
+        Args:
+            x: Input sequence in embedding space - [N, L, E].
+            padding_mask: Padding mask of the input sequence - [N, L].
+            memory: Memory sequence of a decoder - [N, M, E]. All results are discarded, if the memory changed.
+
+        Return:
+            Index of the first token of each sample, which has to be processed - [N].
+        """
+        if self.input is None or self.input.shape[0] != x.shape[0] or not _equal(self.memory, memory):
+            self.reset()
+            return torch.zeros(x.shape[0], dtype=torch.long, device=x.device)
+
+        length = min(self.input.shape[1], x.shape[1])
+        changed = torch.any(self.input[:, :length] != x[:, :length], dim=2)  # [N, L]
+        if padding_mask is not None and self.padding_mask is not None:
+            changed |= self.padding_mask[:, :length] != padding_mask[:, :length]
+
+        # tokens behind the cached sequence are always processed
+        changed = torch.cat([changed, changed.new_ones(x.shape[0], 1)], dim=1)  # [N, L + 1]
+        return torch.minimum(torch.argmax(changed.int(), dim=1), self.valid)  # [N]
+
+
+def _equal(x, y):
+    """ Returns `True`, if both tensors are `None` or have the same shape and elements. """
+    if x is None or y is None:
+        return x is y
+    return x.shape == y.shape and torch.equal(x, y)
+
+
+def _resize(x, length):
+    """ Truncates or pads the sequence dimension of the cached tensor with zeros - [..., L, D] -> [..., length, D]. """
+    if x.shape[-2] >= length:
+        return x[..., :length, :]
+    return torch.cat([x, x.new_zeros(x.shape[:-2] + (length - x.shape[-2], x.shape[-1]))], dim=-2)
+
+
+def _heads(x, num_heads):
+    """ Splits the embedding dimension into attention heads - [N, T, E] -> [N, H, T, D]. """
+    return x.reshape(x.shape[0], x.shape[1], num_heads, x.shape[2] // num_heads).transpose(1, 2)
+
+
+def _scatter(cache, index, x):
+    """ Writes new tokens [N, H, T, D] into the cache [N, H, L + 1, D] at the sequence positions `index` [N, T]. """
+    return cache.scatter(2, index[:, None, :, None].expand(-1, x.shape[1], -1, x.shape[3]), x)
+
+
+def _cached_attention(q, k, v, index, padding_mask, dropout, training, softmax_temp=None):
+    """ Computes the causal attention of new queries on all cached keys and values.
+
+    Args:
+        q: Queries of the new tokens - [N, H, T, D].
+        k: Keys of all tokens - [N, H, S, D].
+        v: Values of all tokens - [N, H, S, D].
+        index: Sequence position of each new token - [N, T].
+        padding_mask: Padding mask of all tokens - [N, S].
+        dropout: Dropout probability of the attention weights.
+        training: Defines whether dropout is applied.
+        softmax_temp: Temperature of the attention scores. Defaults to `1 / sqrt(D)`.
+
+    Return:
+        Attention output of the new tokens - [N, T, H * D].
+    """
+    mask = torch.arange(k.shape[2], device=q.device) > index.unsqueeze(2)  # [N, T, S]
+    mask = (mask | padding_mask.unsqueeze(1)).unsqueeze(1)  # [N, 1, T, S]
+
+    if softmax_temp is None:
+        softmax_temp = 1.0 / math.sqrt(q.shape[-1])
+    scores = torch.matmul(q, k.transpose(-2, -1)) * softmax_temp  # [N, H, T, S]
+    attn = F.dropout(torch.softmax(scores.masked_fill(mask, -float("Inf")), dim=-1), dropout, training)
+    out = torch.matmul(attn, v)  # [N, H, T, D]
+    return out.transpose(1, 2).reshape(q.shape[0], q.shape[2], -1)  # [N, T, E]
+
+
+def _cached_self_attention(attn, x, cache, layer_idx, index, padding_mask):
+    """ Computes a `nn.MultiheadAttention` self-attention of new tokens and writes their keys and values to the cache.
+    """
+    q, k, v = F.linear(x, attn.in_proj_weight, attn.in_proj_bias).chunk(3, dim=-1)  # [N, T, E]
+    k = cache.keys[layer_idx] = _scatter(cache.keys[layer_idx], index, _heads(k, attn.num_heads))
+    v = cache.values[layer_idx] = _scatter(cache.values[layer_idx], index, _heads(v, attn.num_heads))
+
+    out = _cached_attention(_heads(q, attn.num_heads), k, v, index, padding_mask, attn.dropout, attn.training)
+    return attn.out_proj(out)  # [N, T, E]
+
+
+def _cross_attention(attn, x, memory):
+    """ Computes a `nn.MultiheadAttention` attention of new tokens on all memory tokens. """
+    out, _ = attn(x.transpose(0, 1), memory.transpose(0, 1), memory.transpose(0, 1), need_weights=False)
+    return out.transpose(0, 1)  # [N, T, E]
+
+
+def _cached_pytorch_layer(layer, x, cache, layer_idx, index, padding_mask, memory):
+    """ Computes a single `nn.TransformerEncoderLayer` or `nn.TransformerDecoderLayer` for new tokens - [N, T, E]. """
+    def self_attention(x):
+        return layer.dropout1(_cached_self_attention(layer.self_attn, x, cache, layer_idx, index, padding_mask))
+
+    def cross_attention(x):
+        return layer.dropout2(_cross_attention(layer.multihead_attn, x, memory))
+
+    def feed_forward(x):
+        dropout = layer.dropout3 if memory is not None else layer.dropout2
+        return dropout(layer.linear2(layer.dropout(layer.activation(layer.linear1(x)))))
+
+    norm_ff = layer.norm3 if memory is not None else layer.norm2
+    if getattr(layer, 'norm_first', False):
+        x = x + self_attention(layer.norm1(x))
+        if memory is not None:
+            x = x + cross_attention(layer.norm2(x))
+        return x + feed_forward(norm_ff(x))
+    x = layer.norm1(x + self_attention(x))
+    if memory is not None:
+        x = layer.norm2(x + cross_attention(x))
+    return norm_ff(x + feed_forward(x))
+
+
+def _cached_fast_layer(layer, x, cache, layer_idx, index, padding_mask, memory):
+    """ Computes a single `fast_transformers` encoder layer with a full attention for new tokens - [N, T, E]. """
+    attn = layer.attention
+    q = _heads(attn.query_projection(x), attn.n_heads)  # [N, H, T, D]
+    k = _heads(attn.key_projection(x), attn.n_heads)  # [N, H, T, D]
+    v = _heads(attn.value_projection(x), attn.n_heads)  # [N, H, T, D]
+    k = cache.keys[layer_idx] = _scatter(cache.keys[layer_idx], index, k)
+    v = cache.values[layer_idx] = _scatter(cache.values[layer_idx], index, v)
+
+    inner = attn.inner_attention
+    out = _cached_attention(q, k, v, index, padding_mask, inner.dropout.p, inner.training, inner.softmax_temp)
+    x = layer.norm1(x + layer.dropout(attn.out_projection(out)))
+    y = layer.dropout(layer.linear2(layer.dropout(layer.activation(layer.linear1(x)))))
+    return layer.norm2(x + y)
+
+
+def _num_heads(layer):
+    """ Returns the number of attention heads of a transformer layer. """
+    if hasattr(layer, 'attention'):
+        return layer.attention.n_heads
+    return layer.self_attn.num_heads
+
+
+def cached_embedding(embedding, seq, cache):
+    """ Embeds a token sequence, where composite embeddings reuse the reduced depth layers of unchanged tokens. """
+    if hasattr(embedding, 'num_context'):  # composite embedding
+        return embedding(*seq, cache=cache)
+    return embedding(*seq)
+
+
+def cached_encoder(encoder, seq, cache, padding_mask=None, memory=None):
+    """ Processes a sequence with a causal transformer stack, where only tokens, which changed since the previous call
+    with the same `cache`, and all following tokens of each sample are computed. Padding tokens and tokens skipped by
+    `DecodingCache.skip` are not computed and their outputs are undefined.
+
+    Supports `nn.TransformerEncoder`, `nn.TransformerDecoder` and the 'full' attention encoder of `fast-transformers`.
+
+    Args:
+        encoder: Instance of a transformer stack.
+        seq: Input sequence in embedding space, which is already shifted by one token to the right - [N, L, E].
+        cache: Instance of `DecodingCache`, which stores the results of the previous call.
+        padding_mask: Padding mask of the input sequence, where padding tokens are marked with `True` - [N, L].
+        memory: Memory sequence, which is accessed by a `nn.TransformerDecoder` - [N, M, E].
+
+    Return:
+        The output of the transformer stack for the whole sequence - [N, L, E].
+    """
+    batch_size, seq_len, embed_dim = seq.shape
+    layer_fn = _cached_fast_layer if hasattr(encoder.layers[0], 'attention') else _cached_pytorch_layer
+
+    start = cache.update(seq, padding_mask, memory)  # [N]
+    if cache.output is None:
+        empty = seq.new_zeros(batch_size, 0, embed_dim)  # [N, 0, E]
+        cache.keys = [_heads(empty, _num_heads(layer)) for layer in encoder.layers]
+        cache.values = list(cache.keys)
+        cache.output = empty
+
+    # the additional last token of the cache collects writes of samples with less new tokens than others
+    cache.keys = [_resize(k, seq_len + 1) for k in cache.keys]
+    cache.values = [_resize(v, seq_len + 1) for v in cache.values]
+    cache.output = _resize(cache.output, seq_len + 1)
+    if padding_mask is None:
+        padding_mask = torch.zeros(batch_size, seq_len, dtype=torch.bool, device=seq.device)
+    key_padding_mask = F.pad(padding_mask, (0, 1), value=False)  # [N, L + 1]
+
+    # process changed and appended tokens of each sample, which are not skipped
+    length = torch.sum(~padding_mask, dim=1)  # [N]
+    end = torch.maximum(torch.clamp(length - torch.as_tensor(cache.num_skipped, device=seq.device), min=0), start)
+    num_new = int(torch.max(end - start))
+    index = start.unsqueeze(1) + torch.arange(num_new, device=seq.device)  # [N, T]
+    index = torch.where(index < end.unsqueeze(1), index, torch.full_like(index, seq_len))  # [N, T]
+
+    if num_new > 0:
+        x = F.pad(seq, (0, 0, 0, 1)).gather(1, index.unsqueeze(2).expand(-1, -1, embed_dim))  # [N, T, E]
+        for layer_idx, layer in enumerate(encoder.layers):
+            x = layer_fn(layer, x, cache, layer_idx, index, key_padding_mask, memory)
+        if encoder.norm is not None:
+            x = encoder.norm(x)
+        cache.output = cache.output.scatter(1, index.unsqueeze(2).expand(-1, -1, embed_dim), x)
+
+    cache.input, cache.padding_mask, cache.memory, cache.valid = seq, padding_mask, memory, end
+    return cache.output[:, :seq_len]  # [N, L, E]
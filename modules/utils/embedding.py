@@ -1,6 +1,8 @@
 import torch
 import torch.nn as nn
 
+from .layer_utils import gather_tokens
+
 
 class PositionalEncodingLearned(nn.Module):
     def __init__(self, embed_dim, resolution):
@@ -19,11 +21,12 @@ class PositionalEncodingLearned(nn.Module):
             [nn.Embedding(2 * resolution, embed_dim, padding_idx=0) for _ in range(3)]
         )
 
-    def forward(self, position):
+    def forward(self, position, length=None):
         """ Transform sequences of token into an embedding space.
 
         Args:
             position: Position token sequence with the shape [N, S, A].
+            length: Unused, accepted for compatibility with the look-ahead encodings.
 
         Return:
             Token sequence in the embedding space with the shape [N, S, E].
@@ -54,17 +57,24 @@ class PositionalEncodingLearnedLookAhead(nn.Module):
         self.eos = torch.nn.Parameter(torch.zeros(embed_dim))
         nn.init.normal_(self.eos)
 
-    def _append_eos_token(self, x):
-        """ Appends eos token to sequence """
+    def _append_eos_token(self, x, length=None):
+        """ Appends eos token to sequence, or directly after the first `length` tokens of each sample if given. """
         batch_size = x.shape[0]
-        eos = torch.ones(batch_size, 1, self.eos.shape[0], device=x.device) * self.eos  # [N, 1, E]
-        return torch.cat([x, eos], dim=1)  # [N, S, E]
+        if length is None:
+            eos = torch.ones(batch_size, 1, self.eos.shape[0], device=x.device) * self.eos  # [N, 1, E]
+            return torch.cat([x, eos], dim=1)  # [N, S, E]
+
+        eos_mask = torch.arange(x.shape[1] + 1, device=x.device) == length.unsqueeze(1)  # [N, S + 1]
+        x = torch.cat([x, torch.zeros_like(x[:, :1])], dim=1)  # [N, S + 1, E]
+        return x + eos_mask.unsqueeze(2) * self.eos  # [N, S + 1, E]
 
-    def forward(self, position):
+    def forward(self, position, length=None):
         """ Transform sequences of token into an embedding space.
 
         Args:
             position: Position token sequence with the shape [N, S, A].
+            length: Number of tokens of each sample, which are not padding, with the shape [N]. If given, the last
+                token of each sample looks ahead onto the end of sequence token instead of the padding. Optional.
 
         Return:
             Token sequence in the embedding space with the shape [N, S, E].
@@ -73,7 +83,7 @@ class PositionalEncodingLearnedLookAhead(nn.Module):
         for axis, spatial_embedding in enumerate(self.spatial_embeddings):
             x = x + spatial_embedding(position[:, :, axis])  # [N, S, E]
 
-        x = self._append_eos_token(x)
+        x = self._append_eos_token(x, length)
         x = x[:, :-1] + x[:, 1:]
 
         return x  # [N, S, E]
@@ -102,17 +112,24 @@ class PositionalEncodingLearnedLookAheadSplit(nn.Module):
         self.eos = torch.nn.Parameter(torch.zeros(embed_dim))
         nn.init.normal_(self.eos)
 
-    def _append_eos_token(self, x):
-        """ Appends eos token to sequence """
+    def _append_eos_token(self, x, length=None):
+        """ Appends eos token to sequence, or directly after the first `length` tokens of each sample if given. """
         batch_size = x.shape[0]
-        eos = torch.ones(batch_size, 1, self.eos.shape[0], device=x.device) * self.eos  # [N, 1, E]
-        return torch.cat([x, eos], dim=1)  # [N, S, E]
+        if length is None:
+            eos = torch.ones(batch_size, 1, self.eos.shape[0], device=x.device) * self.eos  # [N, 1, E]
+            return torch.cat([x, eos], dim=1)  # [N, S, E]
+
+        eos_mask = torch.arange(x.shape[1] + 1, device=x.device) == length.unsqueeze(1)  # [N, S + 1]
+        x = torch.cat([x, torch.zeros_like(x[:, :1])], dim=1)  # [N, S + 1, E]
+        return x + eos_mask.unsqueeze(2) * self.eos  # [N, S + 1, E]
 
-    def forward(self, position):
+    def forward(self, position, length=None):
         """ Transform sequences of token into an embedding space.
 
         Args:
             position: Position token sequence with the shape [N, S, A].
+            length: Number of tokens of each sample, which are not padding, with the shape [N]. If given, the last
+                token of each sample looks ahead onto the end of sequence token instead of the padding. Optional.
 
         Return:
             Token sequence in the embedding space with the shape [N, S, E].
@@ -125,7 +142,7 @@ class PositionalEncodingLearnedLookAheadSplit(nn.Module):
         for axis, spatial_embedding in enumerate(self.spatial_embeddings_look_ahead):
             x_look_ahead = x_look_ahead + spatial_embedding(position[:, :, axis])  # [N, S, E]
 
-        x_look_ahead = self._append_eos_token(x_look_ahead)
+        x_look_ahead = self._append_eos_token(x_look_ahead, length)
         x = x + x_look_ahead[:, 1:]
 
         return x  # [N, S, E]
@@ -148,17 +165,49 @@ class Embedding(nn.Module):
         self.value_embedding = nn.Embedding(num_vocab + 1, embed_dim, padding_idx=0)
         self.spatial_embedding = spatial_embedding
 
-    def forward(self, value, depth, position):
+    def forward(self, value, depth, position, length=None):
         """ Transform sequences of token into an embedding space.
 
         Args:
             value: Value token sequence with the shape [N, S].
             depth: Depth token sequence with the shape [N, S].
             position: Position token sequence with the shape [N, S, A].
+            length: Number of tokens of each sample, which are not padding, with the shape [N]. Passed to the spatial
+                encoding. Optional.
 
         Return:
             Token sequence in the embedding space with the shape [N, S, E].
         """
         x = self.value_embedding(value)  # [N, S, E]
-        x += self.spatial_embedding(position)
+        x += self.spatial_embedding(position, length)
         return x  # [N, S, E]
+
+    def gather(self, value, depth, position, index, valid):
+        """ Embeds only the gathered tokens of a sequence, e.g. a single block while sampling.
+
+        Each gathered token is embedded together with its following token, which might be looked ahead to by the
+        spatial encoding. Therefore, the result is equal to gathering the tokens of the embedding of the whole
+        sequence, but does not depend on the sequence length.
+
+        Args:
+            value: Value token sequence with the shape [N, L].
+            depth: Depth token sequence with the shape [N, L].
+            position: Position token sequence with the shape [N, L, A].
+            index: Index of each gathered token in its sample with the shape [N, S].
+            valid: Marks gathered tokens, which are kept. All other tokens are set to zero, with the shape [N, S].
+
+        Return:
+            Gathered tokens in the embedding space with the shape [N, S, E].
+        """
+        batch_size, num_tokens = index.shape
+        seq_len = value.shape[1]
+
+        # pair each token with its following token, the last token of the sequence is followed by the end of sequence
+        has_next = index + 1 < seq_len  # [N, S]
+        pair_index = torch.stack([index, torch.clamp(index + 1, max=seq_len - 1)], dim=2).view(batch_size, -1)
+        pair_valid = torch.stack([valid, valid & has_next], dim=2).view(batch_size, -1)
+        pairs = [gather_tokens(s, pair_index, pair_valid) for s in (value, depth, position)]
+        pairs = [s.view((batch_size * num_tokens, 2) + s.shape[2:]) for s in pairs]  # [N * S, 2, ...]
+
+        x = self.forward(*pairs, length=1 + has_next.view(-1).long())[:, 0]  # [N * S, E]
+        return x.view(batch_size, num_tokens, -1).masked_fill(~valid.unsqueeze(2), 0)  # [N, S, E]
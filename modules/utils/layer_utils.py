@@ -0,0 +1,121 @@
+import torch
+
+
+def gather_tokens(sequence, index, valid):
+    """ Gathers tokens of each sample along the sequence dimension and sets invalid tokens to zero.
+
+    Args:
+        sequence: Batched sequence - [N, S, ...].
+        index: Index of each gathered token in its sample - [N, M].
+        valid: Marks gathered tokens, which are kept. All other tokens are set to zero - [N, M].
+
+    Return:
+        Gathered tokens - [N, M, ...].
+    """
+    shape = sequence.shape[2:]
+    index = index.view(index.shape + (1, ) * len(shape)).expand(index.shape + shape)
+    valid = valid.view(valid.shape + (1, ) * len(shape))
+    return torch.gather(sequence, 1, index).masked_fill(~valid, 0)
+
+
+def gather_layers(sequence, start, length, max_length=None):
+    """ Gathers consecutive tokens, e.g. one or more depth layers, of each sample into a batch-padded tensor.
+
+    Args:
+        sequence: Batched sequence - [N, S, ...].
+        start: Index of the first gathered token of each sample - [N].
+        length: Number of gathered tokens of each sample - [N].
+        max_length: Length of the padded output. Defaults to the maximum of `length`.
+
+    Return:
+        Gathered tokens padded with zeros - [N, M, ...].
+    """
+    if max_length is None:
+        max_length = int(torch.max(length))
+    index = torch.arange(max_length, device=sequence.device)
+    valid = index < length.unsqueeze(1)  # [N, M]
+    index = (start.unsqueeze(1) + index).clamp(max=sequence.shape[1] - 1)  # [N, M]
+    return gather_tokens(sequence, index, valid)
+
+
+def layer_windows(depth, num_context):
+    """ Computes the window of tokens of each depth layer, which spans the layer and its preceding context layers.
+
+    Assumes that the depth layers of each sample are stored consecutively in ascending order, followed by padding.
+
+    Args:
+        depth: Depth token sequence - [N, S].
+        num_context: Number of preceding context layers of each depth layer, starting with depth '1'.
+
+    Return:
+        Number of tokens of each depth layer [N, D], number of tokens of the first layer of each window [N, D], index
+        of the first token of each window [N, D] and number of tokens of each window [N, D].
+    """
+    num_layers = len(num_context)
+    first = [max(idx - num_context[idx], 0) for idx in range(num_layers)]
+
+    # compute number of tokens and first token index of each layer in each sample
+    layers = torch.arange(1, num_layers + 1, device=depth.device)
+    layer_len = torch.sum(depth.unsqueeze(-1) == layers, dim=1)  # [N, D]
+    layer_start = torch.cumsum(layer_len, dim=1) - layer_len  # [N, D]
+
+    window_start = layer_start[:, first]  # [N, D]
+    window_len = layer_start + layer_len - window_start  # [N, D]
+    return layer_len, layer_len[:, first], window_start, window_len
+
+
+def gather_windows(sequences, start, length):
+    """ Gathers multiple windows of consecutive tokens of each sample at once with a single gather per sequence.
+
+    Args:
+        sequences: List of batched sequences - [N, S, ...].
+        start: Index of the first token of each window in each sample - [N, W].
+        length: Number of tokens of each window in each sample - [N, W].
+
+    Return:
+        A list with a tuple of the batch-padded windows [N, M_w, ...] for each sequence.
+    """
+    device = start.device
+    max_len = torch.max(length, dim=0)[0].tolist()
+
+    index = torch.cat([torch.arange(m, device=device) for m in max_len])  # [M]
+    window = torch.repeat_interleave(torch.arange(len(max_len), device=device), torch.tensor(max_len, device=device))
+    valid = index < length[:, window]  # [N, M]
+    index = start[:, window] + index  # [N, M]
+
+    return [
+        torch.split(gather_tokens(s, index.clamp(max=max(s.shape[1] - 1, 0)), valid), max_len, dim=1)
+        for s in sequences
+    ]
+
+
+def scatter_layers(layers, length):
+    """ Concatenates the first tokens of each layer of each sample with a single index map into a padded sequence.
+
+    Args:
+        layers: List of batch-padded layers - [N, M_i, ...].
+        length: Number of valid tokens of each layer in each sample - [N, D].
+
+    Return:
+        Concatenated layers padded with zeros [N, S, ...] and the number of tokens of each sample [N].
+    """
+    batch_size = length.shape[0]
+    device = length.device
+
+    # compute offsets of layers in the output sequence
+    start = torch.cumsum(length, dim=1) - length  # [N, D]
+    total_len = torch.sum(length, dim=1)  # [N]
+    seq_len = int(torch.max(total_len))
+
+    # collect valid tokens and their index in the flattened output sequence
+    batch_offset = torch.arange(batch_size, device=device).unsqueeze(1) * seq_len  # [N, 1]
+    source, target = [], []
+    for idx, x in enumerate(layers):
+        index = torch.arange(x.shape[1], device=device)
+        valid = index < length[:, idx:idx + 1]  # [N, M_i]
+        source += [x[valid]]
+        target += [(batch_offset + start[:, idx:idx + 1] + index)[valid]]
+    source = torch.cat(source)  # [T, ...]
+
+    out = source.new_zeros((batch_size * seq_len, ) + source.shape[1:]).index_copy(0, torch.cat(target), source)
+    return out.view((batch_size, seq_len) + source.shape[1:]), total_len
@@ -0,0 +1,155 @@
+import math
+import torch
+import torch.nn.functional as F
+
+
+def _varlen_attention():
+    """ Returns the variable length attention kernel of `flash-attn`, if it is installed, otherwise `None`. """
+    try:
+        from flash_attn import flash_attn_varlen_func
+        return flash_attn_varlen_func
+    except ImportError:
+        return None
+
+
+def reduce_cu_seqlens(cu_seqlens, num_tokens, num_embedded):
+    """ Maps cumulative sequence lengths of packed token sequences onto the packed sequence after the embedding.
+
+    Embeddings might reduce a fixed number of tokens into a single embedding vector. Each packed sequence has to be
+    aligned to this number of tokens, which is ensured by the packing collate function.
+
+    Args:
+        cu_seqlens: Cumulative lengths of the packed token sequences - [N + 1].
+        num_tokens: Total number of packed tokens.
+        num_embedded: Total number of packed embedding vectors.
+
+    Return:
+        Cumulative lengths of the packed embedding sequences - [N + 1].
+    """
+    return torch.div(cu_seqlens, num_tokens // num_embedded, rounding_mode='floor')
+
+
+def start_tokens(model, cls, batch_size):
+    """ Returns the start of sequence token of each packed sequence.
+
+    Args:
+        model: Architecture, which provides either a class embedding `cls_embedding`, if it is `cls_conditional`, or a
+            learned start of sequence token `sos`.
+        cls: Class label of each sequence - [N].
+        batch_size: Number of packed sequences.
+
+    Return:
+        Start of sequence token of each sequence - [N, E].
+    """
+    if model.cls_conditional:
+        return model.cls_embedding(cls)
+    return model.sos.expand(batch_size, -1)
+
+
+def shift_packed_sequence(seq, start, cu_seqlens):
+    """ Shifts each packed sequence one token to right and pads it with the given start of sequence token.
+
+    Args:
+        seq: Packed sequence in embedding space - [1, S, E].
+        start: Start of sequence token for each packed sequence - [N, E].
+        cu_seqlens: Cumulative lengths of the packed sequences - [N + 1].
+
+    Return:
+        Shifted packed sequence - [1, S, E].
+    """
+    seq = torch.cat([start[:1].unsqueeze(0), seq[:, :-1]], dim=1)  # [1, S, E]
+    return seq.index_copy(1, cu_seqlens[:-1].long(), start.unsqueeze(0))  # [1, S, E]
+
+
+def _segment_attention(padding_mask=None):
+    """ Returns an attention with the interface of the variable length attention kernel of `flash-attn`, which attends
+    each packed sequence on its own. Its cost grows quadratically with the length of each sequence, instead of the total
+    number of packed tokens.
+
+    Args:
+        padding_mask: Padding mask of the packed tokens, which are not attended - [S].
+    """
+    def attention(q, k, v, cu_seqlens_q, cu_seqlens_k, max_seqlen_q, max_seqlen_k, dropout_p=0.0, causal=False):
+        out = []
+        for start, end in zip(cu_seqlens_q[:-1].tolist(), cu_seqlens_q[1:].tolist()):
+            q_i, k_i, v_i = [x[start:end].transpose(0, 1) for x in (q, k, v)]  # [H, L, D]
+            scores = torch.matmul(q_i, k_i.transpose(-2, -1)) / math.sqrt(q.shape[-1])  # [H, L, L]
+
+            mask = torch.ones(end - start, end - start, device=q.device)  # [L, L]
+            mask = torch.triu(mask, diagonal=1).bool() if causal else mask == 0
+            if padding_mask is not None:
+                mask = mask | padding_mask[start:end].unsqueeze(0)
+
+            attn = F.dropout(torch.softmax(scores.masked_fill(mask, -float("Inf")), dim=-1), dropout_p)
+            out += [torch.matmul(attn, v_i).transpose(0, 1)]  # [L, H, D]
+        return torch.cat(out)  # [S, H, D]
+
+    return attention
+
+
+def _varlen_encoder_layer(layer, x, cu_seqlens, max_seqlen, causal, attention):
+    """ Computes a single `nn.TransformerEncoderLayer` with a variable length attention kernel on packed tokens [S, E].
+    """
+    attn = layer.self_attn
+    num_heads = attn.num_heads
+    head_dim = attn.embed_dim // num_heads
+
+    def self_attention(x):
+        qkv = F.linear(x, attn.in_proj_weight, attn.in_proj_bias).view(-1, 3, num_heads, head_dim)  # [S, 3, H, D]
+        out = attention(
+            qkv[:, 0],
+            qkv[:, 1],
+            qkv[:, 2],
+            cu_seqlens,
+            cu_seqlens,
+            max_seqlen,
+            max_seqlen,
+            dropout_p=attn.dropout if layer.training else 0.0,
+            causal=causal,
+        )  # [S, H, D]
+        return layer.dropout1(attn.out_proj(out.reshape(-1, attn.embed_dim)))
+
+    def feed_forward(x):
+        return layer.dropout2(layer.linear2(layer.dropout(layer.activation(layer.linear1(x)))))
+
+    if getattr(layer, 'norm_first', False):
+        x = x + self_attention(layer.norm1(x))
+        return x + feed_forward(layer.norm2(x))
+    x = layer.norm1(x + self_attention(x))
+    return layer.norm2(x + feed_forward(x))
+
+
+def packed_encoder(encoder, seq, cu_seqlens, padding_mask=None, causal=True):
+    """ Processes packed sequences with a `nn.TransformerEncoder` without attending across sequence borders.
+
+    Uses the variable length attention kernel of `flash-attn` on GPU, if it is installed. Otherwise, each packed
+    sequence is attended on its own, while all other operations process the packed tokens at once.
+
+    Note: The kernel attends padding tokens at the end of each packed sequence like any other token. Therefore, it
+        leaves the output of all non-padding tokens unchanged only with a `causal` attention. It is not used otherwise.
+
+    Args:
+        encoder: Instance of `nn.TransformerEncoder`.
+        seq: Packed sequences in embedding space - [1, S, E].
+        cu_seqlens: Cumulative lengths of the packed sequences - [N + 1].
+        padding_mask: Padding mask of the packed sequences - [1, S].
+        causal: Defines whether each token can access previous tokens of its sequence only.
+
+    Return:
+        The output of the encoder for the packed sequences - [1, S, E].
+    """
+    attention = _varlen_attention()
+    half_precision = seq.dtype in (torch.float16, torch.bfloat16) or torch.is_autocast_enabled()
+
+    if attention is None or not seq.is_cuda or not half_precision or not (causal or padding_mask is None):
+        attention = _segment_attention(padding_mask[0] if padding_mask is not None else None)
+
+    cu_seqlens = cu_seqlens.to(device=seq.device, dtype=torch.int32)
+    max_seqlen = int((cu_seqlens[1:] - cu_seqlens[:-1]).max())
+
+    x = seq[0]  # [S, E]
+    for layer in encoder.layers:
+        x = _varlen_encoder_layer(layer, x, cu_seqlens, max_seqlen, causal, attention)
+    if encoder.norm is not None:
+        x = encoder.norm(x)
+    return x.unsqueeze(0)  # [1, S, E]
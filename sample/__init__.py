@@ -1,5 +1,7 @@
 from sample.shape_sampler import ShapeSampler
+from sample.sample_farm import sample_farm
 
 __all__ = [
     "ShapeSampler",
+    "sample_farm",
 ]
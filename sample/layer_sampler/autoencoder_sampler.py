@@ -3,7 +3,9 @@ from ..sample_utils import preprocess, postprocess
 
 
 class AutoencoderSampler():
-    def __init__(self, model, embedding, head, spatial_dim, max_resolution, position_encoding, device, **_):
+    def __init__(
+        self, model, embedding, head, spatial_dim, max_resolution, position_encoding, device, output='dense', **_
+    ):
         """ Provides a basic implementation of the sampler for the 'autoencoder' architecture.
 
         Args:
@@ -14,6 +16,7 @@ class AutoencoderSampler():
             max_resolution: Maximum resolution the model is trained on.
             position_encoding: Defines the positional encoding of the data.
             device: Device on which, the data should be stored. Either "cpu" or "cuda" (gpu-support).
+            output: Output format of the sampled shapes, see `postprocess`.
         """
         self.model = model
         self.embedding = embedding
@@ -22,6 +25,7 @@ class AutoencoderSampler():
         self.max_resolution = max_resolution
         self.pos_encoding = position_encoding
         self.device = device
+        self.output = output
 
     def __call__(self, precondition, precondition_resolution, target_resolution, temperature):
         """ Run the model once on the last layer of the input sequence and sample new values for each token.
@@ -64,4 +68,4 @@ class AutoencoderSampler():
         # replace old values with new ones
         val[dep == max_dep] = new_val
 
-        return postprocess(val, target_resolution, self.spatial_dim)
+        return postprocess(val, target_resolution, self.spatial_dim, output=self.output)
@@ -4,14 +4,19 @@ from tqdm.auto import tqdm
 
 from ..token_generator import create_token_generator
 from ..sample_utils import (
+    cat_layers,
     next_layer_tokens,
     preprocess,
     postprocess,
+    SamplingStatistics,
 )
 
 
 class EncoderDecoderSampler():
-    def __init__(self, model, head, spatial_dim, max_resolution, position_encoding, device, **_):
+    def __init__(
+        self, model, head, spatial_dim, max_resolution, position_encoding, device, accept_threshold=None,
+        output='dense', **_
+    ):
         """ Provides a basic implementation of the sampler for the 'encoder_only' architecture.
 
         Args:
@@ -21,15 +26,20 @@ class EncoderDecoderSampler():
             max_resolution: Maximum resolution the model is trained on.
             position_encoding: Defines the positional encoding of the data.
             device: Device on which, the data should be stored. Either "cpu" or "cuda" (gpu-support).
+            accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+                multinomial draw. Disabled, if `None`.
+            output: Output format of the sampled shapes, see `postprocess`.
         """
         self.head = head[0]
-        self.generators = create_token_generator(head, model, spatial_dim)
+        self.statistics = SamplingStatistics()
+        self.generators = create_token_generator(head, model, spatial_dim, accept_threshold, self.statistics)
         self.compute_memory = model.compute_memory
 
         self.spatial_dim = spatial_dim
         self.max_resolution = max_resolution
         self.pos_encoding = position_encoding
         self.device = device
+        self.output = output
 
     def __call__(self, precondition, precondition_resolution, target_resolution, temperature):
         """ Perform an iterative sampling of the given sequence until reaching the end of sequence, the maximum sequence
@@ -60,9 +70,9 @@ class EncoderDecoderSampler():
 
                 # compute memory / encode sequence
                 seq = (
-                    torch.cat(val).unsqueeze(0),
-                    torch.cat(dep).unsqueeze(0),
-                    torch.cat(pos).unsqueeze(0),
+                    cat_layers(val).unsqueeze(0),
+                    cat_layers(dep).unsqueeze(0),
+                    cat_layers(pos).unsqueeze(0),
                 )
                 memory = self.compute_memory(seq, memory=None, idx=0, is_final=False)
 
@@ -107,4 +117,4 @@ class EncoderDecoderSampler():
                 dep += [layer_dep]
                 pos += [layer_pos]
 
-        return postprocess(val, target_resolution, self.spatial_dim)
+        return postprocess(val, target_resolution, self.spatial_dim, output=self.output)
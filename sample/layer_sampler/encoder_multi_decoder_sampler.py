@@ -4,14 +4,19 @@ from tqdm.auto import tqdm
 
 from ..token_generator import create_token_generator
 from ..sample_utils import (
+    cat_layers,
     next_layer_tokens,
     preprocess,
     postprocess,
+    SamplingStatistics,
 )
 
 
 class EncoderMultiDecoderSampler():
-    def __init__(self, model, embedding, head, spatial_dim, max_resolution, position_encoding, device, **_):
+    def __init__(
+        self, model, embedding, head, spatial_dim, max_resolution, position_encoding, device, accept_threshold=None,
+        output='dense', **_
+    ):
         """ Provides a basic implementation of the sampler for the 'encoder_only' architecture.
 
         Args:
@@ -22,8 +27,12 @@ class EncoderMultiDecoderSampler():
             max_resolution: Maximum resolution the model is trained on.
             position_encoding: Defines the positional encoding of the data.
             device: Device on which, the data should be stored. Either "cpu" or "cuda" (gpu-support).
+            accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+                multinomial draw. Disabled, if `None`.
+            output: Output format of the sampled shapes, see `postprocess`.
         """
-        self.generators = create_token_generator(head, model, spatial_dim)
+        self.statistics = SamplingStatistics()
+        self.generators = create_token_generator(head, model, spatial_dim, accept_threshold, self.statistics)
         self.compute_memory = model.compute_memory
 
         self.head = head
@@ -32,6 +41,7 @@ class EncoderMultiDecoderSampler():
         self.pos_encoding = position_encoding
         self.num_concat_layers = 1 + int(math.log2(max_resolution)) - len(embedding)
         self.device = device
+        self.output = output
 
     def __call__(self, precondition, precondition_resolution, target_resolution, temperature):
         """ Perform an iterative sampling of the given sequence until reaching the end of sequence, the maximum sequence
@@ -64,18 +74,18 @@ class EncoderMultiDecoderSampler():
                     idx = max(0, depth - self.num_concat_layers)
                     # prepare sequence to update memory
                     if depth == self.num_concat_layers:
-                        seq = self._to_sequence(torch.cat(val), torch.cat(dep), torch.cat(pos))
+                        seq = self._to_sequence(cat_layers(val), cat_layers(dep), cat_layers(pos))
                     elif self.head[idx] == 'substitution':
                         seq = self._to_sequence(
-                            torch.cat(val[depth - 2:depth - 1]),
-                            torch.cat(dep[depth - 2:depth - 1]),
-                            torch.cat(pos[depth - 2:depth - 1]),
+                            cat_layers(val[depth - 2:depth - 1]),
+                            cat_layers(dep[depth - 2:depth - 1]),
+                            cat_layers(pos[depth - 2:depth - 1]),
                         )
                     elif self.head[idx] == 'double_substitution':
                         seq = self._to_sequence(
-                            torch.cat(val[depth - 2:depth - 1]),
-                            torch.cat(dep[depth - 2:depth - 1]),
-                            torch.cat(pos[depth - 2:depth - 1]),
+                            cat_layers(val[depth - 2:depth - 1]),
+                            cat_layers(dep[depth - 2:depth - 1]),
+                            cat_layers(pos[depth - 2:depth - 1]),
                         )
                     else:
                         seq = self._to_sequence(val[depth - 1], dep[depth - 1], pos[depth - 1])
@@ -126,18 +136,18 @@ class EncoderMultiDecoderSampler():
 
                 # prepare sequence to update memory
                 if self.head[idx] == 'substitution':
-                    seq = self._to_sequence(torch.cat(val[-2:]), torch.cat(dep[-2:]), torch.cat(pos[-2:]))
+                    seq = self._to_sequence(cat_layers(val[-2:]), cat_layers(dep[-2:]), cat_layers(pos[-2:]))
                 elif self.head[idx] == 'double_substitution':
-                    seq = self._to_sequence(torch.cat(val[-3:]), torch.cat(dep[-3:]), torch.cat(pos[-3:]))
+                    seq = self._to_sequence(cat_layers(val[-3:]), cat_layers(dep[-3:]), cat_layers(pos[-3:]))
                 elif layer_idx == self.num_concat_layers:
-                    seq = self._to_sequence(torch.cat(val), torch.cat(dep), torch.cat(pos))
+                    seq = self._to_sequence(cat_layers(val), cat_layers(dep), cat_layers(pos))
                 elif layer_idx > self.num_concat_layers:
                     seq = self._to_sequence(val[-1], dep[-1], pos[-1])
                 # update memory
                 if layer_idx >= self.num_concat_layers:
                     memory = self.compute_memory(seq, memory=memory, idx=idx, is_final=False)
 
-        return postprocess(val, target_resolution, self.spatial_dim)
+        return postprocess(val, target_resolution, self.spatial_dim, output=self.output)
 
     def _to_sequence(self, val, dep, pos):
         """ Adds a batch dimension to the tensor and packs it into a sequence tuple. """
@@ -4,15 +4,22 @@ import torch
 from tqdm.auto import tqdm
 
 from ..sample_utils import (
-    next_layer_tokens,
+    batch_sequences,
     preprocess,
     postprocess,
+    recurrent_step,
+    select_cls,
+    SamplingStatistics,
+    SequenceBuffer,
 )
 from ..token_generator.recurrent import create_recurrent_token_generator
 
 
 class RecurrentSampler:
-    def __init__(self, model, head, spatial_dim, max_resolution, position_encoding, device, **_):
+    def __init__(
+        self, model, head, spatial_dim, max_resolution, position_encoding, device, accept_threshold=None,
+        output='dense', **_
+    ):
         """ Provides a basic implementation of the sampler for the 'fast-recurrent-transformer' architecture.
 
         Args:
@@ -22,15 +29,20 @@ class RecurrentSampler:
             max_resolution: Maximum resolution the model is trained on.
             position_encoding: Defines the positional encoding of the data.
             device: Device on which, the data should be stored. Either "cpu" or "cuda" (gpu-support).
+            accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+                multinomial draw. Disabled, if `None`.
+            output: Output format of the sampled shapes, see `postprocess`.
         """
         super(RecurrentSampler, self).__init__()
-        self.generators = create_recurrent_token_generator(head, model, spatial_dim)
+        self.statistics = SamplingStatistics()
+        self.generators = create_recurrent_token_generator(head, model, spatial_dim, accept_threshold, self.statistics)
         self.model = model
 
         self.spatial_dim = spatial_dim
         self.max_resolution = max_resolution
         self.pos_encoding = position_encoding
         self.device = device
+        self.output = output
 
     def __call__(self, precondition, precondition_resolution, target_resolution, temperature, cls):
         """ Perform an iterative sampling of the given sequence until reaching the end of sequence, the maximum sequence
@@ -46,20 +58,21 @@ class RecurrentSampler:
         Return:
             A token sequence with values, encoding the final sample.
         """
-        # transform voxel data into sequences
-        val, dep, pos = preprocess(
+        # transform voxel data into sequences, which are stored with all future layers in a single buffer
+        buffer = SequenceBuffer(1, self.spatial_dim, self.max_resolution, self.pos_encoding, self.device)
+        buffer.append(0, *preprocess(
             precondition, precondition_resolution, self.spatial_dim, self.pos_encoding, self.device
-        )
+        ))
 
         # compute the number of finished (current) layers and the maximum sampleable layer
-        cur_layer = len(val)
+        cur_layer = buffer.num_layers(0)
         max_layer = int(math.log2(min(target_resolution, self.max_resolution)))
 
         with torch.no_grad():
 
             # initialise memory and state of the transformer model for already predefined tokens
             state = None
-            seq = (torch.cat(val).unsqueeze(0), torch.cat(dep).unsqueeze(0), torch.cat(pos).unsqueeze(0))
+            seq = tuple(s.unsqueeze(0) for s in buffer.sequence(0))
             input_seq = self.model.token_embedding(seq, cls)  # [N, L, E]
             memory = torch.zeros_like(input_seq)
 
@@ -69,28 +82,109 @@ class RecurrentSampler:
             # sample new tokens layer-wise, as each layer might use a different token embedding and generative head
             for _ in tqdm(range(cur_layer, max_layer), initial=cur_layer, total=max_layer, leave=True, desc="Layers"):
 
-                # init sequences for the current layer based on the previous one
-                next_val, next_dep, next_pos = next_layer_tokens(
-                    val, dep, pos, self.spatial_dim, self.max_resolution, self.pos_encoding
-                )
+                # init sequences for the current layer based on the previous one in place
+                buffer.expand()
+                val, dep, pos = buffer.layers(0)
+
                 # generate value tokens for the current layer
                 next_val, memory, state = self.generators[0](
-                    val=val + [next_val],
-                    dep=dep + [next_dep],
-                    pos=pos + [next_pos],
+                    val=val,
+                    dep=dep,
+                    pos=pos,
                     memory=memory,
                     state=state,
                     temperature=temperature,
                     cls=cls
                 )
 
-                # append sampled tokens to previous sequences
-                val += [next_val]
-                dep += [next_dep]
-                pos += [next_pos]
+                # store sampled tokens, if they were not sampled in place
+                val[-1].copy_(next_val)
 
                 if torch.sum(next_val == 2) == 0:
                     break  # early-out, no mixed tokens sampled
 
         # transform the sampled octree sequence back into a regular-grid voxel array and return
-        return postprocess(val, target_resolution, self.spatial_dim)
+        return postprocess(buffer.layers(0)[0], target_resolution, self.spatial_dim, output=self.output)
+
+    def sample_batch(self, preconditions, precondition_resolution, target_resolution, temperature, cls):
+        """ Perform an iterative sampling of multiple independent samples in lock-step.
+
+        All samples are sampled layer-wise as a single batch. Each sample finishes independently, as soon as it does not
+        contain any mixed tokens in its last layer.
+
+        Args:
+            preconditions: List of arrays of elements (pixels/voxels) as numpy arrays.
+            precondition_resolution: Resolution at which the autoencoder will reconstruct the layer.
+            target_resolution: Resolution up to which an object should be sampled.
+            temperature: Defines the randomness of the samples.
+            cls: class labels of all samples for conditional generation.
+
+        Return:
+            A list of arrays of elements, encoding the final samples.
+        """
+        # transform voxel data into sequences, which are stored with all future layers in a single buffer
+        buffer = SequenceBuffer(
+            len(preconditions), self.spatial_dim, self.max_resolution, self.pos_encoding, self.device
+        )
+        for b, precondition in enumerate(preconditions):
+            buffer.append(b, *preprocess(
+                precondition, precondition_resolution, self.spatial_dim, self.pos_encoding, self.device
+            ))
+
+        # compute the number of finished (current) layers and the maximum sampleable layer
+        cur_layer = max(buffer.num_layers(b) for b in range(len(buffer)))
+        max_layer = int(math.log2(min(target_resolution, self.max_resolution)))
+
+        with torch.no_grad():
+
+            # initialise the state of the transformer model for already predefined tokens of each sample
+            seq = batch_sequences(*zip(*[buffer.sequence(b) for b in range(len(buffer))]))
+            input_seq = self.model.token_embedding(seq, cls)  # [N, L, E]
+            memory_idx = torch.sum(~self.model.embedding[0].padding_mask(), dim=1).tolist()
+            states = len(buffer) * [None]
+
+            for i in tqdm(range(input_seq.shape[1]), desc="Initialize"):
+                active = [b for b in range(len(buffer)) if i < memory_idx[b]]
+                _, active_states = recurrent_step(
+                    self.model.transformer_module, input_seq[active, i], [states[b] for b in active]
+                )
+                for b, state in zip(active, active_states):
+                    states[b] = state
+
+            # sample new tokens layer-wise, as each layer might use a different token embedding and generative head
+            for _ in tqdm(range(cur_layer, max_layer), initial=cur_layer, total=max_layer, leave=True, desc="Layers"):
+                # sample only unfinished samples, which contain mixed tokens in their last layer
+                active = [
+                    b for b in range(len(buffer))
+                    if buffer.num_layers(b) == cur_layer and torch.sum(buffer.last_layer(b) == 2) > 0
+                ]
+                if len(active) == 0:
+                    break  # early-out, no mixed tokens sampled
+
+                # init sequences for the current layer of all active samples based on the previous one in place
+                buffer.expand(active)
+                val, dep, pos = zip(*[buffer.layers(b) for b in active])
+
+                # generate value tokens for the current layer
+                next_val, active_memory_idx, active_states = self.generators[0].sample_batch(
+                    val=list(val),
+                    dep=list(dep),
+                    pos=list(pos),
+                    memory_idx=[memory_idx[b] for b in active],
+                    states=[states[b] for b in active],
+                    temperature=temperature,
+                    cls=select_cls(cls, active),
+                )
+
+                # store sampled tokens, if they were not sampled in place, and update the states
+                for i, b in enumerate(active):
+                    val[i][-1].copy_(next_val[i])
+                    memory_idx[b] = active_memory_idx[i]
+                    states[b] = active_states[i]
+                cur_layer += 1
+
+        # transform the sampled octree sequences back into regular-grid voxel arrays and return
+        return [
+            postprocess(buffer.layers(b)[0], target_resolution, self.spatial_dim, output=self.output)
+            for b in range(len(buffer))
+        ]
@@ -6,7 +6,17 @@ from .recurrent_sampler import RecurrentSampler
 
 
 def create_sampler(
-    architecture, embedding, head, model, spatial_dim, max_tokens, max_resolution, position_encoding, device
+    architecture,
+    embedding,
+    head,
+    model,
+    spatial_dim,
+    max_tokens,
+    max_resolution,
+    position_encoding,
+    device,
+    accept_threshold=None,
+    output='dense',
 ):
     """ Creates a sampler model.
 
@@ -22,6 +32,9 @@ def create_sampler(
         max_tokens: Maximum number of tokens a sequence can have.
         max_resolution: Maximum resolution the model is trained on.
         position_encoding: Defines the positional encoding of the data.
+        accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+            multinomial draw. Disabled, if `None`.
+        output: Output format of the sampled shapes, see `postprocess`.
     """
 
     kwargs = {
@@ -33,6 +46,8 @@ def create_sampler(
         "max_tokens": max_tokens,
         "max_resolution": max_resolution,
         "position_encoding": position_encoding,
+        "accept_threshold": accept_threshold,
+        "output": output,
     }
 
     if architecture == "autoencoder":
@@ -0,0 +1,163 @@
+import os
+import re
+import multiprocessing as mp
+
+import numpy as np
+import torch
+
+from utils import EXPORT_FORMATS, export_sample
+from .shape_sampler import ShapeSampler
+
+# sampler and device of the current worker process, which are initialised once for each worker
+_sampler = None
+_device = None
+
+
+def sample_path(path, idx):
+    """ Returns the path of the sample with the index `idx` without the file extension. """
+    return os.path.join(path, f"shape_{idx}")
+
+
+def missing_samples(path, num_samples, export_format='obj'):
+    """ Returns the indices of all samples, which have no complete file in the output directory, yet.
+
+    Args:
+        path: Output directory of the sampled shapes.
+        num_samples: Total number of sampled shapes.
+        export_format: Format of the exported samples, see `utils.export_sample`.
+
+    Return:
+        Sorted list of the indices of missing samples.
+    """
+    existing = set()
+    for file_name in os.listdir(path):
+        match = re.fullmatch(r"shape_(\d+)" + re.escape(EXPORT_FORMATS[export_format]), file_name)
+        if match is not None:
+            existing.add(int(match.group(1)))
+    return [idx for idx in range(num_samples) if idx not in existing]
+
+
+def _init_worker(checkpoint_path, devices, num_threads, accept_threshold, output):
+    """ Loads the model of a sampling worker process onto the next free device. """
+    global _sampler, _device
+    _device = devices.get()
+    torch.set_num_threads(num_threads)
+    _sampler = ShapeSampler(checkpoint_path, device=_device, accept_threshold=accept_threshold, output=output)
+
+
+def _sample_batch(task):
+    """ Samples a batch of shapes in a worker process. The seed depends only on the first index of the batch. """
+    indices, resolution, temperature, cls, seed = task
+    torch.manual_seed(seed + indices[0])
+    cls = torch.tensor([cls], device=_device) if cls is not None else None
+
+    statistics = _sampler.statistics
+    if statistics is not None:
+        statistics.reset()
+
+    samples = _sampler.sample_batch(len(indices), resolution, temperature, cls)
+    counts = vars(statistics).copy() if statistics is not None else {}
+
+    # send only the occupancy of each element, the value tokens or the surface mesh back to the main process
+    return indices, [s if isinstance(s, tuple) else s.astype(np.uint8) for s in samples], counts
+
+
+def sample_farm(
+    checkpoint_path,
+    path,
+    num_samples,
+    batch_size=1,
+    resolution=64,
+    temperature=1.0,
+    cls=None,
+    num_workers=1,
+    num_threads=None,
+    num_export_workers=1,
+    export_format='obj',
+    gpus=0,
+    accept_threshold=None,
+    seed=0,
+    statistics=None,
+    surface='marching_cubes',
+):
+    """ Samples shapes in a pool of worker processes and exports them in a separate pool of processes.
+
+    Each sampling worker holds its own copy of the model. Sampled batches are handed to the export pool as soon as they
+    are finished, thus sampling, marching cubes and file writing run pipelined. Samples, which already have a complete
+    file in `path`, are skipped, which allows to resume an interrupted sampling.
+
+    Args:
+        checkpoint_path: Relative or absolute path to a checkpoint file ("*.ckpt") containing a trained model.
+        path: Output directory of the sampled shapes.
+        num_samples: Total number of sampled shapes.
+        batch_size: Number of shapes, which are sampled in lock-step by a single worker.
+        resolution: The target resolution of the sampled shapes.
+        temperature: Defines the randomness of the samples.
+        cls: Class label for conditional generation as an integer or `None`.
+        num_workers: Number of sampling worker processes.
+        num_threads: Number of torch threads of each sampling worker. Shares all cores between workers, if `None`.
+        num_export_workers: Number of worker processes, which convert and write the sampled shapes.
+        export_format: Format of the exported samples, see `utils.export_sample`. The 'octree' format writes the sampled
+            value token sequences without decoding them.
+        gpus: Number of GPUs, which are assigned to the sampling workers in a round-robin fashion. Samples on the cpu,
+            if `0` or if CUDA is not available.
+        accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+            multinomial draw. Disabled, if `None`.
+        seed: Base seed of the sampling, which is offset by the index of the first sample of each batch.
+        statistics: Optional `SamplingStatistics` instance, which accumulates the counts of all sampling workers.
+        surface: Surface extraction of mesh formats. Either 'marching_cubes' on the dense array of elements or
+            'octree', which extracts the faces of the leaf nodes in the sampling workers without a dense array.
+
+    Return:
+        Generator, which yields the path of each written file as soon as it is complete.
+    """
+    if surface not in ('marching_cubes', 'octree'):
+        raise ValueError(f"ERROR: Unknown surface extraction: {surface}.")
+    if export_format == 'octree':
+        output = 'sequence'
+    elif surface == 'octree' and export_format in ('obj', 'ply', 'stl'):
+        output = 'mesh'
+    else:
+        output = 'dense'
+
+    os.makedirs(path, exist_ok=True)
+    missing = set(missing_samples(path, num_samples, export_format))
+
+    # batches are aligned to their indices, thus a resumed batch reproduces the same samples
+    tasks = []
+    for i in range(0, num_samples, batch_size):
+        indices = list(range(i, min(i + batch_size, num_samples)))
+        if any(idx in missing for idx in indices):
+            tasks += [(indices, resolution, temperature, cls, seed)]
+    if len(tasks) == 0:
+        return
+
+    # spawn workers, as CUDA cannot be used in forked processes
+    ctx = mp.get_context('spawn')
+    devices = ctx.Queue()
+    for i in range(num_workers):
+        devices.put(f"cuda:{i % gpus}" if gpus > 0 and torch.cuda.is_available() else "cpu")
+    if num_threads is None:
+        num_threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+    init_args = (checkpoint_path, devices, num_threads, accept_threshold, output)
+    with ctx.Pool(num_workers, _init_worker, init_args) as sample_pool, ctx.Pool(num_export_workers) as export_pool:
+        pending = []
+        for batch_indices, samples, counts in sample_pool.imap_unordered(_sample_batch, tasks):
+            if statistics is not None:
+                statistics.update(**counts)
+
+            # export finished samples, while the sampling continues
+            for idx, sample in zip(batch_indices, samples):
+                if idx in missing:
+                    args = (sample, sample_path(path, idx), export_format, resolution if output == 'sequence' else None)
+                    pending += [export_pool.apply_async(export_sample, args)]
+
+            # stream all written files
+            ready = [p.ready() for p in pending]
+            for p in [p for p, r in zip(pending, ready) if r]:
+                yield p.get()
+            pending = [p for p, r in zip(pending, ready) if not r]
+
+        for p in pending:
+            yield p.get()
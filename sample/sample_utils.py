@@ -1,12 +1,65 @@
+import functools
 import torch
 import math
+import numpy as np
+
+from torch.nn.utils.rnn import pad_sequence
 
 from utils import (
     _directions,
-    kdTree,
+    CompactKdTree,
+    quick_delinearise,
+    delinearise_boxes,
+    boxes_to_coo,
+    octree_to_mesh,
 )
 
 
+@functools.lru_cache(maxsize=None)
+def _direction_tensor(spatial_dim, pos_encoding, device):
+    """ Returns the directions of the children of a node as a cached pytorch tensor on the given device. """
+    return torch.tensor(_directions(spatial_dim, pos_encoding), dtype=torch.long, device=device)
+
+
+def _first_layer_tokens(spatial_dim, max_resolution, pos_encoding, device):
+    """ Creates the value, depth and position tokens of the first layer, which consists of the children of the root. """
+    dirs = _direction_tensor(spatial_dim, pos_encoding, device)
+    num_children = 2**spatial_dim
+
+    value = torch.ones(num_children, device=device, dtype=torch.long)
+    depth = torch.ones(num_children, device=device, dtype=torch.long)
+    if pos_encoding == 'centered':
+        pos = max_resolution + (max_resolution // 2) * dirs
+    elif pos_encoding == 'intertwined':
+        pos = dirs.clone()
+    else:
+        raise ValueError(f"ERROR: Unknown position encoding: {pos_encoding}.")
+    return value, depth, pos
+
+
+def _child_positions(position, step, spatial_dim, pos_encoding):
+    """ Computes the positions of all children of the given nodes in the order of the sequence.
+
+    Args:
+        position: Position tokens of the parent nodes - [M, A].
+        step: Distance between the position of a parent and its children for the 'centered' encoding, either shared by
+            all nodes or given for each node - [M].
+        spatial_dim: The spatial dimensionality of the value sequence.
+        pos_encoding: Defines the positional encoding of the data.
+
+    Return:
+        Position tokens of the children - [M * 2^A, A].
+    """
+    dirs = _direction_tensor(spatial_dim, pos_encoding, position.device)
+    if pos_encoding == 'centered':
+        pos = position[:, None] + step.reshape(-1, 1, 1) * dirs[None]
+    elif pos_encoding == 'intertwined':
+        pos = 2 * position[:, None] + dirs[None]
+    else:
+        raise ValueError(f"ERROR: Unknown position encoding: {pos_encoding}.")
+    return pos.reshape(-1, spatial_dim)
+
+
 def next_layer_tokens(value, depth, position, spatial_dim, max_resolution, pos_encoding='centered'):
     """ Creates artificial tokens for the next layer of the value sequence, to match the predefined shape. Precomputes
     corresponding depth and position tokens of the sequence, too.
@@ -23,55 +76,199 @@ def next_layer_tokens(value, depth, position, spatial_dim, max_resolution, pos_e
         Pre-initialised next layer sequence (value, depth, position).
     """
     cur_device = value[0].device
-    dirs = _directions(spatial_dim, pos_encoding)
-    num_children = 2**spatial_dim
 
     # got an empty input - initialize with default values and return
     if len(value[0]) == 0:
-        value = torch.tensor(num_children * [1], device=cur_device, dtype=torch.long)
-        depth = torch.tensor(num_children * [1], device=cur_device, dtype=torch.long)
-        pos = (
-            max_resolution * torch.ones(num_children, spatial_dim, device=cur_device, dtype=torch.long) +
-            (max_resolution // 2) * torch.tensor(dirs, device=cur_device)
-        )
-        if pos_encoding == 'centered':
-            pos = (
-                max_resolution * torch.ones(num_children, spatial_dim, device=cur_device, dtype=torch.long) +
-                (max_resolution // 2) * torch.tensor(dirs, device=cur_device)
-            )
-        elif pos_encoding == 'intertwined':
-            pos = (
-                torch.ones(num_children, spatial_dim, device=cur_device, dtype=torch.long) *
-                torch.tensor(dirs, device=cur_device)
-            )
-        else:
-            raise ValueError(f"ERROR: Unknown position encoding: {pos_encoding}.")
-        return value, depth, pos
+        return _first_layer_tokens(spatial_dim, max_resolution, pos_encoding, cur_device)
 
     # compute next layer depth and number of future tokens
     cur_depth = len(value)
-    num_future_tokens = num_children * torch.sum(value[-1] == 2)
+    num_future_tokens = 2**spatial_dim * int(torch.sum(value[-1] == 2))
 
     # compute future sequence (non padding token) and future depth sequence
-    nl_value = torch.tensor([1], device=cur_device, dtype=torch.long).repeat(num_future_tokens)
-    nl_depth = torch.tensor([cur_depth + 1], device=cur_device, dtype=torch.long).repeat(num_future_tokens)
+    nl_value = torch.ones(num_future_tokens, device=cur_device, dtype=torch.long)
+    nl_depth = torch.full((num_future_tokens, ), cur_depth + 1, device=cur_device, dtype=torch.long)
 
-    # retrive and copy mixed tokens positions
-    pos_token = position[-1][value[-1] == 2]
-    nl_pos = torch.repeat_interleave(pos_token, num_children, dim=0)
-
-    # compute position difference and add it to future positions with respect to predefined pattern
-    if pos_encoding == 'centered':
-        pos_step = position[0][0][0] // 2**cur_depth  # assume same resolution for each dimension
-        nl_pos = nl_pos + pos_step * torch.tensor(dirs, device=cur_device).repeat(pos_token.shape[0], 1)
-    elif pos_encoding == 'intertwined':
-        nl_pos = 2 * nl_pos + torch.tensor(dirs, device=cur_device).repeat(pos_token.shape[0], 1)
-    else:
-        raise ValueError(f"ERROR: Unknown position encoding: {pos_encoding}.")
+    # compute the positions of the children of mixed tokens with respect to predefined pattern
+    pos_step = position[0][0][0] // 2**cur_depth  # assume same resolution for each dimension
+    nl_pos = _child_positions(position[-1][value[-1] == 2], pos_step, spatial_dim, pos_encoding)
 
     return nl_value, nl_depth, nl_pos
 
 
+def cat_layers(layers):
+    """ Concatenates the token sequences of multiple layers.
+
+    Consecutive layers of a `SequenceBuffer` are returned as a view of the buffer without copying any tokens. All other
+    layers are copied.
+
+    Args:
+        layers: List of token sequence layers - [L_i, ...].
+
+    Return:
+        Token sequence of all layers - [sum(L_i), ...].
+    """
+    if isinstance(layers, _BufferLayers):
+        return layers.sequence
+    return torch.cat(layers)
+
+
+class _BufferLayers(list):
+    def __init__(self, layers, sequence):
+        """ List with views of the layers of a sample of a `SequenceBuffer`, which holds a view of all its layers. """
+        super(_BufferLayers, self).__init__(layers)
+        self.sequence = sequence
+
+    def __getitem__(self, index):
+        """ Returns a single layer, or the selected layers with a view of their tokens, if they are consecutive. """
+        layers = super(_BufferLayers, self).__getitem__(index)
+        if not isinstance(index, slice) or index.step not in (None, 1):
+            return layers
+
+        first = range(len(self))[index].start
+        start = sum(len(layer) for layer in super(_BufferLayers, self).__getitem__(slice(first)))
+        return _BufferLayers(layers, self.sequence[start:start + sum(len(layer) for layer in layers)])
+
+
+class SequenceBuffer:
+    def __init__(self, batch_size, spatial_dim, max_resolution, pos_encoding='centered', device='cpu', capacity=0):
+        """ Stores the token sequences of multiple samples in preallocated tensors, which hold all layers of a sample
+        consecutively and are indexed by the offsets of the layers.
+
+        New layers are expanded in place for all samples at once. The layers of a sample are views of the buffer, thus
+        tokens written into a layer by a token generator are stored in the buffer and `cat_layers` returns the whole
+        sequence without copying. The buffer grows by doubling its capacity, which invalidates all previous views.
+
+        Args:
+            batch_size: Number of stored samples.
+            spatial_dim: The spatial dimensionality of the value sequences.
+            max_resolution: The maximal resolution the corresponding model is trained for.
+            pos_encoding: Defines the positional encoding of the data.
+            device: Device on which, the data should be stored. Either "cpu" or "cuda" (gpu-support).
+            capacity: Initial number of tokens, which can be stored for each sample.
+        """
+        self.spatial_dim = spatial_dim
+        self.max_resolution = max_resolution
+        self.pos_encoding = pos_encoding
+        self.device = device
+
+        self.value = torch.zeros(batch_size, capacity, dtype=torch.long, device=device)
+        self.depth = torch.zeros(batch_size, capacity, dtype=torch.long, device=device)
+        self.position = torch.zeros(batch_size, capacity, spatial_dim, dtype=torch.long, device=device)
+        self.offsets = [[0] for _ in range(batch_size)]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def capacity(self):
+        """ Number of tokens, which can be stored for each sample without growing the buffer. """
+        return self.value.shape[1]
+
+    def length(self, b):
+        """ Returns the number of tokens of a sample. """
+        return self.offsets[b][-1]
+
+    def num_layers(self, b):
+        """ Returns the number of layers of a sample. """
+        return len(self.offsets[b]) - 1
+
+    def reserve(self, length):
+        """ Grows the buffer, such that each sample can hold at least the given number of tokens. """
+        if length <= self.capacity:
+            return
+        capacity = max(length, 2 * self.capacity)
+        for name in ('value', 'depth', 'position'):
+            old = getattr(self, name)
+            new = old.new_zeros((len(self), capacity) + old.shape[2:])
+            new[:, :old.shape[1]] = old
+            setattr(self, name, new)
+
+    def append(self, b, val, dep, pos):
+        """ Appends layers of token sequences to a sample.
+
+        Args:
+            b: Index of the sample.
+            val: List of value token sequences for each layer.
+            dep: List of depth token sequences for each layer.
+            pos: List of position token sequences for each layer.
+        """
+        self.reserve(self.length(b) + sum(len(v) for v in val))
+        for v, d, p in zip(val, dep, pos):
+            start, stop = self.length(b), self.length(b) + len(v)
+            self.value[b, start:stop] = v
+            self.depth[b, start:stop] = d
+            self.position[b, start:stop] = p
+            self.offsets[b] += [stop]
+
+    def layers(self, b):
+        """ Returns lists with views of the value, depth and position tokens of each layer of a sample. """
+        offsets = self.offsets[b]
+        layers = [slice(start, stop) for start, stop in zip(offsets[:-1], offsets[1:])]
+        return tuple(_BufferLayers([seq[s] for s in layers], seq) for seq in self.sequence(b))
+
+    def sequence(self, b):
+        """ Returns views of the value, depth and position token sequences of all layers of a sample. """
+        length = self.length(b)
+        return self.value[b, :length], self.depth[b, :length], self.position[b, :length]
+
+    def last_layer(self, b):
+        """ Returns a view of the value tokens of the last layer of a sample. """
+        return self.value[b, self.offsets[b][-2]:self.offsets[b][-1]]
+
+    def expand(self, index=None):
+        """ Appends the pre-initialised next layer to each given sample, see `next_layer_tokens`.
+
+        The children of the mixed tokens of all samples are computed with a single vectorized pass and written directly
+        into the buffer behind the last layer of each sample.
+
+        Args:
+            index: List with indices of the expanded samples. All samples are expanded, if `None`.
+        """
+        index = list(range(len(self))) if index is None else list(index)
+
+        # samples without any tokens start with the first layer
+        empty = [b for b in index if self.length(b) == 0]
+        for b in empty:
+            self.append(b, *[[t] for t in _first_layer_tokens(
+                self.spatial_dim, self.max_resolution, self.pos_encoding, self.device
+            )])
+        index = [b for b in index if b not in empty]
+        if len(index) == 0:
+            return
+
+        rows = torch.tensor(index, device=self.device)
+        start = torch.tensor([self.offsets[b][-2] for b in index], device=self.device)
+        stop = torch.tensor([self.offsets[b][-1] for b in index], device=self.device)
+        num_layers = torch.tensor([self.num_layers(b) for b in index], device=self.device)
+
+        # find the mixed tokens in the last layer of each sample, which is padded to the longest last layer
+        cols = start[:, None] + torch.arange(int(torch.max(stop - start)), device=self.device)
+        valid = cols < stop[:, None]
+        cols = cols.clamp(max=max(self.capacity - 1, 0))
+        mixed = valid & (self.value[rows[:, None], cols] == 2)
+        num_future_tokens = 2**self.spatial_dim * torch.sum(mixed, dim=1)
+        self.reserve(int(torch.max(stop + num_future_tokens)))
+
+        # compute the positions of the children of all mixed tokens in the order of the samples and their sequences
+        sample, col = torch.nonzero(mixed, as_tuple=True)
+        pos_step = self.position[rows, 0, 0] // 2**num_layers  # assume same resolution for each dimension
+        nl_pos = _child_positions(
+            self.position[rows[sample], cols[sample, col]], pos_step[sample], self.spatial_dim, self.pos_encoding
+        )
+
+        # write the next layer of each sample behind its last layer
+        nl_sample = torch.repeat_interleave(sample, 2**self.spatial_dim)
+        first = torch.cumsum(num_future_tokens, dim=0) - num_future_tokens
+        nl_col = stop[nl_sample] + torch.arange(len(nl_sample), device=self.device) - first[nl_sample]
+        self.value[rows[nl_sample], nl_col] = 1
+        self.depth[rows[nl_sample], nl_col] = num_layers[nl_sample] + 1
+        self.position[rows[nl_sample], nl_col] = nl_pos
+
+        for b, s, n in zip(index, stop.tolist(), num_future_tokens.tolist()):
+            self.offsets[b] += [s + n]
+
+
 def preprocess(precondition, precondition_resolution, spatial_dim, pos_encoding, device):
     """ Transform input array elements into token sequences.
 
@@ -86,7 +283,7 @@ def preprocess(precondition, precondition_resolution, spatial_dim, pos_encoding,
         List of pytorch tensor consisting of token sequences (value, depth, position) for each depth layer.
     """
     # convert input array into token sequence
-    tree = kdTree(spatial_dim, pos_encoding)
+    tree = CompactKdTree(spatial_dim, pos_encoding)
     tree = tree.insert_element_array(precondition, max_depth=math.log2(precondition_resolution) + 1)
     value, depth, position = tree.get_token_sequence(
         depth=math.log2(precondition_resolution), return_depth=True, return_pos=True
@@ -106,7 +303,7 @@ def preprocess(precondition, precondition_resolution, spatial_dim, pos_encoding,
     return val, dep, pos
 
 
-def postprocess(value, target_resolution, spatial_dim, pos_encoding="centered"):
+def postprocess(value, target_resolution, spatial_dim, pos_encoding="centered", output="dense"):
     """ Transform sequence of value tokens into an array of elements (voxels/pixels).
 
     Args:
@@ -114,25 +311,283 @@ def postprocess(value, target_resolution, spatial_dim, pos_encoding="centered"):
         target_resolution: Resolution up to which an object should be sampled.
         spatial_dim: The spatial dimensionality of the array of elements.
         pos_encoding: Defines the positional encoding of the data.
+        output: Defines the returned representation. `dense` - an `int64` array of elements. `uint8` - an `uint8`
+            array of elements. `packed` - the occupancy of all elements packed into bits, see `np.packbits`. `boxes` -
+            a tuple of (corner, size) of all occupied leaf nodes, see `delinearise_boxes`. `coo` - the coordinates of
+            all occupied elements. `mesh` - a tuple of (vertices, faces, normals) of the surface, which is extracted
+            from the leaf nodes, see `octree_to_mesh`. `sequence` - the value token sequence itself, e.g. to be written
+            with `write_octree`.
 
     Return:
-        An array of elements as a numpy array.
+        An array of elements as a numpy array or its sparse representation.
     """
     # concat all layers
-    value = torch.cat(value)
+    value = cat_layers(value)
 
     # move value sequence to the cpu and convert to numpy array
     value = value.cpu().numpy()
 
     # TODO: define trinary transformation based on list of embeddings
 
-    # insert the sequence into a kd-tree
-    tree = kdTree(spatial_dim, pos_encoding).insert_token_sequence(
+    # decode the sequence directly into a surface mesh or occupied boxes, without materialising the array
+    if output == 'sequence':
+        return value.copy()  # the tokens might be a view of the buffer of the sampler
+    elif output == 'mesh':
+        return octree_to_mesh(value, target_resolution, autorepair_errors=True, silent=True)
+    elif output in ('boxes', 'coo'):
+        boxes = delinearise_boxes(value, target_resolution, spatial_dim, autorepair_errors=True, silent=True)
+        return boxes if output == 'boxes' else boxes_to_coo(*boxes)
+    elif output not in ('dense', 'uint8', 'packed'):
+        raise ValueError(f"ERROR: Unknown output format: {output}.")
+
+    # decode the sequence directly into pixels/voxels
+    array = quick_delinearise(
         value,
         resolution=target_resolution,
+        spatial_dim=spatial_dim,
+        mode="occupancy",
         autorepair_errors=True,
         silent=True,
+        dtype=np.int64 if output == 'dense' else np.uint8,
     )
+    return np.packbits(array, axis=None) if output == 'packed' else array
+
+
+def batch_sequences(val, dep, pos):
+    """ Pads the token sequences of multiple samples with the padding token '0' into a single batch.
+
+    Args:
+        val: List of value token sequences - [L_i].
+        dep: List of depth token sequences - [L_i].
+        pos: List of position token sequences - [L_i, A].
+
+    Return:
+        Batched token sequences (value, depth, position) with the shapes ([N, L], [N, L], [N, L, A]).
+    """
+    return (
+        pad_sequence(val, batch_first=True, padding_value=0),
+        pad_sequence(dep, batch_first=True, padding_value=0),
+        pad_sequence(pos, batch_first=True, padding_value=0),
+    )
+
+
+def batch_windows(val, dep, pos, windows):
+    """ Concatenates slices of the last layers of multiple samples and pads them into a single batch.
+
+    Args:
+        val: List with value token sequence layers of each sample.
+        dep: List with depth token sequence layers of each sample.
+        pos: List with position token sequence layers of each sample.
+        windows: Dictionary, which maps the index of each batched sample onto a list of slices of its last layers.
+
+    Return:
+        Batched token sequences (value, depth, position) of the samples in the order of `windows`.
+    """
+    def concat(layers, slices):
+        return torch.cat([layer[s] for layer, s in zip(layers[-len(slices):], slices)])
+
+    return batch_sequences(*[[concat(seq[b], slices) for b, slices in windows.items()] for seq in (val, dep, pos)])
+
+
+def window_lengths(val, windows):
+    """ Computes the number of tokens of slices of the last layers of multiple samples.
+
+    Args:
+        val: List with value token sequence layers of each sample.
+        windows: Dictionary, which maps the index of each batched sample onto a list of slices of its last layers.
+
+    Return:
+        Number of tokens of each sample, which are not padding [N], in the batches of `batch_windows`.
+    """
+    length = [sum(len(layer[s]) for layer, s in zip(val[b][-len(slices):], slices)) for b, slices in windows.items()]
+    return torch.tensor(length, device=val[next(iter(windows))][-1].device)
+
+
+def window_index(val, windows):
+    """ Computes the index of the tokens of slices of the last layers of multiple samples in their whole sequences.
+
+    Args:
+        val: List with value token sequence layers of each sample.
+        windows: Dictionary, which maps the index of each batched sample onto a list of slices of its last layers.
+
+    Return:
+        Index of each token in the sequence of its sample [N, S] and a mask of valid, non-padding tokens [N, S], which
+        gather the same tokens as `batch_windows`.
+    """
+    index = []
+    for b, slices in windows.items():
+        start = torch.cumsum(torch.tensor([0] + [len(layer) for layer in val[b]]), dim=0)[-len(slices) - 1:-1]
+        layers = val[b][-len(slices):]
+        index += [torch.cat([
+            int(s) + torch.arange(len(layer), device=layer.device)[w] for s, layer, w in zip(start, layers, slices)
+        ])]
+
+    index = pad_sequence(index, batch_first=True, padding_value=-1)
+    return index.clamp(min=0), index >= 0
+
+
+def select_cls(cls, index):
+    """ Selects the class labels of the given samples, if the sampling is class conditional. """
+    return cls[index] if cls is not None else None
+
+
+class SamplingStatistics:
+    def __init__(self):
+        """ Counts the sampled tokens and the forward passes used to sample them, to report the acceptance rate of the
+        draft tokens and the share of tokens, which were accepted with confidence without a multinomial draw.
+        """
+        self.reset()
+
+    def reset(self):
+        """ Resets all counters. """
+        self.num_tokens = 0
+        self.num_passes = 0
+        self.num_confident = 0
+
+    def update(self, num_tokens=0, num_passes=0, num_confident=0):
+        """ Adds the given counts to the counters. """
+        self.num_tokens += num_tokens
+        self.num_passes += num_passes
+        self.num_confident += num_confident
+
+    @property
+    def acceptance_rate(self):
+        """ Share of sampled tokens, which were accepted without a forward pass of their own. """
+        return 1.0 - self.num_passes / self.num_tokens if self.num_tokens > 0 else 0.0
+
+    @property
+    def confidence_rate(self):
+        """ Share of sampled tokens, which were accepted with confidence without a multinomial draw. """
+        return self.num_confident / self.num_tokens if self.num_tokens > 0 else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.num_tokens} tokens in {self.num_passes} passes - acceptance rate: {self.acceptance_rate:.1%}, "
+            f"confidence rate: {self.confidence_rate:.1%}"
+        )
+
+
+def _draw_tokens(logits, temperature, accept_threshold):
+    """ Draws a single token from each row of the logits. Tokens with a probability of at least `accept_threshold` are
+    accepted without a multinomial draw.
+
+    Return:
+        Drawn value tokens - [N] and a mask of tokens accepted with confidence - [N].
+    """
+    logits = logits.clone()
+    logits[:, 0] = -float("Inf")  # 'padding' token
+    probs = torch.nn.functional.softmax(logits / temperature, dim=-1)  # [N, V]
+
+    if accept_threshold is None:
+        confident = torch.zeros(len(probs), dtype=torch.bool, device=probs.device)
+        return torch.multinomial(probs, num_samples=1)[:, 0], confident
+
+    # draw only tokens without a confident prediction
+    confidence, tokens = torch.max(probs, dim=-1)
+    confident = confidence >= accept_threshold
+    uncertain = torch.nonzero(~confident)[:, 0]
+    if len(uncertain) > 0:
+        tokens[uncertain] = torch.multinomial(probs[uncertain], num_samples=1)[:, 0]
+    return tokens, confident
+
+
+def sample_tokens(logits, temperature, accept_threshold=None, statistics=None):
+    """ Samples a single token for each sample of the batch from the given logits.
+
+    Args:
+        logits: Logits of the sampled token of each sample - [N, V].
+        temperature: Defines the randomness of the samples.
+        accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+            multinomial draw. Disabled, if `None`.
+        statistics: Optional `SamplingStatistics` instance, which counts the sampled tokens.
+
+    Return:
+        Sampled value tokens - [N].
+    """
+    tokens, confident = _draw_tokens(logits, temperature, accept_threshold)
+    if statistics is not None:
+        statistics.update(num_tokens=len(tokens), num_confident=int(torch.sum(confident)))
+    return tokens
+
+
+def verify_draft(logits, draft, temperature, accept_threshold=None, statistics=None):
+    """ Samples the tokens of a block from the logits of a single forward pass, which processed the `draft` tokens as
+    the input of the block.
+
+    The logits of a token are only valid, as long as all previous tokens of the block are equal to their draft tokens.
+    Thus, tokens are accepted up to and including the first sampled token, which differs from its draft. The most
+    likely tokens of the remaining logits are returned as the draft for the following pass.
+
+    Args:
+        logits: Logits of the remaining tokens of the block - [T, V].
+        draft: Draft tokens of the remaining block, which were used as input of the forward pass - [T].
+        temperature: Defines the randomness of the samples.
+        accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+            multinomial draw. Disabled, if `None`.
+        statistics: Optional `SamplingStatistics` instance, which counts the sampled tokens.
+
+    Return:
+        Accepted value tokens - [A] and the new draft of the remaining tokens - [T - A].
+    """
+    tokens, confident = _draw_tokens(logits, temperature, accept_threshold)
+
+    # accept tokens up to the first rejected draft token
+    rejected = torch.nonzero(tokens != draft)[:, 0]
+    num_accepted = int(rejected[0]) + 1 if len(rejected) > 0 else len(tokens)
+    if statistics is not None:
+        statistics.update(num_tokens=num_accepted, num_confident=int(torch.sum(confident[:num_accepted])))
+
+    return tokens[:num_accepted], torch.argmax(logits[num_accepted:, 1:], dim=-1) + 1
+
+
+def _map_state(fn, *states):
+    """ Applies `fn` to corresponding tensors of nested lists or tuples of tensors. """
+    if torch.is_tensor(states[0]):
+        return fn(*states)
+    return type(states[0])(_map_state(fn, *s) for s in zip(*states))
+
+
+def split_state(state, batch_size):
+    """ Splits the batched internal state of a recurrent transformer into a list of states of single samples. """
+    if state is None:
+        return batch_size * [None]
+    return [_map_state(lambda s: s[i:i + 1], state) for i in range(batch_size)]
+
+
+def _state_shape(state):
+    """ Returns the shapes of all tensors of the given internal state of a recurrent transformer. """
+    if state is None:
+        return None
+    if torch.is_tensor(state):
+        return tuple(state.shape)
+    return tuple(_state_shape(s) for s in state)
+
+
+def recurrent_step(transformer_fn, x, states):
+    """ Processes a single token of multiple samples with a recurrent transformer.
+
+    Samples, which internal states have the same shape, are processed together as a single batch. States of linear
+    attentions have a fixed size, such that all samples are processed at once. States of a full attention grow with
+    each processed token, such that only samples with an equal number of processed tokens are batched.
+
+    Args:
+        transformer_fn: Function, which processes a single token of a batch with a recurrent transformer.
+        x: A single input token for each sample - [N, E].
+        states: List with the internal state of each sample.
+
+    Return:
+        The output token of each sample [N, E] and a list with the updated internal state of each sample.
+    """
+    groups = {}
+    for i, state in enumerate(states):
+        groups.setdefault(_state_shape(state), []).append(i)
+
+    out = torch.zeros_like(x)
+    new_states = len(states) * [None]
+    for index in groups.values():
+        state = None if states[index[0]] is None else _map_state(lambda *s: torch.cat(s), *[states[i] for i in index])
+        out[index], state = transformer_fn(x[index], state)
+        for i, s in zip(index, split_state(state, len(index))):
+            new_states[i] = s
 
-    # retrive pixels/voxels from the kd-tree
-    return tree.get_element_array(mode="occupancy")
+    return out, new_states
@@ -5,7 +5,7 @@ from .layer_sampler import create_sampler
 
 
 class ShapeSampler:
-    def __init__(self, checkpoint_path: str, fast_recurrent=True, device="cuda"):
+    def __init__(self, checkpoint_path: str, fast_recurrent=True, device="cuda", accept_threshold=None, output="dense"):
         """ Initializes the sampler class. Loads the correct model and sets functions and parameters according to the
             given model.
 
@@ -15,6 +15,11 @@ class ShapeSampler:
                 formulation durring inference time, otherwise uses the standard full pass technique.
             device: Selects the device on which the sampling should be performed. Either "cpu" or "cuda" (gpu-support)
                 available.
+            accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+                multinomial draw, which trades sample quality for throughput. Disabled, if `None`.
+            output: Output format of the sampled shapes. Either a dense array of elements ("dense"), a sparse format
+                ("boxes", "coo"), a surface mesh extracted directly from the octree ("mesh") or the value token sequence
+                ("sequence"), see `postprocess`.
         """
         # load and restore model from checkpoint
         pl_module = ShapeTransformer.load_from_checkpoint(checkpoint_path)
@@ -39,8 +44,17 @@ class ShapeSampler:
             hparams["resolution"],
             hparams["position_encoding"],
             device,
+            accept_threshold,
+            output,
         )
 
+    @property
+    def statistics(self):
+        """ Returns the `SamplingStatistics` of the sampler with the number of sampled tokens, the acceptance rate of
+        the draft tokens and the share of tokens accepted with confidence, if the sampler counts them.
+        """
+        return getattr(self.sampler, 'statistics', None)
+
     def sample_preconditioned(
         self,
         precondition,
@@ -68,7 +82,6 @@ class ShapeSampler:
             A sampled array of elements (pixels/voxels) with the size of `target_resolution` as a numpy array.
 
         TODO: If `input` is None, than a single random sample will be drawn from the dataset used in the model.
-        TODO: Extend with `batch_size` to allow parallel sampling.
         """
         if input is None:
             raise ValueError("ERROR: `input` cannot be `None`.")
@@ -95,3 +108,36 @@ class ShapeSampler:
         random_element_array = torch.randint(low=0, high=2, size=array_size, dtype=torch.long).numpy()
 
         return self.sampler(random_element_array, 2, target_resolution, temperature, cls)
+
+    def sample_batch(self, num_samples, target_resolution=32, temperature=1.0, cls=None):
+        """ Sample multiple unconditioned random arrays of elements from the model in parallel.
+
+        All samples are processed as a single batch in lock-step, while each sample finishes independently. Samplers
+        without a batched implementation sample each array on its own.
+
+        Args:
+            num_samples: Number of sampled arrays.
+            target_resolution: The target resolution for the up-sampling process. The resolution should be not bigger,
+                than the maximal trained model resolution. Resolution values can be only power of 2.
+            temperature: Defines the randomness of the samples. Lower temperatures make the model increasingly
+                confident in its top choices, while temperatures greater than 1 decrease confidence. 0 temperature is
+                equivalent to argmax/max likelihood, while infinite temperature corresponds to a uniform sampling.
+            cls: if the transformer has been trained class conditional, we can add a single class label for all
+                samples or a class label for each sample, otherwise this argument will be ignored.
+
+        Return:
+            A list of sampled arrays of elements (pixels/voxels) with the size of `target_resolution` as numpy arrays.
+        """
+        # create initial arrays, with all elements marked as undefined/mixed.
+        array_size = [num_samples] + self.spatial_dim * [self.trained_resolution]
+        random_element_arrays = list(torch.randint(low=0, high=2, size=array_size, dtype=torch.long).numpy())
+
+        if cls is not None:
+            cls = cls.expand(num_samples)
+
+        if not hasattr(self.sampler, 'sample_batch'):
+            return [
+                self.sampler(array, 2, target_resolution, temperature, None if cls is None else cls[i:i + 1])
+                for i, array in enumerate(random_element_arrays)
+            ]
+        return self.sampler.sample_batch(random_element_arrays, 2, target_resolution, temperature, cls)
@@ -2,17 +2,25 @@ import torch
 
 from tqdm.auto import trange
 
+from modules.utils import DecodingCache
+from ..sample_utils import batch_sequences, cat_layers, select_cls, verify_draft, SamplingStatistics
+
 
 class BasicGenerator:
-    def __init__(self, compute_logits_fn, num_tokens=1, **_):
+    def __init__(self, compute_logits_fn, num_tokens=1, accept_threshold=None, statistics=None, **_):
         """ Create token generator instance which samples 'num_tokens' in one pass.
 
         Args:
             compute_logits_fn: Pointer to function, which computes logits of given sequence.
             num_tokens: Defines the number of sampled tokens in each step.
+            accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+                multinomial draw. Disabled, if `None`.
+            statistics: `SamplingStatistics` instance, which counts the sampled tokens and forward passes.
         """
         self.compute_logits = compute_logits_fn
         self.kernel_size = num_tokens
+        self.accept_threshold = accept_threshold
+        self.statistics = statistics if statistics is not None else SamplingStatistics()
 
     def __call__(self, val, dep, pos, memory=None, idx=0, temperature=1.0, slice_sequence=True, cls=None, **_):
         """ Sample autoregressive current value token sequence and return updated value sequence.
@@ -31,32 +39,104 @@ class BasicGenerator:
         """
         # compute indices
         token_idx = 0
-        sampled_idx = len(torch.cat(val[:-1])) if len(val) > 1 else 0
+        sampled_idx = sum(len(v) for v in val[:-1]) if len(val) > 1 else 0
+
+        # reuse keys and values of unchanged tokens between consecutive passes
+        cache = DecodingCache()
 
         # sample tokens autoregressive
         for _ in trange(len(val[-1]) // self.kernel_size, leave=False, desc="Tokens"):
 
-            for block_idx in range(self.kernel_size):
+            block_idx = 0
+            while block_idx < self.kernel_size:
                 # concat layers and slice sequence for speed_up
                 seq = (
-                    torch.cat(val)[:sampled_idx + token_idx + self.kernel_size].unsqueeze(0),
-                    torch.cat(dep)[:sampled_idx + token_idx + self.kernel_size].unsqueeze(0),
-                    torch.cat(pos)[:sampled_idx + token_idx + self.kernel_size].unsqueeze(0),
+                    cat_layers(val)[:sampled_idx + token_idx + self.kernel_size].unsqueeze(0),
+                    cat_layers(dep)[:sampled_idx + token_idx + self.kernel_size].unsqueeze(0),
+                    cat_layers(pos)[:sampled_idx + token_idx + self.kernel_size].unsqueeze(0),
                 )
 
-                logits = self.compute_logits(seq, memory, idx, cls)[0]
+                logits = self.compute_logits(seq, memory, idx, cls, cache=cache)[0]
+                self.statistics.update(num_passes=1)
 
-                # retrieve only logits for for current index
-                sampled_token_logits = logits[sampled_idx + token_idx + block_idx]
+                # retrieve only logits for the remaining tokens of the block
+                start = sampled_idx + token_idx
+                remaining = slice(token_idx + block_idx, token_idx + self.kernel_size)
+                block_logits = logits[start + block_idx:start + self.kernel_size]
 
-                # compute token probabilities from logits
-                sampled_token_logits[0] = -float("Inf")  # 'padding' token
-                probs = torch.nn.functional.softmax(sampled_token_logits / temperature, dim=-1)  # [t, V]
-
-                # sample next sequence token
-                val[-1][token_idx + block_idx] = torch.multinomial(probs, num_samples=1)[0]
+                # sample next sequence tokens, as long as they are equal to their draft, and draft remaining tokens
+                tokens, draft = verify_draft(
+                    block_logits, val[-1][remaining], temperature, self.accept_threshold, self.statistics
+                )
+                val[-1][remaining] = torch.cat([tokens, draft])
+                block_idx += len(tokens)
 
             # update indices
             token_idx += self.kernel_size
 
         return val[-1]
+
+    def sample_batch(self, val, dep, pos, memory=None, idx=0, temperature=1.0, cls=None, **_):
+        """ Sample autoregressive current value token sequences of multiple samples in lock-step.
+
+        Each step processes all samples, which have tokens left in the current layer, as a single batch.
+
+        Args:
+            val: List with value token sequence layers of each sample.
+            dep: List with depth token sequence layers of each sample.
+            pos: List with position token sequence layers of each sample.
+            memory: Latent sequence vector of the previous layer.
+            idx: Currently sampled transformer layer index.
+            temperature: Defines the randomness of the samples.
+            cls: class labels of all samples for conditional generation.
+
+        Return:
+            List with the sampled token sequence with values of the current layer for each sample.
+        """
+        # compute indices
+        sampled_idx = [sum(len(v) for v in v_b[:-1]) for v_b in val]
+        num_tokens = [len(v_b[-1]) for v_b in val]
+
+        # reuse keys and values of unchanged tokens between consecutive passes
+        cache = DecodingCache()
+        active = list(range(len(val)))
+
+        # sample tokens autoregressive
+        for token_idx in trange(0, max(num_tokens), self.kernel_size, leave=False, desc="Tokens"):
+            # process only samples with remaining tokens in the current layer and keep their cached results
+            kept = [i for i, b in enumerate(active) if token_idx < num_tokens[b]]
+            if len(kept) < len(active):
+                cache.select(kept)
+                active = [active[i] for i in kept]
+            end = [sampled_idx[b] + token_idx + self.kernel_size for b in active]
+
+            block_idx = {b: 0 for b in active}
+            while min(block_idx.values()) < self.kernel_size:
+                # concat layers and slice sequences for speed_up
+                seq = batch_sequences(
+                    [cat_layers(val[b])[:e] for b, e in zip(active, end)],
+                    [cat_layers(dep[b])[:e] for b, e in zip(active, end)],
+                    [cat_layers(pos[b])[:e] for b, e in zip(active, end)],
+                )
+
+                logits = self.compute_logits(seq, memory, idx, select_cls(cls, active), cache=cache)
+
+                # sample only samples with remaining tokens in the current block
+                block = [i for i, b in enumerate(active) if block_idx[b] < self.kernel_size]
+                self.statistics.update(num_passes=len(block))
+
+                for i in block:
+                    b = active[i]
+                    # retrieve only logits for the remaining tokens of the block
+                    start = sampled_idx[b] + token_idx
+                    remaining = slice(token_idx + block_idx[b], token_idx + self.kernel_size)
+                    block_logits = logits[i, start + block_idx[b]:start + self.kernel_size]
+
+                    # sample next sequence tokens, as long as they are equal to their draft, and draft remaining tokens
+                    tokens, draft = verify_draft(
+                        block_logits, val[b][-1][remaining], temperature, self.accept_threshold, self.statistics
+                    )
+                    val[b][-1][remaining] = torch.cat([tokens, draft])
+                    block_idx[b] += len(tokens)
+
+        return [v_b[-1] for v_b in val]
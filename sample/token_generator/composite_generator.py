@@ -6,15 +6,19 @@ from .substitution_generator import SubstitutionGenerator
 
 
 class CompositeGenerator:
-    def __init__(self, compute_logits_fn, num_tokens=[1], **_):
+    def __init__(self, compute_logits_fn, num_tokens=[1], accept_threshold=None, statistics=None, **_):
         """ Create token generator instance for a 'basic' head.
 
         Args:
             compute_logits_fn: Pointer to function, which computes logits of given sequence.
             num_tokens: Defines the number of sampled tokens in each step.
+            accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+                multinomial draw. Disabled, if `None`.
+            statistics: `SamplingStatistics` instance, which counts the sampled tokens and forward passes.
         """
         self.compute_logits_fn = compute_logits_fn
         self.num_tokens_list = num_tokens
+        self.kwargs = {'accept_threshold': accept_threshold, 'statistics': statistics}
 
     def __call__(self, val, dep, pos, memory=None, layer_idx=0, temperature=1.0, cls=None, **_):
         """ Sample autoregressively current value token sequence and return sampled value sequence.
@@ -31,16 +35,36 @@ class CompositeGenerator:
         Return:
             Sampled token sequence with values of the current layer.
         """
-        # get the currently sampled depth
-        cur_depth = torch.max(dep[-1])
+        # sample a single layer with a generator according to layer depth
+        generator = self._generator(torch.max(dep[-1]))
+        return generator(val, dep, pos, memory, layer_idx, temperature, cls=cls)
+
+    def sample_batch(self, val, dep, pos, memory=None, layer_idx=0, temperature=1.0, cls=None, **_):
+        """ Sample autoregressively current value token sequences of multiple samples in lock-step.
+
+        Args:
+            val: List with value token sequences of previous and current layers of each sample.
+            dep: List with depth token sequences of previous and current layers of each sample.
+            pos: List with position token sequences of previous and current layers of each sample.
+            memory: Latent sequence vector of the previous layer.
+            layer_idx: Currently sampled layer index.
+            temperature: Defines the randomness of the samples.
+            cls: class labels of all samples for conditional generation.
+
+        Return:
+            List with the sampled token sequence with values of the current layer for each sample.
+        """
+        # all samples share the currently sampled depth
+        generator = self._generator(torch.max(dep[0][-1]))
+        return generator.sample_batch(val, dep, pos, memory, layer_idx, temperature, cls=cls)
+
+    def _generator(self, cur_depth):
+        """ Creates a generator according to the currently sampled layer depth. """
         # get number of sampled tokens accordingly to depth
         num_tokens = self.num_tokens_list[cur_depth - 1]
-        # create a generator according to layer depth
         if cur_depth < 6:
-            generator = BasicGenerator(self.compute_logits_fn, num_tokens)
+            return BasicGenerator(self.compute_logits_fn, num_tokens, **self.kwargs)
         elif cur_depth == 6:  # 'substitution'
-            generator = SubstitutionGenerator(self.compute_logits_fn, num_tokens)
+            return SubstitutionGenerator(self.compute_logits_fn, num_tokens, **self.kwargs)
         else:  # 'double_substitution'
-            generator = DoubleSubstitutionGenerator(self.compute_logits_fn, num_tokens)
-        # sample a single layer
-        return generator(val, dep, pos, memory, layer_idx, temperature, cls=cls)
+            return DoubleSubstitutionGenerator(self.compute_logits_fn, num_tokens, **self.kwargs)
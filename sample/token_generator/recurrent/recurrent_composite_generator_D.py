@@ -6,21 +6,38 @@ from .recurrent_double_substitution_generator import RecurrentDoubleSubstitution
 
 
 class RecurrentCompositeGeneratorD:
-    def __init__(self, embed_fn, transformer_fn, head_fn, num_tokens=[1], **_):
+    def __init__(
+        self,
+        embed_fn,
+        transformer_fn,
+        block_embed_fn,
+        block_sample_fn,
+        num_tokens=[1],
+        accept_threshold=None,
+        statistics=None,
+        **_,
+    ):
         """ Create token generator instance for a 'basic' head.
 
         Args:
             embed_fn: Pointer to function, which processes the token embedding of the Shape Transformer.
             transformer_fn: Pointer to function, which processes the Transformer module of the Shape Transformer.
-            head_fn: Pointer to function, which processes the generative head of the Shape Transformer.
+            block_embed_fn: Pointer to function, which embeds a single block of the last layer of the Shape Transformer.
+            block_sample_fn: Pointer to function, which samples a single block with the generative head of the Shape
+                Transformer.
             num_tokens: Defines the number of sampled tokens in each step for each single depth layer.
+            accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+                multinomial draw. Disabled, if `None`.
+            statistics: `SamplingStatistics` instance, which counts the sampled tokens and forward passes.
         """
         self.model_fn = {
             'embed_fn': embed_fn,
             'transformer_fn': transformer_fn,
-            'head_fn': head_fn,
+            'block_embed_fn': block_embed_fn,
+            'block_sample_fn': block_sample_fn,
         }
         self.num_tokens_list = num_tokens
+        self.kwargs = {'accept_threshold': accept_threshold, 'statistics': statistics}
 
     def __call__(self, val, dep, pos, memory=None, state=None, temperature=1.0, cls=None, **_):
         """ Sample autoregressive current value token sequence and return sampled value sequence.
@@ -37,16 +54,37 @@ class RecurrentCompositeGeneratorD:
         Return:
             Sampled token sequence with values of the current layer.
         """
-        # get the currently sampled depth
-        cur_depth = torch.max(dep[-1])
+        # sample a single layer with a generator according to layer depth
+        generator = self._generator(torch.max(dep[-1]))
+        return generator(val, dep, pos, memory, state, temperature, cls=cls)
+
+    def sample_batch(self, val, dep, pos, memory_idx, states, temperature=1.0, cls=None, **_):
+        """ Sample autoregressively current value token sequences of multiple samples in lock-step.
+
+        Args:
+            val: List with value token sequence layers of each sample.
+            dep: List with depth token sequence layers of each sample.
+            pos: List with position token sequence layers of each sample.
+            memory_idx: List with the number of tokens of each sample, which are already processed by the Transformer.
+            states: List with the internal state of the Transformer for each sample.
+            temperature: Defines the randomness of the samples.
+            cls: class labels of all samples for conditional generation.
+
+        Return:
+            Lists with the sampled token sequence with values of the current layer, the number of processed tokens and
+            the internal state of the Transformer for each sample.
+        """
+        # all samples share the currently sampled depth
+        generator = self._generator(torch.max(dep[0][-1]))
+        return generator.sample_batch(val, dep, pos, memory_idx, states, temperature, cls=cls)
+
+    def _generator(self, cur_depth):
+        """ Creates a generator according to the currently sampled layer depth. """
         # get number of sampled tokens accordingly to depth
         num_tokens = self.num_tokens_list[cur_depth - 1]
-        # create a generator according to layer depth
         if cur_depth < 5:
-            generator = RecurrentBasicGenerator(num_tokens=num_tokens, **self.model_fn)
+            return RecurrentBasicGenerator(num_tokens=num_tokens, **self.model_fn, **self.kwargs)
         elif cur_depth in (5, 6):  # 'substitution'
-            generator = RecurrentSubstitutionGenerator(num_tokens=num_tokens, **self.model_fn)
+            return RecurrentSubstitutionGenerator(num_tokens=num_tokens, **self.model_fn, **self.kwargs)
         else:  # 'double_substitution'
-            generator = RecurrentDoubleSubstitutionGenerator(num_tokens=num_tokens, **self.model_fn)
-        # sample a single layer
-        return generator(val, dep, pos, memory, state, temperature, cls=cls)
+            return RecurrentDoubleSubstitutionGenerator(num_tokens=num_tokens, **self.model_fn, **self.kwargs)
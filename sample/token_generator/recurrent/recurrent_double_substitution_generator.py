@@ -1,22 +1,52 @@
 import torch
 
+from functools import partial
 from tqdm.auto import trange
 
+from ...sample_utils import (
+    batch_sequences,
+    cat_layers,
+    batch_windows,
+    recurrent_step,
+    sample_tokens,
+    select_cls,
+    window_index,
+    SamplingStatistics,
+)
+
 
 class RecurrentDoubleSubstitutionGenerator:
-    def __init__(self, embed_fn, transformer_fn, head_fn, num_tokens=8, **_):
+    def __init__(
+        self,
+        embed_fn,
+        transformer_fn,
+        block_embed_fn,
+        block_sample_fn,
+        num_tokens=8,
+        accept_threshold=None,
+        statistics=None,
+        **_,
+    ):
         """ Create token generator instance which samples 'num_tokens' in one pass.
 
         Args:
             embed_fn: Pointer to function, which processes the token embedding of the Shape Transformer.
             transformer_fn: Pointer to function, which processes the Transformer module of the Shape Transformer.
-            head_fn: Pointer to function, which processes the generative head of the Shape Transformer.
+            block_embed_fn: Pointer to function, which embeds a single block of the last layer of the Shape Transformer.
+            block_sample_fn: Pointer to function, which samples a single block with the generative head of the Shape
+                Transformer.
             num_tokens: Defines the number of sampled tokens in each step.
+            accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+                multinomial draw. Disabled, if `None`.
+            statistics: `SamplingStatistics` instance, which counts the sampled tokens and forward passes.
         """
         self.embed_fn = embed_fn
         self.transformer_fn = transformer_fn
-        self.head_fn = head_fn
+        self.block_embed_fn = block_embed_fn
+        self.block_sample_fn = block_sample_fn
         self.kernel_size = num_tokens
+        self.accept_threshold = accept_threshold
+        self.statistics = statistics if statistics is not None else SamplingStatistics()
 
     def __call__(self, val, dep, pos, memory=None, state=None, temperature=1.0, cls=None, **_):
         """ Sample autoregressively current value token sequence and return updated value sequence.
@@ -36,64 +66,54 @@ class RecurrentDoubleSubstitutionGenerator:
             Sampled token sequence with values of the current layer.
         """
         # init indices
+        sample_fn = partial(
+            sample_tokens,
+            temperature=temperature,
+            accept_threshold=self.accept_threshold,
+            statistics=self.statistics,
+        )
         token_idx = 0
         second_last_idx = 0
         third_last_idx = 0
         memory_idx = len(memory[0]) if memory is not None else 0
+        block = None
 
         # sample tokens autoregressive
         for idx in trange(0, len(val[-3]) // self.kernel_size, leave=False, desc="Tokens"):
             # compute number of mixed tokens in third and second last layer and number of tokens, which will be sampled
-            mix_third_last = torch.sum(val[-3][third_last_idx:third_last_idx + self.kernel_size] == 2)
-            mix_second_last = torch.sum(val[-2][second_last_idx:second_last_idx + mix_third_last * 8] == 2)
+            mix_third_last = torch.sum(val[-3][third_last_idx:third_last_idx + self.kernel_size] == 2).item()
+            mix_second_last = torch.sum(val[-2][second_last_idx:second_last_idx + mix_third_last * 8] == 2).item()
             num_sampled = mix_second_last * 8
 
-            # embed sequence
-            seq = (torch.cat(val).unsqueeze(0), torch.cat(dep).unsqueeze(0), torch.cat(pos).unsqueeze(0))
-            input_token = self.embed_fn(seq, cls)[:, memory_idx + idx]
+            seq = (cat_layers(val).unsqueeze(0), cat_layers(dep).unsqueeze(0), cat_layers(pos).unsqueeze(0))
+            if idx == 0:
+                # embed sequence, the first input token is the last embedded token of the previous layers
+                input_token = self.embed_fn(seq, cls)[:, memory_idx]
+            else:
+                # embed only the previously sampled block
+                index, valid = window_index([val], {0: block})
+                input_token = self.block_embed_fn(seq, index, valid)
 
             # process a single token with the Transformer and append output to memory sequence
             out, state = self.transformer_fn(input_token, state)
             memory = torch.cat((memory, out.unsqueeze(0)), dim=1) if memory is not None else out.unsqueeze(0)
 
-            # use an autoregressive head within the substitution block
-            for block_idx in range(num_sampled.item()):
-                # extract only a subsequence of seq and memory, which is actually used (+1 for lookahead embedding)
-                seq = (
-                    torch.cat(
-                        (
-                            val[-3][third_last_idx:third_last_idx + self.kernel_size],
-                            val[-2][second_last_idx:second_last_idx + mix_third_last * 8],
-                            val[-1][token_idx:token_idx + num_sampled + 1],
-                        )
-                    ).unsqueeze(0),
-                    torch.cat(
-                        (
-                            dep[-3][third_last_idx:third_last_idx + self.kernel_size],
-                            dep[-2][second_last_idx:second_last_idx + mix_third_last * 8],
-                            dep[-1][token_idx:token_idx + num_sampled + 1],
-                        )
-                    ).unsqueeze(0),
-                    torch.cat(
-                        (
-                            pos[-3][third_last_idx:third_last_idx + self.kernel_size],
-                            pos[-2][second_last_idx:second_last_idx + mix_third_last * 8],
-                            pos[-1][token_idx:token_idx + num_sampled + 1],
-                        )
-                    ).unsqueeze(0),
-                )
-
-                # compute logits from the memory vector and retrieve them for the current index only
-                logits = self.head_fn(out.unsqueeze(0), seq, last_only=True)[0]  # squeeze(dim=0)
-                sampled_token_logits = logits[block_idx]
-
-                # compute token probabilities from logits
-                sampled_token_logits[0] = -float("Inf")  # 'padding' token
-                probs = torch.nn.functional.softmax(sampled_token_logits / temperature, dim=-1)
-
-                # sample next sequence token and update sequence values
-                sampled_val_token = torch.multinomial(probs, num_samples=1)[0]
-                val[-1][token_idx + block_idx] = sampled_val_token
+            # tokens of the third-last, second-last and last layer, which belong to the current block
+            block = [
+                slice(third_last_idx, third_last_idx + self.kernel_size),
+                slice(second_last_idx, second_last_idx + mix_third_last * 8),
+                slice(token_idx, token_idx + num_sampled),
+            ]
+
+            if num_sampled > 0:
+                # extract only a subsequence of seq, which is actually used (+1 for lookahead embedding)
+                window = block[:2] + [slice(token_idx, token_idx + num_sampled + 1)]
+                seq = batch_windows([val], [dep], [pos], {0: window})
+
+                # sample all tokens of the block autoregressively with a single pass of the head
+                tokens = self.block_sample_fn(out.unsqueeze(0), seq, sample_fn)
+                self.statistics.update(num_passes=1)
+                val[-1][block[2]] = tokens[0]
 
             # update indices
             third_last_idx += self.kernel_size
@@ -101,3 +121,91 @@ class RecurrentDoubleSubstitutionGenerator:
             token_idx += num_sampled
 
         return val[-1], memory, state
+
+    def sample_batch(self, val, dep, pos, memory_idx, states, temperature=1.0, cls=None, **_):
+        """ Sample autoregressively current value token sequences of multiple samples in lock-step.
+
+        Each step processes all samples, which have tokens left to sample in the current block, as a single batch.
+
+        Note: Needs at least, the third-, second- and last layer sequence of each sample.
+
+        Args:
+            val: List with value token sequence layers of each sample.
+            dep: List with depth token sequence layers of each sample.
+            pos: List with position token sequence layers of each sample.
+            memory_idx: List with the number of tokens of each sample, which are already processed by the Transformer.
+            states: List with the internal state of the Transformer for each sample.
+            temperature: Defines the randomness of the samples.
+            cls: class labels of all samples for conditional generation.
+
+        Return:
+            Lists with the sampled token sequence with values of the current layer, the number of processed tokens and
+            the internal state of the Transformer for each sample.
+        """
+        # init indices
+        sample_fn = partial(
+            sample_tokens,
+            temperature=temperature,
+            accept_threshold=self.accept_threshold,
+            statistics=self.statistics,
+        )
+        token_idx = len(val) * [0]
+        second_last_idx = len(val) * [0]
+        memory_idx = list(memory_idx)
+        states = list(states)
+        num_steps = [len(v_b[-3]) // self.kernel_size for v_b in val]
+        blocks = {}
+
+        # sample tokens autoregressive
+        for idx in trange(max(num_steps), leave=False, desc="Tokens"):
+            third_last_idx = idx * self.kernel_size
+            active = [b for b in range(len(val)) if idx < num_steps[b]]
+
+            seq = batch_sequences(
+                [cat_layers(val[b]) for b in active],
+                [cat_layers(dep[b]) for b in active],
+                [cat_layers(pos[b]) for b in active],
+            )
+            if idx == 0:
+                # embed sequences, the first input token is the last embedded token of the previous layers
+                input_seq = self.embed_fn(seq, select_cls(cls, active))  # [N, L, E]
+                input_token = input_seq[range(len(active)), [memory_idx[b] for b in active]]  # [N, E]
+            else:
+                # embed only the previously sampled block of each sample
+                index, valid = window_index(val, {b: blocks[b] for b in active})
+                input_token = self.block_embed_fn(seq, index, valid)  # [N, E]
+
+            # process a single token of each sample with the Transformer
+            out, active_states = recurrent_step(self.transformer_fn, input_token, [states[b] for b in active])
+            for b, state in zip(active, active_states):
+                states[b] = state
+
+            # compute number of tokens which can be sampled and the tokens of each sample, which belong to the block
+            num_sampled, windows = {}, {}
+            for b in active:
+                third_last = slice(third_last_idx, third_last_idx + self.kernel_size)
+                mix_third_last = int(torch.sum(val[b][-3][third_last] == 2))
+                second_last = slice(second_last_idx[b], second_last_idx[b] + mix_third_last * 8)
+                num_sampled[b] = 8 * int(torch.sum(val[b][-2][second_last] == 2))
+                blocks[b] = [third_last, second_last, slice(token_idx[b], token_idx[b] + num_sampled[b])]
+                # extract only a subsequence of each sample, which is actually used (+1 for lookahead embedding)
+                windows[b] = [third_last, second_last, slice(token_idx[b], token_idx[b] + num_sampled[b] + 1)]
+
+            # sample all tokens of each block autoregressively with a single pass of the head
+            block = [i for i, b in enumerate(active) if num_sampled[b] > 0]
+            if len(block) > 0:
+                seq = batch_windows(val, dep, pos, {active[i]: windows[active[i]] for i in block})
+                tokens = self.block_sample_fn(out[block].unsqueeze(1), seq, sample_fn)
+                self.statistics.update(num_passes=len(block))
+                for i, tokens_b in zip(block, tokens):
+                    val[active[i]][-1][blocks[active[i]][2]] = tokens_b[:num_sampled[active[i]]]
+
+            # update indices
+            for b in active:
+                second_last_idx[b] = blocks[b][1].stop
+                token_idx[b] += num_sampled[b]
+
+        # update indices
+        memory_idx = [m + n for m, n in zip(memory_idx, num_steps)]
+
+        return [v_b[-1] for v_b in val], memory_idx, states
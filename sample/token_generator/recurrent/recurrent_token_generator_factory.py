@@ -2,7 +2,7 @@ from .recurrent_composite_generator import RecurrentCompositeGenerator
 from .recurrent_composite_generator_D import RecurrentCompositeGeneratorD
 
 
-def _create_recurrent_token_generator(head, model, spatial_dim):
+def _create_recurrent_token_generator(head, model, spatial_dim, accept_threshold=None, statistics=None):
     """ Creates a token generator.
 
     If the module specified in `head` does not exist raises a value error.
@@ -11,6 +11,9 @@ def _create_recurrent_token_generator(head, model, spatial_dim):
         head: Generative head type used in `model`.
         model: Model which is used for sampling.
         spatial_dim: Spatial dimensionality of input data.
+        accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+            multinomial draw. Disabled, if `None`.
+        statistics: `SamplingStatistics` instance, which counts the sampled tokens and forward passes.
 
     Return:
         Token generator initialised with specified parameters.
@@ -18,7 +21,10 @@ def _create_recurrent_token_generator(head, model, spatial_dim):
     kwargs = {
         'embed_fn': model.token_embedding,
         'transformer_fn': model.transformer_module,
-        'head_fn': model.generative_head,
+        'block_embed_fn': model.block_embedding,
+        'block_sample_fn': model.sample_block,
+        'accept_threshold': accept_threshold,
+        'statistics': statistics,
     }
 
     if head in ('composite_A'):
@@ -32,7 +38,7 @@ def _create_recurrent_token_generator(head, model, spatial_dim):
     raise ValueError(f"ERROR: {head} token generator not implemented.")
 
 
-def create_recurrent_token_generator(head, model, spatial_dim):
+def create_recurrent_token_generator(head, model, spatial_dim, accept_threshold=None, statistics=None):
     """ Creates a recurrent token generator or a list of token generators.
 
     If `head` is a list, creates a list of embeddings for each element of the list, otherwise a single one. If the
@@ -42,11 +48,14 @@ def create_recurrent_token_generator(head, model, spatial_dim):
         head: Generative head type used in `model`.
         model: Model which is used for sampling.
         spatial_dim: Spatial dimensionality of input data.
+        accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+            multinomial draw. Disabled, if `None`.
+        statistics: `SamplingStatistics` instance, which counts the sampled tokens and forward passes.
 
     Return:
         Token generator or a list of generators initialised with specified parameters.
     """
     if type(head) == list:
-        return [_create_recurrent_token_generator(n, model, spatial_dim) for n in head]
+        return [_create_recurrent_token_generator(n, model, spatial_dim, accept_threshold, statistics) for n in head]
     else:
-        return _create_recurrent_token_generator(head, model, spatial_dim)
+        return _create_recurrent_token_generator(head, model, spatial_dim, accept_threshold, statistics)
@@ -2,17 +2,25 @@ import torch
 
 from tqdm.auto import trange
 
+from modules.utils import DecodingCache
+from ..sample_utils import batch_sequences, cat_layers, select_cls, verify_draft, SamplingStatistics
+
 
 class SubstitutionGenerator:
-    def __init__(self, compute_logits_fn, num_tokens=8, **_):
+    def __init__(self, compute_logits_fn, num_tokens=8, accept_threshold=None, statistics=None, **_):
         """ Create token generator instance which samples 'num_tokens' in one pass.
 
         Args:
             compute_logits_fn: Pointer to function, which computes logits of given sequence.
             num_tokens: Defines the number of sampled tokens in each step.
+            accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+                multinomial draw. Disabled, if `None`.
+            statistics: `SamplingStatistics` instance, which counts the sampled tokens and forward passes.
         """
         self.compute_logits = compute_logits_fn
         self.kernel_size = num_tokens
+        self.accept_threshold = accept_threshold
+        self.statistics = statistics if statistics is not None else SamplingStatistics()
 
     def __call__(self, val, dep, pos, memory=None, idx=0, temperature=1.0, cls=None, **_):
         """ Sample autoregressive current value token sequence and return updated value sequence.
@@ -31,32 +39,119 @@ class SubstitutionGenerator:
         # compute indices
         token_idx = 0
         second_last_idx = 0
-        sampled_idx = len(torch.cat(val[:-1])) if len(val) > 2 else 0
+        sampled_idx = sum(len(v) for v in val[:-1]) if len(val) > 2 else 0
+
+        # reuse keys and values of unchanged tokens between consecutive passes
+        cache = DecodingCache()
+        num_steps = len(val[-2]) // self.kernel_size
 
         # sample tokens autoregressive
-        for _ in trange(len(val[-2]) // self.kernel_size, leave=False, desc="Tokens"):
+        for step in trange(num_steps, leave=False, desc="Tokens"):
             # compute number of tokens which can be sampled
             mix_second_last = torch.sum(val[-2][second_last_idx:second_last_idx + self.kernel_size] == 2)
             num_sampled = mix_second_last * 8
 
-            for block_idx in range(num_sampled.item()):
+            block_idx = 0
+            while block_idx < num_sampled:
                 # concat and pack token sequences to compute logits
-                seq = (torch.cat(val).unsqueeze(0), torch.cat(dep).unsqueeze(0), torch.cat(pos).unsqueeze(0))
+                seq = (cat_layers(val).unsqueeze(0), cat_layers(dep).unsqueeze(0), cat_layers(pos).unsqueeze(0))
 
-                logits = self.compute_logits(seq, memory, idx, cls)[0]
+                # skip all following token blocks, which logits are not required yet
+                cache.skip(num_steps - step - 1)
+                logits = self.compute_logits(seq, memory, idx, cls, cache=cache)[0]
+                self.statistics.update(num_passes=1)
 
-                # retrieve only logits for for current index
-                sampled_token_logits = logits[sampled_idx + token_idx + block_idx]
+                # retrieve only logits for the remaining tokens of the block
+                start = sampled_idx + token_idx
+                remaining = slice(token_idx + block_idx, token_idx + num_sampled)
+                block_logits = logits[start + block_idx:start + num_sampled]
 
-                # compute token probabilities from logits
-                sampled_token_logits[0] = -float("Inf")  # 'padding' token
-                probs = torch.nn.functional.softmax(sampled_token_logits / temperature, dim=-1)  # [t, V]
-
-                # sample next sequence token
-                val[-1][token_idx + block_idx] = torch.multinomial(probs, num_samples=1)[0]
+                # sample next sequence tokens, as long as they are equal to their draft, and draft remaining tokens
+                tokens, draft = verify_draft(
+                    block_logits, val[-1][remaining], temperature, self.accept_threshold, self.statistics
+                )
+                val[-1][remaining] = torch.cat([tokens, draft])
+                block_idx += len(tokens)
 
             # update indices
             second_last_idx += self.kernel_size
             token_idx += num_sampled
 
         return val[-1]
+
+    def sample_batch(self, val, dep, pos, memory=None, idx=0, temperature=1.0, cls=None, **_):
+        """ Sample autoregressive current value token sequences of multiple samples in lock-step.
+
+        Each step processes all samples, which have tokens left to sample in the current block, as a single batch.
+
+        Args:
+            val: List with value token sequence layers of each sample.
+            dep: List with depth token sequence layers of each sample.
+            pos: List with position token sequence layers of each sample.
+            memory: Latent sequence vector of the previous layer.
+            idx: Currently sampled transformer layer index.
+            temperature: Defines the randomness of the samples.
+            cls: class labels of all samples for conditional generation.
+
+        Return:
+            List with the sampled token sequence with values of the current layer for each sample.
+        """
+        # compute indices
+        token_idx = len(val) * [0]
+        sampled_idx = [sum(len(v) for v in v_b[:-1]) if len(v_b) > 2 else 0 for v_b in val]
+        num_steps = [len(v_b[-2]) // self.kernel_size for v_b in val]
+
+        # reuse keys and values of unchanged tokens between consecutive passes
+        cache = DecodingCache()
+        active = list(range(len(val)))
+
+        # sample tokens autoregressive
+        for step in trange(max(num_steps), leave=False, desc="Tokens"):
+            second_last_idx = step * self.kernel_size
+
+            # process only samples with remaining token blocks and keep their cached results
+            kept = [i for i, b in enumerate(active) if step < num_steps[b]]
+            if len(kept) < len(active):
+                cache.select(kept)
+                active = [active[i] for i in kept]
+
+            # compute number of tokens which can be sampled in each sample
+            num_sampled = {
+                b: 8 * int(torch.sum(val[b][-2][second_last_idx:second_last_idx + self.kernel_size] == 2))
+                for b in active
+            }
+
+            block_idx = {b: 0 for b in active}
+            while any(block_idx[b] < num_sampled[b] for b in active):
+                # concat and pack token sequences to compute logits, skip all following token blocks
+                seq = batch_sequences(
+                    [cat_layers(val[b]) for b in active],
+                    [cat_layers(dep[b]) for b in active],
+                    [cat_layers(pos[b]) for b in active],
+                )
+                cache.skip([num_steps[b] - step - 1 for b in active])
+                logits = self.compute_logits(seq, memory, idx, select_cls(cls, active), cache=cache)
+
+                # sample only samples with remaining tokens in the current block
+                block = [i for i, b in enumerate(active) if block_idx[b] < num_sampled[b]]
+                self.statistics.update(num_passes=len(block))
+
+                for i in block:
+                    b = active[i]
+                    # retrieve only logits for the remaining tokens of the block
+                    start = sampled_idx[b] + token_idx[b]
+                    remaining = slice(token_idx[b] + block_idx[b], token_idx[b] + num_sampled[b])
+                    block_logits = logits[i, start + block_idx[b]:start + num_sampled[b]]
+
+                    # sample next sequence tokens, as long as they are equal to their draft, and draft remaining tokens
+                    tokens, draft = verify_draft(
+                        block_logits, val[b][-1][remaining], temperature, self.accept_threshold, self.statistics
+                    )
+                    val[b][-1][remaining] = torch.cat([tokens, draft])
+                    block_idx[b] += len(tokens)
+
+            # update indices
+            for b in active:
+                token_idx[b] += num_sampled[b]
+
+        return [v_b[-1] for v_b in val]
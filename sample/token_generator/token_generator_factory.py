@@ -2,7 +2,7 @@ from .composite_generator import CompositeGenerator
 from .composite_generator_D import CompositeGeneratorD
 
 
-def _create_token_generator(head, model, spatial_dim):
+def _create_token_generator(head, model, spatial_dim, accept_threshold=None, statistics=None):
     """ Creates a token generator.
 
     If the module specified in `head` does not exist raises a value error.
@@ -11,12 +11,17 @@ def _create_token_generator(head, model, spatial_dim):
         head: Generative head type used in `model`.
         model: Model which is used for sampling.
         spatial_dim: Spatial dimensionality of input data.
+        accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+            multinomial draw. Disabled, if `None`.
+        statistics: `SamplingStatistics` instance, which counts the sampled tokens and forward passes.
 
     Return:
         Token generator initialised with specified parameters.
     """
     kwargs = {
         'compute_logits_fn': model.compute_logits,
+        'accept_threshold': accept_threshold,
+        'statistics': statistics,
     }
 
     if head in ('composite_A'):
@@ -30,7 +35,7 @@ def _create_token_generator(head, model, spatial_dim):
     raise ValueError(f"ERROR: {head} token generator not implemented.")
 
 
-def create_token_generator(head, model, spatial_dim):
+def create_token_generator(head, model, spatial_dim, accept_threshold=None, statistics=None):
     """ Creates a token generator or a list of token generators.
 
     If `head` is a list, creates a list of embeddings for each element of the list, otherwise a single one. If the
@@ -40,11 +45,14 @@ def create_token_generator(head, model, spatial_dim):
         head: Generative head type used in `model`.
         model: Model which is used for sampling.
         spatial_dim: Spatial dimensionality of input data.
+        accept_threshold: Tokens with a predicted probability of at least this threshold are accepted without a
+            multinomial draw. Disabled, if `None`.
+        statistics: `SamplingStatistics` instance, which counts the sampled tokens and forward passes.
 
     Return:
         Token generator or a list of generators initialised with specified parameters.
     """
     if type(head) == list:
-        return [_create_token_generator(n, model, spatial_dim) for n in head]
+        return [_create_token_generator(n, model, spatial_dim, accept_threshold, statistics) for n in head]
     else:
-        return _create_token_generator(head, model, spatial_dim)
+        return _create_token_generator(head, model, spatial_dim, accept_threshold, statistics)
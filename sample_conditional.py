@@ -3,37 +3,12 @@ import os
 import random
 from argparse import ArgumentParser
 
-import numpy as np
 import torch
-from skimage import measure
 from tqdm.auto import tqdm
 
 from data.octree_ShapeNet import OctreeShapeNet
 from sample import ShapeSampler
-from utils import kdTree
-
-
-def save_obj(sample, path="", file_name="chair_mesh"):
-    """ Use marching cubes to obtain the surface mesh and save it to an *.obj file """
-    # convert volume to mesh
-    sample = np.pad(sample, ((1, 1), (1, 1), (1, 1)))
-    verts, faces, normals, values = measure.marching_cubes(sample, 0)
-    # scale to normalized cube [-1.0, 1.0]^3
-    verts /= sample.shape
-    verts -= [0.5, 0.0, 0.5]
-    verts *= 2.0
-    # fix .obj indexing
-    faces += 1
-
-    # Save output as obj-file
-    file_path = os.path.join(path, f'{file_name}.obj')
-    with open(file_path, 'w') as f:
-        for item in verts:
-            f.write("v {0} {1} {2}\n".format(item[0], item[1], item[2]))
-        for item in normals:
-            f.write("vn {0} {1} {2}\n".format(item[0], item[1], item[2]))
-        for item in faces:
-            f.write("f {0}//{0} {1}//{1} {2}//{2}\n".format(item[0], item[1], item[2]))
+from utils import CompactKdTree, EXPORT_FORMATS, export_sample
 
 
 if __name__ == "__main__":
@@ -49,6 +24,7 @@ if __name__ == "__main__":
     parser.add_argument("--temperature", type=float, default=0.8)
     parser.add_argument("--subclass", type=str, default="chair")
     parser.add_argument("--class_label", type=int, default=None)
+    parser.add_argument("--format", type=str, default="obj", choices=list(EXPORT_FORMATS))
     args = parser.parse_args()
 
     # load model
@@ -77,10 +53,10 @@ if __name__ == "__main__":
         r = random.randrange(len(ds_test))
         precon, _ = ds_test[r]
 
-        save_obj(precon, path, f"shape_{i}_high")
-        tree = kdTree(3).insert_element_array(precon, max_depth=math.log2(args.resolution) + 1)
+        export_sample(precon, os.path.join(path, f"shape_{i}_high"), args.format)
+        tree = CompactKdTree(3).insert_element_array(precon, max_depth=math.log2(args.resolution) + 1)
         low_res = tree.get_element_array(depth=math.log2(args.resolution) - 3)
-        save_obj(low_res, path, f"shape_{i}_low")
+        export_sample(low_res, os.path.join(path, f"shape_{i}_low"), args.format)
 
         for j in range(args.num_samples):
             output = sampler.sample_preconditioned(
@@ -91,4 +67,4 @@ if __name__ == "__main__":
                 cls=cls_label
             )
 
-            save_obj(output, path, f"shape_{i}_{j}")
+            export_sample(output, os.path.join(path, f"shape_{i}_{j}"), args.format)
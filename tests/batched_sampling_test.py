@@ -0,0 +1,67 @@
+import unittest
+import numpy as np
+import torch
+
+from modules.architecture import create_architecture
+from modules.generative_head import create_head
+from modules.token_embedding import create_embedding
+from sample.layer_sampler import create_sampler
+from sample.sample_utils import batch_sequences, recurrent_step
+
+
+class TestBatchedSampling(unittest.TestCase):
+    """ Tests the batched sampling of multiple samples in lock-step against sampling each sample on its own. """
+    def test_batch_sequences(self):
+        """ Sequences of different lengths should be padded with the padding token '0'. """
+        val = [torch.tensor([2, 1]), torch.tensor([3])]
+        pos = [torch.ones(2, 3, dtype=torch.long), torch.ones(1, 3, dtype=torch.long)]
+        value, depth, position = batch_sequences(val, val, pos)
+
+        np.testing.assert_array_equal(value, [[2, 1], [3, 0]])
+        np.testing.assert_array_equal(position[1], [[1, 1, 1], [0, 0, 0]])
+
+    def test_recurrent_step(self):
+        """ Samples with growing internal states of different size should be processed like single samples. """
+        def transformer_fn(x, state):
+            state = x.unsqueeze(1) if state is None else torch.cat([state, x.unsqueeze(1)], dim=1)  # [N, T, E]
+            return torch.sum(state, dim=1), state
+
+        torch.manual_seed(0)
+        states = [None, torch.rand(1, 2, 4), torch.rand(1, 3, 4), torch.rand(1, 2, 4)]
+        x = torch.rand(4, 4)
+        out, new_states = recurrent_step(transformer_fn, x, states)
+
+        for i, state in enumerate(states):
+            out_i, state_i = transformer_fn(x[i:i + 1], state)
+            np.testing.assert_array_equal(out[i:i + 1], out_i)
+            np.testing.assert_array_equal(new_states[i], state_i)
+
+    def test_encoder_only_sampler(self):
+        """ Each sample of the batch should be equal to the sample drawn on its own. """
+        torch.manual_seed(0)
+        model = create_architecture(
+            architecture='pytorch',
+            attention='basic_full',
+            token_embedding=create_embedding(['composite_A'], 'basic', 3, 16, 8, 3),
+            generative_head=create_head(['composite_A'], 'basic', 3, 16, 8, 1, 8),
+            embed_dim=16,
+            num_heads=2,
+            num_layers=1,
+            dropout=0.0,
+            num_classes=1,
+        ).eval()
+        sampler = create_sampler('pytorch', ['composite_A'], ['composite_A'], model, 3, 4096, 8, 'centered', 'cpu')
+
+        # preconditions with different empty, full and mixed octants result in trees of different size
+        rng = np.random.default_rng(0)
+        preconditions = []
+        for _ in range(4):
+            octants = rng.integers(0, 3, (2, 2, 2))
+            octants[0, 0, 0] = 2
+            octants = np.kron(octants, np.ones((4, 4, 4), dtype=int))
+            preconditions += [np.where(octants == 2, rng.integers(0, 2, (8, 8, 8)), octants)]
+
+        # an almost zero temperature selects the most likely token in both cases
+        samples = sampler.sample_batch(preconditions, 2, 8, 1e-6, None)
+        for precondition, sample in zip(preconditions, samples):
+            np.testing.assert_array_equal(sample, sampler(precondition, 2, 8, 1e-6, None))
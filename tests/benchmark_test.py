@@ -0,0 +1,68 @@
+import types
+import unittest
+import numpy as np
+
+from benchmarks.sampling_benchmark import benchmark_sampler, _processing_targets
+from benchmarks.training_benchmark import benchmark_training, synthetic_sequences
+from sample.sample_utils import SequenceBuffer
+
+
+class TestTrainingBenchmark(unittest.TestCase):
+    """ Tests the synthetic batches and the reproducibility of the training benchmark. """
+    def test_synthetic_sequences(self):
+        """ Sequences should be reproducible and their lengths should follow the selected range. """
+        sequences = synthetic_sequences(16, 32, 100, 400, seed=0)
+        lengths = np.array([len(val) for val, _, _ in sequences])
+        self.assertGreater(np.min(lengths), 50)
+        self.assertLess(np.max(lengths), 600)
+        self.assertLess(np.mean(lengths[lengths < 250]), np.mean(lengths[lengths >= 250]))
+
+        for (v0, d0, p0), (v1, d1, p1) in zip(sequences, synthetic_sequences(16, 32, 100, 400, seed=0)):
+            np.testing.assert_array_equal(v0, v1)
+            np.testing.assert_array_equal(d0, d1)
+            np.testing.assert_array_equal(p0, p1)
+
+    def test_benchmark_training(self):
+        """ The final loss of a configuration should be reproducible. """
+        kwargs = {
+            'resolution': 16,
+            'batch_size': 2,
+            'num_steps': 2,
+            'warmup_steps': 1,
+            'min_tokens': 100,
+            'max_tokens': 400,
+            'embed_dim': 16,
+            'num_layers': 1,
+        }
+        result = benchmark_training('encoder_only', 'composite_B', **kwargs)
+        self.assertEqual(set(result['components']), {'embedding', 'transformer', 'head'})
+        self.assertGreater(result['tokens_per_sec'], 0)
+
+        repeated = benchmark_training('encoder_only', 'composite_B', **kwargs)
+        self.assertEqual(result['final_loss'], repeated['final_loss'])
+
+
+class TestSamplingBenchmark(unittest.TestCase):
+    """ Tests the separation of the processing time from the model time of the sampling benchmark. """
+    def test_benchmark_sampler(self):
+        """ Each processing stage should be timed and all timed functions should be restored afterwards. """
+        expand = SequenceBuffer.expand
+        result = benchmark_sampler('pytorch', 'composite_A', 16, batch_size=2, embed_dim=16, num_layers=1)
+
+        processing_time = result['processing_time']
+        self.assertEqual(set(processing_time), {'preprocess', 'next_layer_tokens', 'postprocess'})
+        self.assertGreater(processing_time['next_layer_tokens'], 0)
+        self.assertAlmostEqual(result['model_time'] + sum(processing_time.values()), result['total_time'])
+        self.assertEqual([layer['depth'] for layer in result['layers']], [3, 4])
+        self.assertGreater(result['tokens'], 0)
+        self.assertIs(SequenceBuffer.expand, expand)
+
+    def test_missing_function(self):
+        """ A sampler module without any function of a processing stage should raise an error. """
+        module = types.ModuleType('sampler')
+        module.preprocess = module.postprocess = lambda *args: None
+        with self.assertRaises(ValueError):
+            _processing_targets(module)
+
+        module.next_layer_tokens = lambda *args: None
+        self.assertEqual(_processing_targets(module)['next_layer_tokens'], (module, 'next_layer_tokens'))
@@ -0,0 +1,132 @@
+import unittest
+import numpy as np
+import torch
+import torch.nn as nn
+
+from modules.generative_head import create_head
+from modules.token_embedding import create_embedding
+from modules.utils import BlockConvolution, block_convolution_step, gather_tokens
+from sample.sample_utils import batch_sequences, batch_windows, window_index, window_lengths
+from utils import quick_linearise
+from tests.shapes import sphere
+
+
+def _argmax(logits):
+    """ Selects the most likely value token, excluding the padding token. """
+    return torch.argmax(logits[:, 1:], dim=-1) + 1
+
+
+class TestBlockSampling(unittest.TestCase):
+    """ Tests the sampling of single blocks of the last layer against the processing of the whole sequence. """
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        val, dep, pos = quick_linearise(sphere(64, rng, radius=(0.2, 0.4)))
+        self.layers = [[torch.tensor(s[dep == d]) for d in range(1, dep.max() + 1)] for s in (val, dep, pos)]
+
+    def substitution_blocks(self, kernel_size):
+        """ Returns the slices of the penultimate and last layer of each block of the last layer. """
+        val = self.layers[0]
+        blocks, token_idx = [], 0
+        for idx in range(len(val[-2]) // kernel_size):
+            second_last = slice(idx * kernel_size, (idx + 1) * kernel_size)
+            num_children = 8 * int(torch.sum(val[-2][second_last] == 2))
+            blocks += [[second_last, slice(token_idx, token_idx + num_children)]]
+            token_idx += num_children
+        return blocks
+
+    def test_block_convolution_step(self):
+        """ Stepwise block convolutions should be equal to the convolution of the whole block. """
+        torch.manual_seed(0)
+        convolution = nn.Sequential(nn.GELU(), BlockConvolution(4, 4, 8), nn.GELU(), BlockConvolution(4, 4, 8))
+        x = torch.rand(3, 8, 4)
+
+        with torch.no_grad():
+            buffers = []
+            out = torch.stack([block_convolution_step(convolution, x, buffers, idx) for idx in range(8)], dim=1)
+            np.testing.assert_allclose(out, convolution(x), atol=1e-6)
+
+    def embed_block(self, embedding, seq, index, valid):
+        """ Embeds a block like `FastRecurrentTransformer.block_embedding`, which requires `fast-transformers`. """
+        block = [embedding.embedding.gather(*seq, index, valid)] + [gather_tokens(s, index, valid) for s in seq]
+        return embedding.reduce_block(*block, 6)[:, 0]
+
+    def test_gather_encoding(self):
+        """ Encoding only gathered tokens should be equal to gathering the tokens of the encoded sequence. """
+        rng = np.random.default_rng(0)
+        seq = [torch.cat(s).unsqueeze(0).repeat(2, *[1] * s[0].dim()) for s in self.layers]
+        for s in seq:
+            s[1, -5:] = 0  # pad the second sample
+        index = torch.tensor(rng.integers(0, seq[0].shape[1], (2, 32)))
+        index[:, -1] = seq[0].shape[1] - 1  # the last token looks ahead onto the end of sequence token
+        valid = torch.tensor(rng.random((2, 32)) < 0.8)
+
+        for encoding in ('basic', 'look_ahead', 'look_ahead_split'):
+            torch.manual_seed(0)
+            embedding = create_embedding(['composite_A'], encoding, 3, 16, 64, 3)[0].embedding
+            with torch.no_grad():
+                x = gather_tokens(embedding(*seq), index, valid)
+                np.testing.assert_allclose(embedding.gather(*seq, index, valid), x, atol=1e-6)
+
+    def test_reduce_block(self):
+        """ Each embedded block should be equal to its token of the embedding of the whole sequence. """
+        torch.manual_seed(0)
+        embedding = create_embedding(['composite_A'], 'look_ahead', 3, 16, 64, 3)[0]
+        seq = [torch.cat(s).unsqueeze(0) for s in self.layers]
+        blocks = self.substitution_blocks(8)
+
+        with torch.no_grad(), torch.backends.mkldnn.flags(enabled=False):
+            x = embedding(*seq)[0, -len(blocks):]  # last layer
+
+            # embed all blocks of the last layer as a single batch, including blocks without children
+            index, valid = window_index(len(blocks) * [self.layers[0]], dict(enumerate(blocks)))
+            batch = [s.expand(len(blocks), *s.shape[1:]) for s in seq]
+            np.testing.assert_allclose(self.embed_block(embedding, batch, index, valid), x, atol=1e-5)
+
+            # blocks without children do not contain any token of the last layer
+            empty = [i for i, b in enumerate(blocks) if b[1].start == b[1].stop][0]
+            index, valid = window_index([self.layers[0]], {0: blocks[empty]})
+            np.testing.assert_allclose(self.embed_block(embedding, seq, index, valid)[0], x[empty], atol=1e-5)
+
+    def test_sample(self):
+        """ Sampling a block with a single pass of the head should be equal to sampling each token with the head. """
+        torch.manual_seed(0)
+        head = create_head(['composite_A'], 'look_ahead', 3, 16, 8, 2, 64)[0]
+        blocks = [b for b in self.substitution_blocks(8) if b[1].start < b[1].stop][:3]
+
+        # add one lookahead token to each block and fill the last layer with arbitrary tokens
+        windows = []
+        for second_last, last in blocks:
+            window = [torch.cat([s[-2][second_last], s[-1][last.start:last.stop + 1]]) for s in self.layers]
+            window[0][second_last.stop - second_last.start:] = 1
+            windows += [window]
+        x = torch.rand(len(windows), 1, 16)
+
+        with torch.no_grad(), torch.backends.mkldnn.flags(enabled=False):
+            tokens = head.sample(x, *batch_sequences(*zip(*windows)), _argmax)
+
+            for i, (value, depth, position) in enumerate(windows):
+                value = value.clone()
+                num_last = int(torch.sum(depth == 6))
+                for idx in range(num_last - 1):
+                    logits = head(x[i:i + 1], *[s.unsqueeze(0) for s in (value, depth, position)], last_only=True)
+                    value[len(value) - num_last + idx] = _argmax(logits[:, idx])[0]
+
+                np.testing.assert_array_equal(tokens[i, :num_last - 1], value[len(value) - num_last:-1])
+
+    def test_sample_length(self):
+        """ Sampling a batch of padded blocks should be equal to sampling each block on its own, including the last. """
+        torch.manual_seed(0)
+        head = create_head('single_conv', 'look_ahead', 3, 16, 8, 2, 64)
+        val, dep, pos = [2 * [[s[-1]]] for s in self.layers]
+        num_tokens = len(self.layers[0][-1])
+
+        # the last block of the second sample has no lookahead token and is padded in the batch
+        windows = {0: [slice(0, 9)], 1: [slice(num_tokens - 8, num_tokens + 1)]}
+        x = torch.rand(len(windows), 1, 16)
+
+        with torch.no_grad(), torch.backends.mkldnn.flags(enabled=False):
+            tokens = head.sample(x, *batch_windows(val, dep, pos, windows), _argmax, window_lengths(val, windows))
+
+            for i, (b, slices) in enumerate(windows.items()):
+                seq = [s[b][-1][slices[0]].unsqueeze(0) for s in (val, dep, pos)]
+                np.testing.assert_array_equal(tokens[i], head.sample(x[i:i + 1], *seq, _argmax)[0])
@@ -0,0 +1,90 @@
+import unittest
+import numpy as np
+
+from data import dataloaders
+from data.sampler import BucketBatchSampler
+
+
+class TestBucketBatchSampler(unittest.TestCase):
+    """ Tests the BucketBatchSampler with random sequence lengths. """
+    def setUp(self):
+        self.lengths = np.random.default_rng(0).integers(10, 1000, size=1000)
+
+    def test_fixed_batch_size(self):
+        """ Each sample should be drawn exactly once in batches of the given size. """
+        sampler = BucketBatchSampler(self.lengths, batch_size=8, bucket_size=10)
+        batches = list(sampler)
+
+        self.assertEqual(len(batches), 125)
+        self.assertTrue(all(len(b) == 8 for b in batches))
+        self.assertEqual(sorted(i for b in batches for i in b), list(range(1000)))
+
+    def test_similar_lengths(self):
+        """ Batches should hold samples of similar length, thus less padding is needed than with random batches. """
+        sampler = BucketBatchSampler(self.lengths, batch_size=8, bucket_size=10)
+
+        padded = sum(len(b) * max(self.lengths[b]) for b in sampler)
+        random_batches = np.random.default_rng(0).permutation(1000).reshape(-1, 8)
+        random_padded = sum(len(b) * max(self.lengths[b]) for b in random_batches)
+
+        self.assertLess(padded, 0.7 * random_padded)
+
+    def test_token_budget(self):
+        """ Each batch should stay within the token budget, including padding tokens. """
+        sampler = BucketBatchSampler(self.lengths, max_tokens=4000)
+        batches = list(sampler)
+
+        self.assertEqual(sorted(i for b in batches for i in b), list(range(1000)))
+        self.assertTrue(all(len(b) * max(self.lengths[b]) <= 4000 for b in batches))
+
+    def test_epochs(self):
+        """ Batches should differ between epochs, but be reproducible for the same epoch. """
+        sampler = BucketBatchSampler(self.lengths, batch_size=8)
+
+        epoch_0 = list(sampler)
+        epoch_1 = list(sampler)
+        sampler.set_epoch(0)
+
+        self.assertNotEqual(epoch_0, epoch_1)
+        self.assertEqual(epoch_0, list(sampler))
+
+    def test_length(self):
+        """ The length should be equal to the number of batches of the running epoch, also for a token budget. """
+        sampler = BucketBatchSampler(self.lengths, max_tokens=4000)
+
+        for _ in range(3):
+            num_batches = len(sampler)
+            batches = iter(sampler)
+            count = 0
+            for _ in batches:
+                self.assertEqual(len(sampler), num_batches)
+                count += 1
+            self.assertEqual(count, num_batches)
+
+    def test_length_before_distributed(self):
+        """ A length requested before the distributed setup is known should not be reused for the sharded epoch. """
+        sampler = BucketBatchSampler(self.lengths, max_tokens=4000)
+        num_batches = len(sampler)
+
+        sampler.num_replicas, sampler.rank = 3, 1
+        batches = list(BucketBatchSampler(self.lengths, max_tokens=4000, num_replicas=3, rank=1))
+        self.assertLess(len(sampler), num_batches)
+        self.assertEqual(list(sampler), batches)
+
+    def test_token_budget_requires_bucketing(self):
+        """ A token budget should not be ignored silently without bucketing. """
+        with self.assertRaises(ValueError):
+            dataloaders(
+                'shapenet', None, 32, 'linear_max_res', 'basic', 'pytorch', 8, 0, 'centered', 4096, max_tokens=4000
+            )
+
+    def test_distributed(self):
+        """ All processes should get the same number of distinct batches. """
+        samplers = [BucketBatchSampler(self.lengths, max_tokens=4000, num_replicas=3, rank=r) for r in range(3)]
+        num_batches = len(samplers[0])
+        batches = [list(s) for s in samplers]
+
+        self.assertEqual(len(set(len(b) for b in batches)), 1)
+        self.assertEqual(len(batches[0]), num_batches)
+        self.assertTrue(set(i for b in batches for batch in b for i in batch) == set(range(1000)))
+        self.assertFalse(set(map(tuple, batches[0])) & set(map(tuple, batches[1])))
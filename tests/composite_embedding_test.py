@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+import torch
+
+from data.collate.collate_utils import pad_batch
+from modules.token_embedding import create_embedding
+from utils import quick_linearise
+from tests.shapes import sphere
+
+
+class TestCompositeEmbedding(unittest.TestCase):
+    """ Tests the batched composite embeddings against the embedding of each sample on its own. """
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.batch = [quick_linearise(sphere(64, rng)) + (np.array(0), ) for _ in range(3)]
+
+    def assert_batch_equal(self, embedding, batch):
+        """ Each embedded sample of the batch should be equal to the embedding of the single sample. """
+        value, depth, position, _ = pad_batch(batch)
+
+        # convolution backends might select different algorithms for different batch sizes
+        with torch.no_grad(), torch.backends.mkldnn.flags(enabled=False):
+            x = embedding(value, depth, position)
+            mask = embedding.padding_mask()
+
+            for i, (val, dep, pos, _) in enumerate(batch):
+                x_i = embedding(*[torch.tensor(s).unsqueeze(0) for s in (val, dep, pos)])[0]
+
+                np.testing.assert_array_equal(x[i, :len(x_i)], x_i)
+                np.testing.assert_array_equal(x[i, len(x_i):], 0)
+                np.testing.assert_array_equal(mask[i], np.arange(x.shape[1]) >= len(x_i))
+
+    def test_composite(self):
+        """ Tests each composite embedding with all reductions up to substitution. """
+        for name in ('composite_A', 'composite_B', 'composite_C', 'composite_D'):
+            torch.manual_seed(0)
+            self.assert_batch_equal(create_embedding(name, 'basic', 3, 16, 64, 3), self.batch)
+
+    def test_double_substitution(self):
+        """ Tests the composite embeddings with double substitution reductions, which are used from resolution 128 on.
+        """
+        rng = np.random.default_rng(0)
+        batch = [quick_linearise(sphere(128, rng, (0.1, 0.2))) + (np.array(0), ) for _ in range(3)]
+        for name in ('composite_A', 'composite_D'):
+            torch.manual_seed(0)
+            self.assert_batch_equal(create_embedding(name, 'basic', 3, 16, 128, 3), batch)
+
+    def test_different_depth(self):
+        """ Samples with fewer depth layers than others should be embedded as well. """
+        rng = np.random.default_rng(0)
+        batch = [quick_linearise(sphere(16, rng)) + (np.array(0), ) for _ in range(3)]
+        batch = [(v[d < 4], d[d < 4], p[d < 4], c) for v, d, p, c in batch[:2]] + batch[2:]
+        torch.manual_seed(0)
+        self.assert_batch_equal(create_embedding('composite_B', 'basic', 3, 16, 16, 3), batch)
@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+import torch
+
+from data.collate.collate_utils import pad_batch
+from modules.generative_head import create_head
+from utils import quick_linearise
+from tests.shapes import sphere
+
+
+class TestCompositeHead(unittest.TestCase):
+    """ Tests the batched composite heads against the logits of each sample on its own. """
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.batch = [quick_linearise(sphere(64, rng)) + (np.array(0), ) for _ in range(3)]
+        self.x = torch.randn(len(self.batch), 4096, 16, generator=torch.Generator().manual_seed(0))
+
+    def assert_batch_equal(self, head, last_only=False, batch=None, x=None):
+        """ The logits of each sample of the batch should be equal to the logits of the single sample. """
+        batch = self.batch if batch is None else batch
+        x = self.x if x is None else x
+        value, depth, position, _ = pad_batch(batch)
+
+        # convolution backends might select different algorithms for different batch sizes
+        with torch.no_grad(), torch.backends.mkldnn.flags(enabled=False):
+            logits = head(x, value, depth, position, last_only=last_only)
+
+            for i, (val, dep, pos, _) in enumerate(batch):
+                sample = [torch.tensor(s).unsqueeze(0) for s in (val, dep, pos)]
+                logits_i = head(x[i:i + 1], *sample, last_only=last_only)[0]
+
+                np.testing.assert_allclose(logits[i, :len(logits_i)], logits_i, atol=1e-6)
+                np.testing.assert_array_equal(logits[i, len(logits_i):], 0)
+
+    def test_composite(self):
+        """ Tests each composite head with all heads up to substitution. """
+        for name in ('composite_A', 'composite_B', 'composite_C', 'composite_D'):
+            torch.manual_seed(0)
+            head = create_head(name, 'basic', 3, 16, 8, 2, 64)
+            self.assert_batch_equal(head)
+            self.assert_batch_equal(head, last_only=True)
+
+    def test_double_substitution(self):
+        """ Tests the composite heads with double substitution heads, which are used from resolution 128 on. """
+        rng = np.random.default_rng(0)
+        batch = [quick_linearise(sphere(128, rng, (0.1, 0.2))) + (np.array(0), ) for _ in range(3)]
+        x = torch.randn(len(batch), max(len(b[0]) for b in batch), 16, generator=torch.Generator().manual_seed(0))
+        for encoding in ('basic', 'look_ahead'):
+            for name in ('composite_A', 'composite_D'):
+                torch.manual_seed(0)
+                head = create_head(name, encoding, 3, 16, 8, 2, 128)
+                self.assert_batch_equal(head, batch=batch, x=x)
+                self.assert_batch_equal(head, last_only=True, batch=batch, x=x)
+
+    def test_look_ahead(self):
+        """ The last token of each layer of each sample should look ahead onto the end of sequence token. """
+        for encoding in ('look_ahead', 'look_ahead_split'):
+            for name in ('composite_A', 'composite_B'):
+                torch.manual_seed(0)
+                head = create_head(name, encoding, 3, 16, 8, 2, 64)
+                self.assert_batch_equal(head)
+                self.assert_batch_equal(head, last_only=True)
+
+    def test_number_of_logits(self):
+        """ The head should return one logit for each token of the sample. """
+        torch.manual_seed(0)
+        head = create_head('composite_B', 'basic', 3, 16, 8, 2, 64)
+        value, depth, position, _ = pad_batch(self.batch)
+
+        with torch.no_grad():
+            logits = head(self.x, value, depth, position)
+
+        self.assertEqual(logits.shape, (len(self.batch), value.shape[1], 4))
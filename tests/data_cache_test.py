@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import numpy.testing as np_test
+
+from torch.utils.data import Subset
+
+from data import CachedOctreeShapeNet
+from data.data import sequence_lengths
+from data.cached_octree_ShapeNet import cache_path, write_sequence_cache
+from data.transform import create_data_transform
+from utils import quick_linearise
+
+
+class TestCachedOctreeShapeNet(unittest.TestCase):
+    """ Tests the sequence cache, iff the cached dataset returns the same samples as a transform of the voxels. """
+    def setUp(self):
+        """ Writes a small cache with random shapes of two classes into a temporary directory. """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+
+        rng = np.random.default_rng(0)
+        self.voxels = []
+        for _ in range(10):
+            voxels = np.array(rng.random((32, 32, 32)) < 0.01, dtype=int)
+            voxels[rng.integers(16):24, 4:rng.integers(8, 32), 8:20] = 1
+            self.voxels += [voxels]
+
+        # first five shapes are chairs, the others airplanes - each with a 80-20 train-test split
+        self.cls_ids = np.array(5 * [20] + 5 * [0])
+        self.train = np.array(2 * [True, True, True, True, False])
+
+        write_sequence_cache(
+            cache_path(self.root, 32, 'centered'),
+            (quick_linearise(v, 'centered') for v in self.voxels),
+            self.cls_ids,
+            self.train,
+            [f"shape_{i}" for i in range(10)],
+            resolution=32,
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_transform(self, name, num_positions=0):
+        """ Creates a data transform for shapes with a resolution of 32. """
+        return create_data_transform(
+            name=name,
+            spatial_dim=3,
+            resolution=32,
+            position_encoding='centered',
+            num_positions=num_positions,
+            embedding=['basic'],
+        )
+
+    def test_cache_files(self):
+        """ The cache should consist of a single packed sequence file and an index. """
+        path = cache_path(self.root, 32, 'centered')
+        self.assertTrue(os.path.isfile(os.path.join(path, 'sequences.bin')))
+        self.assertTrue(os.path.isfile(os.path.join(path, 'index.npz')))
+
+    def test_subclass_split(self):
+        """ The dataset should select shapes by subclass and train-test split. """
+        train_ds = CachedOctreeShapeNet(self.root, train=True, subclass="all", resolution=32)
+        test_ds = CachedOctreeShapeNet(self.root, train=False, subclass="chair", resolution=32)
+
+        self.assertEqual(len(train_ds), 8)
+        self.assertEqual(len(test_ds), 1)
+        np_test.assert_array_equal(test_ds.cls_ids, [20])
+
+    def test_deterministic_transform(self):
+        """ Deterministic transforms should return the same sequences as applied on the voxels. """
+        for name in ('basic', 'linear', 'linear_max_16', ['linear', 'check_len']):
+            transform = self.create_transform(name)
+            ds = CachedOctreeShapeNet(self.root, train=True, subclass="all", resolution=32, transform=transform)
+            self.assertTrue(ds.deterministic)
+
+            for i, idx in enumerate(np.nonzero(self.train)[0]):
+                output = ds[i]
+                target = transform(self.voxels[idx])
+
+                self.assertEqual(len(output), 4)
+                self.assertEqual(output[3], self.cls_ids[idx])
+                for o, t in zip(output[:3], target):
+                    self.assertEqual(o.dtype, t.dtype)
+                    np_test.assert_array_equal(o, t)
+
+    def test_voxels(self):
+        """ Without a transform, the dataset should return the decoded voxels. """
+        ds = CachedOctreeShapeNet(self.root, train=True, subclass="all", resolution=32)
+
+        for i, idx in enumerate(np.nonzero(self.train)[0]):
+            voxels, cls = ds[i]
+            np_test.assert_array_equal(voxels, self.voxels[idx])
+            self.assertEqual(cls, self.cls_ids[idx])
+
+    def test_layer_tokens(self):
+        """ The number of tokens of each depth layer should be counted from the cached sequence. """
+        transform = self.create_transform(['length_aware_scaling', 'linear', 'check_len'], num_positions=4096)
+        ds = CachedOctreeShapeNet(self.root, train=True, subclass="all", resolution=32, transform=transform)
+        self.assertTrue(ds.uses_layer_tokens)
+        for i in range(len(ds)):
+            _, dep, _ = quick_linearise(ds.load_voxels(i), 'centered')
+            np_test.assert_array_equal(ds.layer_tokens(i), np.bincount(dep)[1:])
+            self.assertLessEqual(len(ds[i][0]), 4096)
+
+    def test_augmentation_transform(self):
+        """ Random augmentations should be applied on the decoded voxels. """
+        transform = self.create_transform(['scaling', 'linear'])
+        ds = CachedOctreeShapeNet(self.root, train=True, subclass="chair", resolution=32, transform=transform)
+
+        self.assertFalse(ds.deterministic)
+        value, depth, position, cls = ds[0]
+        self.assertEqual(len(value), len(depth))
+        self.assertEqual(len(value), len(position))
+        self.assertEqual(cls, 20)
+
+    def test_sequence_lengths(self):
+        """ Precomputed sequence lengths should match the length of each sample, also for subsets of the dataset. """
+        transform = self.create_transform('linear')
+        ds = CachedOctreeShapeNet(self.root, train=True, subclass="all", resolution=32, transform=transform)
+        subset = Subset(ds, [5, 1, 3])
+
+        np_test.assert_array_equal(sequence_lengths(ds), [len(ds[i][0]) for i in range(len(ds))])
+        np_test.assert_array_equal(sequence_lengths(subset), [len(subset[i][0]) for i in range(len(subset))])
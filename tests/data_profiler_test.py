@@ -0,0 +1,97 @@
+import tempfile
+import unittest
+import numpy as np
+
+from torch.utils.data import DataLoader
+
+from data import CachedOctreeShapeNet
+from data.cached_octree_ShapeNet import cache_path, write_sequence_cache
+from data.collate import create_data_collate
+from data.profiler import ProfiledCollate, ProfiledDataLoader, ProfiledDataset, disable_profiling
+from data.transform import create_data_transform
+from utils import quick_linearise
+
+
+class TestDataProfiler(unittest.TestCase):
+    """ Tests the profiling of the data pipeline with a small sequence cache. """
+    def setUp(self):
+        """ Writes a small cache with random shapes into a temporary directory. """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+
+        rng = np.random.default_rng(0)
+        voxels = []
+        for _ in range(12):
+            v = np.zeros((16, 16, 16), dtype=int)
+            v[rng.integers(8):12, 2:rng.integers(4, 16), 4:10] = 1
+            voxels += [v]
+        self.lengths = [len(quick_linearise(v, 'centered')[0]) for v in voxels]
+
+        write_sequence_cache(
+            cache_path(self.root, 16, 'centered'),
+            (quick_linearise(v, 'centered') for v in voxels),
+            np.zeros(12, dtype=int),
+            np.ones(12, dtype=bool),
+            [f"shape_{i}" for i in range(12)],
+            resolution=16,
+        )
+        self.collate = create_data_collate('encoder_only', ['basic'], 16)
+
+    def tearDown(self):
+        disable_profiling()
+        self.tmp_dir.cleanup()
+
+    def create_dataset(self, transform, num_positions=0):
+        """ Creates the cached dataset with the given transform. """
+        transform = create_data_transform(transform, 3, 16, 'centered', num_positions, ['basic'])
+        return CachedOctreeShapeNet(self.root, train=True, subclass="all", resolution=16, transform=transform)
+
+    def test_same_batches(self):
+        """ A profiled data loader should return the same batches as the data loader without profiling. """
+        ds = self.create_dataset(['linear', 'check_len'])
+        dl = DataLoader(ds, batch_size=4, collate_fn=self.collate)
+        profiled_dl = ProfiledDataLoader(ProfiledDataset(ds), batch_size=4, collate_fn=ProfiledCollate(self.collate))
+
+        for (seq, _, cls), (profiled_seq, _, profiled_cls) in zip(list(dl), list(profiled_dl)):
+            for x, y in zip(seq[0], profiled_seq[0]):
+                np.testing.assert_array_equal(x, y)
+            np.testing.assert_array_equal(cls, profiled_cls)
+
+        summary = profiled_dl.summaries[0]
+        self.assertEqual(summary['samples'], 12)
+        self.assertEqual(summary['batches'], 3)
+        self.assertEqual(summary['stages']['collate']['calls'], 3)
+        self.assertEqual(summary['stages']['transform/CheckSequenceLenghtTransform']['calls'], 12)
+
+    def test_retries(self):
+        """ Rejected samples of the data augmentation should be counted as retries in all workers. """
+        num_positions = int(np.median(self.lengths))
+        ds = self.create_dataset(['scaling', 'linear', 'check_len'], num_positions)
+        dl = ProfiledDataLoader(
+            ProfiledDataset(ds), batch_size=3, collate_fn=ProfiledCollate(self.collate), num_workers=2
+        )
+        for _ in range(2):
+            self.assertEqual(sum(len(cls) for _, _, cls in dl), 12)
+
+        self.assertEqual(len(dl.summaries), 2)
+        for summary in dl.summaries:
+            self.assertEqual(set(summary['workers']), {'worker_0', 'worker_1'})
+            self.assertEqual(sum(w['samples'] for w in summary['workers'].values()), 12)
+            self.assertEqual(summary['stages']['load']['calls'], 12 + summary['counts'].get('resamples', 0))
+
+            retries = summary['counts']['retries']
+            self.assertGreater(retries, 0)
+            self.assertEqual(summary['counts']['rejected/CheckSequenceLenghtTransform'], retries)
+            self.assertEqual(summary['stages']['transform']['calls'], 12 + retries)
+
+    def test_deterministic_reject(self):
+        """ Samples, which exceed the token limit with any scaling, should be resampled without further retries. """
+        num_positions = int(0.6 * np.median(self.lengths))
+        ds = self.create_dataset(['length_aware_scaling', 'linear'], num_positions)
+        dl = ProfiledDataLoader(ProfiledDataset(ds), batch_size=3, collate_fn=ProfiledCollate(self.collate))
+        self.assertEqual(sum(len(cls) for _, _, cls in dl), 12)
+
+        counts = dl.summaries[0]['counts']
+        self.assertGreater(counts['resamples'], 0)
+        self.assertEqual(counts['rejected/LengthAwareScalingTransform'], counts['resamples'])
+        self.assertNotIn('retries', counts)
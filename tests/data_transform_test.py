@@ -1,7 +1,10 @@
 import unittest
 import numpy as np
 
+from benchmarks.training_benchmark import procedural_shape
 from data.transform import create_data_transform
+from data.transform.length_aware_scaling_transform import predict_layer_tokens
+from utils import axis_scaling, layer_token_counts, quick_linearise
 
 
 class TestSequenceLengthTransform(unittest.TestCase):
@@ -160,3 +163,64 @@ class TestSequenceLengthTransform(unittest.TestCase):
 
         self.assertEqual(seq, transform_valid(seq))
         self.assertEqual(None, transform_invalid(seq))
+
+
+class TestLengthAwareScalingTransform(unittest.TestCase):
+    """ Test the LengthAwareScalingTransform class """
+    def setUp(self):
+        grid = np.stack(np.meshgrid(*3 * [np.arange(32)], indexing='ij'))
+        self.voxels = (np.sum((grid - 15.5)**2, axis=0) < 12**2).astype(np.int64)
+
+    def test_layer_tokens(self):
+        """ The number of tokens of each depth layer should be equal to the linearised sequence. """
+        _, dep, _ = quick_linearise(self.voxels)
+        layer_tokens = layer_token_counts(self.voxels)
+        np.testing.assert_array_equal(layer_tokens, np.bincount(dep)[1:])
+        np.testing.assert_array_equal(predict_layer_tokens(layer_tokens, [1.0, 1.0, 1.0]), layer_tokens)
+
+    def test_sequence_length(self):
+        """ Scaled outputs should exceed the token limit less often than outputs of the random scaling transform.
+
+        Inputs, which exceed the token limit with any scaling, should be rejected directly.
+        """
+        _, dep, _ = quick_linearise(self.voxels)
+        kwargs = {'spatial_dim': 3, 'resolution': 32, 'position_encoding': 'centered', 'embedding': ['basic']}
+        num_positions = int(0.8 * len(dep))
+        check_len = create_data_transform(name='check_len', num_positions=num_positions, **kwargs)
+
+        num_valid = {}
+        for name in ('scaling', 'length_aware_scaling'):
+            transform = create_data_transform(name=name, num_positions=num_positions, **kwargs)
+            np.random.seed(0)
+            outputs = [transform(self.voxels) for _ in range(20)]
+            num_valid[name] = sum(o is not None and check_len(quick_linearise(o)) is not None for o in outputs)
+        self.assertGreater(num_valid['length_aware_scaling'], 2 * num_valid['scaling'])
+
+        transform = create_data_transform(name='length_aware_scaling', num_positions=len(dep) // 4, **kwargs)
+        self.assertIsNone(transform(self.voxels))
+        self.assertTrue(transform.rejected)
+
+        # the reject is passed on by composed transforms
+        names = ['length_aware_scaling', 'linear']
+        transform = create_data_transform(name=names, num_positions=len(dep) // 4, **kwargs)
+        self.assertIsNone(transform(self.voxels))
+        self.assertTrue(transform.rejected)
+
+    def test_varied_shapes(self):
+        """ Shapes, which fit into the token limit with the smallest scaling, should never be rejected. """
+        rng = np.random.default_rng(0)
+        np.random.seed(0)
+        for embedding in (['basic'], ['composite_B']):
+            kwargs = {'spatial_dim': 3, 'resolution': 64, 'position_encoding': 'centered', 'embedding': embedding}
+            for _ in range(10):
+                voxels = procedural_shape(rng, 64, rng.integers(1, 10))
+                check_len = create_data_transform(name='check_len', num_positions=0, **kwargs)
+                num_positions = int(0.8 * check_len.sequence_length(layer_token_counts(voxels)))
+                transform = create_data_transform(name='length_aware_scaling', num_positions=num_positions, **kwargs)
+                min_length = transform.exact_length(axis_scaling(voxels, np.full(3, 0.75)))
+
+                for _ in range(3):
+                    output = transform(voxels)
+                    self.assertEqual(transform.rejected, output is None)
+                    if min_length <= num_positions:
+                        self.assertIsNotNone(output)
@@ -0,0 +1,191 @@
+import math
+import unittest
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from data.collate.collate_utils import pad_batch
+from modules.architecture import create_architecture
+from modules.generative_head import create_head
+from modules.token_embedding import create_embedding
+from modules.utils import DecodingCache, cached_encoder
+from sample.token_generator.double_substitution_generator import DoubleSubstitutionGenerator
+from sample.token_generator.substitution_generator import SubstitutionGenerator
+from utils import quick_linearise
+from tests.shapes import sphere
+
+
+class FullAttention(nn.Module):
+    """ Stub of the 'full' attention of `fast-transformers`, which receives and returns tensors with shape [N, L, H, D].
+    """
+    def __init__(self, dropout):
+        super(FullAttention, self).__init__()
+        self.softmax_temp = None
+        self.dropout = nn.Dropout(dropout)
+
+    def forward(self, queries, keys, values, mask):
+        scores = torch.einsum("nlhe,nshe->nhls", queries * (1.0 / math.sqrt(queries.shape[-1])), keys)
+        attn = self.dropout(torch.softmax(scores.masked_fill(mask, -float("Inf")), dim=-1))
+        return torch.einsum("nhls,nshd->nlhd", attn, values)
+
+
+class AttentionLayer(nn.Module):
+    """ Stub of the attention layer of `fast-transformers`. """
+    def __init__(self, embed_dim, num_heads, dropout):
+        super(AttentionLayer, self).__init__()
+        self.inner_attention = FullAttention(dropout)
+        self.query_projection = nn.Linear(embed_dim, embed_dim)
+        self.key_projection = nn.Linear(embed_dim, embed_dim)
+        self.value_projection = nn.Linear(embed_dim, embed_dim)
+        self.out_projection = nn.Linear(embed_dim, embed_dim)
+        self.n_heads = num_heads
+
+    def forward(self, x, mask):
+        heads = [p(x).view(x.shape[0], x.shape[1], self.n_heads, -1) for p in (
+            self.query_projection,
+            self.key_projection,
+            self.value_projection,
+        )]
+        return self.out_projection(self.inner_attention(*heads, mask).reshape(x.shape))
+
+
+class EncoderLayer(nn.Module):
+    """ Stub of the encoder layer of `fast-transformers` with a causal attention and a key padding mask. """
+    def __init__(self, embed_dim, num_heads, dropout=0.0):
+        super(EncoderLayer, self).__init__()
+        self.attention = AttentionLayer(embed_dim, num_heads, dropout)
+        self.linear1 = nn.Linear(embed_dim, 4 * embed_dim)
+        self.linear2 = nn.Linear(4 * embed_dim, embed_dim)
+        self.norm1 = nn.LayerNorm(embed_dim)
+        self.norm2 = nn.LayerNorm(embed_dim)
+        self.dropout = nn.Dropout(dropout)
+        self.activation = F.gelu
+
+    def forward(self, x, padding_mask):
+        causal = torch.ones(x.shape[1], x.shape[1], dtype=torch.bool).triu(1)  # [L, L]
+        x = self.norm1(x + self.dropout(self.attention(x, causal | padding_mask[:, None, None])))
+        y = self.dropout(self.linear2(self.dropout(self.activation(self.linear1(x)))))
+        return self.norm2(x + y)
+
+
+class TestDecodingCache(unittest.TestCase):
+    """ Tests the incremental decoding with cached keys and values against the computation of the full sequence. """
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        batch = [quick_linearise(sphere(32, self.rng)) + (np.array(0), ) for _ in range(3)]
+        self.seq = [torch.tensor(s) for s in pad_batch(batch)[:3]]
+
+    def create_model(self, architecture, resolution=32):
+        torch.manual_seed(0)
+        return create_architecture(
+            architecture=architecture,
+            attention='basic_full',
+            token_embedding=create_embedding(['composite_A'], 'basic', 3, 16, resolution, 3),
+            generative_head=create_head(['composite_A'], 'basic', 3, 16, 8, 1, resolution),
+            embed_dim=16,
+            num_heads=2,
+            num_layers=2,
+            dropout=0.0,
+            num_classes=1,
+        ).eval()
+
+    def mutate(self, value, depth):
+        """ Changes a random token of the last layer of each sample, like a sampler filling in the sequence. """
+        for i in range(value.shape[0]):
+            last = torch.nonzero(depth[i] == depth[i].max())[:, 0]
+            value[i, last[self.rng.integers(len(last))]] = int(self.rng.integers(1, 4))
+
+    def assert_logits_close(self, model, seq, cache):
+        full = model.compute_logits(seq, None, 0, None)
+        cached = model.compute_logits(seq, None, 0, None, cache=cache)
+        np.testing.assert_allclose(torch.nan_to_num(cached), torch.nan_to_num(full), atol=1e-5)
+
+    def test_compute_logits(self):
+        """ Logits computed with the cache should be equal to the logits of the full sequence after each change. """
+        for architecture in ['pytorch', 'encoder_only']:
+            model = self.create_model(architecture)
+            value, depth, position = [s.clone() for s in self.seq]
+            cache = DecodingCache()
+
+            with torch.no_grad(), torch.backends.mkldnn.flags(enabled=False):
+                for _ in range(4):
+                    self.mutate(value, depth)
+                    self.assert_logits_close(model, (value, depth, position), cache)
+
+    def test_fast_transformers_layer(self):
+        """ The cached encoder should compute the layers of `fast-transformers` like their full pass. """
+        torch.manual_seed(0)
+        layers = nn.ModuleList([EncoderLayer(16, 2) for _ in range(2)])
+        encoder = nn.Module()
+        encoder.layers, encoder.norm = layers, nn.LayerNorm(16)
+
+        seq = torch.randn(3, 12, 16)
+        padding_mask = torch.arange(12) >= torch.tensor([[12], [9], [5]])  # [N, L]
+        cache = DecodingCache()
+
+        with torch.no_grad():
+            for _ in range(4):
+                x = seq
+                for layer in layers:
+                    x = layer(x, padding_mask)
+                full = encoder.norm(x)
+                cached = cached_encoder(encoder, seq, cache, padding_mask)
+
+                np.testing.assert_allclose(cached[~padding_mask], full[~padding_mask], atol=1e-5)
+                seq = seq.clone()
+                seq[:, self.rng.integers(4, 12)] = torch.randn(16)
+
+    def test_select(self):
+        """ Cached results of the kept samples should remain valid, if other samples of the batch are finished. """
+        model = self.create_model('pytorch')
+        value, depth, position = [s.clone() for s in self.seq]
+        cache = DecodingCache()
+
+        with torch.no_grad(), torch.backends.mkldnn.flags(enabled=False):
+            model.compute_logits((value, depth, position), None, 0, None, cache=cache)
+            cache.select([0, 2])
+
+            value, depth, position = value[[0, 2]], depth[[0, 2]], position[[0, 2]]
+            self.mutate(value, depth)
+            self.assert_logits_close(model, (value, depth, position), cache)
+
+    def test_compute_logits_substitution(self):
+        """ Cached logits of the substitution (64^3) and double substitution (128^3) layers should be equal to the
+        logits of the full sequence after each change, also if the previous pass skipped the last tokens.
+        """
+        for resolution in [64, 128]:
+            model = self.create_model('pytorch', resolution)
+            batch = [quick_linearise(sphere(resolution, self.rng, (0.1, 0.2))) + (np.array(0), ) for _ in range(2)]
+            value, depth, position = [torch.tensor(s) for s in pad_batch(batch)[:3]]
+            cache = DecodingCache()
+
+            with torch.no_grad(), torch.backends.mkldnn.flags(enabled=False):
+                for num_skipped in [0, 3, 1]:
+                    for _ in range(8):
+                        self.mutate(value, depth)
+                    cache.skip(num_skipped)
+                    model.compute_logits((value, depth, position), None, 0, None, cache=cache)
+
+                    # skipped tokens have to be computed by the next pass, which requires them
+                    cache.skip(0)
+                    self.assert_logits_close(model, (value, depth, position), cache)
+
+    def test_substitution_generators(self):
+        """ Greedy sampling of substitution layers with the cache and skipped token blocks should be equal to the
+        sampling with the full sequence in each pass.
+        """
+        for resolution, generator in [(64, SubstitutionGenerator), (128, DoubleSubstitutionGenerator)]:
+            model = self.create_model('pytorch', resolution)
+            val, dep, pos = quick_linearise(sphere(resolution, self.rng, (0.1, 0.2)))
+            layers = [[torch.tensor(s[dep == d]) for d in range(1, dep.max() + 1)] for s in (val, dep, pos)]
+
+            def uncached_logits(seq, memory, idx, cls, cache=None):
+                return model.compute_logits(seq, memory, idx, cls)
+
+            samples = []
+            for compute_logits in [model.compute_logits, uncached_logits]:
+                val = layers[0][:-1] + [torch.ones_like(layers[0][-1])]
+                with torch.no_grad(), torch.backends.mkldnn.flags(enabled=False):
+                    samples += [generator(compute_logits, 8)(val, layers[1], layers[2], temperature=1e-6)]
+            np.testing.assert_array_equal(samples[0], samples[1])
@@ -0,0 +1,95 @@
+import unittest
+import numpy as np
+import torch
+
+from sample.sample_utils import sample_tokens, verify_draft, SamplingStatistics
+from sample.token_generator.basic_generator import BasicGenerator
+from sample.token_generator.substitution_generator import SubstitutionGenerator
+
+
+def _one_hot_logits(tokens, num_vocab=4, scale=50.0):
+    """ Returns logits, which predict the given tokens with a probability of nearly one. """
+    return scale * torch.nn.functional.one_hot(tokens, num_vocab).float()
+
+
+def _causal_logits(seq, memory, idx, cls, cache=None):
+    """ Predicts each token deterministically from the sum of all previous tokens of the sequence. """
+    value = seq[0]
+    prefix = torch.cumsum(value, dim=1) - value
+    return _one_hot_logits(prefix % 3 + 1)
+
+
+def _expected_tokens(val):
+    """ Samples the last layer token by token with `_causal_logits`. """
+    value = torch.cat(val).clone()
+    for i in range(len(value) - len(val[-1]), len(value)):
+        value[i] = torch.sum(value[:i]) % 3 + 1
+    return value[-len(val[-1]):]
+
+
+class TestDraftSampling(unittest.TestCase):
+    """ Tests the sampling of token blocks with draft tokens against the sampling of single tokens. """
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        second_last = [torch.tensor(rng.integers(1, 4, 8 * n)) for n in (2, 3)]
+        self.val = [
+            [torch.full((n, ), 2), s, torch.ones(8 * int(torch.sum(s == 2)), dtype=torch.long)]
+            for n, s in zip((2, 3), second_last)
+        ]
+        self.dep = [[torch.full_like(v, d + 1) for d, v in enumerate(v_b)] for v_b in self.val]
+        self.pos = [[torch.zeros(len(v), 3, dtype=torch.long) for v in v_b] for v_b in self.val]
+
+    def test_verify_draft(self):
+        """ Tokens should be accepted up to and including the first token, which differs from its draft. """
+        statistics = SamplingStatistics()
+        logits = _one_hot_logits(torch.tensor([1, 1, 3, 2, 1]))
+
+        tokens, draft = verify_draft(logits, torch.tensor([1, 1, 2, 2, 2]), 1.0, statistics=statistics)
+        np.testing.assert_array_equal(tokens, [1, 1, 3])
+        np.testing.assert_array_equal(draft, [2, 1])
+
+        tokens, draft = verify_draft(logits, torch.tensor([1, 1, 3, 2, 1]), 1.0, statistics=statistics)
+        np.testing.assert_array_equal(tokens, [1, 1, 3, 2, 1])
+        self.assertEqual(len(draft), 0)
+        self.assertEqual(statistics.num_tokens, 8)
+
+    def test_accept_threshold(self):
+        """ Only tokens with a probability of at least the threshold should be accepted with confidence. """
+        statistics = SamplingStatistics()
+        logits = torch.tensor([[0.0, 5.0, 0.0, 0.0], [0.0, 1.0, 1.0, 1.0]])
+
+        tokens = sample_tokens(logits, 1.0, accept_threshold=0.9, statistics=statistics)
+        self.assertEqual(tokens[0], 1)
+        self.assertEqual(statistics.num_confident, 1)
+
+        sample_tokens(logits, 1.0, statistics=statistics)
+        self.assertEqual(statistics.num_tokens, 4)
+        self.assertEqual(statistics.num_confident, 1)
+
+    def test_basic_generator(self):
+        """ Sampled blocks should be equal to tokens sampled one by one with fewer forward passes. """
+        for kernel_size in (1, 4, 8):
+            generator = BasicGenerator(_causal_logits, kernel_size)
+            val = [[v.clone() for v in v_b] for v_b in self.val]
+            tokens = generator(val[0], self.dep[0], self.pos[0])
+            np.testing.assert_array_equal(tokens, _expected_tokens(self.val[0]))
+
+            val = [[v.clone() for v in v_b] for v_b in self.val]
+            for tokens, val_b in zip(generator.sample_batch(val, self.dep, self.pos), self.val):
+                np.testing.assert_array_equal(tokens, _expected_tokens(val_b))
+
+            num_tokens = sum(len(v_b[-1]) for v_b in self.val)
+            self.assertEqual(generator.statistics.num_tokens, len(self.val[0][-1]) + num_tokens)
+            self.assertLessEqual(generator.statistics.num_passes, generator.statistics.num_tokens)
+
+    def test_substitution_generator(self):
+        """ Sampled blocks should be equal to tokens sampled one by one with fewer forward passes. """
+        generator = SubstitutionGenerator(_causal_logits, 8)
+        val = [[v.clone() for v in v_b] for v_b in self.val]
+        tokens = generator(val[0], self.dep[0], self.pos[0])
+        np.testing.assert_array_equal(tokens, _expected_tokens(self.val[0]))
+
+        val = [[v.clone() for v in v_b] for v_b in self.val]
+        for tokens, val_b in zip(generator.sample_batch(val, self.dep, self.pos), self.val):
+            np.testing.assert_array_equal(tokens, _expected_tokens(val_b))
+        self.assertLess(generator.statistics.num_passes, generator.statistics.num_tokens)
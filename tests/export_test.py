@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import torch
+
+from sample.sample_utils import postprocess
+from utils import export_sample, read_octree, read_voxels
+from utils.export import voxels_to_mesh
+from utils.kd_tree_utils import quick_linearise
+from tests.shapes import sphere
+
+
+class TestExport(unittest.TestCase):
+    """ Tests the export of sampled voxel arrays into mesh and voxel file formats. """
+    def setUp(self):
+        self.array = sphere(16)
+        self.array[0, 0, 0] = 1
+        self.verts, self.faces, self.normals = voxels_to_mesh(self.array)
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'shape_0')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_obj(self):
+        """ The *.obj file should hold all vertices, normals and faces with 1-based indices. """
+        file_path = export_sample(self.array, self.path, 'obj')
+        self.assertEqual(os.listdir(self.dir.name), ['shape_0.obj'])
+
+        with open(file_path) as f:
+            lines = [line.split() for line in f.read().splitlines()]
+        verts = np.array([line[1:] for line in lines if line[0] == 'v'], dtype=float)
+        faces = np.array([[c.split('//')[0] for c in line[1:]] for line in lines if line[0] == 'f'], dtype=int)
+
+        np.testing.assert_allclose(verts, self.verts, atol=1e-6)
+        np.testing.assert_array_equal(faces, self.faces + 1)
+        self.assertEqual(sum(line[0] == 'vn' for line in lines), len(self.normals))
+
+    def test_ply(self):
+        """ The binary *.ply file should hold the vertex and face buffers after the header. """
+        file_path = export_sample(self.array, self.path, 'ply')
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        header, body = data.split(b'end_header\n', 1)
+        self.assertIn(f"element vertex {len(self.verts)}".encode(), header)
+        self.assertIn(f"element face {len(self.faces)}".encode(), header)
+
+        vertex = np.frombuffer(body, dtype='<f4', count=6 * len(self.verts)).reshape(-1, 6)
+        face = np.frombuffer(body[vertex.nbytes:], dtype=[('n', 'u1'), ('idx', '<i4', (3, ))])
+        np.testing.assert_array_equal(vertex[:, :3], self.verts)
+        np.testing.assert_array_equal(vertex[:, 3:], self.normals)
+        np.testing.assert_array_equal(face['n'], 3)
+        np.testing.assert_array_equal(face['idx'], self.faces)
+
+    def test_stl(self):
+        """ The binary *.stl file should hold the corners of each face. """
+        file_path = export_sample(self.array, self.path, 'stl')
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        self.assertEqual(np.frombuffer(data[80:84], dtype='<u4')[0], len(self.faces))
+
+        dtype = [('normal', '<f4', (3, )), ('corners', '<f4', (3, 3)), ('attr', '<u2')]
+        triangles = np.frombuffer(data[84:], dtype=dtype)
+        np.testing.assert_array_equal(triangles['corners'], self.verts[self.faces])
+
+        # normals of degenerated faces are zero
+        norm = np.linalg.norm(triangles['normal'], axis=1)
+        np.testing.assert_allclose(norm[norm > 0], 1.0, atol=1e-5)
+
+    def test_voxels(self):
+        """ The bit-packed voxel array should be restored without any changes. """
+        file_path = export_sample(self.array, self.path, 'voxels')
+        np.testing.assert_array_equal(read_voxels(file_path), self.array)
+
+    def test_octree(self):
+        """ The packed token sequence should be decoded into the original voxel array. """
+        file_path = export_sample(self.array, self.path, 'octree')
+        value, array = read_octree(file_path)
+        self.assertTrue(set(np.unique(value)) <= {1, 2, 3})
+        np.testing.assert_array_equal(array, self.array)
+
+    def test_octree_sequence(self):
+        """ A sampled token sequence should be written without changes and decoded like the sampled voxel array. """
+        value, depth, _ = quick_linearise(self.array)
+        # the sampling stopped before the last layer, thus the sequence ends with mixed tokens
+        layers = [torch.tensor(value[depth == d]) for d in range(1, depth.max())]
+        sequence = postprocess(layers, 16, 3, output='sequence')
+        np.testing.assert_array_equal(sequence, value[depth < depth.max()])
+
+        file_path = export_sample(sequence, self.path, 'octree', resolution=16)
+        value, array = read_octree(file_path)
+        np.testing.assert_array_equal(value, sequence)
+        np.testing.assert_array_equal(array, postprocess(layers, 16, 3))
+
+        with self.assertRaises(ValueError):
+            export_sample(sequence, self.path, 'voxels', resolution=16)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export_sample(self.array, self.path, 'vtk')
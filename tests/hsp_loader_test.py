@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import numpy.testing as np_test
+from scipy.io import savemat
+
+from utils import load_hsp, load_hsp_batch
+
+
+class TestHSPLoader(unittest.TestCase):
+    """ Tests the HSP loader with small synthetic shapes, which consist of full blocks and random boundary blocks. """
+    def setUp(self):
+        """ Writes synthetic shapes in the HSP format into a temporary directory. """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.paths = []
+        self.voxels = []
+
+        rng = np.random.default_rng(0)
+        for i in range(3):
+            # block indices: '1' - empty, '2' - full, '>2' - boundary block at index - 1
+            block_index = np.ones((16, 16, 16))
+            block_index[rng.random(block_index.shape) < 0.1] = 2
+            boundary = rng.random(block_index.shape) < 0.1
+            block_index[boundary] = np.arange(3, 3 + np.count_nonzero(boundary))
+
+            blocks = np.zeros((2 + np.count_nonzero(boundary), 16, 16, 16), dtype=np.uint8)
+            blocks[1] = 1
+            blocks[2:] = rng.random(blocks[2:].shape) < 0.05
+
+            # reference voxels with a resolution of 256
+            voxels = np.zeros((256, 256, 256), dtype=np.uint8)
+            for idx in np.argwhere(block_index >= 2):
+                x, y, z = 16 * idx
+                voxels[x:x + 16, y:y + 16, z:z + 16] = blocks[int(block_index[tuple(idx)]) - 1]
+
+            path = os.path.join(self.tmp_dir.name, f"shape_{i}.mat")
+            savemat(path, {"bi": block_index, "b": blocks})
+            self.paths += [path]
+            self.voxels += [voxels]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def downsample(self, voxels, resolution):
+        """ Downsamples the reference voxels by the maximum over each block. """
+        step = 256 // resolution
+        return voxels.reshape(3 * [resolution, step]).max(axis=(1, 3, 5))
+
+    def test_load_hsp(self):
+        """ The loaded voxels should be equal to the downsampled reference voxels. """
+        for path, voxels in zip(self.paths, self.voxels):
+            for resolution in (16, 32, 64, 256):
+                output = load_hsp(path, resolution)
+
+                self.assertEqual(output.dtype, np.uint8)
+                np_test.assert_array_equal(output, self.downsample(voxels, resolution))
+
+    def test_load_hsp_min_resolution(self):
+        """ Shapes should be loaded with a resolution of at least 16. """
+        output = load_hsp(self.paths[0], 8, dtype=bool)
+
+        self.assertEqual(output.shape, (16, 16, 16))
+        self.assertEqual(output.dtype, bool)
+
+    def test_load_hsp_packbits(self):
+        """ Unpacking the bit-packed voxels should restore the voxels. """
+        output = load_hsp(self.paths[0], 32, packbits=True)
+
+        self.assertEqual(output.shape, (32, 32, 4))
+        np_test.assert_array_equal(np.unpackbits(output, axis=-1), load_hsp(self.paths[0], 32))
+
+    def test_load_hsp_batch(self):
+        """ A batch of shapes should be equal to each separately loaded shape. """
+        for num_workers in (0, 2):
+            output = load_hsp_batch(self.paths, 32, num_workers=num_workers)
+
+            self.assertEqual(output.shape, (3, 32, 32, 32))
+            for o, path in zip(output, self.paths):
+                np_test.assert_array_equal(o, load_hsp(path, 32))
@@ -3,7 +3,7 @@ import numpy as np
 import numpy.testing as np_test
 import matplotlib.image as mpimg
 
-from utils import kdTree
+from utils import kdTree, CompactKdTree, quick_delinearise
 
 
 class TestWhiteboxSplit(unittest.TestCase):
@@ -524,3 +524,134 @@ class TestQuadtree(unittest.TestCase):
         np_test.assert_array_equal(target_value, output_value)
         np_test.assert_array_equal(target_depth, output_depth)
         np_test.assert_array_equal(target_pos, output_pos)
+
+
+class TestCompactKdTree(unittest.TestCase):
+    """ Testsuit for the array-backed kd-tree. The results should be identical to the node-based kd-tree. """
+    def mnist_32x32_binarized(self):
+        """ Return a single binarized and padded MNIST image, with a resolution of 32x32. """
+        return np.array(np.pad(mpimg.imread('tests/img/mnist.jpg')[:, :, 0] / 255.0, (2, )) > 0.1, dtype=int)
+
+    def random_volume_16x16x16(self, seed=0):
+        """ Return a random binary volume, with a resolution of 16x16x16. """
+        rng = np.random.default_rng(seed)
+        return np.array(rng.random((16, 16, 16)) < 0.2, dtype=int)
+
+    def assert_equal_sequences(self, tree, compact_tree, depth=float('Inf')):
+        """ Compares the value, depth and position sequences of both trees. """
+        target = tree.get_token_sequence(depth=depth, return_depth=True, return_pos=True)
+        output = compact_tree.get_token_sequence(depth=depth, return_depth=True, return_pos=True)
+        for t, o in zip(target, output):
+            self.assertEqual(t.dtype, o.dtype)
+            np_test.assert_array_equal(t, o)
+
+    def test_token_sequence_generation_image(self):
+        """ Inserts a binarized image and compares all token sequences with the node-based kd-tree. """
+        input = self.mnist_32x32_binarized()
+
+        for pos_encoding in ('centered', 'intertwined'):
+            qtree = kdTree(2, pos_encoding).insert_element_array(input)
+            compact_qtree = CompactKdTree(2, pos_encoding).insert_element_array(input)
+
+            self.assert_equal_sequences(qtree, compact_qtree)
+            self.assert_equal_sequences(qtree, compact_qtree, depth=2)
+
+    def test_token_sequence_generation_volume(self):
+        """ Inserts random volumes and compares all token sequences with the node-based kd-tree. """
+        for seed in range(4):
+            input = self.random_volume_16x16x16(seed)
+
+            for pos_encoding in ('centered', 'intertwined'):
+                for max_depth in (2, float('Inf')):
+                    octree = kdTree(3, pos_encoding).insert_element_array(input, max_depth=max_depth)
+                    compact_octree = CompactKdTree(3, pos_encoding).insert_element_array(input, max_depth=max_depth)
+
+                    self.assert_equal_sequences(octree, compact_octree)
+
+    def test_element_array_retrival(self):
+        """ Retrives element arrays in all modes and compares them with the node-based kd-tree. """
+        input = self.random_volume_16x16x16()
+
+        octree = kdTree(3).insert_element_array(input)
+        compact_octree = CompactKdTree(3).insert_element_array(input)
+
+        np_test.assert_array_equal(input, compact_octree.get_element_array())
+        for mode in ('occupancy', 'value', 'color', 'depth'):
+            for depth in (1, 3, float('Inf')):
+                np_test.assert_array_equal(
+                    octree.get_element_array(depth, mode),
+                    compact_octree.get_element_array(depth, mode),
+                )
+
+    def test_volume_to_sequence_to_volume(self):
+        """ Transforms a volume into a token sequence and back for both positional encodings. """
+        input = self.random_volume_16x16x16()
+
+        for pos_encoding in ('centered', 'intertwined'):
+            octree = CompactKdTree(3, pos_encoding).insert_element_array(input)
+            token_sequence = octree.get_token_sequence()[0]
+
+            octree2 = CompactKdTree(3, pos_encoding).insert_token_sequence(token_sequence, resolution=16)
+
+            np_test.assert_array_equal(input, octree2.get_element_array())
+            self.assert_equal_sequences(octree, octree2)
+
+    def test_token_sequence_retrival_diagonal(self):
+        """ Inserts a sequence representing a diagonal line and tries to retrive the same token sequence. """
+        input = (
+            "1221" + "12211221" + "1221122112211221" + "12211221122112211221122112211221" +
+            "1221122112211221122112211221122112211221122112211221122112211221"
+        )
+
+        qtree = kdTree(spatial_dim=2).insert_token_sequence(input, resolution=32)
+        compact_qtree = CompactKdTree(spatial_dim=2).insert_token_sequence(input, resolution=32)
+
+        self.assertSequenceEqual(input, ''.join(str(x) for x in compact_qtree.get_token_sequence()[0]))
+        self.assert_equal_sequences(qtree, compact_qtree)
+        np_test.assert_array_equal(qtree.get_element_array(), compact_qtree.get_element_array())
+
+    def test_autorepair_truncated_sequence(self):
+        """ Truncated sequences should be padded, if autorepair is enabled, and raise an error otherwise. """
+        input = self.mnist_32x32_binarized()
+        token_sequence = kdTree(spatial_dim=2).insert_element_array(input).get_token_sequence()[0][:-10]
+
+        qtree = kdTree(spatial_dim=2).insert_token_sequence(
+            token_sequence, resolution=32, autorepair_errors=True, silent=True
+        )
+        compact_qtree = CompactKdTree(spatial_dim=2).insert_token_sequence(
+            token_sequence, resolution=32, autorepair_errors=True, silent=True
+        )
+        np_test.assert_array_equal(qtree.get_element_array(), compact_qtree.get_element_array())
+
+        with self.assertRaises(ValueError):
+            CompactKdTree(spatial_dim=2).insert_token_sequence(token_sequence, resolution=32, silent=True)
+
+    def test_quick_delinearise(self):
+        """ Decodes a token sequence directly into an element array and compares it with the node-based kd-tree. """
+        input = self.random_volume_16x16x16()
+        token_sequence = kdTree(3).insert_element_array(input).get_token_sequence()[0]
+        octree = kdTree(3).insert_token_sequence(token_sequence, resolution=16)
+
+        np_test.assert_array_equal(input, quick_delinearise(token_sequence, resolution=16, spatial_dim=3))
+        for mode in ('occupancy', 'value', 'color', 'depth'):
+            for depth in (1, 3, float('Inf')):
+                np_test.assert_array_equal(
+                    octree.get_element_array(depth, mode),
+                    quick_delinearise(token_sequence, resolution=16, spatial_dim=3, depth=depth, mode=mode),
+                )
+
+    def test_quick_delinearise_autorepair(self):
+        """ Truncated sequences should be padded, if autorepair is enabled, and raise an error otherwise. """
+        input = self.mnist_32x32_binarized()
+        token_sequence = kdTree(spatial_dim=2).insert_element_array(input).get_token_sequence()[0][:-10]
+
+        qtree = kdTree(spatial_dim=2).insert_token_sequence(
+            token_sequence, resolution=32, autorepair_errors=True, silent=True
+        )
+        output = quick_delinearise(
+            token_sequence, resolution=32, spatial_dim=2, mode='value', autorepair_errors=True, silent=True
+        )
+        np_test.assert_array_equal(qtree.get_element_array(mode='value'), output)
+
+        with self.assertRaises(ValueError):
+            quick_delinearise(token_sequence, resolution=32, spatial_dim=2, silent=True)
@@ -1,6 +1,7 @@
 import unittest
 import numpy as np
 import numpy.testing as np_test
+import torch
 
 from utils import (TrinaryRepresentation, load_chair, load_airplane, quick_linearise, kdTree)
 
@@ -226,6 +227,29 @@ class TestConversionBasicTrinarySequence(unittest.TestCase):
         np_test.assert_array_equal(out_depth, tgt_depth)
         np_test.assert_array_equal(out_pos, tgt_pos)
 
+    def test_trinary_pytorch_batch(self):
+        """ Batched pytorch conversions should be equal to the numpy conversions of each sequence and keep padding. """
+        repr_trans = TrinaryRepresentation(spatial_dim=3)
+        value, depth, position = quick_linearise(np.pad(np.ones((6, 5, 4), dtype=int), ((1, 1), (2, 1), (3, 1))))
+        tri_value, tri_depth, tri_pos = repr_trans.encode_trinary(value, depth, position)
+
+        # batch of two sequences, each padded with a single tuple of padding tokens
+        in_value, in_depth, in_pos = [
+            torch.tensor(np.stack(2 * [np.concatenate([x, np.zeros((8, ) + x.shape[1:], dtype=int)])]))
+            for x in (value, depth, position)
+        ]
+        out_value, out_depth, out_pos = repr_trans.encode_trinary_pytorch(in_value, in_depth, in_pos)
+
+        np_test.assert_array_equal(out_value[:, :-1], np.stack(2 * [tri_value]))
+        np_test.assert_array_equal(out_value[:, -1], [0, 0])
+        np_test.assert_array_equal(out_depth[:, :-1], np.stack(2 * [tri_depth]))
+        np_test.assert_array_equal(out_pos[:, :-1], np.stack(2 * [tri_pos]))
+
+        out_value, out_depth, out_pos = repr_trans.decode_trinary_pytorch(out_value, out_depth, out_pos)
+        np_test.assert_array_equal(out_value, in_value)
+        np_test.assert_array_equal(out_depth[:, :len(depth)], np.stack(2 * [depth]))
+        np_test.assert_array_equal(out_pos[:, :len(position)], np.stack(2 * [position]))
+
 
 class TestQuickLinearise(unittest.TestCase):
     """ Tests the 'quick_linearise' function, iff the computed results are equal to the kdTree class.
@@ -270,3 +294,53 @@ class TestQuickLinearise(unittest.TestCase):
         """
         voxels = load_airplane("/clusterarchive/ShapeNet/voxelization", 16)
         self.quick_linearisation(voxels, pos_encoding="intertwined")
+
+    def random_voxels(self, seed: int = 0, resolution: int = 32) -> np.ndarray:
+        """ Returns a random binarized shape, consisting of a box and some noise.
+
+        Args:
+            seed (int): Seed of the random number generator.
+            resolution (int): Resolution of the shape.
+        """
+        rng = np.random.default_rng(seed)
+        voxels = np.array(rng.random(3 * [resolution]) < 0.02, dtype=int)
+        voxels[resolution // 4:resolution // 2, 3:resolution - 5, resolution // 3:] = 1
+        return voxels
+
+    def test_random_centered(self):
+        """ Tests 'quick_linearise' with random inputs and centered encoding.
+        """
+        for seed in range(4):
+            self.quick_linearisation(self.random_voxels(seed), pos_encoding="centered")
+
+    def test_random_intertwined(self):
+        """ Tests 'quick_linearise' with random inputs and intertwined encoding.
+        """
+        for seed in range(4):
+            self.quick_linearisation(self.random_voxels(seed), pos_encoding="intertwined")
+
+    def test_max_resolution(self):
+        """ Tests 'quick_linearise' with a limited resolution, which should return only the first depth layers.
+        """
+        voxels = self.random_voxels()
+        sequence = quick_linearise(voxels, max_resolution=8)
+        target = kdTree(spatial_dim=3).insert_element_array(voxels, max_depth=2).get_token_sequence(
+            return_depth=True, return_pos=True
+        )
+
+        for output, expected in zip(sequence, target):
+            np_test.assert_array_equal(output, expected)
+
+    def test_batch(self):
+        """ Tests 'quick_linearise' with a stack of inputs, which should be equal to a separate linearisation.
+        """
+        voxels = np.stack([self.random_voxels(seed) for seed in range(4)])
+
+        for pos_encoding in ("centered", "intertwined"):
+            sequences = quick_linearise(voxels, pos_encoding=pos_encoding, batch=True)
+
+            self.assertEqual(len(sequences), len(voxels))
+            for sequence, v in zip(sequences, voxels):
+                target = quick_linearise(v, pos_encoding=pos_encoding)
+                for output, expected in zip(sequence, target):
+                    np_test.assert_array_equal(output, expected)
@@ -0,0 +1,81 @@
+import unittest
+import numpy as np
+import numpy.testing as np_test
+
+from utils import MortonIndex, breadth_first_order, morton_keys, morton_order, node_coords, quick_linearise
+from utils.morton_index import deinterleave_bits, interleave_bits
+from tests.shapes import sphere
+
+
+class TestMortonIndex(unittest.TestCase):
+    """ Tests the location keys and lookups of nodes of linearised octrees. """
+    def setUp(self):
+        # a sphere with an attached box, which are refined down to the deepest layer
+        self.voxels = sphere(16)
+        self.voxels[8:, 1:8, 3:] = 1
+        self.sequences = {p: quick_linearise(self.voxels, p) for p in ('centered', 'intertwined')}
+
+    def test_interleave_bits(self):
+        """ Deinterleaving Morton codes should return the original coordinates. """
+        coords = np.random.default_rng(0).integers(0, 2**20, (100, 3))
+        np_test.assert_array_equal(deinterleave_bits(interleave_bits(coords, 20), 3, 20), coords)
+        np_test.assert_array_equal(interleave_bits([[0, 0, 1], [0, 1, 0], [1, 0, 0], [1, 1, 1]], 1), [1, 2, 4, 7])
+
+    def test_keys(self):
+        """ Keys should be equal for both encodings and sorted in the breadth-first order of the sequence. """
+        keys = [morton_keys(dep, node_coords(dep, pos, p)) for p, (_, dep, pos) in self.sequences.items()]
+        np_test.assert_array_equal(keys[0], keys[1])
+        self.assertTrue(np.all(np.diff(keys[0]) > 0))
+
+    def test_order(self):
+        """ Each node should be followed by its children in Morton order, which is reversible. """
+        value, depth, position = self.sequences['centered']
+        coords = node_coords(depth, position)
+        order = morton_order(depth, coords)
+
+        # the token after each mixed node is its first child
+        mixed = np.nonzero(value[order][:-1] == 2)[0]
+        np_test.assert_array_equal(depth[order][mixed + 1], depth[order][mixed] + 1)
+        np_test.assert_array_equal(coords[order][mixed + 1], 2 * coords[order][mixed])
+
+        np_test.assert_array_equal(breadth_first_order(depth[order], coords[order]), np.argsort(order))
+
+    def test_parent_children(self):
+        """ Mixed nodes should have all children, whose parent is the mixed node, leaves should have no children. """
+        for pos_encoding, (value, depth, position) in self.sequences.items():
+            index = MortonIndex(depth, position, pos_encoding)
+            tokens = np.arange(len(value))
+            children = index.children(tokens)
+
+            np_test.assert_array_equal(np.all(children >= 0, axis=1), value == 2)
+            np_test.assert_array_equal(np.all(children < 0, axis=1), value != 2)
+            mixed = np.nonzero(value == 2)[0]
+            np_test.assert_array_equal(index.parent(children[mixed]), np.repeat(mixed[:, None], 8, axis=1))
+            np_test.assert_array_equal(index.parent(tokens[depth == 1]), -1)
+
+    def test_queries(self):
+        """ Point, box and neighbour queries should be equal to a brute force search on the voxel array. """
+        for pos_encoding, (value, depth, position) in self.sequences.items():
+            index = MortonIndex(depth, position, pos_encoding, resolution=16)
+            points = np.stack(np.nonzero(np.ones_like(self.voxels)), axis=1)
+            leaves = index.point_query(points)
+            np_test.assert_array_equal(value[leaves] == 3, self.voxels[tuple(points.T)] == 1)
+
+            lower, upper = np.array([3, 0, 5]), np.array([9, 4, 16])
+            in_box = np.all((points >= lower) & (points < upper), axis=1)
+            expected = np.unique(np.concatenate([leaves[in_box], index.parent(leaves[in_box])]))
+            ancestors = expected
+            while len(ancestors) > 0:
+                ancestors = index.parent(ancestors)
+                ancestors = ancestors[ancestors >= 0]
+                expected = np.union1d(expected, ancestors)
+            np_test.assert_array_equal(index.box_query(lower, upper), expected[expected >= 0])
+
+            neighbours = index.neighbours(np.arange(len(value)))
+            offsets = np.concatenate([np.eye(3), -np.eye(3)]).astype(int)
+            for token in np.nonzero(depth == 4)[0]:
+                cells = index.coords[token] + offsets
+                inside = np.all((cells >= 0) & (cells < 16), axis=1)
+                cell_index = np.ravel_multi_index(cells[inside].T, self.voxels.shape)
+                np_test.assert_array_equal(neighbours[token][inside], leaves[cell_index])
+                np_test.assert_array_equal(neighbours[token][~inside], -1)
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import torch
+
+from sample.sample_utils import postprocess
+from utils import export_sample, octree_to_mesh, quick_linearise
+
+
+def _volume(verts, faces, resolution):
+    """ Returns the enclosed volume of a closed mesh in elements of the array, see `octree_to_mesh` for the scaling. """
+    verts = (verts / 2 + [0.5, 0.0, 0.5]) * (resolution + 2) - 0.5
+    corners = verts[faces].astype(np.float64)
+    return np.sum(np.einsum('ij,ij->i', corners[:, 0], np.cross(corners[:, 1], corners[:, 2]))) / 6
+
+
+class TestOctreeMesh(unittest.TestCase):
+    """ Tests the extraction of surface meshes from the leaf nodes of token sequences. """
+    def test_coarse_faces(self):
+        """ Faces of coarse leaf nodes should be a single quad, inner faces should be removed. """
+        verts, faces, normals = octree_to_mesh(np.array(8 * [3]), 4)
+        self.assertEqual(len(faces), 8 * 3 * 2)
+        self.assertEqual(len(verts), 26)
+        self.assertAlmostEqual(_volume(verts, faces, 4), 64, places=3)
+        np.testing.assert_allclose(np.linalg.norm(normals, axis=1), 1.0, rtol=1e-6)
+
+    def test_volume(self):
+        """ The mesh should enclose exactly the occupied elements, including inner cavities, with outward faces. """
+        grid = np.stack(np.meshgrid(*3 * [np.arange(32)], indexing='ij'), axis=-1)
+        array = (np.linalg.norm(grid - 15.5, axis=-1) < 11).astype(np.int64)
+        array[2:10, 3:30, 16:29] = 1
+        array[14:18, 14:18, 14:18] = 0
+        value, _, _ = quick_linearise(array)
+
+        verts, faces, normals = octree_to_mesh(value, 32)
+        self.assertAlmostEqual(_volume(verts, faces, 32), np.sum(array), places=2)
+        self.assertEqual(len(verts), len(normals))
+
+        # sampled sequences can be exported as a mesh without a dense array
+        mesh = postprocess([torch.tensor(value)], 32, 3, output='mesh')
+        np.testing.assert_array_equal(mesh[1], faces)
+        with tempfile.TemporaryDirectory() as path:
+            file_path = export_sample(mesh, os.path.join(path, 'shape_0'), 'ply')
+            self.assertTrue(os.path.isfile(file_path))
+            with self.assertRaises(ValueError):
+                export_sample(mesh, os.path.join(path, 'shape_0'), 'voxels')
@@ -0,0 +1,114 @@
+import unittest
+import numpy as np
+import torch
+import torch.nn as nn
+
+from data.collate import create_data_collate
+from modules.architecture import create_architecture
+from modules.generative_head import create_head
+from modules.token_embedding import create_embedding
+from modules.utils import packed_encoder
+from utils import quick_linearise
+from utils.masks import block_diagonal_mask
+
+
+class TestPackedSequences(unittest.TestCase):
+    """ Tests the packed batch format of the 'encoder_only' architectures against the padded batch format. """
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.batch = []
+        for i in range(3):
+            value, depth, position = quick_linearise((rng.random((8, 8, 8)) < 0.3).astype(int))
+            length = rng.integers(8, len(value)) // 8 * 8
+            self.batch += [(value[:length], depth[:length], position[:length], np.array(i % 2))]
+
+    def test_pack_batch(self):
+        """ Samples should be concatenated without padding and aligned to the chunk size of the embedding. """
+        seq, target, cls, cu_seqlens = create_data_collate('pytorch', ['basic'], 8, 3, packed=True)(self.batch)
+        lengths = [len(b[0]) for b in self.batch]
+
+        np.testing.assert_array_equal(cu_seqlens, np.cumsum([0] + lengths))
+        np.testing.assert_array_equal(seq[0][0][0], np.concatenate([b[0] for b in self.batch]))
+        np.testing.assert_array_equal(seq[0][2][0], np.concatenate([b[2] for b in self.batch]))
+        np.testing.assert_array_equal(cls, [0, 1, 0])
+        self.assertIs(target, seq[-1])
+
+        _, _, _, cu_seqlens = create_data_collate('pytorch', ['half_conv'], 8, 3, packed=True)(self.batch[:1] * 2)
+        self.assertEqual(cu_seqlens[1] % 4, 0)
+
+    def test_unsupported_embedding(self):
+        """ Embeddings, which split sequences into layers, should not accept packed sequences. """
+        with self.assertRaises(ValueError):
+            create_data_collate('pytorch', ['substitution'], 8, 3, packed=True)
+
+    def test_look_ahead_encoding(self):
+        """ Look-ahead encodings would look ahead across sequence borders and should not accept packed sequences. """
+        for encodings in (('look_ahead', 'None'), ('basic', 'look_ahead'), ('look_ahead_split', 'basic')):
+            with self.assertRaises(ValueError):
+                create_data_collate('pytorch', ['basic'], 8, 3, packed=True, encodings=encodings)
+        create_data_collate('pytorch', ['basic'], 8, 3, packed=True, encodings=('basic', 'basic'))
+
+    def test_block_diagonal_mask(self):
+        """ Each token should access previous tokens of its own sequence only. """
+        mask = block_diagonal_mask(torch.tensor([0, 2, 5]))
+        target = np.full((5, 5), -np.inf)
+        target[0, 0] = target[1, :2] = target[2, 2] = target[3, 2:4] = target[4, 2:5] = 0
+
+        np.testing.assert_array_equal(mask, target)
+
+    def test_packed_encoder(self):
+        """ Attending each packed sequence on its own should be equal to the attention with a block diagonal mask. """
+        torch.manual_seed(0)
+        layer = nn.TransformerEncoderLayer(d_model=16, nhead=2, dim_feedforward=32, dropout=0.0, activation='gelu')
+        encoder = nn.TransformerEncoder(layer, num_layers=2, norm=nn.LayerNorm(16)).eval()
+        seq = torch.randn(1, 12, 16)
+        cu_seqlens = torch.tensor([0, 5, 8, 12])
+        padding_mask = torch.zeros(1, 12, dtype=torch.bool)
+        padding_mask[0, [4, 11]] = True
+
+        with torch.no_grad():
+            for causal in (True, False):
+                target = encoder(
+                    src=seq.transpose(0, 1),
+                    mask=block_diagonal_mask(cu_seqlens, causal),
+                    src_key_padding_mask=padding_mask,
+                ).transpose(0, 1)
+                out = packed_encoder(encoder, seq, cu_seqlens, padding_mask, causal)
+                np.testing.assert_allclose(out[~padding_mask], target[~padding_mask], atol=1e-5)
+
+    def test_packed_forward(self):
+        """ Logits of packed sequences should be equal to the logits of padded sequences. """
+        torch.manual_seed(0)
+        for architecture in ('encoder_only', 'pytorch'):
+            for embedding, head, head_encoding in (
+                ('basic', 'generative_basic', 'None'),
+                ('basic', 'generative_basic', 'basic'),
+                ('single_conv', 'single_conv', 'basic'),
+            ):
+                model = create_architecture(
+                    architecture=architecture,
+                    attention='basic_full',
+                    token_embedding=create_embedding([embedding], 'basic', 3, 16, 8, 3),
+                    generative_head=create_head([head], head_encoding, 3, 16, 8, 1, 8),
+                    embed_dim=16,
+                    num_heads=2,
+                    num_layers=2,
+                    dropout=0.0,
+                    num_classes=2,
+                ).eval()
+
+                seq, _, cls = create_data_collate(architecture, [embedding], 8)(self.batch)
+                packed_seq, _, packed_cls, cu_seqlens = create_data_collate(
+                    architecture, [embedding], 8, 3, packed=True
+                )(self.batch)
+
+                with torch.no_grad():
+                    logits = model(seq, cls)
+                    packed_logits = model(packed_seq, packed_cls, cu_seqlens)
+
+                for i, sample in enumerate(self.batch):
+                    np.testing.assert_allclose(
+                        packed_logits[0, cu_seqlens[i]:cu_seqlens[i] + len(sample[0])],
+                        logits[i, :len(sample[0])],
+                        atol=1e-5,
+                    )
@@ -0,0 +1,48 @@
+import unittest
+import numpy as np
+import torch
+
+from modules.utils import PositionalEncodingLearnedLookAhead, PositionalEncodingLearnedLookAheadSplit
+
+
+class TestPositionalEncoding(unittest.TestCase):
+    """ Tests the look-ahead encodings of padded batches against the reference encoding of the whole padded batch. """
+    def setUp(self):
+        torch.manual_seed(0)
+        self.length = torch.tensor([7, 4, 1])
+        position = torch.randint(1, 16, (3, 7, 3))
+        self.position = position * (torch.arange(7) < self.length.unsqueeze(1)).unsqueeze(2)
+
+    def spatial(self, embeddings):
+        """ Returns the sum of the spatial embeddings of all axes - [N, S, E]. """
+        return sum(embedding(self.position[:, :, axis]) for axis, embedding in enumerate(embeddings))
+
+    def look_ahead(self, x, eos):
+        """ Returns the look-ahead tokens, where the end of sequence token follows the padded sequence - [N, S, E]. """
+        return torch.cat([x[:, 1:], eos.expand(x.shape[0], 1, -1)], dim=1)
+
+    def test_look_ahead(self):
+        """ The last token of the padded batch should look ahead onto the end of sequence token. """
+        encoding = PositionalEncodingLearnedLookAhead(8, 8)
+        with torch.no_grad():
+            x = self.spatial(encoding.spatial_embeddings)
+            expected = x + self.look_ahead(x, encoding.eos)
+            np.testing.assert_array_equal(encoding(self.position), expected)
+
+    def test_look_ahead_split(self):
+        """ The last token of the padded batch should look ahead onto the end of sequence token. """
+        encoding = PositionalEncodingLearnedLookAheadSplit(8, 8)
+        with torch.no_grad():
+            x = self.spatial(encoding.spatial_embeddings)
+            x_look_ahead = self.spatial(encoding.spatial_embeddings_look_ahead)
+            expected = x + self.look_ahead(x_look_ahead, encoding.eos)
+            np.testing.assert_array_equal(encoding(self.position), expected)
+
+    def test_length(self):
+        """ The last token of each sample should look ahead onto the end of sequence token, if lengths are given. """
+        for encoding in (PositionalEncodingLearnedLookAhead(8, 8), PositionalEncodingLearnedLookAheadSplit(8, 8)):
+            with torch.no_grad():
+                x = encoding(self.position, self.length)
+                for i, length in enumerate(self.length):
+                    x_i = encoding(self.position[i:i + 1, :length])[0]
+                    np.testing.assert_allclose(x[i, :length], x_i, atol=1e-6)
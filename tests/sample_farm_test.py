@@ -0,0 +1,20 @@
+import os
+import tempfile
+import unittest
+
+from sample.sample_farm import missing_samples
+
+
+class TestSampleFarm(unittest.TestCase):
+    """ Tests the resumption of sampled shapes. """
+    def test_missing_samples(self):
+        """ Only complete files of sampled shapes in the selected format should count as existing samples. """
+        with tempfile.TemporaryDirectory() as path:
+            file_names = ['shape_0.obj', 'shape_2.obj', 'shape_3.obj.tmp', 'shape_10.obj', 'other_1.obj', 'shape_1.npz']
+            for file_name in file_names:
+                open(os.path.join(path, file_name), 'w').close()
+
+            self.assertEqual(missing_samples(path, 5), [1, 3, 4])
+            self.assertEqual(missing_samples(path, 12), [1, 3, 4, 5, 6, 7, 8, 9, 11])
+            self.assertEqual(missing_samples(path, 3, 'voxels'), [0, 2])
+            self.assertEqual(missing_samples(path, 3, 'octree'), [0, 1, 2])
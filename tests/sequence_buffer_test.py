@@ -0,0 +1,82 @@
+import unittest
+import numpy as np
+import torch
+
+from sample.sample_utils import cat_layers, next_layer_tokens, postprocess, SequenceBuffer
+
+
+class TestSequenceBuffer(unittest.TestCase):
+    """ Tests the in place expansion of layers of multiple samples against the expansion of each layer on its own. """
+    def layers(self, pos_encoding):
+        """ Creates random first and second layers of three samples with the given position encoding. """
+        rng = np.random.default_rng(0)
+        samples = []
+        for num_mixed in (1, 3, 0):
+            val = [torch.tensor(rng.permutation([2] * num_mixed + [1, 3] * 4)[:8])]
+            dep = [torch.ones(8, dtype=torch.long)]
+            pos = [next_layer_tokens([torch.tensor([])], None, None, 3, 32, pos_encoding)[2]]
+            v, d, p = next_layer_tokens(val, dep, pos, 3, 32, pos_encoding)
+            v = torch.tensor(rng.integers(1, 4, len(v)))
+            samples += [(val + [v], dep + [d], pos + [p])]
+        return samples
+
+    def expand(self, pos_encoding):
+        """ The next layer of each sample should be equal to the layer created by `next_layer_tokens`. """
+        samples = self.layers(pos_encoding)
+        buffer = SequenceBuffer(len(samples), 3, 32, pos_encoding, capacity=4)
+        for b, sample in enumerate(samples):
+            buffer.append(b, *sample)
+
+        buffer.expand([0, 1, 2])
+        for b, (val, dep, pos) in enumerate(samples):
+            next_val, next_dep, next_pos = next_layer_tokens(val, dep, pos, 3, 32, pos_encoding)
+            layers = buffer.layers(b)
+            self.assertEqual(len(layers[0]), 3)
+            for layer, next_layer in zip(layers, (next_val, next_dep, next_pos)):
+                np.testing.assert_array_equal(layer[-1], next_layer)
+
+    def test_expand_centered(self):
+        """ Test the expansion with the centered position encoding. """
+        self.expand('centered')
+
+    def test_expand_intertwined(self):
+        """ Test the expansion with the intertwined position encoding. """
+        self.expand('intertwined')
+
+    def test_expand_empty(self):
+        """ Samples without tokens should be expanded into the first layer. """
+        buffer = SequenceBuffer(2, 2, 32, 'centered')
+        buffer.expand([1])
+
+        self.assertEqual(buffer.length(0), 0)
+        np.testing.assert_array_equal(buffer.sequence(1)[2], [[16, 16], [16, 48], [48, 16], [48, 48]])
+
+    def test_cat_layers(self):
+        """ Layers of a buffer should be concatenated into a view of the buffer, other layers should be copied. """
+        samples = self.layers('centered')
+        buffer = SequenceBuffer(1, 3, 32, 'centered')
+        buffer.append(0, *samples[0])
+        buffer.expand()
+
+        val, _, pos = buffer.layers(0)
+        value, position = cat_layers(val), cat_layers(pos)
+        self.assertEqual(value.data_ptr(), buffer.value.data_ptr())
+        self.assertEqual(position.data_ptr(), buffer.position.data_ptr())
+        self.assertEqual(cat_layers(pos[1:]).data_ptr(), pos[1].data_ptr())
+        self.assertEqual(cat_layers(val[-2:-1]).data_ptr(), val[-2].data_ptr())
+        np.testing.assert_array_equal(cat_layers(pos[1:]), torch.cat(list(pos[1:])))
+        self.assertNotEqual(cat_layers(list(pos[1:])).data_ptr(), pos[1].data_ptr())
+        np.testing.assert_array_equal(position, buffer.sequence(0)[2])
+
+        # tokens written into the last layer are stored in the buffer
+        val[-1][:] = 3
+        np.testing.assert_array_equal(value, torch.cat(val))
+
+        # the returned sequence does not change with the buffer
+        sequence = postprocess(val, 32, 3, output='sequence')
+        val[-1][:] = 1
+        np.testing.assert_array_equal(sequence[-len(val[-1]):], 3)
+
+        val = samples[1][0]
+        np.testing.assert_array_equal(cat_layers(val), torch.cat(val))
+        self.assertNotEqual(cat_layers(val[::-1]).data_ptr(), val[1].data_ptr())
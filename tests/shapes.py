@@ -0,0 +1,21 @@
+import numpy as np
+
+
+def sphere(resolution, rng=None, radius=(0.15, 0.35)):
+    """ Returns a voxelized sphere for tests.
+
+    Args:
+        resolution: Side length of the voxel array.
+        rng: Numpy random generator. The sphere has a random center and radius, if given, otherwise it is centered in
+            the array with a radius of a third of the resolution.
+        radius: Range of the random radius relative to the resolution.
+
+    Return:
+        Voxel array with the shape [R, R, R].
+    """
+    grid = np.stack(np.meshgrid(*3 * [np.arange(resolution)], indexing='ij'), axis=-1)
+    if rng is None:
+        return (np.linalg.norm(grid - resolution / 2, axis=-1) < resolution / 3).astype(np.int64)
+    center = rng.uniform(0.3, 0.7, 3) * resolution
+    radius = rng.uniform(*radius) * resolution
+    return (np.linalg.norm(grid - center, axis=-1) < radius).astype(np.int64)
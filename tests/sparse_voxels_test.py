@@ -0,0 +1,64 @@
+import unittest
+import numpy as np
+import torch
+
+from sample.sample_utils import postprocess
+from utils import boxes_iou, boxes_to_coo, boxes_to_mesh, delinearise_boxes, quick_linearise, rasterize_boxes
+from utils.export import voxels_to_mesh
+from tests.shapes import sphere
+
+
+def _triangles(verts, faces):
+    """ Returns the set of all triangles, independent of the order of vertices and faces. """
+    corners = np.round(verts[faces], 5)
+    corners = corners[np.arange(len(faces))[:, None], np.lexsort(corners.transpose(2, 0, 1)[::-1])]
+    return set(map(tuple, corners.reshape(-1, 9).tolist()))
+
+
+class TestSparseVoxels(unittest.TestCase):
+    """ Tests the sparse decoding of token sequences into boxes of occupied leaf nodes. """
+    def setUp(self):
+        # a sphere with an attached box
+        self.array = sphere(32)
+        self.array[2:10, 3:-2, 16:-3] = 1
+        self.value, _, _ = quick_linearise(self.array)
+        self.corner, self.size = delinearise_boxes(self.value, 32)
+
+    def test_boxes(self):
+        """ Boxes and coordinates should cover exactly the occupied elements of the dense array. """
+        np.testing.assert_array_equal(rasterize_boxes(self.corner, self.size, [0, 0, 0], [32, 32, 32]), self.array)
+        region = rasterize_boxes(self.corner, self.size, [-1, 4, 7], [3, 5, 9])
+        np.testing.assert_array_equal(region, np.pad(self.array, 1)[:3, 5:10, 8:17])
+        self.assertLess(len(self.corner), np.sum(self.array) // 4)
+
+        coo = boxes_to_coo(self.corner, self.size)
+        coo_index = np.sort(np.ravel_multi_index(coo.T, self.array.shape))
+        np.testing.assert_array_equal(coo_index, np.flatnonzero(self.array))
+
+    def test_iou(self):
+        """ The intersection over union of boxes should be equal to the one of the dense arrays. """
+        other = self.array.copy()
+        other[:, :12] = 1 - other[:, :12]
+        boxes = delinearise_boxes(quick_linearise(other)[0], 32)
+
+        iou = np.sum(self.array & other) / np.sum(self.array | other)
+        self.assertAlmostEqual(boxes_iou((self.corner, self.size), boxes, 32), iou)
+        self.assertEqual(boxes_iou((self.corner, self.size), (self.corner, self.size), 32), 1.0)
+
+    def test_mesh(self):
+        """ Chunks of marching cubes on the boxes should return the same triangles as the dense array. """
+        verts, faces, _ = voxels_to_mesh(self.array)
+        for chunk_size in (8, 13, 64):
+            sparse_verts, sparse_faces, normals = boxes_to_mesh(self.corner, self.size, 32, chunk_size)
+            self.assertEqual(_triangles(sparse_verts, sparse_faces), _triangles(verts, faces))
+            self.assertEqual(len(sparse_verts), len(np.unique(sparse_verts, axis=0)))
+            self.assertEqual(normals.shape, sparse_verts.shape)
+
+    def test_postprocess(self):
+        """ All output formats of sampled sequences should hold the same occupancy. """
+        value = [torch.tensor(self.value)]
+        np.testing.assert_array_equal(postprocess(value, 32, 3), self.array)
+        self.assertEqual(postprocess(value, 32, 3, output='uint8').dtype, np.uint8)
+        np.testing.assert_array_equal(np.unpackbits(postprocess(value, 32, 3, output='packed')), self.array.reshape(-1))
+        np.testing.assert_array_equal(postprocess(value, 32, 3, output='boxes')[1], self.size)
+        self.assertEqual(len(postprocess(value, 32, 3, output='coo')), np.sum(self.array))
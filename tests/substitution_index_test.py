@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+import torch
+
+from data.collate import create_data_collate
+from modules.generative_head import create_head
+from modules.token_embedding import create_embedding
+from utils import quick_linearise, substitution_index
+
+
+class TestSubstitutionIndex(unittest.TestCase):
+    """ Tests the precomputed substitution index and its use in the substitution embeddings and heads. """
+    def test_index(self):
+        """ Each mixed token should be mapped onto the group of its children in the following layer. """
+        value = torch.tensor([[1, 2, 2, 1, 3, 0], [2, 1, 3, 0, 0, 0]])
+        depth = torch.tensor([[1, 1, 1, 2, 2, 0], [1, 1, 1, 2, 0, 0]])
+        index = substitution_index(value, depth)
+
+        np.testing.assert_array_equal(index.start[1], [3, 3])
+        np.testing.assert_array_equal(index.length[1], [2, 1])
+        self.assertEqual(index.max_length, (3, 2))
+        self.assertEqual(index.max_mixed, (2, ))
+
+        batch, token, chunk = index.mixed[0]
+        np.testing.assert_array_equal(batch, [0, 0, 1])
+        np.testing.assert_array_equal(token, [1, 2, 0])
+        np.testing.assert_array_equal(chunk, [0, 1, 0])
+
+        window = index.window(1, 1)
+        np.testing.assert_array_equal(window.start[0], [0, 0])
+        self.assertEqual(window.mixed, ())
+
+    def test_precomputed_index(self):
+        """ Composite embeddings and heads should return the same output with the index of the collate function. """
+        rng = np.random.default_rng(0)
+        batch = []
+        for i in range(3):
+            grid = np.zeros((64, 64, 64), dtype=int)
+            lo, hi = rng.integers(8, 24, 3), rng.integers(40, 56, 3)
+            grid[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]] = 1
+            batch += [quick_linearise(grid) + (np.array(0), )]
+
+        for name in ('composite_A', 'composite_D'):
+            seq, _, _ = create_data_collate('encoder_only', [name], 64)(batch)
+            value, depth, position, index = seq[0]
+
+            torch.manual_seed(0)
+            embedding = create_embedding(name, 'basic', 3, 16, 64, 3)
+            head = create_head(name, 'basic', 3, 16, 8, 2, 64)
+
+            with torch.no_grad():
+                x = embedding(value, depth, position)
+                x_index = embedding(value, depth, position, index)
+                logits = head(x, value, depth, position)
+                logits_index = head(x, value, depth, position, index)
+
+            np.testing.assert_array_equal(x_index, x)
+            np.testing.assert_array_equal(logits_index, logits)
@@ -1,5 +1,6 @@
 from utils.hsp_loader import (
     load_hsp,
+    load_hsp_batch,
     load_chair,
     load_airplane,
 )
@@ -7,23 +8,78 @@ from utils.kd_tree_utils import (
     TrinaryRepresentation,
     _directions,
     quick_linearise,
+    layer_token_counts,
 )
 from utils.kd_tree import kdTree
+from utils.compact_kd_tree import (
+    CompactKdTree,
+    quick_delinearise,
+)
 from utils.functions import (
     nanmean,
     axis_scaling,
+    random_axis_scales,
+    AXIS_SCALING_RANGE,
     piecewise_linear_warping,
 )
+from utils.substitution_index import (
+    SubstitutionIndex,
+    substitution_index,
+)
+from utils.morton_index import (
+    MortonIndex,
+    node_coords,
+    morton_keys,
+    morton_order,
+    breadth_first_order,
+)
+from utils.sparse_voxels import (
+    delinearise_boxes,
+    boxes_to_coo,
+    rasterize_boxes,
+    boxes_iou,
+)
+from utils.octree_mesh import octree_to_mesh
+from utils.export import (
+    EXPORT_FORMATS,
+    boxes_to_mesh,
+    export_sample,
+    read_octree,
+    read_voxels,
+)
 
 __all__ = [
     "load_hsp",
+    "load_hsp_batch",
     "load_chair",
     "load_airplane",
     "_directions",
     "TrinaryRepresentation",
     "kdTree",
+    "CompactKdTree",
     "nanmean",
     "axis_scaling",
+    "random_axis_scales",
+    "AXIS_SCALING_RANGE",
     "piecewise_linear_warping",
     "quick_linearise",
+    "layer_token_counts",
+    "quick_delinearise",
+    "SubstitutionIndex",
+    "substitution_index",
+    "MortonIndex",
+    "node_coords",
+    "morton_keys",
+    "morton_order",
+    "breadth_first_order",
+    "delinearise_boxes",
+    "boxes_to_coo",
+    "rasterize_boxes",
+    "boxes_iou",
+    "octree_to_mesh",
+    "EXPORT_FORMATS",
+    "boxes_to_mesh",
+    "export_sample",
+    "read_octree",
+    "read_voxels",
 ]
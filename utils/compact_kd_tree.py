@@ -0,0 +1,452 @@
+import numpy as np
+
+from utils.kd_tree import _cmap
+from utils.kd_tree_utils import _directions
+
+# lookup table of the colormap `_cmap`, indexed by the token value
+_cmap_lut = np.array([_cmap[v] for v in sorted(_cmap)])
+
+
+def _element_values(value, depth, mode):
+    """ Maps values of leaf nodes onto the values of the element array, based on `mode`. """
+    if mode == 'occupancy':
+        out = np.ones_like(value)
+    elif mode == 'value':
+        out = value.copy()
+    elif mode == 'color':
+        out = _cmap_lut[value]
+    elif mode == 'depth':
+        out = np.full_like(value, depth)
+    elif mode == 'random':
+        out = (np.random.rand(len(value)) * 20) % 20
+    else:
+        raise ValueError(f"ERROR: Unknown mode: {mode}.")
+    # empty nodes are always returned as '0'
+    out[value == 1] = 0
+    return out
+
+
+def _block_view(array, num_blocks):
+    """ Returns a writable view of `array` with shape [B, ..., B, X_1 / B, ..., X_A / B], where `B` is `num_blocks`.
+
+    Indexing the first A axes of the view with integer coordinates addresses a whole block of elements.
+    """
+    ndim = array.ndim
+    view = array.reshape([x for s in array.shape for x in (num_blocks, s // num_blocks)])
+    return view.transpose([2 * i for i in range(ndim)] + [2 * i + 1 for i in range(ndim)])
+
+
+def _scatter_leaves(array, coords, value, depth, mode):
+    """ Writes the values of leaf nodes of one depth layer into the element array.
+
+    Args:
+        array: Preallocated element array, which covers all nodes.
+        coords: Integer coordinates of each leaf node on the regular grid of its depth layer with shape [N, A].
+        value: Token value of each leaf node with shape [N].
+        depth: Depth of the layer.
+        mode: Defines how the value of each node should be represented in the array, see `get_element_array`.
+    """
+    if len(value) == 0:
+        return
+    view = _block_view(array, 2**depth)
+    view[tuple(coords.T)] = _element_values(value, depth, mode).reshape([-1] + array.ndim * [1])
+
+
+def _repair_sequence(value, num_nodes, depth, autorepair_errors, silent):
+    """ Handles a remaining input sequence, which is not long enough to fill the next layer with `num_nodes` nodes.
+
+    Raises a value error, if `autorepair_errors` is not set, otherwise pads the sequence with '0' tokens.
+    """
+    if not silent:
+        print(
+            "WARNING: Remaining input sequence is not long enough.", "Current depth:", depth, "Remaining sequence: ",
+            value, "Current length:", len(value), "Expected lenght:", num_nodes
+        )
+    if not autorepair_errors:
+        print("ERROR: Malformed input sequence not resolved.")
+        raise ValueError
+
+    # perform simple sequence repair by appending missing tokens
+    value = np.append(value, np.zeros(num_nodes - len(value), dtype=np.int64))
+    if not silent:
+        print(f"WARNING: Resolved error - Modified input sequence: {value}, Current length: {len(value)}")
+    return value
+
+
+def _parse_token_layers(value, resolution, spatial_dim, max_depth, autorepair_errors, silent):
+    """ Splits a token sequence into depth layers, with the same semantics as `kdTree.insert_token_sequence`.
+
+    Args:
+        value: A token sequence representing a spatial object, given as a string or an array of strings or integers.
+        resolution: The resolution of the token sequence. This value should be a power of 2.
+        max_depth: The maximum depth up to which the token sequence will be parsed.
+        autorepair_errors: Select if the parser should try to automatically repair malformed input sequences.
+        silent: Select if errors and warnings should be printed into the output console.
+
+    Return:
+        A generator, which yields a tuple of (depth, resolution, value, final) for each layer, where `value` holds the
+        tokens of all nodes of the layer and `final` marks nodes without children in the next layer.
+    """
+    # fail-fast: malformed input sequence
+    value = np.array([int(c) for c in value] if isinstance(value, str) else value).astype(np.int64).reshape(-1)
+    if not np.isin(value, (1, 2, 3)).all():
+        raise ValueError(
+            "ERROR: Input sequence consists of invalid tokens. Check token values and array type." +
+            f"Valid tokens consist of 1 (white), 2 (mixed) and 3 (black). Sequence: {value}."
+        )
+
+    # initialize parser
+    num_children = 2**spatial_dim
+    depth = 1
+    final_layer = False
+    resolution = resolution // 2
+    num_nodes = num_children
+    if 0 < len(value) < num_nodes:
+        value = _repair_sequence(value, num_nodes, depth, autorepair_errors, silent)
+
+    while len(value) > 0 and depth <= max_depth and num_nodes > 0:
+        # consume all tokens of the current layer at once
+        layer_value, value = value[:num_nodes], value[num_nodes:]
+
+        # final node:
+        # - head is '1' or '3', thus all elements have the same value
+        # - the resolution is 1, thus the elements cannot be split anymore
+        # - we are in the last depth layer, thus all nodes are final
+        final = np.isin(layer_value, (1, 3)) | (resolution == 1) | final_layer
+        yield depth, resolution, layer_value, final
+
+        # update depth
+        depth += 1
+        resolution = resolution // 2
+        # return if the resolution becomes less than 1 - no visible elements
+        if resolution < 1:
+            return
+
+        num_nodes = num_children * np.count_nonzero(~final)
+        # fail-fast: malformed input sequence
+        if len(value) < num_nodes:
+            value = _repair_sequence(value, num_nodes, depth, autorepair_errors, silent)
+
+        if len(value) == num_nodes:
+            final_layer = True
+
+
+def quick_delinearise(
+    value,
+    resolution,
+    spatial_dim=3,
+    depth=float('Inf'),
+    mode='occupancy',
+    autorepair_errors=False,
+    silent=False,
+    dtype=None,
+):
+    """ Converts a token sequence directly into an array of elements, without building an intermediate kd-tree.
+
+    The sequence is parsed layer by layer and the values of all leaf nodes of a layer are written at once into a
+    single preallocated array. The result is identical to `insert_token_sequence` followed by `get_element_array`.
+
+    Args:
+        value: A token sequence representing a spatial object. The values should consist only of '1', '2' and '3'.
+            The sequence can be eiter a string or an array of strings or integers.
+        resolution: The resolution of the token sequence. This value should be a power of 2.
+        spatial_dim: The spatial dimensionality of the array of elements.
+        depth: Defines the maximum depth of the nodes, of which the value will be returned in the array.
+        mode: Defines how the value of each node should be represented in the returned array, see
+            `CompactKdTree.get_element_array`.
+        autorepair_errors: Select if the parser should try to automatically repair malformed input sequenced by
+            adding padding tokens up to a required length.
+        silent: Select if errors and warnings should be printed into the output console.
+        dtype: Data type of the returned array, e.g. `np.uint8` to reduce the memory of high resolutions. Defaults to
+            `float` for the 'random' mode and `np.int64` otherwise.
+
+    Return:
+        A numpy array with the dimensionality `spatial_dim`, which hold values defined by `mode`.
+    """
+    if dtype is None:
+        dtype = float if mode == 'random' else np.int64
+    array = np.zeros(spatial_dim * [resolution], dtype=dtype)
+    bits = _directions(spatial_dim, 'intertwined') - 1
+
+    # integer coordinates of all mixed nodes of the previous layer on its regular grid
+    coords = np.zeros((1, spatial_dim), dtype=np.int64)
+    layers = _parse_token_layers(value, resolution, spatial_dim, depth, autorepair_errors, silent)
+    for layer_depth, _, layer_value, final in layers:
+        coords = (2 * coords[:, None] + bits[None]).reshape(-1, spatial_dim)
+        leaf = final | (layer_depth == depth)
+        _scatter_leaves(array, coords[leaf], layer_value[leaf], layer_depth, mode)
+        coords = coords[~leaf]
+
+    return array
+
+
+class CompactKdTree():
+    """ Implements an array-backed kd-tree data structure for volumetric/spatial objects. Works with arrays of spatial
+    data as well as linearised token sequence representations.
+
+    Provides the same interface as `kdTree`, but instead of creating a Python object for each node, all nodes of one
+    depth layer are stored in flat NumPy arrays. Each layer holds the value, depth and position of its nodes as well as
+    the offset of the first child node in the next layer, where final nodes have an offset of '-1'. As children of
+    mixed nodes are stored consecutively in breadth-first order, each layer is already a slice of the linearised token
+    sequence. This allows to build and parse trees layer by layer with vectorized operations.
+    """
+    def __init__(self, spatial_dim: int, pos_encoding: str = "centered"):
+        """ Initializes the kd-tree for the right spatial dimensionality.
+
+        Args:
+            spatial_dim: Defines the spatial dimensionality of the kd-tree, e.g. '2' for images/pixels and '3' for
+                volumes/voxels.
+            pos_encoding: Defines the positional encoding of positions. It uses either a centered position,
+                where each position relates to the center of all pixels/voxels or an intertwined encoding, where each
+                layer uses an ascending, axis aligned enumeration, thus the position values are intertwined.
+        """
+        super().__init__()
+        self.spatial_dim = spatial_dim
+        self.num_children = 2**spatial_dim
+        self.intertwined_positions = pos_encoding == 'intertwined'
+        self.pos_encoding = pos_encoding
+        self.dirs = _directions(spatial_dim, pos_encoding)
+        # binary offsets of each child node along each axis in the order of `dirs`
+        self.bits = (self.dirs > self.dirs.min()).astype(np.int64)
+
+        # root node
+        self.value = 0
+        self.depth = 0
+        self.pos = None
+        self.shape = None
+        self.final = True
+
+        # flat per-layer node arrays, where the list index `i` holds the layer with depth `i + 1`
+        self.values = []
+        self.depths = []
+        self.positions = []
+        self.child_offsets = []
+
+    @property
+    def resolution(self):
+        """ Returns the side length of the array of elements represented by the root node. """
+        return self.shape[0]
+
+    @property
+    def num_layers(self):
+        """ Returns the number of depth layers below the root node. """
+        return len(self.values)
+
+    def _child_positions(self, pos, shape):
+        """ Computes positions of all children of the given nodes.
+
+        Args:
+            pos: Positions of parent nodes with shape [N, A].
+            shape: Shape of the elements covered by a single child node.
+
+        Return:
+            Positions of children with shape [N * 2^A, A] in breadth-first order.
+        """
+        if self.intertwined_positions:
+            child_pos = 2 * pos[:, None] + self.dirs[None]
+        else:
+            child_pos = pos[:, None] + np.array(shape) * self.dirs[None]
+        return child_pos.reshape(-1, self.spatial_dim)
+
+    def _append_layer(self, value, depth, pos, final):
+        """ Appends a new layer of nodes and links the children offsets of the previous layer.
+
+        Args:
+            value: Value of each node in the new layer.
+            depth: Depth of the new layer.
+            pos: Position of each node in the new layer.
+            final: Boolean mask, which marks final nodes in the new layer.
+        """
+        offset = np.full(len(value), -1, dtype=np.int64)
+        offset[~final] = self.num_children * np.arange(np.count_nonzero(~final))
+
+        self.values += [value.astype(np.int64)]
+        self.depths += [np.full(len(value), depth, dtype=np.int64)]
+        self.positions += [pos.astype(np.int64)]
+        self.child_offsets += [offset]
+
+    def _split(self, elements):
+        """ Splits a stack of arrays along each spatial axis in half.
+
+        Args:
+            elements: Stack of arrays with shape [N, X_1, ..., X_A].
+
+        Return:
+            Stack of subarrays with shape [N * 2^A, X_1 / 2, ..., X_A / 2], where all subarrays of one input array are
+            consecutive and ordered in the same way as `utils.functions.split`.
+        """
+        n, shape = elements.shape[0], elements.shape[1:]
+        half = [s // 2 for s in shape]
+        # [N, 2, X_1 / 2, ..., 2, X_A / 2]
+        elements = elements.reshape([n] + [x for h in half for x in (2, h)])
+        # [N, 2, ..., 2, X_1 / 2, ..., X_A / 2]
+        axes = [0] + [1 + 2 * i for i in range(self.spatial_dim)] + [2 + 2 * i for i in range(self.spatial_dim)]
+        return elements.transpose(axes).reshape([n * self.num_children] + half)
+
+    def _values(self, elements):
+        """ Computes the token value of each array in the stack `elements` with shape [N, X_1, ..., X_A].
+
+        '1' - all elements are empty, '2' - elements are empty and occupied, '3' - all elements are occupied.
+        """
+        axes = tuple(range(1, elements.ndim))
+        value = np.full(elements.shape[0], 2, dtype=np.int64)
+        value[np.min(elements, axis=axes) > 0] = 3
+        value[np.max(elements, axis=axes) == 0] = 1
+        return value
+
+    def insert_element_array(self, elements, max_depth=float('Inf')):
+        """ Inserts an array of element values which is converted into a kd-tree.
+
+        Args:
+            elements: A numpy array of element values, with the dimensionality of the kd-tree.
+            max_depth: The maximum depth of the resulting kd-tree. All nodes at `max_depth` are marked as final.
+
+        Return:
+            The kd-tree containing inserted values.
+        """
+        self.values, self.depths, self.positions, self.child_offsets = [], [], [], []
+
+        # initialize root node
+        self.shape = np.array(elements.shape)
+        if self.intertwined_positions:
+            self.pos = np.array(self.spatial_dim * [0])
+        else:
+            self.pos = np.array(elements.shape)
+        self.value = self._values(elements[None])[0]
+        self.final = self.resolution <= 1 or self.value != 2 or self.depth > max_depth
+        if self.final:
+            return self
+
+        # process the tree layer by layer, keeping only arrays of mixed nodes in memory
+        blocks = elements[None]
+        parent_pos = self.pos[None]
+        depth = 1
+        while len(blocks) > 0:
+            # split arrays of all mixed nodes of the previous layer at once
+            blocks = self._split(blocks)
+            shape = blocks.shape[1:]
+            pos = self._child_positions(parent_pos, shape)
+            value = self._values(blocks)
+
+            # nodes are final, if they are not mixed, cannot be split anymore or are at maximum depth
+            final = (value != 2) | (shape[0] <= 1) | (depth > max_depth)
+            self._append_layer(value, depth, pos, final)
+
+            blocks = blocks[~final]
+            parent_pos = pos[~final]
+            depth += 1
+
+        return self
+
+    def get_element_array(self, depth=float('Inf'), mode='occupancy'):
+        """ Converts the kd-tree into an array of elements.
+
+        Args:
+            depth: Defines the maximum depth of the children nodes, of which the value will be returned in the array.
+            mode: Defines how the value of each node should be represented in the returned array. `occupancy` - returns
+                all padding and empty values as '0' and all mixed and occupied values as '1'. `value` - return the
+                exact value stored in the node. `color` - returns the values based on a colormap defined in `_cmap`,
+                where the stored value is subtracted by 1 and the padding value is returned as '0'. `depth` - returns
+                the current depth of the node as value in the array. `random` - returns a random number in the range of
+                [0, 19] for each node.
+
+        Return:
+            A numpy array with the dimensionality of the kd-tree, which hold values defined by `mode`.
+        """
+        array = np.zeros(self.shape, dtype=float if mode == 'random' else np.int64)
+
+        # the root node covers all elements
+        if self.final or self.depth == depth:
+            array[...] = _element_values(np.array([self.value]), 0, mode)
+            return array
+
+        # integer coordinates of all nodes of the current layer on its regular grid
+        coords = np.zeros((1, self.spatial_dim), dtype=np.int64)
+        for layer_idx in range(self.num_layers):
+            layer_depth = layer_idx + 1
+            mixed = self.child_offsets[layer_idx - 1] >= 0 if layer_idx > 0 else np.array([True])
+            coords = (2 * coords[mixed][:, None] + self.bits[None]).reshape(-1, self.spatial_dim)
+
+            # write values of all leaf nodes of the layer at once into the array
+            leaf = (self.child_offsets[layer_idx] < 0) | (layer_depth == depth)
+            _scatter_leaves(array, coords[leaf], self.values[layer_idx][leaf], layer_depth, mode)
+
+            if layer_depth == depth:
+                break
+
+        return array
+
+    def insert_token_sequence(self, value, resolution, max_depth=float('Inf'), autorepair_errors=False, silent=False):
+        """ Inserts a token sequence which is parsed into a kd-tree.
+
+        Args:
+            value: A token sequence representing a spatial object. The values should consist only of '1', '2' and '3'.
+                The sequence can be eiter a string or an array of strings or integers.
+            resolution: The resolution of the token sequence. This value should be a power of 2.
+            max_depth: The maximum depth up to which the token sequence will be parsed.
+            autorepair_errors: Select if the parser should try to automatically repair malformed input sequenced by
+                adding padding tokens up to a required length. Each node with a value of '2' should have
+                2**`spatial_dim` children nodes.
+            silent: Select if errors and warnings should be printed into the output console.
+
+        Return:
+            The kd-tree representing the given token sequence.
+        """
+        self.values, self.depths, self.positions, self.child_offsets = [], [], [], []
+
+        # initialize root node
+        self.value = 0
+        self.shape = np.array(self.spatial_dim * [resolution])
+        if self.intertwined_positions:
+            self.pos = np.array(self.spatial_dim * [0])
+        else:
+            self.pos = np.array(self.spatial_dim * [resolution])
+        self.final = False
+
+        # append all parsed layers, where only non-final nodes have children
+        parent_pos = self.pos[None]
+        layers = _parse_token_layers(value, resolution, self.spatial_dim, max_depth, autorepair_errors, silent)
+        for depth, layer_resolution, layer_value, final in layers:
+            pos = self._child_positions(parent_pos, self.spatial_dim * [layer_resolution])
+            self._append_layer(layer_value, depth, pos, final)
+            parent_pos = pos[~final]
+
+        return self
+
+    def get_token_sequence(self, depth=float('Inf'), return_depth=False, return_pos=False):
+        """ Returns a linearised sequence representation of the kd-tree.
+
+        Args:
+            depth: Defines the maximum depth of the nodes, up to which the tree is parsed.
+            return_depth: Selects if the corresponding depth sequence should be returned.
+            return_pos: Selects if the corresponding position sequence should be returned.
+
+        Return
+            A numpy array consisting of integer values representing the linearised kd-tree. Returns additionally the
+            corresponding depth and position sequence if specified in `return_depth` or `return_pos`. The values are
+            returned in the following order: (value, depth, position).
+        """
+        num_layers = int(min(self.num_layers, depth))
+
+        # layers are already stored in breadth-first order
+        if num_layers > 0:
+            seq_value = np.concatenate(self.values[:num_layers])
+            seq_depth = np.concatenate(self.depths[:num_layers])
+            seq_pos = np.concatenate(self.positions[:num_layers])
+        else:
+            seq_value = np.asarray([])
+            seq_depth = np.asarray([])
+            seq_pos = np.asarray([])
+
+        # output format depends in flags 'return_depth' and 'return_pos'
+        output = [seq_value]
+        if return_depth:
+            output += [seq_depth]
+        if return_pos:
+            output += [seq_pos]
+        return output
+
+    def __repr__(self):
+        """ Returns of human readable string representation of the kd-tree. """
+        seq = self.get_token_sequence()[0]
+        return f"CompactKdTree() = {seq}, len = {len(seq)}, dim = {self.spatial_dim}"
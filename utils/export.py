@@ -0,0 +1,219 @@
+import os
+import itertools
+import numpy as np
+
+from skimage import measure
+
+from utils.kd_tree_utils import quick_linearise
+from utils.compact_kd_tree import quick_delinearise
+from utils.sparse_voxels import rasterize_boxes
+
+# file extension of each export format
+EXPORT_FORMATS = {
+    'obj': '.obj',
+    'ply': '.ply',
+    'stl': '.stl',
+    'voxels': '.npz',
+    'octree': '.octree.npz',
+}
+
+
+def voxels_to_mesh(array):
+    """ Uses marching cubes to obtain the surface mesh of a voxel array, scaled to the normalized cube [-1.0, 1.0]^3.
+
+    Args:
+        array: An array of elements (voxels) as a numpy array.
+
+    Return:
+        Vertices - [V, 3], faces with vertex indices - [F, 3] and vertex normals - [V, 3] of the mesh.
+    """
+    # convert volume to mesh
+    array = np.pad(array, ((1, 1), (1, 1), (1, 1)))
+    verts, faces, normals, _ = measure.marching_cubes(array, 0)
+    # scale to normalized cube [-1.0, 1.0]^3
+    verts /= array.shape
+    verts -= [0.5, 0.0, 0.5]
+    verts *= 2.0
+    return verts.astype(np.float32), faces.astype(np.int32), normals.astype(np.float32)
+
+
+def boxes_to_mesh(corner, size, resolution, chunk_size=64):
+    """ Uses marching cubes on chunks of the volume to obtain the same surface mesh as `voxels_to_mesh` from the boxes
+    of occupied leaf nodes, without materialising the dense voxel array.
+
+    Chunks, which are completely empty or occupied, contain no surface and are skipped. Vertices on the borders
+    between chunks are merged.
+
+    Args:
+        corner: Integer coordinates of the first element of each box - [B, 3], see `delinearise_boxes`.
+        size: Side length of each box - [B].
+        resolution: The resolution of the shape.
+        chunk_size: Number of marching cubes cells along each axis of a chunk.
+
+    Return:
+        Vertices - [V, 3], faces with vertex indices - [F, 3] and vertex normals - [V, 3] of the mesh.
+    """
+    # cells of the padded array, each chunk samples the elements of its cells and the following element
+    num_cells = resolution + 1
+    verts, faces, normals = [np.zeros((0, 3))], [np.zeros((0, 3), dtype=np.int64)], [np.zeros((0, 3))]
+    num_verts = 0
+    for lower in itertools.product(range(0, num_cells, chunk_size), repeat=3):
+        lower = np.array(lower)
+        shape = np.minimum(lower + chunk_size, num_cells) - lower + 1
+        chunk = rasterize_boxes(corner, size, lower - 1, shape)
+        if chunk.min() == chunk.max():
+            continue
+        v, f, n, _ = measure.marching_cubes(chunk, 0)
+        verts += [v + lower]
+        faces += [f + num_verts]
+        normals += [n]
+        num_verts += len(v)
+
+    # merge vertices on the borders of chunks
+    verts, index, inverse = np.unique(np.concatenate(verts), axis=0, return_index=True, return_inverse=True)
+    faces = inverse.reshape(-1)[np.concatenate(faces)]
+    normals = np.concatenate(normals)[index]
+
+    # scale to normalized cube [-1.0, 1.0]^3
+    verts /= resolution + 2
+    verts -= [0.5, 0.0, 0.5]
+    verts *= 2.0
+    return verts.astype(np.float32), faces.astype(np.int32), normals.astype(np.float32)
+
+
+def write_obj(file_path, verts, faces, normals):
+    """ Writes a mesh with vertex normals into a text *.obj file.
+
+    Each block of lines is formatted with a single format operation over the flattened buffer, instead of formatting
+    each line separately.
+    """
+    faces = np.repeat(faces + 1, 2, axis=1)  # fix .obj indexing, vertex and normal index of each corner
+    with open(file_path, 'w') as f:
+        f.write(("v %.6f %.6f %.6f\n" * len(verts)) % tuple(verts.ravel()))
+        f.write(("vn %.6f %.6f %.6f\n" * len(normals)) % tuple(normals.ravel()))
+        f.write(("f %d//%d %d//%d %d//%d\n" * len(faces)) % tuple(faces.ravel()))
+
+
+def write_ply(file_path, verts, faces, normals=None):
+    """ Writes a mesh with optional vertex normals into a binary little endian *.ply file. """
+    vertex_props = ['x', 'y', 'z'] + (['nx', 'ny', 'nz'] if normals is not None else [])
+    vertex = np.concatenate([verts, normals], axis=1) if normals is not None else verts
+    face = np.empty(len(faces), dtype=[('n', 'u1'), ('idx', '<i4', (3, ))])
+    face['n'] = 3
+    face['idx'] = faces
+
+    header = (
+        ["ply", "format binary_little_endian 1.0", f"element vertex {len(vertex)}"] +
+        [f"property float {p}" for p in vertex_props] +
+        [f"element face {len(face)}", "property list uchar int vertex_indices", "end_header"]
+    )
+    with open(file_path, 'wb') as f:
+        f.write(("\n".join(header) + "\n").encode('ascii'))
+        f.write(vertex.astype('<f4').tobytes())
+        f.write(face.tobytes())
+
+
+def write_stl(file_path, verts, faces):
+    """ Writes a mesh into a binary *.stl file, with a normal for each face. """
+    corners = verts[faces]  # [F, 3, 3]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+
+    triangles = np.zeros(len(faces), dtype=[('normal', '<f4', (3, )), ('corners', '<f4', (3, 3)), ('attr', '<u2')])
+    triangles['normal'] = normals
+    triangles['corners'] = corners
+    with open(file_path, 'wb') as f:
+        f.write(b'\0' * 80)
+        f.write(np.uint32(len(triangles)).tobytes())
+        f.write(triangles.tobytes())
+
+
+def write_voxels(file_path, array):
+    """ Writes the occupancy of a voxel array bit-packed into a compressed *.npz file. """
+    with open(file_path, 'wb') as f:
+        np.savez_compressed(f, occupancy=np.packbits(array.astype(bool), axis=None), shape=array.shape)
+
+
+def read_voxels(file_path):
+    """ Reads a voxel array written by `write_voxels`. """
+    data = np.load(file_path)
+    shape = tuple(data['shape'])
+    return np.unpackbits(data['occupancy'], count=int(np.prod(shape))).reshape(shape).astype(np.int64)
+
+
+def write_octree(file_path, value, resolution, spatial_dim=3):
+    """ Writes the value token sequence of an octree into a compressed *.npz file.
+
+    The tokens '1', '2' and '3' are stored with 2 bits each. Depth and position tokens are implied by the values.
+
+    Args:
+        file_path: Path of the written file.
+        value: Value token sequence of the octree as a numpy array, e.g. sampled with `postprocess(output='sequence')`.
+        resolution: The resolution of the shape.
+        spatial_dim: The spatial dimensionality of the shape.
+    """
+    bits = (value.astype(np.uint8)[:, None] >> np.array([1, 0], dtype=np.uint8)) & 1
+    with open(file_path, 'wb') as f:
+        np.savez_compressed(
+            f, value=np.packbits(bits, axis=None), num_tokens=len(value), shape=(resolution, ) * spatial_dim
+        )
+
+
+def read_octree(file_path):
+    """ Reads a token sequence written by `write_octree`.
+
+    Return:
+        Value token sequence and the corresponding voxel array.
+    """
+    data = np.load(file_path)
+    bits = np.unpackbits(data['value'], count=2 * int(data['num_tokens'])).reshape(-1, 2)
+    value = (2 * bits[:, 0] + bits[:, 1]).astype(np.int64)
+    shape = tuple(data['shape'])
+    array = quick_delinearise(value, shape[0], len(shape), autorepair_errors=True, silent=True)
+    return value, array
+
+
+def export_sample(array, file_path, export_format='obj', resolution=None):
+    """ Exports a sampled voxel array or surface mesh in the given format.
+
+    The file is written into a temporary file first and renamed afterwards, thus an existing file is always complete.
+
+    Args:
+        array: An array of elements (voxels) as a numpy array or a tuple of (vertices, faces, normals) of a mesh, e.g.
+            extracted with `octree_to_mesh`. Meshes can be exported only in the 'obj', 'ply' and 'stl' format.
+        file_path: Path of the written file without the file extension.
+        export_format: One of 'obj', 'ply', 'stl', 'voxels' (bit-packed occupancy) or 'octree' (packed value tokens).
+        resolution: The resolution of the shape, if `array` is the value token sequence of its octree, e.g. sampled
+            with `postprocess(output='sequence')`. Sequences can be exported only in the 'octree' format.
+
+    Return:
+        The path of the written file.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"ERROR: Unknown export format: {export_format}.")
+    file_path = file_path + EXPORT_FORMATS[export_format]
+
+    # the surface mesh is already given
+    is_mesh = isinstance(array, tuple)
+    if is_mesh and export_format not in ('obj', 'ply', 'stl'):
+        raise ValueError(f"ERROR: Meshes cannot be exported in the format: {export_format}.")
+    # the value token sequence is already given
+    is_sequence = resolution is not None
+    if is_sequence and export_format != 'octree':
+        raise ValueError(f"ERROR: Token sequences cannot be exported in the format: {export_format}.")
+
+    if export_format == 'obj':
+        write_obj(file_path + '.tmp', *(array if is_mesh else voxels_to_mesh(array)))
+    elif export_format == 'ply':
+        write_ply(file_path + '.tmp', *(array if is_mesh else voxels_to_mesh(array)))
+    elif export_format == 'stl':
+        write_stl(file_path + '.tmp', *(array if is_mesh else voxels_to_mesh(array))[:2])
+    elif export_format == 'voxels':
+        write_voxels(file_path + '.tmp', array)
+    elif is_sequence:
+        write_octree(file_path + '.tmp', array, resolution)
+    else:
+        write_octree(file_path + '.tmp', quick_linearise(array)[0], array.shape[0], array.ndim)
+    os.replace(file_path + '.tmp', file_path)
+
+    return file_path
@@ -52,11 +52,22 @@ def concat(array: np.ndarray) -> np.ndarray:
     return np.squeeze(array, axis=0)
 
 
-def axis_scaling(array: np.ndarray) -> np.array:
+# range of the random scaling factors of `axis_scaling`
+AXIS_SCALING_RANGE = (0.75, 1.25)
+
+
+def random_axis_scales(ndim: int) -> np.ndarray:
+    """ Draws a random scaling factor in the range of [0.75 .. 1.25] for each axis independently. """
+    low, high = AXIS_SCALING_RANGE
+    return np.array([low + (high - low) * random() for _ in range(ndim)])
+
+
+def axis_scaling(array: np.ndarray, scales: np.ndarray = None) -> np.array:
     """Performs a linear scaling of each array axis in the range of [0.75 .. 1.25] for each axis independently.
 
     Args:
         array (np.ndarray): Input array containing pixels/voxels.
+        scales (np.ndarray, optional): Scaling factor of each axis. Defaults to random factors.
 
     Returns:
         np.array: Scaled array of values with the same shape as input.
@@ -70,8 +81,10 @@ def axis_scaling(array: np.ndarray) -> np.array:
     matrix[ndim][ndim] = 1
 
     # scaling (diagonal row)
+    if scales is None:
+        scales = random_axis_scales(ndim)
     for i in range(ndim):
-        matrix[i][i] = 0.75 + 0.5 * random()
+        matrix[i][i] = scales[i]
     # translation (fix centering)
     for i in range(ndim):
         matrix[i][ndim] = (1 - matrix[i][i]) * (res[i] / 2.0)
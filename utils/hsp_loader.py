@@ -1,43 +1,100 @@
 import numpy as np
 from scipy.io import loadmat
+from concurrent.futures import ThreadPoolExecutor
 
 
-def load_hsp(file_path, resolution=None):
-    resolution = max(resolution, 16)
-    file = loadmat(file_path)
+def _block_view(grid, num_blocks):
+    """ Returns a writable view of the cubic grid with shape [B, B, B, R / B, R / B, R / B], where `B` is `num_blocks`.
+    """
+    reach = grid.shape[0] // num_blocks
+    return grid.reshape(3 * [num_blocks, reach]).transpose(0, 2, 4, 1, 3, 5)
 
-    boundary = (file["bi"] > 2).nonzero()
-    boundary = np.stack([boundary[0], boundary[1], boundary[2]])
 
-    if resolution is not None:
-        grid = np.zeros((resolution, resolution, resolution))
-        step = 256 // resolution
-        reach = 16 // step
+def _downsample_max(cells, step):
+    """ Downsamples a stack of cubic blocks with shape [K, X, X, X] by the maximum over each `step`^3 subblock.
 
-        full = np.stack((file["bi"] == 2.0).nonzero()) * reach
-        n_full = full.shape[-1]
+    Combines strided slices one axis at a time, which is considerably faster than a max-reduction over small axes.
+    """
+    for axis in (1, 2, 3):
+        slices = [tuple([slice(None)] * axis + [slice(i, None, step)]) for i in range(step)]
+        reduced = cells[slices[0]]
+        for sl in slices[1:]:
+            reduced = np.maximum(reduced, cells[sl])
+        cells = reduced
+    return cells
 
-        if n_full > 0:
-            full = np.repeat(np.expand_dims(full, 1), reach, 1)
-            full = np.add(full, np.array(range(reach))[None, :, None])
-            full = np.stack(
-                [np.array(np.meshgrid(full[0, :, i], full[1, :, i], full[2, :, i])) for i in range(n_full)], axis=4
-            ).reshape(3, -1)
 
-            grid[full[0], full[1], full[2]] = 1
+def _hsp_to_grid(file, grid):
+    """ Writes the voxels of a single loaded HSP shape into the preallocated grid.
 
-        boundary_cells = file["b"][file["bi"][boundary[0], boundary[1], boundary[2]].astype(int) - 1]
+    The shape is stored as 16^3 blocks with a resolution of 16^3 voxels each. Block indices in `bi` mark full blocks
+    with '2' and boundary blocks with values greater than '2', which point into the array of boundary blocks `b`.
 
-        for l in range(reach):
-            for m in range(reach):
-                for n in range(reach):
-                    cell = boundary_cells[:, l * step:(l + 1) * step, m * step:(m + 1) * step,
-                                          n * step:(n + 1) * step].max(axis=-1).max(axis=-1).max(axis=-1)
-                    grid[boundary[0] * reach + l, boundary[1] * reach + m, boundary[2] * reach + n] = cell.astype(float)
+    Args:
+        file: Dictionary with the arrays `bi` and `b` of a loaded HSP file.
+        grid: Preallocated and zero-initialized cubic grid with a resolution between 16 and 256.
+    """
+    block_index = file["bi"]
+    step = 256 // grid.shape[0]
+    blocks = _block_view(grid, 16)
+
+    # expand all full blocks at once by broadcasting
+    blocks[block_index == 2] = 1
+
+    # downsample all boundary blocks at once
+    boundary = (block_index > 2).nonzero()
+    if len(boundary[0]) > 0:
+        boundary_cells = file["b"][block_index[boundary].astype(int) - 1]
+        blocks[boundary] = _downsample_max(boundary_cells, step)
+
+
+def load_hsp(file_path, resolution=None, dtype=np.uint8, packbits=False):
+    """ Loads a single voxelized shape stored in the HSP format.
+
+    Args:
+        file_path: Path to the *.mat file.
+        resolution: Resolution of the returned voxel grid, at least 16. Returns the full resolution of 256, if `None`.
+        dtype: Data type of the returned voxel grid, e.g. `np.uint8` or `bool`.
+        packbits: Packs the voxel grid along the last axis into bits, see `np.packbits`. Use `np.unpackbits` with
+            `axis=-1` to restore the voxel grid.
+
+    Return:
+        A numpy array with the voxel grid of shape [R, R, R] or [R, R, R / 8], if packed.
+    """
+    resolution = 256 if resolution is None else max(resolution, 16)
+    grid = np.zeros(3 * [resolution], dtype=dtype)
+    _hsp_to_grid(loadmat(file_path), grid)
+
+    return np.packbits(grid, axis=-1) if packbits else grid
+
+
+def load_hsp_batch(file_paths, resolution=None, dtype=np.uint8, packbits=False, num_workers=0):
+    """ Loads multiple voxelized shapes stored in the HSP format into a single preallocated array.
+
+    Args:
+        file_paths: List of paths to *.mat files.
+        resolution: Resolution of the returned voxel grids, at least 16. Uses the full resolution of 256, if `None`.
+        dtype: Data type of the returned voxel grids, e.g. `np.uint8` or `bool`.
+        packbits: Packs the voxel grids along the last axis into bits, see `np.packbits`.
+        num_workers: Number of threads, which load the files concurrently.
+
+    Return:
+        A numpy array with all voxel grids of shape [N, R, R, R] or [N, R, R, R / 8], if packed.
+    """
+    resolution = 256 if resolution is None else max(resolution, 16)
+    grids = np.zeros([len(file_paths)] + 3 * [resolution], dtype=dtype)
+
+    def load(i):
+        _hsp_to_grid(loadmat(file_paths[i]), grids[i])
+
+    if num_workers > 0:
+        with ThreadPoolExecutor(num_workers) as executor:
+            list(executor.map(load, range(len(file_paths))))
     else:
-        grid = np.empty(1)
+        for i in range(len(file_paths)):
+            load(i)
 
-    return grid
+    return np.packbits(grids, axis=-1) if packbits else grids
 
 
 def load_chair(file_path, resolution):
@@ -3,7 +3,6 @@ import itertools
 import torch
 import math
 
-from utils.functions import split
 from typing import Tuple
 
 
@@ -14,77 +13,180 @@ def _directions(spatial_dim, pos_encoding):
         return np.array(list(itertools.product([-1, 1], repeat=spatial_dim)))
 
 
+def _block_reduce(array: np.ndarray, factor: int, func) -> np.ndarray:
+    """ Reduces non-overlapping blocks of a stack of arrays with the given function.
+
+    Args:
+        array (np.ndarray): Stack of arrays with shape [N, X_1, ..., X_A].
+        factor (int): Side length of each block. Each spatial axis has to be divisible by `factor`.
+        func: Binary numpy function, e.g. `np.minimum` or `np.maximum`.
+
+    Returns:
+        np.ndarray: Reduced stack of arrays with shape [N, X_1 / factor, ..., X_A / factor].
+    """
+    # reduce one axis at a time by combining strided slices, which is faster than reducing small reshaped axes
+    for axis in range(1, array.ndim):
+        slices = [tuple([slice(None)] * axis + [slice(i, None, factor)]) for i in range(factor)]
+        reduced = array[slices[0]].copy()
+        for sl in slices[1:]:
+            func(reduced, array[sl], out=reduced)
+        array = reduced
+    return array
+
+
+def _min_max_pyramid(array: np.ndarray, max_dep: int) -> list:
+    """ Computes the minimum and maximum element of all nodes of all depth layers for a stack of arrays at once.
+
+    The pyramids are computed bottom-up, where each level reduces 2x2x2 blocks of the level below.
+
+    Args:
+        array (np.ndarray): Stack of arrays with shape [N, X_1, ..., X_A].
+        max_dep (int): Maximum depth of the pyramid.
+
+    Returns:
+        list: Tuples of (min, max) arrays with shape [N, 2^d, ..., 2^d] for each depth `d`, starting with depth 1.
+            Depth layers, which cannot be computed, as the spatial shape is not divisible by 2^d, are omitted.
+    """
+    # find the deepest layer, for which the array can be split evenly
+    num_levels = 0
+    while num_levels < max_dep and all(s % 2**(num_levels + 1) == 0 for s in array.shape[1:]):
+        num_levels += 1
+    if num_levels == 0:
+        return []
+
+    # compute the deepest layer directly from the array, all other layers bottom-up
+    block_size = array.shape[1] // 2**num_levels
+    if block_size == 1:
+        pyramid = [(array, array)]
+    else:
+        pyramid = [(_block_reduce(array, block_size, np.minimum), _block_reduce(array, block_size, np.maximum))]
+    for _ in range(num_levels - 1):
+        cur_min, cur_max = pyramid[0]
+        pyramid.insert(0, (_block_reduce(cur_min, 2, np.minimum), _block_reduce(cur_max, 2, np.maximum)))
+
+    return pyramid
+
+
 def quick_linearise(array: np.ndarray,
                     pos_encoding: str = "centered",
-                    max_resolution: int = 8096) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+                    max_resolution: int = 8096,
+                    batch: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """ Performs a quick linearisation of given voxel array into value, depth and position sequences.
 
+    The linearisation is computed level-synchronous: the minimum and maximum element of all nodes are precomputed
+    with pyramids and each depth layer is gathered at once from the coordinates of the mixed nodes of the last layer.
+
     Args:
-        array (np.ndarray): Numpy array holding pixels/voxels of a discretized shape.
+        array (np.ndarray): Numpy array holding pixels/voxels of a discretized shape. If `batch` is set, the first
+            axis holds a stack of arrays with the same shape.
         pos_encoding (optional, str): Defines position encoding. Defaults to "centered".
         max_resolution (optional, int): Parses voxels only until 'max_resolution'.
+        batch (optional, bool): Linearises a stack of arrays in one call. Defaults to False.
 
     Returns:
-        tuple(np.ndarray, np.ndarray, np.ndarray): Linearised value, depth and position sequences.
+        tuple(np.ndarray, np.ndarray, np.ndarray): Linearised value, depth and position sequences. Returns a list of
+            sequence tuples, one for each array in the stack, if `batch` is set.
     """
-    def recursive_linearise(array: np.ndarray, pos: np.ndarray, dep: int = 1):
-        """ Recursive internal function to linearise given voxel array.
+    if not batch:
+        array = array[None]
+    num_arrays, shape = array.shape[0], np.array(array.shape[1:])
+    spatial_dim = len(shape)
 
-        Note: Uses variables of parent function to store values.
-
-        Args:
-            array (np.ndarray): Numpy array (or subarray) holding pixels/voxels of a discretized shape.
-            pos (np.ndarray): Position of parent array
-            dep (int, optional): Current recursion depth. Defaults to 0.
-        """
-        # split input into an octree/quadtree
-        subarrays = split(array)
-        num_subarrays = len(subarrays)
-
-        # initialize dictionary only on first pass
-        if dep not in value:
-            value[dep] = []
-            depth[dep] = []
-            position[dep] = []
-
-        # compute values for each subarray
-        for idx, sub in enumerate(subarrays):
-            value[dep] += [1] if np.max(sub) == 0 else [3] if np.min(sub) > 0 else [2]
-            depth[dep] += [dep]
-            if pos_encoding == "centered":
-                position[dep] += [pos + sub.shape * dirs[idx]]
-            else:
-                position[dep] += [2 * pos + dirs[idx]]
-
-        # process each subarray recursivelly
-        for idx, sub in enumerate(subarrays):
-            cur_idx = -num_subarrays + idx
-            if value[dep][cur_idx] == 2 and dep < max_dep:
-                recursive_linearise(sub, position[dep][cur_idx], dep + 1)
-
-    # initialise memory
-    value = {}
-    depth = {}
-    position = {}
-    dirs = _directions(array.ndim, pos_encoding)
-    init_pos = array.shape if pos_encoding == "centered" else np.array(array.ndim * [0])
     max_dep = int(math.log2(max_resolution))
+    pyramid = _min_max_pyramid(array, max(max_dep, 1))
+    if len(pyramid) == 0:
+        raise ValueError(f"ERROR: Array with shape {tuple(array.shape[1:])} cannot be split evenly.")
+
+    # binary offsets of each child along each axis, ordered as the directions of the kd-tree
+    dirs = _directions(spatial_dim, pos_encoding)
+    bits = (dirs > dirs.min()).astype(np.int64)
+
+    # index of the array in the stack and integer coordinates of all mixed nodes of the previous layer
+    idx = np.arange(num_arrays)
+    coords = np.zeros((num_arrays, spatial_dim), dtype=np.int64)
+
+    value, depth, position, index = [], [], [], []
+    dep = 1
+    while len(idx) > 0:
+        # fail-fast: mixed nodes which cannot be split evenly
+        if dep > len(pyramid):
+            raise ValueError(f"ERROR: Array with shape {tuple(array.shape[1:])} cannot be split evenly at depth {dep}.")
+
+        # compute all children of the previous layer at once
+        idx = np.repeat(idx, len(bits))
+        coords = (2 * coords[:, None] + bits[None]).reshape(-1, spatial_dim)
+        node_min = pyramid[dep - 1][0][(idx, *coords.T)]
+        node_max = pyramid[dep - 1][1][(idx, *coords.T)]
+        val = np.full(len(idx), 2, dtype=np.int64)
+        val[node_min > 0] = 3
+        val[node_max == 0] = 1
+
+        value += [val]
+        depth += [np.full(len(val), dep, dtype=np.int64)]
+        if pos_encoding == "centered":
+            position += [(2 * coords + 1) * (shape // 2**dep)]
+        else:
+            position += [coords + 2**dep - 1]
+        index += [idx]
+
+        # process only mixed nodes in the next layer
+        mask = val == 2 if dep < max_dep else np.zeros_like(val, dtype=bool)
+        idx, coords = idx[mask], coords[mask]
+        dep += 1
+
+    # flatten layers
+    value = np.concatenate(value)
+    depth = np.concatenate(depth)
+    position = np.concatenate(position)
+
+    if not batch:
+        return value, depth, position
+
+    # group nodes by arrays, a stable sort preserves the breadth-first order of each array
+    index = np.concatenate(index)
+    order = np.argsort(index, kind='stable')
+    splits = np.cumsum(np.bincount(index, minlength=num_arrays))[:-1]
+    value = np.split(value[order], splits)
+    depth = np.split(depth[order], splits)
+    position = np.split(position[order], splits)
+    return list(zip(value, depth, position))
 
-    # call function recursivelly
-    recursive_linearise(array, init_pos)
 
-    # flatten dictionaries
-    value = np.array(list(itertools.chain(*value.values())))
-    depth = np.array(list(itertools.chain(*depth.values())))
-    position = np.array(list(itertools.chain(*position.values())))
+def layer_token_counts(array: np.ndarray, max_resolution: int = 8096) -> np.ndarray:
+    """ Computes the number of tokens of each depth layer of the linearised array without linearising it.
+
+    Each depth layer holds the children of all mixed nodes of the previous layer, thus the number of tokens follows
+    from the number of mixed nodes of the min/max pyramid alone.
+
+    Args:
+        array (np.ndarray): Numpy array holding pixels/voxels of a discretized shape.
+        max_resolution (optional, int): Counts tokens only until 'max_resolution'.
+
+    Returns:
+        np.ndarray: Number of tokens of each depth layer, starting with depth 1, as returned by `quick_linearise`.
+    """
+    num_children = 2**array.ndim
+    max_dep = int(math.log2(max_resolution))
+    pyramid = _min_max_pyramid(array[None], max(max_dep, 1))
+    if len(pyramid) == 0:
+        raise ValueError(f"ERROR: Array with shape {tuple(array.shape)} cannot be split evenly.")
 
-    return value, depth, position
+    counts = [num_children]
+    for node_min, node_max in pyramid[:max_dep - 1]:
+        num_mixed = int(np.count_nonzero(node_min != node_max))
+        if num_mixed == 0:
+            break
+        counts += [num_children * num_mixed]
+    return np.array(counts, dtype=np.int64)
 
 
 class TrinaryRepresentation():
     def __init__(self, spatial_dim=3):
         """ Provides a transformation wrapper between the basic and trinary sequence format.
 
+        Each tuple of `2**spatial_dim` basic tokens is encoded as a single token by a dot product with the powers of 3
+        and decoded with a precomputed lookup table. The padding token `0` is kept as padding in both directions.
+
         Args:
             spatial_dim: Define the spatial dimensionality of the input sequences.
         """
@@ -92,23 +194,39 @@ class TrinaryRepresentation():
         self.spatial_dim = spatial_dim
         self.num_tokens = 2**spatial_dim
         self.max_int_value_as_tri = 3**self.num_tokens
-        self.dirs = _directions(spatial_dim)
+        # trinary sequences are decoded with the position deltas of the centered encoding
+        self.dirs = _directions(spatial_dim, 'centered')
+
+        # powers of 3 with the most significant digit first
+        self.powers = 3**np.arange(self.num_tokens - 1, -1, -1, dtype=np.int64)
+        # basic token tuple of each trinary token, the first row decodes the padding token
+        digits = np.arange(self.max_int_value_as_tri, dtype=np.int64)[:, None] // self.powers % 3 + 1
+        self.lookup = np.concatenate([np.zeros((1, self.num_tokens), dtype=np.int64), digits])
+
+        # copies of the tables on each device, which are used by the pytorch functions
+        self._device_tables = {}
+
+    def _tables(self, device):
+        """ Returns the powers, lookup table and position directions as pytorch tensors on the given device. """
+        if device not in self._device_tables:
+            self._device_tables[device] = tuple(
+                torch.as_tensor(t, dtype=torch.long, device=device) for t in (self.powers, self.lookup, self.dirs)
+            )
+        return self._device_tables[device]
 
     def dec_to_tri(self, seq):
         """ Transformes input sequence given as a single decimal number to a trinary representation as an array.
 
         Takes care of `0` as an additional padding value, which is reserved.
         """
-        repr = np.base_repr(seq - 1, base=3, padding=self.num_tokens)[-self.num_tokens:]
-        return [int(c) + 1 for c in repr]
+        return self.lookup[seq].tolist()
 
     def tri_to_dec(self, seq):
         """ Transformes input sequence given as an integer array in trianary base to a single decimal number.
 
         Takes care of `0` as an additional padding value, which is reserved.
         """
-        repr = [c - 1 for c in seq]
-        return int("".join(map(str, repr)), base=3) + 1
+        return int(np.dot(np.asarray(seq) - 1, self.powers[-len(seq):])) + 1
 
     def encode_trinary(self, value, depth, position):
         """ Transforms given basic sequence into a trinary sequence representation.
@@ -121,14 +239,11 @@ class TrinaryRepresentation():
         Return:
             A tuple of (value, depth, position) in trinary representation.
         """
-        value_trinary = []
-
         # reshape value tokens into tuples, where one tuple represents exactly one new token
         value = value.reshape(-1, self.num_tokens)
 
-        # iterate over the value sequence to encode tuples into tokens in trinary representation
-        for token in value:
-            value_trinary += [self.tri_to_dec(token)]
+        # encode all tuples at once, tuples with padding tokens are encoded as padding
+        value_trinary = np.where(np.any(value == 0, axis=-1), 0, (value - 1) @ self.powers + 1)
 
         # recompute positions: compute the mean position of each n tokens.
         position = position.reshape(-1, self.num_tokens, self.spatial_dim)
@@ -137,35 +252,33 @@ class TrinaryRepresentation():
         # take each n-th depth token, as we summarized them
         depth = depth[::self.num_tokens]
 
-        return np.array(value_trinary), depth, position
+        return value_trinary, depth, position
 
     def encode_trinary_pytorch(self, value, depth, position):
-        """ Transforms given basic sequence into a trinary sequence representation. Provides a wrapper for pytorch
-            tensors.
+        """ Transforms given basic sequence into a trinary sequence representation. Provides an implementation for
+            pytorch tensors, which stays on the device of the tensors.
 
         Args:
-            value: Pytorch tensor holding the value token sequence with shape (S), with token values in [0, 3].
-            depth: Pytorch tensor holding the depth token sequence with shape (S).
-            position: Pytorch tensor holding the position token sequence with shape (S, spatial_dim).
+            value: Pytorch tensor holding the value token sequence with shape (S) or (N, S), with token values in
+                [0, 3].
+            depth: Pytorch tensor holding the depth token sequence with shape (S) or (N, S).
+            position: Pytorch tensor holding the position token sequence with shape (S, spatial_dim) or
+                (N, S, spatial_dim).
 
         Return:
             A tuple of (value, depth, position) in trinary representation.
         """
-        # remember on which device the sequences are stored
-        device = value.device
-
-        # move sequences to cpu and convert them to numpy arrays
-        value = value.cpu().numpy()
-        depth = depth.cpu().numpy()
-        position = position.cpu().numpy()
+        powers, _, _ = self._tables(value.device)
+        batch_shape = value.shape[:-1]
 
-        # transform value, depth and position sequences
-        value, depth, position = self.encode_trinary(value, depth, position)
+        # encode all tuples of n tokens at once, tuples with padding tokens are encoded as padding
+        value = value.reshape(*batch_shape, -1, self.num_tokens)
+        value = torch.where(torch.any(value == 0, dim=-1), 0, torch.sum((value - 1) * powers, dim=-1) + 1)
 
-        # recast numpy arrays into pytorch tensors and move to original device
-        value = torch.tensor(value, dtype=torch.long, device=device)
-        depth = torch.tensor(depth, dtype=torch.long, device=device)
-        position = torch.tensor(position, dtype=torch.long, device=device)
+        # compute the mean position of each n tokens and take each n-th depth token
+        position = position.reshape(*batch_shape, -1, self.num_tokens, self.spatial_dim)
+        position = torch.sum(position, dim=-2) // self.num_tokens
+        depth = depth[..., ::self.num_tokens]
 
         return value, depth, position
 
@@ -178,13 +291,8 @@ class TrinaryRepresentation():
         Return:
             Value sequence in basic sequence representation.
         """
-        # iterate over the value sequence to decode a single token into multiple basic tokens
-        value_new = []
-        for val_token in value:
-            value_new += self.dec_to_tri(val_token)
-        value = np.array(value_new).reshape(-1)
-
-        return value
+        # decode each token into multiple basic tokens with a single lookup
+        return self.lookup[value].reshape(-1)
 
     def decode_trinary(self, value, depth, position):
         """ Transforms given trinary sequence into a basic sequence representation.
@@ -213,31 +321,29 @@ class TrinaryRepresentation():
         return value, depth, position
 
     def decode_trinary_pytorch(self, value, depth, position):
-        """ Transforms given trinary sequence into a basic sequence representation. Provides a wrapper for pytorch
-            tensors.
+        """ Transforms given trinary sequence into a basic sequence representation. Provides an implementation for
+            pytorch tensors, which stays on the device of the tensors.
 
         Args:
-            value: Pytorch tensor holding the value token sequence with shape (S), with token values in [0, 3].
-            depth: Pytorch tensor holding the depth token sequence with shape (S).
-            position: Pytorch tensor holding the position token sequence with shape (S, spatial_dim).
+            value: Pytorch tensor holding the value token sequence with shape (S) or (N, S), with token values in
+                [0, 3].
+            depth: Pytorch tensor holding the depth token sequence with shape (S) or (N, S).
+            position: Pytorch tensor holding the position token sequence with shape (S, spatial_dim) or
+                (N, S, spatial_dim).
 
         Return:
             A tuple of (value, depth, position) in basic sequence representation.
         """
-        # remember on which device the sequences are stored
-        device = value.device
-
-        # move sequences to cpu and convert them to numpy arrays
-        value = value.cpu().numpy()
-        depth = depth.cpu().numpy()
-        position = position.cpu().numpy()
+        _, lookup, dirs = self._tables(value.device)
+        batch_shape = value.shape[:-1]
 
-        # transform value, depth and position sequences
-        value, depth, position = self.decode_trinary(value, depth, position)
+        # decode each token into multiple basic tokens with a single lookup
+        value = lookup[value].reshape(*batch_shape, -1)
+        depth = torch.repeat_interleave(depth, self.num_tokens, dim=-1)
 
-        # recast numpy arrays into pytorch tensors and move to original device
-        value = torch.tensor(value, dtype=torch.long, device=device)
-        depth = torch.tensor(depth, dtype=torch.long, device=device)
-        position = torch.tensor(position, dtype=torch.long, device=device)
+        # position delta of each token, relative to the first position of each sequence
+        pos_steps = (position[..., :1, :1] // 2**depth[..., None])
+        pos_deltas = dirs.repeat(position.shape[-2], 1) * pos_steps
+        position = torch.repeat_interleave(position, self.num_tokens, dim=-2) + pos_deltas
 
         return value, depth, position
@@ -2,10 +2,12 @@ from .look_ahead_mask import look_ahead_mask
 from .padding_mask import padding_mask
 from .ancestor_mask import ancestor_mask
 from .full_mask import full_mask
+from .block_diagonal_mask import block_diagonal_mask
 
 __all__ = [
     "look_ahead_mask",
     "padding_mask",
     "ancestor_mask",
     "full_mask",
+    "block_diagonal_mask",
 ]
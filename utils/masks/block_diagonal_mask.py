@@ -0,0 +1,27 @@
+import torch
+
+
+def block_diagonal_mask(cu_seqlens, causal=True, device=None):
+    """ Creates a block diagonal mask for packed sequences, which prevents the self-attention to access tokens of other
+        sequences in the same pack.
+
+        args:
+            cu_seqlens: Cumulative lengths of the packed sequences starting with '0', with shape [N + 1].
+            causal: Defines whether the mask additionally prevents the self-attention to look ahead.
+            device: Device on which the tensor will be created.
+
+        return:
+            Attention mask with shape [S, S], where S is the total length of all packed sequences.
+    """
+    seq_len = int(cu_seqlens[-1])
+    lengths = (cu_seqlens[1:] - cu_seqlens[:-1]).long().to(device)
+
+    # assign each token the index of its sequence
+    segment = torch.repeat_interleave(torch.arange(len(lengths), device=device), lengths)
+    allowed = segment.unsqueeze(1) == segment.unsqueeze(0)  # [S, S]
+    if causal:
+        index = torch.arange(seq_len, device=device)
+        allowed = allowed & (index.unsqueeze(1) >= index.unsqueeze(0))
+
+    # convert values to additive matrix with 0 or -Inf
+    return torch.full((seq_len, seq_len), -float("Inf"), device=device).masked_fill(allowed, 0.0)
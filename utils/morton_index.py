@@ -0,0 +1,251 @@
+import math
+import numpy as np
+
+# keys are stored as positive 64-bit integers, thus the highest bit is never used
+_KEY_BITS = 63
+
+
+def max_key_depth(spatial_dim):
+    """ Returns the maximal depth of nodes, which can be encoded in a 64-bit key with the given dimensionality. """
+    return (_KEY_BITS - 1) // spatial_dim
+
+
+def interleave_bits(coords, num_bits):
+    """ Interleaves the bits of integer coordinates into Morton codes (Z-order).
+
+    The first axis holds the most significant bit of each group of `spatial_dim` bits, thus the children of a node are
+    ordered as the directions of the kd-tree.
+
+    Args:
+        coords: Integer coordinates with shape [..., spatial_dim].
+        num_bits: Number of bits of each coordinate, which are interleaved.
+
+    Return:
+        Morton code of each coordinate with shape [...].
+    """
+    coords = np.asarray(coords, dtype=np.int64)
+    spatial_dim = coords.shape[-1]
+    code = np.zeros(coords.shape[:-1], dtype=np.int64)
+    for b in range(num_bits):
+        for axis in range(spatial_dim):
+            code |= ((coords[..., axis] >> b) & 1) << (b * spatial_dim + spatial_dim - 1 - axis)
+    return code
+
+
+def deinterleave_bits(code, spatial_dim, num_bits):
+    """ Splits Morton codes into integer coordinates, which is the inverse of `interleave_bits`. """
+    code = np.asarray(code, dtype=np.int64)
+    coords = np.zeros(code.shape + (spatial_dim, ), dtype=np.int64)
+    for b in range(num_bits):
+        for axis in range(spatial_dim):
+            coords[..., axis] |= ((code >> (b * spatial_dim + spatial_dim - 1 - axis)) & 1) << b
+    return coords
+
+
+def node_coords(depth, position, pos_encoding='centered', resolution=None):
+    """ Computes the integer coordinates of each node on the regular grid of its depth layer.
+
+    Args:
+        depth: Depth token sequence with shape [S].
+        position: Position token sequence with shape [S, spatial_dim].
+        pos_encoding: Position encoding of the sequence, either 'centered' or 'intertwined'.
+        resolution: Resolution of the linearised array. Only used by the 'centered' encoding and inferred from the
+            positions of the first depth layer, if `None`.
+
+    Return:
+        Integer coordinates with shape [S, spatial_dim].
+    """
+    depth = np.asarray(depth, dtype=np.int64)
+    position = np.asarray(position, dtype=np.int64)
+    if pos_encoding == 'centered':
+        if resolution is None:
+            resolution = 2 * int(np.min(position[depth == 1]))
+        # the position of a node is the center of its cell in the coordinates of the array
+        return position // (2 * (resolution >> depth))[:, None]
+    elif pos_encoding == 'intertwined':
+        return position - (2**depth - 1)[:, None]
+    raise ValueError(f"ERROR: Unknown position encoding: {pos_encoding}.")
+
+
+def morton_keys(depth, coords):
+    """ Computes the 64-bit location key of each node from its depth and integer coordinates.
+
+    The key is the Morton code of the coordinates with a leading sentinel bit, which encodes the depth of the node.
+    Thus, keys of different depths never collide, the parent key is `key >> spatial_dim` and the child keys are
+    `(key << spatial_dim) | i`. Keys of a single depth layer are sorted in the breadth-first order of the sequence.
+
+    Args:
+        depth: Depth of each node with shape [...].
+        coords: Integer coordinates of each node on the grid of its depth layer with shape [..., spatial_dim].
+
+    Return:
+        Location key of each node with shape [...].
+    """
+    depth = np.asarray(depth, dtype=np.int64)
+    spatial_dim = np.shape(coords)[-1]
+    num_bits = int(np.max(depth, initial=0))
+    if num_bits > max_key_depth(spatial_dim):
+        raise ValueError(f"ERROR: Nodes with depth {num_bits} exceed the 64-bit key with dimensionality {spatial_dim}.")
+    return (np.int64(1) << (spatial_dim * depth)) | interleave_bits(coords, num_bits)
+
+
+def _aligned_keys(depth, coords):
+    """ Computes Morton codes of the first element of each node on the grid of the deepest layer. """
+    depth = np.asarray(depth, dtype=np.int64)
+    max_depth = int(np.max(depth, initial=0))
+    return interleave_bits(np.asarray(coords) << (max_depth - depth)[:, None], max_depth)
+
+
+def morton_order(depth, coords):
+    """ Computes the permutation, which sorts a sequence into depth-first Morton order (Z-order).
+
+    Each node is followed by its children, which are ordered as the directions of the kd-tree. The breadth-first order
+    is restored with `np.argsort` of the permutation or with `breadth_first_order`.
+
+    Args:
+        depth: Depth token sequence with shape [S].
+        coords: Integer coordinates of each node with shape [S, spatial_dim], see `node_coords`.
+
+    Return:
+        Index array with shape [S], such that `sequence[order]` is in Morton order.
+    """
+    return np.lexsort((depth, _aligned_keys(depth, coords)))
+
+
+def breadth_first_order(depth, coords):
+    """ Computes the permutation, which sorts a sequence in any order into the breadth-first order of `quick_linearise`.
+
+    Args:
+        depth: Depth token sequence with shape [S].
+        coords: Integer coordinates of each node with shape [S, spatial_dim], see `node_coords`.
+
+    Return:
+        Index array with shape [S], such that `sequence[order]` is in breadth-first order.
+    """
+    return np.lexsort((_aligned_keys(depth, coords), depth))
+
+
+class MortonIndex():
+    def __init__(self, depth, position, pos_encoding='centered', resolution=None):
+        """ Provides lookups of nodes of a linearised octree by their location keys, see `morton_keys`.
+
+        All keys are sorted once. Each lookup of a single node is a binary search with O(log n), where n is the number
+        of tokens, thus nodes, parents, children and neighbours are retrieved without rebuilding a kd-tree.
+
+        Args:
+            depth: Depth token sequence of a single shape without padding with shape [S].
+            position: Position token sequence with shape [S, spatial_dim].
+            pos_encoding: Position encoding of the sequence, either 'centered' or 'intertwined'.
+            resolution: Resolution of the linearised array. Inferred from the sequence, if `None`.
+        """
+        self.depth = np.asarray(depth, dtype=np.int64)
+        self.spatial_dim = np.shape(position)[1]
+        self.max_depth = int(np.max(self.depth))
+        if resolution is None and pos_encoding == 'centered':
+            resolution = 2 * int(np.min(np.asarray(position)[self.depth == 1]))
+        self.resolution = 2**self.max_depth if resolution is None else resolution
+
+        self.coords = node_coords(self.depth, position, pos_encoding, self.resolution)
+        self.keys = morton_keys(self.depth, self.coords)
+        self._order = np.argsort(self.keys, kind='stable')
+        self._sorted_keys = self.keys[self._order]
+
+    def find_keys(self, keys):
+        """ Returns the token index of each key or `-1`, if the sequence holds no node with this key. """
+        keys = np.asarray(keys, dtype=np.int64)
+        idx = np.minimum(np.searchsorted(self._sorted_keys, keys), len(self._sorted_keys) - 1)
+        return np.where(self._sorted_keys[idx] == keys, self._order[idx], -1)
+
+    def find(self, depth, coords):
+        """ Returns the token index of each node given by its depth and integer coordinates or `-1`, if missing. """
+        return self.find_keys(morton_keys(depth, coords))
+
+    def locate(self, depth, coords):
+        """ Returns the token index of the deepest node, which contains the given cell of a depth layer.
+
+        Cells below leaf nodes are contained by the leaf. Cells outside of the array return `-1`.
+
+        Args:
+            depth: Depth of each cell with shape [...]. Might be deeper than the deepest layer of the sequence.
+            coords: Integer coordinates of each cell on the grid of its depth layer with shape [..., spatial_dim].
+
+        Return:
+            Token index of the containing node of each cell with shape [...].
+        """
+        depth = np.broadcast_to(np.asarray(depth, dtype=np.int64), np.shape(coords)[:-1])
+        coords = np.asarray(coords, dtype=np.int64)
+        inside = np.all((coords >= 0) & (coords < 2**depth[..., None]), axis=-1)
+
+        # start at the deepest layer of the sequence and move up until an existing node is found
+        shift = np.maximum(depth - self.max_depth, 0)
+        depth, coords = depth - shift, coords >> shift[..., None]
+        keys = morton_keys(depth, np.where(inside[..., None], coords, 0))
+        index = np.full(keys.shape, -1, dtype=np.int64)
+        for _ in range(self.max_depth):
+            missing = (index < 0) & inside & (keys > 1)
+            if not np.any(missing):
+                break
+            index[missing] = self.find_keys(keys[missing])
+            keys = keys >> self.spatial_dim
+        return index
+
+    def parent(self, index):
+        """ Returns the token index of the parent of each node or `-1` for nodes of the first depth layer. """
+        return self.find_keys(self.keys[index] >> self.spatial_dim)
+
+    def children(self, index):
+        """ Returns the token indices of all children of each node with shape [..., 2**spatial_dim] or `-1`, if the
+        node has no children.
+        """
+        child_bits = np.arange(2**self.spatial_dim, dtype=np.int64)
+        return self.find_keys((self.keys[index][..., None] << self.spatial_dim) | child_bits)
+
+    def neighbours(self, index):
+        """ Returns the face neighbours of each node with shape [..., 2 * spatial_dim].
+
+        Neighbours are ordered by the positive and then the negative direction of each axis. A neighbour is the node of
+        the same depth or the coarser leaf node, which contains the adjacent cell. Cells outside of the array return
+        `-1`.
+        """
+        offsets = np.concatenate([np.eye(self.spatial_dim), -np.eye(self.spatial_dim)]).astype(np.int64)
+        coords = self.coords[index][..., None, :] + offsets
+        return self.locate(self.depth[index][..., None], coords)
+
+    def point_query(self, points):
+        """ Returns the token index of the leaf node, which contains each element of the array.
+
+        Args:
+            points: Integer coordinates of elements of the array with shape [..., spatial_dim].
+
+        Return:
+            Token index of the containing leaf node of each element with shape [...] or `-1`, if outside.
+        """
+        return self.locate(int(math.log2(self.resolution)), points)
+
+    def box_query(self, lower, upper):
+        """ Returns all nodes, which intersect an axis aligned box of elements of the array.
+
+        Keys of each depth layer within the Morton code range of the box corners are found with a binary search and
+        filtered by their coordinates.
+
+        Args:
+            lower: Integer coordinates of the first element in the box with shape [spatial_dim].
+            upper: Integer coordinates of the first element behind the box with shape [spatial_dim].
+
+        Return:
+            Sorted token indices of all intersecting nodes.
+        """
+        lower, upper = np.asarray(lower, dtype=np.int64), np.asarray(upper, dtype=np.int64) - 1
+        num_levels = int(math.log2(self.resolution))
+
+        index = []
+        for d in range(1, self.max_depth + 1):
+            cell_lower, cell_upper = lower >> (num_levels - d), upper >> (num_levels - d)
+            key_lower, key_upper = morton_keys([d, d], [cell_lower, cell_upper])
+            start = np.searchsorted(self._sorted_keys, key_lower, 'left')
+            stop = np.searchsorted(self._sorted_keys, key_upper, 'right')
+            candidates = self._order[start:stop]
+            coords = self.coords[candidates]
+            mask = np.all((coords >= cell_lower) & (coords <= cell_upper), axis=-1)
+            index += [candidates[mask]]
+        return np.sort(np.concatenate(index))
@@ -0,0 +1,89 @@
+import numpy as np
+
+from utils.kd_tree_utils import _directions
+from utils.compact_kd_tree import _parse_token_layers
+from utils.morton_index import MortonIndex
+
+
+def _leaf_nodes(value, resolution, depth, autorepair_errors, silent):
+    """ Parses a token sequence into the depth, integer coordinates, occupancy and leaf flag of all nodes. """
+    bits = _directions(3, 'intertwined') - 1
+    nodes = []
+    coords = np.zeros((1, 3), dtype=np.int64)
+    layers = _parse_token_layers(value, resolution, 3, depth, autorepair_errors, silent)
+    for layer_depth, _, layer_value, final in layers:
+        coords = (2 * coords[:, None] + bits[None]).reshape(-1, 3)
+        leaf = final | (layer_depth == depth)
+        nodes += [(np.full(len(coords), layer_depth), coords, layer_value > 1, leaf)]
+        coords = coords[~leaf]
+    return [np.concatenate(x) for x in zip(*nodes)]
+
+
+def octree_to_mesh(value, resolution, depth=float('Inf'), autorepair_errors=False, silent=False):
+    """ Extracts the surface mesh of a token sequence directly from the leaf nodes of the octree.
+
+    A quad is emitted for each face between an occupied and an empty leaf node or the outside of the array. Each quad
+    covers the complete face of the smaller node, thus large coplanar faces of coarse leaf nodes are a single quad and
+    the number of faces grows with the number of leaf nodes at the surface. Neighbours are found with a `MortonIndex`.
+    The mesh covers the same elements as `quick_delinearise` in 'occupancy' mode and is scaled like `voxels_to_mesh`,
+    but it consists of axis aligned faces instead of a smooth marching cubes surface.
+
+    Args:
+        value: A token sequence representing a 3D object. The values should consist only of '1', '2' and '3'.
+        resolution: The resolution of the token sequence. This value should be a power of 2.
+        depth: Defines the maximum depth of the nodes, where mixed nodes of this depth are treated as occupied.
+        autorepair_errors: Select if the parser should try to automatically repair malformed input sequences.
+        silent: Select if errors and warnings should be printed into the output console.
+
+    Return:
+        Vertices - [V, 3], triangle faces with vertex indices - [F, 3] and vertex normals - [V, 3] of the mesh.
+    """
+    node_depth, coords, occupied, leaf = _leaf_nodes(value, resolution, depth, autorepair_errors, silent)
+    index = MortonIndex(node_depth, coords + (2**node_depth - 1)[:, None], 'intertwined', resolution)
+    size = resolution >> node_depth
+
+    # face neighbours of all leaf nodes, which have either the same depth or are coarser leaf nodes
+    leaves = np.nonzero(leaf)[0]
+    neighbours = index.neighbours(leaves)  # [L, 6]
+    inside = neighbours >= 0
+    neighbours = np.where(inside, neighbours, 0)
+    neighbour_leaf = inside & leaf[neighbours]
+    neighbour_occupied = inside & occupied[neighbours]
+
+    # each face between two leaf nodes is emitted once by the smaller node, or by the occupied one for equal sizes
+    emit_out = occupied[leaves, None] & ~neighbour_occupied & (neighbour_leaf | ~inside)
+    emit_in = ~occupied[leaves, None] & neighbour_leaf & neighbour_occupied
+    emit_in &= size[neighbours] > size[leaves, None]
+    node, direction = np.nonzero(emit_out | emit_in)
+    outward = emit_out[node, direction]
+    node = leaves[node]
+
+    # corners of each quad, counter-clockwise around the outward normal of the occupied node
+    axis = direction % 3
+    positive = direction < 3
+    s = size[node]
+    base = coords[node] * s[:, None]
+    base[np.arange(len(node)), axis] += np.where(positive, s, 0)
+    u, v = np.eye(3, dtype=np.int64)[(axis + 1) % 3], np.eye(3, dtype=np.int64)[(axis + 2) % 3]
+    quads = np.stack([base, base + s[:, None] * u, base + s[:, None] * (u + v), base + s[:, None] * v], axis=1)
+    flip = positive != outward
+    quads[flip] = quads[flip][:, ::-1]
+
+    # merge shared corners, which are identified by their linear index, and split each quad into two triangles
+    grid_shape = 3 * (resolution + 1, )
+    corner_index, inverse = np.unique(np.ravel_multi_index(quads.reshape(-1, 3).T, grid_shape), return_inverse=True)
+    verts = np.stack(np.unravel_index(corner_index, grid_shape), axis=1)
+    quads = inverse.reshape(-1, 4)
+    faces = np.concatenate([quads[:, [0, 1, 2]], quads[:, [0, 2, 3]]])
+
+    # vertex normals are the normalized sum of the normals of all adjacent quads
+    face_normals = np.eye(3)[axis] * np.where(positive == outward, 1.0, -1.0)[:, None]
+    normals = np.zeros((len(verts), 3))
+    np.add.at(normals, quads.reshape(-1), np.repeat(face_normals, 4, axis=0))
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+
+    # the boundary of the elements lies half way between the samples of the padded array of `voxels_to_mesh`
+    verts = (verts + 0.5) / (resolution + 2)
+    verts -= [0.5, 0.0, 0.5]
+    verts *= 2.0
+    return verts.astype(np.float32), faces.astype(np.int32), normals.astype(np.float32)
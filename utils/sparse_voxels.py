@@ -0,0 +1,127 @@
+import math
+import numpy as np
+
+from utils.kd_tree_utils import _directions
+from utils.compact_kd_tree import _parse_token_layers
+from utils.morton_index import interleave_bits
+
+
+def delinearise_boxes(
+    value,
+    resolution,
+    spatial_dim=3,
+    depth=float('Inf'),
+    autorepair_errors=False,
+    silent=False,
+):
+    """ Converts a token sequence into the boxes of all occupied leaf nodes, without materialising an array.
+
+    The boxes cover exactly the elements, which are occupied in the array of `quick_delinearise` in 'occupancy' mode.
+    The number of boxes grows with the surface of the shape instead of its volume, as the interior and exterior of the
+    shape is covered by few large leaf nodes.
+
+    Args:
+        value: A token sequence representing a spatial object. The values should consist only of '1', '2' and '3'.
+        resolution: The resolution of the token sequence. This value should be a power of 2.
+        spatial_dim: The spatial dimensionality of the array of elements.
+        depth: Defines the maximum depth of the nodes, where mixed nodes of this depth are returned as occupied.
+        autorepair_errors: Select if the parser should try to automatically repair malformed input sequences.
+        silent: Select if errors and warnings should be printed into the output console.
+
+    Return:
+        Integer coordinates of the first element of each box - [B, spatial_dim] and the side length of each box - [B].
+    """
+    bits = _directions(spatial_dim, 'intertwined') - 1
+
+    corner, size = [np.zeros((0, spatial_dim), dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    coords = np.zeros((1, spatial_dim), dtype=np.int64)
+    layers = _parse_token_layers(value, resolution, spatial_dim, depth, autorepair_errors, silent)
+    for layer_depth, layer_size, layer_value, final in layers:
+        coords = (2 * coords[:, None] + bits[None]).reshape(-1, spatial_dim)
+        leaf = final | (layer_depth == depth)
+        occupied = leaf & (layer_value > 1)
+        corner += [coords[occupied] * layer_size]
+        size += [np.full(np.count_nonzero(occupied), layer_size, dtype=np.int64)]
+        coords = coords[~leaf]
+
+    return np.concatenate(corner), np.concatenate(size)
+
+
+def boxes_to_coo(corner, size):
+    """ Converts boxes into the integer coordinates of all occupied elements - [V, spatial_dim].
+
+    The number of coordinates grows with the volume of the shape. Boxes of the same size are expanded at once.
+    """
+    spatial_dim = corner.shape[1]
+    coords = [np.zeros((0, spatial_dim), dtype=np.int64)]
+    for s in np.unique(size):
+        offsets = np.stack(np.meshgrid(*spatial_dim * [np.arange(s)], indexing='ij'), axis=-1).reshape(-1, spatial_dim)
+        coords += [(corner[size == s][:, None] + offsets[None]).reshape(-1, spatial_dim)]
+    return np.concatenate(coords)
+
+
+def rasterize_boxes(corner, size, lower, shape, dtype=np.uint8):
+    """ Writes all boxes, which intersect a region of the array, into a dense array of this region.
+
+    Each box adds its corners to a difference array, which is integrated with a cumulative sum along each axis. Thus,
+    the cost grows with the number of boxes and the size of the region, but not with the size of the boxes.
+
+    Args:
+        corner: Integer coordinates of the first element of each box - [B, spatial_dim].
+        size: Side length of each box - [B].
+        lower: Integer coordinates of the first element of the region, which might be outside of the array.
+        shape: Shape of the region.
+        dtype: Data type of the returned array.
+
+    Return:
+        Dense occupancy array of the region with the given shape.
+    """
+    spatial_dim = corner.shape[1]
+    lower, shape = np.asarray(lower, dtype=np.int64), np.asarray(shape, dtype=np.int64)
+    start = np.clip(corner - lower, 0, shape)
+    stop = np.clip(corner + size[:, None] - lower, 0, shape)
+    inside = np.all(stop > start, axis=1)
+    start, stop = start[inside], stop[inside]
+
+    # add +1 or -1 at each corner of each box, depending on the number of upper bounds of the corner
+    diff = np.zeros(shape + 1, dtype=np.int32)
+    for corner_bits in _directions(spatial_dim, 'intertwined') - 1:
+        idx = np.where(corner_bits == 1, stop, start)
+        np.add.at(diff, tuple(idx.T), (-1)**np.sum(corner_bits))
+    for axis in range(spatial_dim):
+        diff = np.cumsum(diff, axis=axis)
+    return diff[tuple(slice(0, s) for s in shape)].astype(dtype)
+
+
+def boxes_iou(boxes_a, boxes_b, resolution):
+    """ Computes the volumetric intersection over union of two shapes given as boxes of leaf nodes.
+
+    The elements of each leaf node form a single contiguous range of Morton codes. Thus, the intersection is computed
+    from the sorted endpoints of both sets of ranges without materialising any array.
+
+    Args:
+        boxes_a: Tuple of (corner, size) of the first shape, see `delinearise_boxes`.
+        boxes_b: Tuple of (corner, size) of the second shape.
+        resolution: The resolution of both shapes. This value should be a power of 2.
+
+    Return:
+        Intersection over union as a float, '1.0' if both shapes are empty.
+    """
+    num_bits = int(math.log2(resolution))
+    starts, stops = [], []
+    for corner, size in (boxes_a, boxes_b):
+        start = interleave_bits(corner, num_bits)
+        starts += [start]
+        stops += [start + size**corner.shape[1]]
+
+    volume = sum(np.sum(stop - start) for start, stop in zip(starts, stops))
+    if volume == 0:
+        return 1.0
+
+    # leaf nodes of a single shape never overlap, thus a coverage of 2 is covered by both shapes
+    points = np.concatenate(starts + stops)
+    delta = np.concatenate([np.ones(sum(len(s) for s in starts)), -np.ones(sum(len(s) for s in stops))])
+    order = np.argsort(points, kind='stable')
+    coverage = np.cumsum(delta[order])
+    intersection = np.sum(np.diff(points[order])[coverage[:-1] == 2])
+    return float(intersection / (volume - intersection))
@@ -0,0 +1,77 @@
+import torch
+from collections import namedtuple
+
+
+class SubstitutionIndex(namedtuple('SubstitutionIndex', ['start', 'length', 'max_length', 'mixed', 'max_mixed'])):
+    """ Index tensors, which split a batch into its depth layers and substitute mixed tokens with their children.
+
+    Layers are stored in ascending depth. The i-th substitution replaces the mixed tokens of layer `i` with the reduced
+    groups of 8 children in layer `i + 1`.
+
+    Attributes:
+        start: Index of the first token of each layer in each sample - tuple of [N].
+        length: Number of tokens of each layer in each sample - tuple of [N].
+        max_length: Maximal number of tokens of each layer in the batch - tuple of int.
+        mixed: Tuple of (batch, token, chunk) index tensors - [M] for each substitution. The mixed token `token` of
+            sample `batch` is substituted by the `chunk`-th group of children in the following layer.
+        max_mixed: Maximal number of mixed tokens of each substituted layer in the batch - tuple of int.
+    """
+    __slots__ = ()
+
+    def window(self, first, num_layers):
+        """ Returns the index of `num_layers` consecutive layers starting with layer `first`, where the first token of
+        the window has the index '0' in each sample.
+        """
+        layers = slice(first, first + num_layers)
+        substitutions = slice(first, first + num_layers - 1)
+        return SubstitutionIndex(
+            start=tuple(s - self.start[first] for s in self.start[layers]),
+            length=self.length[layers],
+            max_length=self.max_length[layers],
+            mixed=self.mixed[substitutions],
+            max_mixed=self.max_mixed[substitutions],
+        )
+
+
+def substitution_index(value, depth, num_layers=None, max_depth=None):
+    """ Computes the index tensors, which are used by substitution embeddings and heads to split and substitute layers.
+
+    Computing the index tensors requires synchronisation with the host. Therefore, they should be computed once for
+    each batch, e.g. in the collate function, and shared by the embedding and the head.
+
+    Args:
+        value: Value token sequence - [N, S].
+        depth: Depth token sequence - [N, S].
+        num_layers: Number of last depth layers of the batch, which are indexed. Indexes all layers, if `None`.
+        max_depth: Depth of the last indexed layer, which might be empty, e.g. in a single block of a sequence.
+            Computed from `depth`, if `None`.
+
+    Return:
+        A `SubstitutionIndex` with index tensors on the device of `value`.
+    """
+    max_depth = int(torch.max(depth)) if max_depth is None else max_depth
+    num_layers = max_depth if num_layers is None else num_layers
+    layer_depth = range(max_depth - num_layers + 1, max_depth + 1)
+
+    # compute the number of tokens and the first token of each layer in each sample
+    length = [torch.sum(depth == d, dim=1) for d in layer_depth]
+    start = [torch.zeros_like(length[0])]
+    for l in length[:-1]:
+        start += [start[-1] + l]
+
+    # compute the index of each mixed token and of the group of children, which substitutes it
+    mixed, max_mixed = [], []
+    for d, s in zip(layer_depth[:-1], start[:-1]):
+        is_mixed = (depth == d) & (value == 2)  # [N, S]
+        batch, token = torch.nonzero(is_mixed, as_tuple=True)  # [M]
+        chunk = torch.cumsum(is_mixed, dim=1)[batch, token] - 1  # [M]
+        mixed += [(batch, token - s[batch], chunk)]
+        max_mixed += [int(torch.max(torch.sum(is_mixed, dim=1)))]
+
+    return SubstitutionIndex(
+        start=tuple(start),
+        length=tuple(length),
+        max_length=tuple(int(torch.max(l)) for l in length),
+        mixed=tuple(mixed),
+        max_mixed=tuple(max_mixed),
+    )